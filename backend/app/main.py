@@ -142,15 +142,49 @@ def health():
     return {"status": "ok"}
 
 
+@app.on_event("startup")
+def start_chain_simulator():
+    """Serve the chain from an in-process simulator when CHAIN_SIMULATOR is set (local runs, demos)."""
+    if os.getenv("CHAIN_SIMULATOR", "").lower() not in ("1", "true", "yes"):
+        return
+    try:
+        from .services.chain_simulator import install_chain_simulator
+        simulator = install_chain_simulator()
+        os.environ.update(simulator.contracts.env())
+        print(f"[INFO] Chain simulator installed (chain id {simulator.chain_id}, contracts deployed by the Hardhat deployer)")
+    except Exception as e:
+        print(f"[WARNING] Failed to install chain simulator: {str(e)}")
+        print(f"[INFO] Chain calls will go to {os.getenv('RPC_URL', 'http://127.0.0.1:8545')}")
+
+
+@app.on_event("startup")
+def load_order_books():
+    """Load resting orders into the in-memory order books."""
+    try:
+        from .db import SessionLocal
+        from .services.order_book import load_order_books
+        db = SessionLocal()
+        try:
+            load_order_books(db)
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"[WARNING] Failed to load order books: {str(e)}")
+        print("[INFO] Order books will be loaded on first use")
+
+
 # Start bot worker on startup (optional - comment out if you want manual control)
 @app.on_event("startup")
 def start_bot_worker():
     """Start the bot worker to automatically execute market making bots."""
     try:
-        from .services.bot_worker import start_bot_worker
-        # Start worker with 60 second interval (adjust as needed)
-        start_bot_worker(interval_seconds=60)
-        print("[INFO] Bot worker started (60 second interval)")
+        from .services.bot_worker import start_bot_worker, stop_bot_worker
+        from .services.worker_election import elect_worker
+        # Bots refresh when their market changes; every 60 seconds as a fallback (adjust as needed)
+        if not elect_worker("bot_worker", lambda: start_bot_worker(interval_seconds=60), stop_bot_worker):
+            print("[INFO] Bot worker is running in another API process (this one takes over if it stops)")
+            return
+        print("[INFO] Bot worker started (event-driven, 60 second fallback interval)")
     except Exception as e:
         print(f"[WARNING] Failed to start bot worker: {str(e)}")
         print("[INFO] You can still manually trigger bot orders via the API")
@@ -160,9 +194,104 @@ def start_bot_worker():
 def stop_bot_worker():
     """Stop the bot worker on shutdown."""
     try:
-        from .services.bot_worker import stop_bot_worker
-        stop_bot_worker()
+        from .services.worker_election import resign_worker
+        resign_worker("bot_worker")
         print("[INFO] Bot worker stopped")
     except Exception as e:
         print(f"[WARNING] Error stopping bot worker: {str(e)}")
 
+
+
+@app.on_event("shutdown")
+def stop_worker_election():
+    """Stop checking and retrying the worker locks; each worker's own shutdown hook releases its lock."""
+    try:
+        from .services.worker_election import stop_worker_election
+        stop_worker_election()
+    except Exception as e:
+        print(f"[WARNING] Error stopping worker election: {str(e)}")
+
+
+@app.on_event("shutdown")
+def stop_market_actors():
+    """Let each market's actor finish its queued commands."""
+    try:
+        from .services.market_actor import stop_market_actors
+        stop_market_actors()
+        print("[INFO] Market actors stopped")
+    except Exception as e:
+        print(f"[WARNING] Error stopping market actors: {str(e)}")
+
+
+@app.on_event("startup")
+def start_settlement_worker():
+    """Start the worker that settles matched trades on-chain."""
+    try:
+        from .services.settlement_worker import start_settlement_worker, stop_settlement_worker
+        from .services.worker_election import elect_worker
+        if not elect_worker("settlement_worker", lambda: start_settlement_worker(interval_seconds=5), stop_settlement_worker):
+            print("[INFO] Settlement worker is running in another API process (this one takes over if it stops)")
+            return
+        print("[INFO] Settlement worker started (5 second interval)")
+    except Exception as e:
+        print(f"[WARNING] Failed to start settlement worker: {str(e)}")
+        print("[INFO] Matched trades will stay PENDING_SETTLEMENT until the worker runs")
+
+
+@app.on_event("shutdown")
+def stop_settlement_worker():
+    """Stop the settlement worker on shutdown."""
+    try:
+        from .services.worker_election import resign_worker
+        resign_worker("settlement_worker")
+        print("[INFO] Settlement worker stopped")
+    except Exception as e:
+        print(f"[WARNING] Error stopping settlement worker: {str(e)}")
+
+
+@app.on_event("startup")
+def start_chain_indexer():
+    """Start the indexer that materialises on-chain credit balances into SQL."""
+    try:
+        from .services.chain_indexer_worker import start_chain_indexer, stop_chain_indexer
+        from .services.worker_election import elect_worker
+        if not elect_worker("chain_indexer", lambda: start_chain_indexer(interval_seconds=2), stop_chain_indexer):
+            print("[INFO] Chain indexer is running in another API process (this one takes over if it stops)")
+            return
+        print("[INFO] Chain indexer started (2 second interval)")
+    except Exception as e:
+        print(f"[WARNING] Failed to start chain indexer: {str(e)}")
+        print("[INFO] Holdings will be read from the blockchain node")
+
+
+@app.on_event("shutdown")
+def stop_chain_indexer():
+    """Stop the chain indexer on shutdown."""
+    try:
+        from .services.worker_election import resign_worker
+        resign_worker("chain_indexer")
+        print("[INFO] Chain indexer stopped")
+    except Exception as e:
+        print(f"[WARNING] Error stopping chain indexer: {str(e)}")
+
+
+@app.on_event("startup")
+def start_price_history_worker():
+    """Start the worker that writes in-memory OHLCV candles to price_history."""
+    try:
+        from .services.price_history_worker import start_price_history_worker
+        start_price_history_worker(interval_seconds=5)
+        print("[INFO] Price history flush worker started (5 second interval)")
+    except Exception as e:
+        print(f"[WARNING] Failed to start price history flush worker: {str(e)}")
+
+
+@app.on_event("shutdown")
+def stop_price_history_worker():
+    """Flush remaining candles and stop the price history worker on shutdown."""
+    try:
+        from .services.price_history_worker import stop_price_history_worker
+        stop_price_history_worker()
+        print("[INFO] Price history flush worker stopped")
+    except Exception as e:
+        print(f"[WARNING] Error stopping price history flush worker: {str(e)}")
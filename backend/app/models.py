@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import enum
 from .db import Base
 
@@ -70,6 +70,9 @@ class AgreementArchive(Base):
 
 class Scheme(Base):
     __tablename__ = "schemes"
+    __table_args__ = (
+        Index("ix_schemes_catchment_unit_type", "catchment", "unit_type"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     # NFT token ID from the on-chain SchemeNFT contract.
@@ -94,6 +97,10 @@ class Scheme(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        # /landowner/notifications per account (keyset pages), newest first
+        Index("ix_notifications_account_created_id", "account_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)
@@ -140,6 +147,9 @@ class BrokerMandate(Base):
 
 class ExchangeListing(Base):
     __tablename__ = "exchange_listings"
+    __table_args__ = (
+        Index("ix_exchange_listings_status_market", "status", "catchment", "unit_type", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     owner_account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)
@@ -163,6 +173,17 @@ class ExchangeListing(Base):
 
 class Trade(Base):
     __tablename__ = "trades"
+    __table_args__ = (
+        # /trades (keyset pages) and balance aggregates look up both sides of an account's trades, newest first
+        Index("ix_trades_buyer_created_id", "buyer_account_id", "created_at", "id"),
+        Index("ix_trades_seller_created_id", "seller_account_id", "created_at", "id"),
+        # Reference price / price history per scheme, newest first
+        Index("ix_trades_scheme_created", "scheme_id", "created_at"),
+        Index("ix_trades_mandate_id", "mandate_id"),
+        # Broker, bot and order trade histories join trades to the orders that filled
+        Index("ix_trades_buy_order_id", "buy_order_id"),
+        Index("ix_trades_sell_order_id", "sell_order_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     listing_id = Column(Integer, ForeignKey("exchange_listings.id"), nullable=True)  # Optional for order-based trades
@@ -174,6 +195,9 @@ class Trade(Base):
     total_price = Column(Float, nullable=False)  # quantity_units * price_per_unit
     transaction_hash = Column(String, nullable=True)  # On-chain transaction hash
     mandate_id = Column(Integer, ForeignKey("broker_mandates.id"), nullable=True)  # Links broker sales to client mandate
+    buy_order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)  # Orders that filled (NULL for listing purchases)
+    sell_order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)
+    status = Column(String, default="SETTLED")  # PENDING_SETTLEMENT, SETTLED, SETTLEMENT_FAILED (NULL on legacy rows = SETTLED)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
@@ -182,6 +206,30 @@ class Trade(Base):
     seller = relationship("Account", foreign_keys=[seller_account_id])
     scheme = relationship("Scheme")
     mandate = relationship("BrokerMandate")
+    buy_order = relationship("Order", foreign_keys=[buy_order_id])
+    sell_order = relationship("Order", foreign_keys=[sell_order_id])
+
+
+class SettlementInstruction(Base):
+    """Outbox row for an on-chain credit transfer, drained by the settlement worker."""
+    __tablename__ = "settlement_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    trade_id = Column(Integer, ForeignKey("trades.id"), nullable=False, index=True)
+    from_address = Column(String, nullable=False)  # Address the credits leave (trading/house/broker wallet)
+    to_address = Column(String, nullable=False)
+    nft_token_id = Column(Integer, nullable=False)  # ERC-1155 tokenId
+    quantity_units = Column(Integer, nullable=False)
+    signer = Column(String, nullable=False)  # Which configured key signs: TRADING_ACCOUNT, BROKER_HOUSE, BROKER, LANDOWNER
+    status = Column(String, default="PENDING")  # PENDING, SUBMITTED, SETTLED, FAILED
+    attempts = Column(Integer, default=0)
+    last_error = Column(String, nullable=True)
+    transaction_hash = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Relationships
+    trade = relationship("Trade")
 
 
 class PlanningApplication(Base):
@@ -219,6 +267,25 @@ class PlanningApplicationScheme(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Matching and book rebuilds per market: catchment + unit_type + side + status, then price-time
+        Index("ix_orders_market", "catchment", "unit_type", "side", "status", "price_per_unit", "created_at"),
+        # /orders/open and /orders/completed (keyset pages) per account, newest first
+        Index("ix_orders_account_status_created_id", "account_id", "status", "created_at", "id"),
+        # Best bid/ask and order book load only ever read priced (limit) orders
+        Index(
+            "ix_orders_priced_side_status",
+            "side", "status", "price_per_unit",
+            sqlite_where=text("price_per_unit IS NOT NULL"),
+            postgresql_where=text("price_per_unit IS NOT NULL")
+        ),
+        Index(
+            "ix_orders_priced_status_created",
+            "status", "created_at", "id",
+            sqlite_where=text("price_per_unit IS NOT NULL"),
+            postgresql_where=text("price_per_unit IS NOT NULL")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)
@@ -233,12 +300,17 @@ class Order(Base):
     status = Column(String, default="PENDING")  # PENDING, PARTIALLY_FILLED, FILLED, CANCELLED
     scheme_id = Column(Integer, ForeignKey("schemes.id"), nullable=True)  # Optional, for tracking
     nft_token_id = Column(Integer, nullable=True)  # Optional, for on-chain transfers
+    # SELL orders: where fills' credits come from, resolved when the order is placed
+    funding_source = Column(String, nullable=True)  # Settlement signer: TRADING_ACCOUNT, BROKER_HOUSE, BROKER or LANDOWNER
+    source_address = Column(String, nullable=True)  # Wallet the credits leave from
+    mandate_id = Column(Integer, ForeignKey("broker_mandates.id"), nullable=True)  # Client mandate a broker sells under
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     # Relationships
     account = relationship("Account")
     scheme = relationship("Scheme")
+    mandate = relationship("BrokerMandate")
 
 
 class PriceHistory(Base):
@@ -257,6 +329,11 @@ class PriceHistory(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        # Candle load/flush: one series, range of timestamps
+        Index("ix_price_history_series", "catchment", "unit_type", "timeframe", "timestamp"),
+    )
+
 
 class MarketMakingBot(Base):
     __tablename__ = "market_making_bots"
@@ -297,6 +374,10 @@ class BotAssignment(Base):
 
 class FIFOCreditQueue(Base):
     __tablename__ = "fifo_credit_queues"
+    __table_args__ = (
+        Index("ix_fifo_credit_queues_bot_position", "bot_id", "queue_position", "id"),
+        Index("ix_fifo_credit_queues_bot_scheme_position", "bot_id", "scheme_id", "queue_position", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     bot_id = Column(Integer, ForeignKey("market_making_bots.id"), nullable=False)
@@ -317,6 +398,10 @@ class FIFOCreditQueue(Base):
 
 class BotOrder(Base):
     __tablename__ = "bot_orders"
+    __table_args__ = (
+        Index("ix_bot_orders_order_id", "order_id"),
+        Index("ix_bot_orders_bot_id", "bot_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     bot_id = Column(Integer, ForeignKey("market_making_bots.id"), nullable=False)
@@ -369,6 +454,9 @@ class SellLadderBotAssignment(Base):
 
 class SellLadderFIFOCreditQueue(Base):
     __tablename__ = "sell_ladder_fifo_credit_queues"
+    __table_args__ = (
+        Index("ix_sell_ladder_fifo_credit_queues_bot_position", "bot_id", "queue_position"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     bot_id = Column(Integer, ForeignKey("sell_ladder_bots.id"), nullable=False)
@@ -389,6 +477,11 @@ class SellLadderFIFOCreditQueue(Base):
 
 class SellLadderBotOrder(Base):
     __tablename__ = "sell_ladder_bot_orders"
+    __table_args__ = (
+        Index("ix_sell_ladder_bot_orders_order_id", "order_id"),
+        Index("ix_sell_ladder_bot_orders_bot_level", "bot_id", "price_level"),
+        Index("ix_sell_ladder_bot_orders_fifo_queue_id", "fifo_queue_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     bot_id = Column(Integer, ForeignKey("sell_ladder_bots.id"), nullable=False)
@@ -403,3 +496,88 @@ class SellLadderBotOrder(Base):
     bot = relationship("SellLadderBot", back_populates="bot_orders")
     order = relationship("Order")
     fifo_queue = relationship("SellLadderFIFOCreditQueue")
+
+
+class ChainCursor(Base):
+    """Checkpoint of a chain indexer: last block whose logs have been applied."""
+    __tablename__ = "chain_cursors"
+
+    name = Column(String, primary_key=True)  # e.g. "credits"
+    last_block = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class IndexedBlock(Base):
+    """Hashes of recently indexed blocks, used to detect reorgs."""
+    __tablename__ = "indexed_blocks"
+
+    block_number = Column(Integer, primary_key=True)
+    block_hash = Column(String, nullable=False)
+
+
+class CreditBalance(Base):
+    """SchemeCredits balance per holder and tokenId, materialised from chain logs."""
+    __tablename__ = "credit_balances"
+    __table_args__ = (UniqueConstraint("holder_address", "nft_token_id", name="uq_credit_balance_holder_token"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    holder_address = Column(String, nullable=False, index=True)  # Lowercase EVM address
+    nft_token_id = Column(Integer, nullable=False, index=True)  # ERC-1155 tokenId
+    balance = Column(Integer, nullable=False, default=0)
+    locked = Column(Integer, nullable=False, default=0)  # SchemeCredits.lockedBalance
+    burned = Column(Integer, nullable=False, default=0)  # Burned on planning approval
+    last_block = Column(Integer, nullable=True)
+
+
+class CreditBalanceDelta(Base):
+    """One applied change to a CreditBalance (or SchemeNFT owner), kept so reorgs and replays can be undone."""
+    __tablename__ = "credit_balance_deltas"
+
+    id = Column(Integer, primary_key=True, index=True)
+    block_number = Column(Integer, nullable=False, index=True)
+    transaction_hash = Column(String, nullable=False)
+    log_index = Column(Integer, nullable=False)
+    event = Column(String, nullable=False)  # TransferSingle, TransferBatch, ApplicationSubmitted, ApplicationApproved, ApplicationRejected, SchemeNFTTransfer
+    holder_address = Column(String, nullable=False)
+    nft_token_id = Column(Integer, nullable=False)
+    balance_delta = Column(Integer, nullable=False, default=0)
+    locked_delta = Column(Integer, nullable=False, default=0)
+    burned_delta = Column(Integer, nullable=False, default=0)
+    application_id = Column(Integer, nullable=True, index=True)  # PlanningLock application for lock events
+    counterparty = Column(String, nullable=True)  # Previous owner for SchemeNFT transfers
+
+
+class SchemeNFTOwner(Base):
+    """Current owner of each SchemeNFT token, materialised from Transfer logs."""
+    __tablename__ = "scheme_nft_owners"
+
+    nft_token_id = Column(Integer, primary_key=True)
+    owner_address = Column(String, nullable=True, index=True)  # Lowercase; NULL once burned
+    last_block = Column(Integer, nullable=True)
+
+
+class AccountBalance(Base):
+    """Cash ledger per account, updated in the same transaction as each trade insert."""
+    __tablename__ = "account_balances"
+
+    account_id = Column(Integer, ForeignKey("accounts.id"), primary_key=True)
+    cash_balance = Column(Float, nullable=False, default=0.0)  # GBP, before the non-negative clamp
+    reserved_balance = Column(Float, nullable=False, default=0.0)  # GBP held by open LIMIT BUY orders
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class CreditReservation(Base):
+    """Credits an account holds in open SELL orders and ACTIVE listings, per scheme."""
+    __tablename__ = "credit_reservations"
+    __table_args__ = (
+        UniqueConstraint("account_id", "scheme_id", name="uq_credit_reservation_account_scheme"),
+        Index("ix_credit_reservations_account_catchment", "account_id", "catchment", "unit_type"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("accounts.id"), nullable=False)
+    scheme_id = Column(Integer, ForeignKey("schemes.id"), nullable=False)
+    catchment = Column(String, nullable=False)  # Uppercase, copied from the scheme
+    unit_type = Column(String, nullable=False)  # Lowercase, copied from the scheme
+    reserved_units = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -7,7 +7,7 @@ import os
 from ..db import SessionLocal
 from ..models import Account, Trade, BrokerMandate, AccountRole
 from ..services.credits_summary import get_account_credits_summary, get_account_credits_summary_by_catchment
-from ..services.balance_check import get_account_balance as get_account_balance_service
+from ..services.balance_check import get_account_balance as get_account_balance_service, get_reserved_balance
 
 router = APIRouter()
 
@@ -242,6 +242,7 @@ class AccountBalanceResponse(BaseModel):
     balance_gbp: float
     total_sales: float
     total_withdrawals: float = 0.0  # For future use
+    reserved_gbp: float = 0.0  # Held by open limit buy orders
 
 
 @router.get("/{account_id}/balance", response_model=AccountBalanceResponse)
@@ -288,5 +289,6 @@ def get_account_balance(
         account_name=account.name,
         balance_gbp=round(balance_gbp, 2),
         total_sales=round(total_sales, 2),
-        total_withdrawals=round(float(total_withdrawals), 2)
+        total_withdrawals=round(float(total_withdrawals), 2),
+        reserved_gbp=round(get_reserved_balance(account, db), 2)
     )
@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from ..db import SessionLocal
-from ..models import Account, AccountRole, Trade, BotOrder, MarketMakingBot, Scheme, SellLadderBot, SellLadderBotOrder
+from ..models import Account, AccountRole, Order, Trade, BotOrder, MarketMakingBot, Scheme, SellLadderBot, SellLadderBotOrder
 from ..services.broker import get_broker_client_holdings, get_broker_house_holdings, get_broker_mandates
 from ..services.market_making_bot import (
     create_bot, get_bot, list_bots, update_bot_strategy,
@@ -743,18 +743,23 @@ def get_broker_trades(
     if not broker:
         raise HTTPException(status_code=404, detail="Broker account not found")
     
-    # Get all bot orders for this broker
-    query = db.query(BotOrder).join(MarketMakingBot).filter(
-        MarketMakingBot.broker_account_id == broker_account_id
-    )
-    
-    if bot_id:
-        query = query.filter(BotOrder.bot_id == bot_id)
+    # Trades filled by the broker's bot orders: join each trade to the order on
+    # the bot's side of the fill (trades record the buy and sell order they filled)
+    def bot_fills(order_column, side):
+        query = db.query(Trade, BotOrder).join(
+            BotOrder, BotOrder.order_id == order_column
+        ).join(
+            MarketMakingBot, MarketMakingBot.id == BotOrder.bot_id
+        ).filter(
+            MarketMakingBot.broker_account_id == broker_account_id
+        )
+        if bot_id:
+            query = query.filter(BotOrder.bot_id == bot_id)
+        return [(trade, bot_order, side) for trade, bot_order in query.all()]
     
-    bot_orders = query.all()
-    bot_order_ids = [bo.order_id for bo in bot_orders]
+    fills = bot_fills(Trade.sell_order_id, "SELL") + bot_fills(Trade.buy_order_id, "BUY")
     
-    if not bot_order_ids:
+    if not fills:
         return BotTradesResponse(
             broker_account_id=broker.id,
             broker_name=broker.name,
@@ -762,103 +767,64 @@ def get_broker_trades(
             total_pnl=0.0
         )
     
-    # Get all orders that belong to bots
-    from ..models import Order
-    bot_order_objs = db.query(Order).filter(Order.id.in_(bot_order_ids)).all()
-    bot_order_map = {o.id: o for o in bot_order_objs}
-    
-    # Get all trades where broker's orders were involved
-    trades = db.query(Trade).filter(
-        ((Trade.buyer_account_id == broker_account_id) | (Trade.seller_account_id == broker_account_id))
-    ).order_by(Trade.created_at.desc()).all()
+    # Load the bots, schemes and counterparties once for all fills
+    bots = {b.id: b for b in db.query(MarketMakingBot).filter(
+        MarketMakingBot.id.in_({bot_order.bot_id for _, bot_order, _ in fills})
+    ).all()}
+    schemes = {s.id: s for s in db.query(Scheme).filter(
+        Scheme.id.in_({trade.scheme_id for trade, _, _ in fills})
+    ).all()}
+    counterparty_ids = {
+        trade.buyer_account_id if side == "SELL" else trade.seller_account_id
+        for trade, _, side in fills
+    }
+    counterparties = {a.id: a for a in db.query(Account).filter(Account.id.in_(counterparty_ids)).all()}
+    
+    # (bot, scheme) pairs the bot holds house account credits in
+    from ..models import FIFOCreditQueue, BotAssignment
+    house_queues = set(db.query(FIFOCreditQueue.bot_id, FIFOCreditQueue.scheme_id).join(
+        BotAssignment, BotAssignment.id == FIFOCreditQueue.assignment_id
+    ).filter(
+        FIFOCreditQueue.bot_id.in_(bots.keys()),
+        BotAssignment.is_house_account == 1,
+        BotAssignment.is_active == 1
+    ).all())
     
-    # Filter to only trades from bot orders by checking order fills
     bot_trades = []
-    for trade in trades:
-        # Find orders that were filled around this trade time and match the trade
-        # Check if any bot order matches this trade
-        matching_order = None
-        for order_id in bot_order_ids:
-            order = bot_order_map.get(order_id)
-            if not order:
-                continue
-            
-            # Check if this order could have generated this trade
-            # Order must match scheme, side, and be filled around trade time
-            if (order.scheme_id == trade.scheme_id and 
-                order.filled_quantity > 0 and
-                abs((order.updated_at - trade.created_at).total_seconds()) < 60):  # Within 60 seconds
-                
-                # Verify side matches
-                if ((order.side == "SELL" and trade.seller_account_id == broker_account_id) or
-                    (order.side == "BUY" and trade.buyer_account_id == broker_account_id)):
-                    matching_order = order
-                    break
+    for trade, bot_order, side in fills:
+        bot = bots[bot_order.bot_id]
+        scheme = schemes.get(trade.scheme_id)
+        counterparty = counterparties.get(trade.buyer_account_id if side == "SELL" else trade.seller_account_id)
         
-        if matching_order and matching_order.id in bot_order_ids:
-            bot_order = db.query(BotOrder).filter(BotOrder.order_id == matching_order.id).first()
-            bot = db.query(MarketMakingBot).filter(MarketMakingBot.id == bot_order.bot_id).first()
-            scheme = db.query(Scheme).filter(Scheme.id == trade.scheme_id).first()
-            
-            # Determine counterparty
-            if trade.buyer_account_id == broker_account_id:
-                counterparty = db.query(Account).filter(Account.id == trade.seller_account_id).first()
-                side = "BUY"
+        # Calculate PnL for bot sales
+        pnl = None
+        if side == "SELL":
+            if (bot.id, trade.scheme_id) in house_queues:
+                # House account trade - credits were received as fees (no cost basis)
+                # PnL = full sale price (pure profit)
+                pnl = trade.total_price
             else:
-                counterparty = db.query(Account).filter(Account.id == trade.buyer_account_id).first()
-                side = "SELL"
-            
-            # Calculate PnL for house account trades
-            pnl = None
-            if bot_order and side == "SELL":
-                # Check if this trade is from house account
-                # Find the assignment and queue entry for this scheme
-                from ..models import FIFOCreditQueue, BotAssignment
-                
-                # Get all house account assignments for this bot
-                house_assignments = db.query(BotAssignment).filter(
-                    BotAssignment.bot_id == bot.id,
-                    BotAssignment.is_house_account == 1,
-                    BotAssignment.is_active == 1
-                ).all()
-                
-                house_assignment_ids = [a.id for a in house_assignments]
-                
-                # Check if there's a house queue entry for this scheme
-                house_queue = None
-                if house_assignment_ids:
-                    house_queue = db.query(FIFOCreditQueue).filter(
-                        FIFOCreditQueue.bot_id == bot.id,
-                        FIFOCreditQueue.scheme_id == scheme.id,
-                        FIFOCreditQueue.assignment_id.in_(house_assignment_ids)
-                    ).first()
-                
-                if house_queue:
-                    # House account trade - credits were received as fees (no cost basis)
-                    # PnL = full sale price (pure profit)
-                    pnl = trade.total_price
-                else:
-                    # Client account trade - use strategy price as cost basis
-                    cost_basis = bot_order.strategy_price
-                    sale_price = trade.price_per_unit
-                    pnl = (sale_price - cost_basis) * trade.quantity_units
-            
-            bot_trades.append({
-                "trade_id": trade.id,
-                "bot_id": bot.id,
-                "bot_name": bot.name,
-                "side": side,
-                "scheme_id": scheme.id,
-                "scheme_name": scheme.name,
-                "quantity_units": trade.quantity_units,
-                "price_per_unit": trade.price_per_unit,
-                "total_price": trade.total_price,
-                "counterparty_account_id": counterparty.id if counterparty else 0,
-                "counterparty_name": counterparty.name if counterparty else "Unknown",
-                "transaction_hash": trade.transaction_hash,
-                "created_at": trade.created_at.isoformat() if trade.created_at else "",
-                "pnl": pnl
-            })
+                # Client account trade - use strategy price as cost basis
+                cost_basis = bot_order.strategy_price
+                sale_price = trade.price_per_unit
+                pnl = (sale_price - cost_basis) * trade.quantity_units
+        
+        bot_trades.append({
+            "trade_id": trade.id,
+            "bot_id": bot.id,
+            "bot_name": bot.name,
+            "side": side,
+            "scheme_id": trade.scheme_id,
+            "scheme_name": scheme.name if scheme else "",
+            "quantity_units": trade.quantity_units,
+            "price_per_unit": trade.price_per_unit,
+            "total_price": trade.total_price,
+            "counterparty_account_id": counterparty.id if counterparty else 0,
+            "counterparty_name": counterparty.name if counterparty else "Unknown",
+            "transaction_hash": trade.transaction_hash,
+            "created_at": trade.created_at.isoformat() if trade.created_at else "",
+            "pnl": pnl
+        })
     
     # Sort by created_at descending
     bot_trades.sort(key=lambda x: x["created_at"], reverse=True)
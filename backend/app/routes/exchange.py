@@ -1,17 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Request, Response, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional, Dict
-from ..db import SessionLocal
+from datetime import datetime
+from ..db import SessionLocal, is_postgresql
 from ..models import ExchangeListing, Account, Scheme, Trade, Order, PriceHistory, AccountRole
 from ..services.exchange import check_seller_has_sufficient_credits, transfer_credits_on_chain
 from ..services.order_matching import match_order
+from ..services.batch_orders import BatchOrder, apply_order_batch, MAX_BATCH_ITEMS
+from ..services.order_book import get_order_book, read_order_book
+from ..services.market_feed import get_market_feed
+from ..services.read_cache import cached_response, market_version, TRADES_VERSION
+from ..services.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, Page, merge_newest_first, newest_first, page_of, parse_cursor, set_next_cursor
+)
 from ..services.price_history import update_price_history, get_price_history
-from ..services.balance_check import check_buyer_has_sufficient_balance
+from ..services.balance_check import check_buyer_has_sufficient_balance, record_trade_cash
+from ..services.settlement import resolve_order_funding
+from ..services.latency import traced, stage, lap
+from ..services.market_actor import run_in_market
+from ..services.reservations import (
+    reserve_order,
+    release_order,
+    reserve_listing,
+    release_listing,
+    get_reserved_credits_by_scheme
+)
+import asyncio
+import json
 import os
 
 router = APIRouter()
 
+# SSE comment sent when a market is quiet, so proxies keep the connection open
+SSE_KEEPALIVE_SECONDS = 15
+
 
 def get_db():
     """Dependency to get database session"""
@@ -59,6 +84,9 @@ class TradeResponse(BaseModel):
     price_per_unit: float
     total_price: float
     transaction_hash: Optional[str]
+    status: Optional[str] = None  # PENDING_SETTLEMENT, SETTLED, SETTLEMENT_FAILED
+    buy_order_id: Optional[int] = None  # Orders that filled (None for listing purchases)
+    sell_order_id: Optional[int] = None
     created_at: str
 
     model_config = {"from_attributes": True}
@@ -101,6 +129,38 @@ class OrderResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class BatchOrderItem(BaseModel):
+    side: str  # "BUY" or "SELL"
+    price_per_unit: float
+    quantity_units: int
+    scheme_id: Optional[int] = None  # Required for SELL orders
+
+
+class BatchOrdersRequest(BaseModel):
+    account_id: int
+    catchment: str
+    unit_type: str
+    orders: List[BatchOrderItem] = []
+    cancel_order_ids: List[int] = []
+
+
+class BatchItemResponse(BaseModel):
+    index: int
+    status: str  # ACCEPTED, CANCELLED, ALREADY_CLOSED, REJECTED, NOT_APPLIED or MATCH_FAILED
+    order_id: Optional[int] = None
+    error: Optional[str] = None
+    order_status: Optional[str] = None
+    filled_quantity: int = 0
+    remaining_quantity: int = 0
+
+
+class BatchOrdersResponse(BaseModel):
+    applied: bool
+    orders: List[BatchItemResponse]
+    cancels: List[BatchItemResponse]
+    trade_count: int
+
+
 class MultipleOrdersResponse(BaseModel):
     """Response for orders that were split across multiple schemes"""
     orders: List[OrderResponse]
@@ -183,6 +243,7 @@ def create_listing(request: CreateListingRequest, db: Session = Depends(get_db))
         status="ACTIVE"
     )
     
+    reserve_listing(listing, db)
     db.add(listing)
     db.commit()
     db.refresh(listing)
@@ -313,6 +374,7 @@ def buy_listing(
     total_price = request.quantity_units * listing.price_per_unit
     
     # Update listing
+    release_listing(listing, request.quantity_units, db)
     listing.quantity_units -= request.quantity_units
     if listing.quantity_units == 0:
         listing.status = "SOLD"
@@ -330,6 +392,7 @@ def buy_listing(
     )
     
     db.add(trade)
+    record_trade_cash(trade, db)
     db.commit()
     db.refresh(trade)
     
@@ -343,12 +406,14 @@ def buy_listing(
         price_per_unit=trade.price_per_unit,
         total_price=trade.total_price,
         transaction_hash=trade.transaction_hash,
+        status=trade.status,
         created_at=trade.created_at.isoformat() if trade.created_at else ""
     )
 
 
 # New order endpoints
 @router.post("/orders/limit", response_model=OrderResponse)
+@traced("create_limit_order")
 def create_limit_order(request: CreateLimitOrderRequest, db: Session = Depends(get_db)):
     """
     Create a limit order (buy or sell).
@@ -374,6 +439,7 @@ def create_limit_order(request: CreateLimitOrderRequest, db: Session = Depends(g
     
     if not account.evm_address:
         raise HTTPException(status_code=400, detail="Account does not have an EVM address")
+    lap("validation")
     
     # For BUY orders, validate available balance
     if request.side == "BUY":
@@ -391,6 +457,7 @@ def create_limit_order(request: CreateLimitOrderRequest, db: Session = Depends(g
                 status_code=400,
                 detail=f"Insufficient balance. Available: £{available_balance:,.2f}, Required: £{max_cost:,.2f}"
             )
+        lap("balance_check")
     
     # For SELL orders, validate available credits in the specified catchment
     scheme = None
@@ -405,6 +472,7 @@ def create_limit_order(request: CreateLimitOrderRequest, db: Session = Depends(g
             db,
             trading_account_address=trading_account_address if account.role == AccountRole.LANDOWNER else None
         )
+        lap("credits_summary")
         
         # Filter holdings by the requested catchment and unit_type
         matching_holdings = [
@@ -435,24 +503,10 @@ def create_limit_order(request: CreateLimitOrderRequest, db: Session = Depends(g
                 # Others sell from their personal balance
                 total_available_credits += max(0, h["credits"] - h.get("locked_credits", 0))
         
-        # Check existing reservations (listings and orders) in this catchment/unit_type
-        existing_listings = db.query(ExchangeListing).filter(
-            ExchangeListing.owner_account_id == account.id,
-            ExchangeListing.catchment == request.catchment.upper(),
-            ExchangeListing.unit_type == request.unit_type.lower(),
-            ExchangeListing.status == "ACTIVE"
-        ).all()
-        
-        existing_orders = db.query(Order).filter(
-            Order.account_id == account.id,
-            Order.side == "SELL",
-            Order.catchment == request.catchment.upper(),
-            Order.unit_type == request.unit_type.lower(),
-            Order.status.in_(["PENDING", "PARTIALLY_FILLED"])
-        ).all()
-        
-        reserved_credits = sum(listing.quantity_units for listing in existing_listings)
-        reserved_credits += sum(order.remaining_quantity for order in existing_orders)
+        # Existing reservations (listings and orders) in this catchment/unit_type, per scheme
+        reserved_by_scheme = get_reserved_credits_by_scheme(account.id, request.catchment, request.unit_type, db)
+        reserved_credits = sum(reserved_by_scheme.values())
+        lap("reservations")
         
         # Free credits = total available minus already reserved
         free_credits = total_available_credits - reserved_credits
@@ -489,20 +543,7 @@ def create_limit_order(request: CreateLimitOrderRequest, db: Session = Depends(g
                     scheme_available = max(0, holding["credits"] - holding.get("locked_credits", 0))
                 
                 # Subtract already reserved credits for this scheme
-                scheme_listings = db.query(ExchangeListing).filter(
-                    ExchangeListing.owner_account_id == account.id,
-                    ExchangeListing.scheme_id == scheme_id,
-                    ExchangeListing.status == "ACTIVE"
-                ).all()
-                scheme_orders = db.query(Order).filter(
-                    Order.account_id == account.id,
-                    Order.side == "SELL",
-                    Order.scheme_id == scheme_id,
-                    Order.status.in_(["PENDING", "PARTIALLY_FILLED"])
-                ).all()
-                
-                scheme_reserved = sum(l.quantity_units for l in scheme_listings)
-                scheme_reserved += sum(o.remaining_quantity for o in scheme_orders)
+                scheme_reserved = reserved_by_scheme.get(scheme_id, 0)
                 scheme_free = max(0, scheme_available - scheme_reserved)
                 
                 if scheme_free > 0:
@@ -523,6 +564,8 @@ def create_limit_order(request: CreateLimitOrderRequest, db: Session = Depends(g
                            f"Created {len(scheme_allocations)} order(s) for {request.quantity_units - remaining_to_allocate:,} credits."
                 )
             
+            lap("allocation")
+            
             # Create separate orders for each scheme
             created_orders = []
             all_trades = []
@@ -542,13 +585,17 @@ def create_limit_order(request: CreateLimitOrderRequest, db: Session = Depends(g
                     scheme_id=allocation["scheme"].id,
                     nft_token_id=allocation["scheme"].nft_token_id
                 )
+                resolve_order_funding(order, account, db)
                 
+                reserve_order(order, db)
                 db.add(order)
                 db.flush()  # Flush to get order ID
+                lap("persist")
                 
                 # Attempt to match the order
                 try:
-                    trades = match_order(order, db)
+                    with stage("match"):
+                        trades = match_order(order, db)
                     all_trades.extend(trades)
                     
                     # Update price history for each trade
@@ -556,16 +603,17 @@ def create_limit_order(request: CreateLimitOrderRequest, db: Session = Depends(g
                         update_price_history(trade, db)
                     
                     db.refresh(order)
+                    lap("price_history")
                 except Exception as e:
                     print(f"Error matching order {order.id}: {str(e)}")
                 
                 created_orders.append(order)
             
             db.commit()
+            lap("commit")
             
             # If multiple orders were created, return a list
             if len(created_orders) > 1:
-                from fastapi import Response
                 return MultipleOrdersResponse(
                     orders=[
                         OrderResponse(
@@ -634,19 +682,23 @@ def create_limit_order(request: CreateLimitOrderRequest, db: Session = Depends(g
         nft_token_id=scheme.nft_token_id if scheme else None
     )
     
+    reserve_order(order, db)
     db.add(order)
     db.commit()
     db.refresh(order)
+    lap("persist")
     
     # Attempt to match the order
     try:
-        trades = match_order(order, db)
+        with stage("match"):
+            trades = match_order(order, db)
         
         # Update price history for each trade
         for trade in trades:
             update_price_history(trade, db)
         
         db.refresh(order)
+        lap("price_history")
     except Exception as e:
         print(f"Error matching order: {str(e)}")
         # Order still created, just not matched
@@ -670,6 +722,7 @@ def create_limit_order(request: CreateLimitOrderRequest, db: Session = Depends(g
 
 
 @router.post("/orders/market", response_model=OrderResponse)
+@traced("create_market_order")
 def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends(get_db)):
     """
     Create a market order (buy or sell).
@@ -695,6 +748,7 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
         
         if not account.evm_address:
             raise HTTPException(status_code=400, detail="Account does not have an EVM address")
+        lap("validation")
         
         # For BUY orders, validate available balance
         # Note: For market orders, we can't know the exact cost upfront, so we'll check during matching
@@ -711,6 +765,7 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
                     status_code=400,
                     detail=f"Insufficient balance. Available: £{available_balance:,.2f}"
                 )
+            lap("balance_check")
         
         # For SELL orders, validate available credits
         scheme = None
@@ -725,6 +780,7 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
                 db,
                 trading_account_address=trading_account_address if account.role == AccountRole.LANDOWNER else None
             )
+            lap("credits_summary")
             
             # Filter holdings by the requested catchment and unit_type
             matching_holdings = [
@@ -755,24 +811,10 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
                     # Others sell from their personal balance
                     total_available_credits += max(0, h["credits"] - h.get("locked_credits", 0))
             
-            # Check existing reservations in this catchment/unit_type
-            existing_listings = db.query(ExchangeListing).filter(
-                ExchangeListing.owner_account_id == account.id,
-                ExchangeListing.catchment == request.catchment.upper(),
-                ExchangeListing.unit_type == request.unit_type.lower(),
-                ExchangeListing.status == "ACTIVE"
-            ).all()
-            
-            existing_orders = db.query(Order).filter(
-                Order.account_id == account.id,
-                Order.side == "SELL",
-                Order.catchment == request.catchment.upper(),
-                Order.unit_type == request.unit_type.lower(),
-                Order.status.in_(["PENDING", "PARTIALLY_FILLED"])
-            ).all()
-            
-            reserved_credits = sum(listing.quantity_units for listing in existing_listings)
-            reserved_credits += sum(order.remaining_quantity for order in existing_orders)
+            # Existing reservations in this catchment/unit_type, per scheme
+            reserved_by_scheme = get_reserved_credits_by_scheme(account.id, request.catchment, request.unit_type, db)
+            reserved_credits = sum(reserved_by_scheme.values())
+            lap("reservations")
             
             free_credits = total_available_credits - reserved_credits
             if free_credits < 0:
@@ -806,20 +848,7 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
                     scheme_available = max(0, holding["credits"] - holding.get("locked_credits", 0))
                 
                 # Subtract already reserved credits for this scheme
-                scheme_listings = db.query(ExchangeListing).filter(
-                    ExchangeListing.owner_account_id == account.id,
-                    ExchangeListing.scheme_id == scheme_id,
-                    ExchangeListing.status == "ACTIVE"
-                ).all()
-                scheme_orders = db.query(Order).filter(
-                    Order.account_id == account.id,
-                    Order.side == "SELL",
-                    Order.scheme_id == scheme_id,
-                    Order.status.in_(["PENDING", "PARTIALLY_FILLED"])
-                ).all()
-                
-                scheme_reserved = sum(l.quantity_units for l in scheme_listings)
-                scheme_reserved += sum(o.remaining_quantity for o in scheme_orders)
+                scheme_reserved = reserved_by_scheme.get(scheme_id, 0)
                 scheme_free = max(0, scheme_available - scheme_reserved)
                 
                 if scheme_free > 0:
@@ -840,6 +869,8 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
                            f"Created {len(scheme_allocations)} order(s) for {request.quantity_units - remaining_to_allocate:,} credits."
                 )
             
+            lap("allocation")
+            
             # Create separate orders for each scheme
             created_orders = []
             all_trades = []
@@ -859,14 +890,18 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
                     scheme_id=allocation["scheme"].id,
                     nft_token_id=allocation["scheme"].nft_token_id
                 )
+                resolve_order_funding(order, account, db)
                 
+                reserve_order(order, db)
                 db.add(order)
                 db.flush()  # Flush to get order ID
+                lap("persist")
                 
                 # Attempt to match the order immediately
                 try:
                     print(f"[MARKET_ORDER] Attempting to match market {request.side} order for {request.catchment} {request.unit_type}, quantity: {allocation['quantity']}, scheme: {allocation['scheme'].name}")
-                    trades = match_order(order, db)
+                    with stage("match"):
+                        trades = match_order(order, db)
                     print(f"[MARKET_ORDER] Match completed, created {len(trades)} trades")
                     all_trades.extend(trades)
                     
@@ -878,6 +913,7 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
                             print(f"[MARKET_ORDER] ERROR updating price history for trade {trade.id}: {str(e)}")
                     
                     db.refresh(order)
+                    lap("price_history")
                     print(f"[MARKET_ORDER] Order {order.id} status after matching: {order.status}, filled: {order.filled_quantity}, remaining: {order.remaining_quantity}")
                     
                     # If market order couldn't be fully filled, cancel remaining
@@ -885,10 +921,12 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
                         if order.filled_quantity == 0:
                             # No matches at all - reject the order
                             print(f"[MARKET_ORDER] Market order {order.id} could not be filled - no matching orders available. Cancelling order.")
+                            release_order(order, order.remaining_quantity, db)
                             order.status = "CANCELLED"
                         else:
                             # Partially filled
                             print(f"[MARKET_ORDER] Market order {order.id} partially filled ({order.filled_quantity}/{order.quantity_units}), cancelling remaining {order.remaining_quantity}")
+                            release_order(order, order.remaining_quantity, db)
                             order.status = "CANCELLED"
                     elif order.remaining_quantity == 0 and order.filled_quantity > 0:
                         print(f"[MARKET_ORDER] Market order {order.id} fully filled: {order.filled_quantity} credits")
@@ -898,6 +936,7 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
                 created_orders.append(order)
             
             db.commit()
+            lap("commit")
             
             # If multiple orders were created, return the first one
             if len(created_orders) > 1:
@@ -948,11 +987,13 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
         db.add(order)
         db.commit()
         db.refresh(order)
+        lap("persist")
         
         # Attempt to match the order immediately
         try:
             print(f"[MARKET_ORDER] Attempting to match market {request.side} order for {request.catchment} {request.unit_type}, quantity: {request.quantity_units}")
-            trades = match_order(order, db)
+            with stage("match"):
+                trades = match_order(order, db)
             print(f"[MARKET_ORDER] Match completed, created {len(trades)} trades")
             
             # Update price history for each trade
@@ -964,6 +1005,7 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
                     db.rollback()
             
             db.refresh(order)
+            lap("price_history")
             print(f"[MARKET_ORDER] Order status after matching: {order.status}, filled: {order.filled_quantity}, remaining: {order.remaining_quantity}")
             
             # If market order couldn't be fully filled, cancel remaining
@@ -1030,90 +1072,173 @@ def create_market_order(request: CreateMarketOrderRequest, db: Session = Depends
 
 @router.get("/orderbook", response_model=OrderBookResponse)
 def get_orderbook(
+    request: Request,
     catchment: str = Query(..., description="Catchment to get order book for"),
     unit_type: str = Query(..., description="Unit type (nitrate/phosphate)"),
     db: Session = Depends(get_db)
 ):
     """
     Get the order book (bids and asks) for a specific catchment + unit_type.
+    Cached per market version; supports If-None-Match. On PostgreSQL it is read
+    from the orders table on every request (see services.read_cache).
     """
     # Normalize catchment and unit_type for filtering
     normalized_catchment = catchment.upper()
     normalized_unit_type = unit_type.lower()
     
+    return cached_response(
+        request,
+        "orderbook",
+        {"catchment": normalized_catchment, "unit_type": normalized_unit_type},
+        market_version(normalized_catchment, normalized_unit_type),
+        lambda: _build_orderbook(normalized_catchment, normalized_unit_type, db)
+    )
+
+
+def _build_orderbook(normalized_catchment: str, normalized_unit_type: str, db: Session) -> OrderBookResponse:
     print(f"[ORDERBOOK] Fetching order book for catchment='{normalized_catchment}', unit_type='{normalized_unit_type}'")
     
-    # Get pending/partially filled orders - use case-insensitive comparison with func.upper()
-    from sqlalchemy import func
-    buy_orders = db.query(Order).filter(
-        Order.side == "BUY",
-        func.upper(Order.catchment) == normalized_catchment,
-        func.lower(Order.unit_type) == normalized_unit_type,
-        Order.status.in_(["PENDING", "PARTIALLY_FILLED"])
-    ).order_by(Order.price_per_unit.desc(), Order.created_at.asc()).all()
-    
-    sell_orders = db.query(Order).filter(
-        Order.side == "SELL",
-        func.upper(Order.catchment) == normalized_catchment,
-        func.lower(Order.unit_type) == normalized_unit_type,
-        Order.status.in_(["PENDING", "PARTIALLY_FILLED"])
-    ).order_by(Order.price_per_unit.asc(), Order.created_at.asc()).all()
-    
-    print(f"[ORDERBOOK] Found {len(buy_orders)} buy orders and {len(sell_orders)} sell orders")
-    if sell_orders:
-        print(f"[ORDERBOOK] First sell order: ID={sell_orders[0].id}, catchment='{sell_orders[0].catchment}', unit_type='{sell_orders[0].unit_type}'")
-        # Verify all sell orders have correct catchment
-        for order in sell_orders:
-            if order.catchment.upper() != normalized_catchment:
-                print(f"[ORDERBOOK] WARNING: Order {order.id} has catchment '{order.catchment}' but filter requested '{normalized_catchment}'")
+    # Served from the in-memory book (already aggregated by price level). On PostgreSQL
+    # other API processes place orders this process's book never sees, so read the table.
+    if is_postgresql(db):
+        book = read_order_book(normalized_catchment, normalized_unit_type, db)
+    else:
+        book = get_order_book(normalized_catchment, normalized_unit_type, db)
     
-    # Aggregate by price
-    bids_dict = {}
-    for order in buy_orders:
-        if order.price_per_unit:
-            price = order.price_per_unit
-            if price not in bids_dict:
-                bids_dict[price] = 0
-            bids_dict[price] += order.remaining_quantity
-    
-    asks_dict = {}
-    for order in sell_orders:
-        if order.price_per_unit:
-            price = order.price_per_unit
-            if price not in asks_dict:
-                asks_dict[price] = 0
-            asks_dict[price] += order.remaining_quantity
-    
-    # Convert to list and calculate totals
     bids = []
     total_bids = 0
-    for price in sorted(bids_dict.keys(), reverse=True):
-        quantity = bids_dict[price]
+    for price, quantity in book.depth("BUY"):
         total_bids += quantity
         bids.append(OrderBookEntry(price=price, quantity=quantity, total=total_bids))
     
     asks = []
     total_asks = 0
-    for price in sorted(asks_dict.keys()):
-        quantity = asks_dict[price]
+    for price, quantity in book.depth("SELL"):
         total_asks += quantity
         asks.append(OrderBookEntry(price=price, quantity=quantity, total=total_asks))
     
+    print(f"[ORDERBOOK] {len(bids)} bid levels and {len(asks)} ask levels")
+    
     return OrderBookResponse(bids=bids, asks=asks)
 
 
+async def _subscribe(catchment: str, unit_type: str, db: Session):
+    """Subscribe to a market feed, loading the order book off the event loop; the session is released afterwards."""
+    loop = asyncio.get_running_loop()
+    try:
+        return await run_in_threadpool(get_market_feed().subscribe, catchment, unit_type, db, loop)
+    finally:
+        db.close()
+
+
+@router.websocket("/stream")
+async def stream_market_websocket(
+    websocket: WebSocket,
+    catchment: str = Query(..., description="Catchment"),
+    unit_type: str = Query(..., description="Unit type (nitrate/phosphate)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Push feed for a catchment + unit_type: an order book snapshot, then
+    sequence-numbered level changes and trade prints (see services/market_feed).
+    """
+    await websocket.accept()
+    subscription, snapshot = await _subscribe(catchment, unit_type, db)
+    print(f"[STREAM] WebSocket subscribed to {subscription.market[0]} {subscription.market[1]}")
+
+    async def pump():
+        await websocket.send_json(snapshot)
+        while True:
+            message = await subscription.get()
+            if message is None:
+                break
+            await websocket.send_json(message)
+
+    async def watch_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(watch_disconnect())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        if tasks[0] in done and tasks[0].exception() is None:
+            # Feed ended (slow consumer or shutdown)
+            await websocket.close()
+    finally:
+        for task in tasks:
+            task.cancel()
+        get_market_feed().unsubscribe(subscription)
+        print(f"[STREAM] WebSocket unsubscribed from {subscription.market[0]} {subscription.market[1]}")
+
+
+@router.get("/stream/sse")
+async def stream_market_sse(
+    catchment: str = Query(..., description="Catchment"),
+    unit_type: str = Query(..., description="Unit type (nitrate/phosphate)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Server-Sent Events version of /stream: each message is an event whose id is
+    its sequence number and whose type is snapshot, levels, trade or error.
+    """
+    subscription, snapshot = await _subscribe(catchment, unit_type, db)
+
+    def encode(message: Dict) -> str:
+        return f"id: {message['seq']}\nevent: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+    async def events():
+        try:
+            yield encode(snapshot)
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield encode(message) if "seq" in message else f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+        finally:
+            get_market_feed().unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @router.get("/price-history", response_model=List[CandlestickData])
 def get_price_history_endpoint(
+    request: Request,
     catchment: str = Query(..., description="Catchment"),
     unit_type: str = Query(..., description="Unit type (nitrate/phosphate)"),
     timeframe: str = Query(..., description="Timeframe: 1min, 5min, 15min, 1hr, 4hr, 1day"),
     limit: int = Query(100, description="Maximum number of candles to return"),
+    start: Optional[datetime] = Query(None, alias="from", description="Earliest candle start (ISO 8601, UTC)"),
+    end: Optional[datetime] = Query(None, alias="to", description="Latest candle start (ISO 8601, UTC)"),
     db: Session = Depends(get_db)
 ):
     """
-    Get price history (candlestick data) for a catchment + unit_type + timeframe.
+    Get price history (candlestick data) for a catchment + unit_type + timeframe,
+    optionally within a from/to time range. Cached per market version; supports If-None-Match.
     """
-    candles = get_price_history(catchment, unit_type, timeframe, limit, db)
+    return cached_response(
+        request,
+        "price-history",
+        {"catchment": catchment.upper(), "unit_type": unit_type.lower(), "timeframe": timeframe,
+         "limit": limit, "from": start, "to": end},
+        market_version(catchment, unit_type),
+        lambda: _build_price_history(catchment, unit_type, timeframe, limit, start, end, db)
+    )
+
+
+def _build_price_history(
+    catchment: str,
+    unit_type: str,
+    timeframe: str,
+    limit: int,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    db: Session
+) -> List[CandlestickData]:
+    candles = get_price_history(catchment, unit_type, timeframe, limit, db, start=start, end=end)
     
     return [
         CandlestickData(
@@ -1180,6 +1305,7 @@ def cancel_order(
 ):
     """
     Cancel a pending or partially filled order.
+    Runs on the market's actor, so it cannot interleave with a fill of the same order.
     """
     order = db.query(Order).filter(Order.id == order_id).first()
     if not order:
@@ -1188,30 +1314,68 @@ def cancel_order(
     if order.account_id != account_id:
         raise HTTPException(status_code=403, detail="You can only cancel your own orders")
     
-    if order.status not in ["PENDING", "PARTIALLY_FILLED"]:
-        raise HTTPException(status_code=400, detail=f"Cannot cancel order with status: {order.status}")
+    def cancel():
+        # On PostgreSQL lock the row until the commit: a matcher in another API process
+        # skips it, and one already filling it commits first and the cancel sees the fill
+        db.refresh(order, with_for_update=is_postgresql(db))
+        if order.status not in ["PENDING", "PARTIALLY_FILLED"]:
+            raise HTTPException(status_code=400, detail=f"Cannot cancel order with status: {order.status}")
+        
+        release_order(order, order.remaining_quantity, db)
+        order.status = "CANCELLED"
+        db.commit()
     
-    order.status = "CANCELLED"
-    db.commit()
+    run_in_market(order.catchment, order.unit_type, cancel)
     
     return {"success": True, "message": f"Order {order_id} cancelled"}
 
 
+@router.post("/orders/batch", response_model=BatchOrdersResponse)
+def create_order_batch(request: BatchOrdersRequest, db: Session = Depends(get_db)):
+    """
+    Place several limit orders and cancel several orders in one market as a unit
+    (cancel-replace). Everything is validated together and applied in one
+    transaction; if any item is invalid nothing is applied and the 400 response
+    carries the per-item results.
+    """
+    if len(request.orders) + len(request.cancel_order_ids) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {MAX_BATCH_ITEMS} orders and cancels")
+    
+    batch = apply_order_batch(
+        request.account_id,
+        request.catchment,
+        request.unit_type,
+        [BatchOrder(**item.model_dump()) for item in request.orders],
+        request.cancel_order_ids,
+        db
+    )
+    response = BatchOrdersResponse(
+        applied=batch.applied,
+        orders=[BatchItemResponse(**vars(result)) for result in batch.orders],
+        cancels=[BatchItemResponse(**vars(result)) for result in batch.cancels],
+        trade_count=len(batch.trades)
+    )
+    if not batch.applied:
+        raise HTTPException(status_code=400, detail=response.model_dump())
+    return response
+
+
 @router.get("/orders/completed", response_model=List[OrderResponse])
 def get_completed_orders(
+    response: Response,
     account_id: int = Query(..., description="Account ID"),
     catchment: Optional[str] = Query(None, description="Filter by catchment"),
     unit_type: Optional[str] = Query(None, description="Filter by unit type"),
-    limit: int = Query(50, description="Maximum number of orders to return"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of orders to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
     db: Session = Depends(get_db)
 ):
     """
-    Get user's completed orders (filled or cancelled).
+    Get user's completed orders (filled or cancelled), newest first.
+    The X-Next-Cursor response header is the cursor for the next page.
     """
-    query = db.query(Order).filter(
-        Order.account_id == account_id,
-        Order.status.in_(["FILLED", "CANCELLED"])
-    )
+    after_id = parse_cursor("completed-orders", cursor)
+    query = db.query(Order).filter(Order.account_id == account_id)
     
     if catchment:
         query = query.filter(Order.catchment == catchment.upper())
@@ -1219,7 +1383,12 @@ def get_completed_orders(
     if unit_type:
         query = query.filter(Order.unit_type == unit_type.lower())
     
-    orders = query.order_by(Order.created_at.desc()).limit(limit).all()
+    # One (account, status, created_at, id) index range per status, merged, so no sort
+    orders = merge_newest_first(*(
+        newest_first(query.filter(Order.status == status), Order, limit, after_id) for status in ("FILLED", "CANCELLED")
+    ))
+    page = page_of("completed-orders", orders, limit)
+    set_next_cursor(response, page)
     
     return [
         OrderResponse(
@@ -1238,37 +1407,62 @@ def get_completed_orders(
             created_at=order.created_at.isoformat() if order.created_at else "",
             updated_at=order.updated_at.isoformat() if order.updated_at else ""
         )
-        for order in orders
+        for order in page.items
     ]
 
 
 @router.get("/trades", response_model=List[TradeResponse])
 def get_trades(
+    request: Request,
     account_id: int = Query(..., description="Account ID"),
     catchment: Optional[str] = Query(None, description="Filter by catchment"),
     unit_type: Optional[str] = Query(None, description="Filter by unit type"),
-    limit: int = Query(50, description="Maximum number of trades to return"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of trades to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
     db: Session = Depends(get_db)
 ):
     """
-    Get trades where the user was either buyer or seller.
+    Get trades where the user was either buyer or seller, newest first.
+    The X-Next-Cursor response header is the cursor for the next page.
+    Cached per market version (or any-trade version without a market); supports If-None-Match.
     """
-    from ..models import Scheme
-    query = db.query(Trade).filter(
-        (Trade.buyer_account_id == account_id) | (Trade.seller_account_id == account_id)
+    after_id = parse_cursor("trades", cursor)
+    version_key = market_version(catchment, unit_type) if catchment and unit_type else TRADES_VERSION
+    return cached_response(
+        request,
+        "trades",
+        {"account_id": account_id, "catchment": catchment.upper() if catchment else None,
+         "unit_type": unit_type.lower() if unit_type else None, "limit": limit, "cursor": after_id},
+        version_key,
+        lambda: _build_trades(account_id, catchment, unit_type, limit, db, after_id)
     )
+
+
+def _build_trades(
+    account_id: int,
+    catchment: Optional[str],
+    unit_type: Optional[str],
+    limit: int,
+    db: Session,
+    after_id: Optional[int] = None
+) -> Page:
+    def side(account_column):
+        query = db.query(Trade).filter(account_column == account_id)
+        if catchment or unit_type:
+            # Join with Scheme to filter by catchment/unit_type
+            query = query.join(Scheme, Trade.scheme_id == Scheme.id)
+            if catchment:
+                query = query.filter(Scheme.catchment == catchment.upper())
+            if unit_type:
+                query = query.filter(Scheme.unit_type == unit_type.lower())
+        return newest_first(query, Trade, limit, after_id)
+
+    # Each side walks its own (account, created_at, id) index from the cursor;
+    # an OR across both would sort every trade the account ever made
+    trades = merge_newest_first(side(Trade.buyer_account_id), side(Trade.seller_account_id))
+    page = page_of("trades", trades, limit)
     
-    if catchment or unit_type:
-        # Join with Scheme to filter by catchment/unit_type
-        query = query.join(Scheme, Trade.scheme_id == Scheme.id)
-        if catchment:
-            query = query.filter(Scheme.catchment == catchment.upper())
-        if unit_type:
-            query = query.filter(Scheme.unit_type == unit_type.lower())
-    
-    trades = query.order_by(Trade.created_at.desc()).limit(limit).all()
-    
-    return [
+    return Page([
         TradeResponse(
             id=trade.id,
             listing_id=trade.listing_id,
@@ -1279,7 +1473,10 @@ def get_trades(
             price_per_unit=trade.price_per_unit,
             total_price=trade.total_price,
             transaction_hash=trade.transaction_hash,
+            status=trade.status or "SETTLED",
+            buy_order_id=trade.buy_order_id,
+            sell_order_id=trade.sell_order_id,
             created_at=trade.created_at.isoformat() if trade.created_at else ""
         )
-        for trade in trades
-    ]
+        for trade in page.items
+    ], page.next_cursor)
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
@@ -6,6 +6,8 @@ from ..db import SessionLocal
 from ..models import Scheme, Notification, Account, BrokerMandate
 from ..services.credits_integration import mint_scheme_credits
 from ..services.exchange import transfer_credits_on_chain, get_scheme_credits_abi
+from ..services.chain_client import get_web3, is_connected
+from ..services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, newest_first, page_of, parse_cursor, set_next_cursor
 import os
 from sqlalchemy import func
 
@@ -48,15 +50,27 @@ class NotificationResponse(BaseModel):
 
 @router.get("/notifications", response_model=List[NotificationResponse])
 def get_notifications(
+    response: Response,
     account_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of notifications to return"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
     db: Session = Depends(get_db)
 ):
     """
-    Get all notifications for a landowner account.
+    Get a landowner account's notifications, newest first.
+    Without limit or cursor every notification is returned (claim tokens must not
+    drop off a page); otherwise the X-Next-Cursor response header is the cursor
+    for the next page.
     """
-    notifications = db.query(Notification).filter(
-        Notification.account_id == account_id
-    ).order_by(Notification.created_at.desc()).all()
+    after_id = parse_cursor("notifications", cursor)
+    query = db.query(Notification).filter(Notification.account_id == account_id)
+    if limit is None and after_id is None:
+        notifications = query.order_by(Notification.created_at.desc(), Notification.id.desc()).all()
+    else:
+        limit = limit or DEFAULT_PAGE_SIZE
+        page = page_of("notifications", newest_first(query, Notification, limit, after_id), limit)
+        set_next_cursor(response, page)
+        notifications = page.items
     
     return [
         NotificationResponse(
@@ -330,8 +344,8 @@ def assign_to_broker(request: AssignToBrokerRequest, db: Session = Depends(get_d
         # Verify landowner has sufficient credits for this scheme
         print(f"[ASSIGN_TO_BROKER] Checking landowner balance for scheme {scheme.nft_token_id}")
         try:
-            w3 = Web3(Web3.HTTPProvider(rpc_url))
-            if not w3.is_connected():
+            w3 = get_web3(rpc_url)
+            if not is_connected(rpc_url):
                 print(f"[ASSIGN_TO_BROKER] ERROR: Cannot connect to blockchain node at {rpc_url}")
                 raise HTTPException(status_code=500, detail="Cannot connect to blockchain node")
             
@@ -506,8 +520,7 @@ def transfer_to_trading_account(request: TransferToTradingAccountRequest, db: Se
     # Transfer credits on-chain
     try:
         # Verify the private key matches the landowner's address
-        from web3 import Web3
-        w3_temp = Web3(Web3.HTTPProvider(rpc_url))
+        w3_temp = get_web3(rpc_url)
         account_from_key = w3_temp.eth.account.from_key(landowner_private_key)
         
         # Use the address from the private key, not the database address
@@ -529,7 +542,7 @@ def transfer_to_trading_account(request: TransferToTradingAccountRequest, db: Se
             
             # Check balance at DB address to see if credits are there
             from web3 import Web3
-            w3_check = Web3(Web3.HTTPProvider(rpc_url))
+            w3_check = get_web3(rpc_url)
             contract_check = w3_check.eth.contract(
                 address=Web3.to_checksum_address(scheme_credits_address),
                 abi=get_scheme_credits_abi()
@@ -586,7 +599,7 @@ def transfer_to_trading_account(request: TransferToTradingAccountRequest, db: Se
         
         # Additional debug: Check balance at transfer address before transfer
         print(f"Pre-transfer check: Using address {transfer_address} for transfer")
-        w3_precheck = Web3(Web3.HTTPProvider(rpc_url))
+        w3_precheck = get_web3(rpc_url)
         contract_precheck = w3_precheck.eth.contract(
             address=Web3.to_checksum_address(scheme_credits_address),
             abi=get_scheme_credits_abi()
@@ -757,8 +770,8 @@ def recall_from_broker(request: RecallFromBrokerRequest, db: Session = Depends(g
     
     # Verify broker has sufficient credits
     try:
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
-        if not w3.is_connected():
+        w3 = get_web3(rpc_url)
+        if not is_connected(rpc_url):
             raise HTTPException(status_code=500, detail="Cannot connect to blockchain node")
         
         contract = w3.eth.contract(
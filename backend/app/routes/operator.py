@@ -5,6 +5,7 @@ from typing import List, Dict, Optional
 from ..db import SessionLocal
 from ..models import Account, Scheme
 from ..services.credits_summary import get_account_credits_summary
+from ..services.latency import get_latency_recorder
 from collections import defaultdict
 
 router = APIRouter()
@@ -54,6 +55,34 @@ def get_holdings_summary(db: Session = Depends(get_db)):
     )
 
 
+class LatencyResponse(BaseModel):
+    enabled: bool
+    slow_threshold_ms: float
+    pipelines: Dict[str, Dict]
+
+
+@router.get("/latency", response_model=LatencyResponse)
+def get_latency():
+    """
+    Per-stage latency histograms for the order pipeline (create_limit_order,
+    create_market_order, match_order) since startup or the last reset.
+    Percentiles are bucket upper bounds, capped at the slowest call seen.
+    """
+    recorder = get_latency_recorder()
+    return LatencyResponse(
+        enabled=recorder.enabled,
+        slow_threshold_ms=recorder.slow_ms,
+        pipelines=recorder.snapshot()
+    )
+
+
+@router.delete("/latency")
+def reset_latency():
+    """Clear the latency histograms."""
+    get_latency_recorder().reset()
+    return {"message": "Latency histograms reset"}
+
+
 class SimulateBlockTradeRequest(BaseModel):
     buyer_account_id: int
     required_catchment: str
@@ -10,25 +10,9 @@ from ..services.planning_application import (
     reject_planning_application_on_chain,
     submit_planning_application_on_chain
 )
-from web3 import Web3
+from ..services.chain_client import is_connected
+from ..services.balance_cache import fetch_balances
 import os
-from ..services.credits_summary import get_scheme_credits_abi
-
-def get_scheme_credits_abi_with_locked():
-    """Get ABI for SchemeCredits contract including lockedBalance"""
-    abi = get_scheme_credits_abi()
-    # Add lockedBalance function
-    abi.append({
-        "constant": True,
-        "inputs": [
-            {"name": "id", "type": "uint256"},
-            {"name": "account", "type": "address"}
-        ],
-        "name": "lockedBalance",
-        "outputs": [{"name": "", "type": "uint256"}],
-        "type": "function"
-    })
-    return abi
 
 router = APIRouter()
 
@@ -167,7 +151,8 @@ def validate_qr(request: ValidateQRRequest, db: Session = Depends(get_db)):
                         planning_lock_address=planning_lock_address,
                         developer_private_key=regulator_private_key,  # Planning officer signs the transaction
                         rpc_url=rpc_url,
-                        scheme_nft_address=scheme_nft_address
+                        scheme_nft_address=scheme_nft_address,
+                        db=db
                     )
                     
                     # Update application with on-chain ID and set status to LOCKED
@@ -207,22 +192,26 @@ def validate_qr(request: ValidateQRRequest, db: Session = Depends(get_db)):
     scheme_credits_address = os.getenv("SCHEME_CREDITS_CONTRACT_ADDRESS")
     rpc_url = os.getenv("RPC_URL", "http://127.0.0.1:8545")
     
-    # Connect to blockchain to query available credits
-    w3 = None
-    credits_contract = None
-    if scheme_credits_address:
+    schemes_by_id = {
+        scheme.id: scheme
+        for scheme in db.query(Scheme).filter(Scheme.id.in_([a.scheme_id for a in scheme_allocations])).all()
+    }
+    
+    # Read the developer's balance and locked amount for every allocated scheme in one batched round trip
+    developer_balances = None
+    if scheme_credits_address and developer.evm_address:
         try:
-            w3 = Web3(Web3.HTTPProvider(rpc_url))
-            if w3.is_connected():
-                credits_contract = w3.eth.contract(
-                    address=Web3.to_checksum_address(scheme_credits_address),
-                    abi=get_scheme_credits_abi_with_locked()
+            if is_connected(rpc_url):
+                developer_balances = fetch_balances(
+                    [(developer.evm_address, scheme.nft_token_id) for scheme in schemes_by_id.values()],
+                    scheme_credits_address,
+                    rpc_url
                 )
         except Exception as e:
-            print(f"Warning: Could not connect to blockchain to query available credits: {e}")
+            print(f"Warning: Could not query available credits: {e}")
     
     for allocation in scheme_allocations:
-        scheme = db.query(Scheme).filter(Scheme.id == allocation.scheme_id).first()
+        scheme = schemes_by_id.get(allocation.scheme_id)
         if not scheme:
             continue
         
@@ -246,29 +235,11 @@ def validate_qr(request: ValidateQRRequest, db: Session = Depends(get_db)):
         total_tonnage_allocated += tonnes_allocated
         print(f"Debug: Total tonnage so far: {total_tonnage_allocated}")
         
-        # Query available credits for this scheme (developer's current balance minus locked)
+        # Available credits for this scheme (developer's current balance minus locked)
         available_credits = 0
-        if credits_contract and developer.evm_address:
-            try:
-                developer_address = Web3.to_checksum_address(developer.evm_address)
-                # Get total balance for this scheme
-                balance = credits_contract.functions.balanceOf(
-                    developer_address,
-                    scheme.nft_token_id
-                ).call()
-                
-                # Get locked balance
-                locked = credits_contract.functions.lockedBalance(
-                    scheme.nft_token_id,
-                    developer_address
-                ).call()
-                
-                # Available = balance - locked
-                available_credits = int(balance) - int(locked)
-                if available_credits < 0:
-                    available_credits = 0
-            except Exception as e:
-                print(f"Warning: Could not query available credits for scheme {scheme.nft_token_id}: {e}")
+        if developer_balances is not None:
+            balance, locked = developer_balances.get((developer.evm_address.lower(), scheme.nft_token_id), (0, 0))
+            available_credits = max(balance - locked, 0)
         
         schemes_breakdown.append(SchemeBreakdown(
             scheme_nft_id=scheme.nft_token_id,
@@ -592,22 +563,26 @@ def get_application_details(
     scheme_credits_address = os.getenv("SCHEME_CREDITS_CONTRACT_ADDRESS")
     rpc_url = os.getenv("RPC_URL", "http://127.0.0.1:8545")
     
-    # Connect to blockchain to query available credits
-    w3 = None
-    credits_contract = None
-    if scheme_credits_address:
+    schemes_by_id = {
+        scheme.id: scheme
+        for scheme in db.query(Scheme).filter(Scheme.id.in_([a.scheme_id for a in scheme_allocations])).all()
+    }
+    
+    # Read the developer's balance and locked amount for every allocated scheme in one batched round trip
+    developer_balances = None
+    if scheme_credits_address and developer.evm_address:
         try:
-            w3 = Web3(Web3.HTTPProvider(rpc_url))
-            if w3.is_connected():
-                credits_contract = w3.eth.contract(
-                    address=Web3.to_checksum_address(scheme_credits_address),
-                    abi=get_scheme_credits_abi_with_locked()
+            if is_connected(rpc_url):
+                developer_balances = fetch_balances(
+                    [(developer.evm_address, scheme.nft_token_id) for scheme in schemes_by_id.values()],
+                    scheme_credits_address,
+                    rpc_url
                 )
         except Exception as e:
-            print(f"Warning: Could not connect to blockchain to query available credits: {e}")
+            print(f"Warning: Could not query available credits: {e}")
     
     for allocation in scheme_allocations:
-        scheme = db.query(Scheme).filter(Scheme.id == allocation.scheme_id).first()
+        scheme = schemes_by_id.get(allocation.scheme_id)
         if not scheme:
             continue
         
@@ -631,29 +606,11 @@ def get_application_details(
         total_tonnage_allocated += tonnes_allocated
         print(f"Debug: Total tonnage so far: {total_tonnage_allocated}")
         
-        # Query available credits for this scheme (developer's current balance minus locked)
+        # Available credits for this scheme (developer's current balance minus locked)
         available_credits = 0
-        if credits_contract and developer.evm_address:
-            try:
-                developer_address = Web3.to_checksum_address(developer.evm_address)
-                # Get total balance for this scheme
-                balance = credits_contract.functions.balanceOf(
-                    developer_address,
-                    scheme.nft_token_id
-                ).call()
-                
-                # Get locked balance
-                locked = credits_contract.functions.lockedBalance(
-                    scheme.nft_token_id,
-                    developer_address
-                ).call()
-                
-                # Available = balance - locked
-                available_credits = int(balance) - int(locked)
-                if available_credits < 0:
-                    available_credits = 0
-            except Exception as e:
-                print(f"Warning: Could not query available credits for scheme {scheme.nft_token_id}: {e}")
+        if developer_balances is not None:
+            balance, locked = developer_balances.get((developer.evm_address.lower(), scheme.nft_token_id), (0, 0))
+            available_credits = max(balance - locked, 0)
         
         schemes_breakdown.append(SchemeBreakdown(
             scheme_nft_id=scheme.nft_token_id,
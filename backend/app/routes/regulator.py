@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, Query, HTTPException, Path
+from fastapi import APIRouter, Depends, Query, HTTPException, Path, Request
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
@@ -9,6 +9,7 @@ import os
 from ..db import SessionLocal
 from ..models import SchemeSubmission, SubmissionStatus, Scheme
 from ..services import submissions as submission_service
+from ..services.read_cache import cached_response, SCHEMES_VERSION
 
 router = APIRouter()
 
@@ -300,8 +301,12 @@ class SchemeListItem(BaseModel):
 
 
 @router.get("/schemes", response_model=List[SchemeListItem])
-def list_all_schemes(db: Session = Depends(get_db)):
-    """Get all schemes for the archive list"""
+def list_all_schemes(request: Request, db: Session = Depends(get_db)):
+    """Get all schemes for the archive list (cached until a scheme changes; supports If-None-Match)"""
+    return cached_response(request, "regulator-schemes", {}, SCHEMES_VERSION, lambda: _build_scheme_list(db))
+
+
+def _build_scheme_list(db: Session) -> List[SchemeListItem]:
     schemes = db.query(Scheme).order_by(Scheme.created_at.desc()).all()
     
     return [
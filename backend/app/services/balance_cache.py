@@ -0,0 +1,253 @@
+"""
+Block-aware cache of on-chain SchemeCredits balances.
+
+Holdings reads (credits summary, sell-order checks, broker holdings) used to run
+balanceOfBatch plus one lockedBalance call per scheme on every request. This
+cache keeps (holder, tokenId) -> (balance, locked) per contract and only goes
+back to the node when an entry is missing; missing entries are read together in
+one batched round trip (fetch_balances).
+
+Entries are invalidated by watching the chain: at most once per
+POLL_INTERVAL_SECONDS the cache reads the new block range's logs and drops the
+entries touched by SchemeCredits TransferSingle/TransferBatch events and by
+PlanningLock application events (the only paths that change lockedBalance).
+Repeated reads between polls therefore cost no RPC calls at all.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from eth_abi import decode, encode
+from web3 import Web3
+import os
+import threading
+import time
+
+from .chain_client import get_web3, get_rpc_url, to_checksum, batch_call
+
+# New blocks are checked for invalidating events at most this often
+POLL_INTERVAL_SECONDS = 1.0
+
+TRANSFER_SINGLE_TOPIC = Web3.keccak(text="TransferSingle(address,address,address,uint256,uint256)")
+TRANSFER_BATCH_TOPIC = Web3.keccak(text="TransferBatch(address,address,address,uint256[],uint256[])")
+APPLICATION_SUBMITTED_TOPIC = Web3.keccak(text="ApplicationSubmitted(uint256,address,bytes32,uint256[],uint256[])")
+APPLICATION_APPROVED_TOPIC = Web3.keccak(text="ApplicationApproved(uint256)")
+APPLICATION_REJECTED_TOPIC = Web3.keccak(text="ApplicationRejected(uint256)")
+
+BALANCE_OF_BATCH_SELECTOR = Web3.keccak(text="balanceOfBatch(address[],uint256[])")[:4]
+LOCKED_BALANCE_SELECTOR = Web3.keccak(text="lockedBalance(uint256,address)")[:4]
+
+
+def fetch_balances(
+    pairs: List[Tuple[str, int]],
+    contract_address: str,
+    rpc_url: Optional[str] = None
+) -> Dict[Tuple[str, int], Tuple[int, int]]:
+    """
+    Read balance and locked balance for N (holder, tokenId) pairs in one round trip:
+    a single balanceOfBatch plus one lockedBalance per pair, sent as one JSON-RPC batch.
+
+    Returns:
+        Dict of (lowercase holder, tokenId) -> (balance, locked)
+    """
+    if not pairs:
+        return {}
+    holders = [to_checksum(holder) for holder, _ in pairs]
+    token_ids = [token_id for _, token_id in pairs]
+
+    calls = [(contract_address, Web3.to_hex(BALANCE_OF_BATCH_SELECTOR + encode(["address[]", "uint256[]"], [holders, token_ids])))]
+    calls += [
+        (contract_address, Web3.to_hex(LOCKED_BALANCE_SELECTOR + encode(["uint256", "address"], [token_id, holder])))
+        for holder, token_id in zip(holders, token_ids)
+    ]
+    results = batch_call(calls, rpc_url)
+
+    (balances,) = decode(["uint256[]"], results[0])
+    return {
+        (holder.lower(), token_id): (int(balance), int(decode(["uint256"], locked)[0]))
+        for (holder, token_id), balance, locked in zip(pairs, balances, results[1:])
+    }
+
+
+def _topic_address(topic) -> str:
+    return ("0x" + bytes(topic)[-20:].hex()).lower()
+
+
+def _touched_keys(log) -> Optional[List[Tuple[str, int]]]:
+    """
+    (holder, tokenId) pairs a log may have changed.
+    Returns None when the log cannot be narrowed down (drop everything).
+    """
+    topics = log["topics"]
+    if not topics:
+        return []
+    topic0 = bytes(topics[0])
+    data = bytes(log["data"])
+
+    if topic0 == TRANSFER_SINGLE_TOPIC:
+        token_id, _ = decode(["uint256", "uint256"], data)
+        return [(_topic_address(topics[2]), token_id), (_topic_address(topics[3]), token_id)]
+    if topic0 == TRANSFER_BATCH_TOPIC:
+        token_ids, _ = decode(["uint256[]", "uint256[]"], data)
+        holders = (_topic_address(topics[2]), _topic_address(topics[3]))
+        return [(holder, token_id) for holder in holders for token_id in token_ids]
+    if topic0 == APPLICATION_SUBMITTED_TOPIC:
+        _, token_ids, _ = decode(["bytes32", "uint256[]", "uint256[]"], data)
+        developer = _topic_address(topics[2])
+        return [(developer, token_id) for token_id in token_ids]
+    if topic0 in (APPLICATION_APPROVED_TOPIC, APPLICATION_REJECTED_TOPIC):
+        # Only the application id is emitted - unlocks/burns cannot be attributed
+        return None
+    return []
+
+
+class BalanceCache:
+    """(contract, holder, tokenId) -> (balance, locked), invalidated from chain logs."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries: Dict[Tuple[str, str, int], Tuple[int, int]] = {}
+        self._synced_block: Dict[str, int] = {}
+        self._last_poll: Dict[str, float] = {}
+
+    def invalidate(self, holders: Iterable[str], token_ids: Iterable[int], contract_address: Optional[str] = None):
+        """Drop entries for every holder/token combination (all contracts if none given)."""
+        holders = {h.lower() for h in holders if h}
+        token_ids = set(token_ids)
+        contract = contract_address.lower() if contract_address else None
+        with self._lock:
+            for key in list(self._entries):
+                if (contract is None or key[0] == contract) and key[1] in holders and key[2] in token_ids:
+                    del self._entries[key]
+
+    def clear(self, contract_address: Optional[str] = None):
+        with self._lock:
+            if contract_address is None:
+                self._entries.clear()
+                self._synced_block.clear()
+                self._last_poll.clear()
+                return
+            contract = contract_address.lower()
+            for key in list(self._entries):
+                if key[0] == contract:
+                    del self._entries[key]
+
+    def sync(self, contract_address: str, rpc_url: str, planning_lock_address: Optional[str] = None):
+        """Apply invalidating events from blocks mined since the last poll."""
+        contract = contract_address.lower()
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_poll.get(contract)
+            if last is not None and now - last < POLL_INTERVAL_SECONDS:
+                return
+            self._last_poll[contract] = now
+            synced = self._synced_block.get(contract)
+
+        w3 = get_web3(rpc_url)
+        latest = w3.eth.block_number
+
+        if synced is None or latest < synced:
+            # First use, or the node was reset (local Hardhat restart)
+            self.clear(contract_address)
+            with self._lock:
+                self._synced_block[contract] = latest
+            return
+        if latest == synced:
+            return
+
+        addresses = [to_checksum(contract_address)]
+        if planning_lock_address:
+            addresses.append(to_checksum(planning_lock_address))
+        logs = w3.eth.get_logs({"fromBlock": synced + 1, "toBlock": latest, "address": addresses})
+
+        with self._lock:
+            for log in logs:
+                keys = _touched_keys(log)
+                if keys is None:
+                    self.clear(contract_address)
+                    break
+                for holder, token_id in keys:
+                    self._entries.pop((contract, holder, token_id), None)
+            self._synced_block[contract] = latest
+
+    def get_balances(
+        self,
+        holder: str,
+        token_ids: List[int],
+        contract_address: str,
+        rpc_url: Optional[str] = None,
+        planning_lock_address: Optional[str] = None
+    ) -> Dict[int, Tuple[int, int]]:
+        """
+        Balance and locked balance per token for one holder.
+        Only tokens missing from the cache are read from the node.
+
+        Returns:
+            Dict of tokenId -> (balance, locked)
+        """
+        return {
+            token_id: entry
+            for (_, token_id), entry in self.get_pair_balances(
+                [(holder, token_id) for token_id in token_ids], contract_address, rpc_url, planning_lock_address
+            ).items()
+        }
+
+    def get_pair_balances(
+        self,
+        pairs: List[Tuple[str, int]],
+        contract_address: str,
+        rpc_url: Optional[str] = None,
+        planning_lock_address: Optional[str] = None
+    ) -> Dict[Tuple[str, int], Tuple[int, int]]:
+        """
+        Balance and locked balance for any (holder, tokenId) pairs.
+        Pairs missing from the cache are fetched together in one batched round trip.
+
+        Returns:
+            Dict of (lowercase holder, tokenId) -> (balance, locked)
+        """
+        rpc_url = get_rpc_url(rpc_url)
+        if planning_lock_address is None:
+            planning_lock_address = os.getenv("PLANNING_LOCK_CONTRACT_ADDRESS")
+        self.sync(contract_address, rpc_url, planning_lock_address)
+
+        contract = contract_address.lower()
+        result: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        missing: List[Tuple[str, int]] = []
+        with self._lock:
+            for holder, token_id in pairs:
+                key = (holder.lower(), token_id)
+                entry = self._entries.get((contract,) + key)
+                if entry is None:
+                    missing.append(key)
+                else:
+                    result[key] = entry
+
+        if missing:
+            fetched = fetch_balances(list(dict.fromkeys(missing)), contract_address, rpc_url)
+            with self._lock:
+                for key, entry in fetched.items():
+                    self._entries[(contract,) + key] = entry
+            result.update(fetched)
+
+        return result
+
+
+_balance_cache = BalanceCache()
+
+
+def get_balance_cache() -> BalanceCache:
+    """Get the process-wide balance cache."""
+    return _balance_cache
+
+
+def get_cached_balances(
+    holder: str,
+    token_ids: List[int],
+    contract_address: str,
+    rpc_url: Optional[str] = None
+) -> Dict[int, Tuple[int, int]]:
+    """Balance and locked balance per token for one holder (see BalanceCache.get_balances)."""
+    return _balance_cache.get_balances(holder, token_ids, contract_address, rpc_url)
+
+
+def invalidate_balances(holders: Iterable[str], token_ids: Iterable[int]):
+    """Drop cached balances after a transfer this process submitted."""
+    _balance_cache.invalidate(holders, token_ids)
@@ -1,79 +1,211 @@
 """
 Service to check account balances for order validation.
+
+Balances are read from the account_balances ledger (one primary-key lookup)
+instead of summing the trades table. The ledger is updated in the same
+transaction as each trade insert (record_trade_cash) and can be recomputed from
+trades at any time with rebuild_account_balances / migrate_account_balances.py.
+It also keeps the funds held by open LIMIT BUY orders in reserved_balance.
 """
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_
-from typing import Tuple
-from ..models import Account, Trade, AccountRole, BrokerMandate
+from typing import Optional, Tuple
+from ..db import lock_for_update
+from ..models import Account, Trade, Order, AccountRole, AccountBalance, BrokerMandate
+from .order_book import OPEN_ORDER_STATUSES
 
 # Developer opening balance constant (matches frontend)
 DEVELOPER_OPENING_BALANCE_GBP = 5000000.00  # £5 million
 
+# Roles that have a trading balance
+LEDGER_ROLES = (AccountRole.DEVELOPER, AccountRole.LANDOWNER, AccountRole.BROKER)
 
-def get_account_balance(account: Account, db: Session) -> float:
+
+def compute_cash_balance(account: Account, db: Session, exclude_trade_id: Optional[int] = None) -> float:
     """
-    Get the current available balance for an account.
-    
-    For developers: Opening balance (£5M) minus purchases
+    Recompute an account's cash balance from the trades table.
+
+    For developers: Opening balance (£5M) minus purchases plus sales
     For landowners: Sum of direct sales + broker sales (via mandates)
     For brokers: Sum of house account sales (sales without mandate_id)
     For others: 0 (not applicable)
-    
-    Returns:
-        Current balance in GBP
+
+    Used to seed and rebuild the ledger; the result is not clamped at zero.
     """
+    def total(query):
+        if exclude_trade_id is not None:
+            query = query.filter(Trade.id != exclude_trade_id)
+        return float(query.scalar() or 0.0)
+
     if account.role == AccountRole.DEVELOPER:
-        # Developers start with £5M and subtract purchases
-        opening_balance = DEVELOPER_OPENING_BALANCE_GBP
-        
-        # Sum all purchases (where developer was buyer)
-        total_purchases = db.query(func.sum(Trade.total_price)).filter(
+        total_purchases = total(db.query(func.sum(Trade.total_price)).filter(
             Trade.buyer_account_id == account.id
-        ).scalar() or 0.0
-        
-        # Sum all sales (where developer was seller) - unlikely but possible
-        total_sales = db.query(func.sum(Trade.total_price)).filter(
+        ))
+        # Sales where the developer was seller - unlikely but possible
+        total_sales = total(db.query(func.sum(Trade.total_price)).filter(
             Trade.seller_account_id == account.id
-        ).scalar() or 0.0
-        
-        balance = opening_balance - float(total_purchases) + float(total_sales)
-        return max(0.0, balance)  # Don't allow negative balance
-    
+        ))
+        return DEVELOPER_OPENING_BALANCE_GBP - total_purchases + total_sales
+
     elif account.role == AccountRole.LANDOWNER:
-        # Landowners get balance from:
-        # 1. Direct sales (where landowner was the seller)
-        direct_sales = db.query(func.sum(Trade.total_price)).filter(
+        direct_sales = total(db.query(func.sum(Trade.total_price)).filter(
             Trade.seller_account_id == account.id
-        ).scalar() or 0.0
-        
-        # 2. Broker sales (trades linked to mandates where this landowner is the beneficiary)
-        broker_sales = db.query(func.sum(Trade.total_price)).join(
+        ))
+        # Broker sales (trades linked to mandates where this landowner is the beneficiary)
+        broker_sales = total(db.query(func.sum(Trade.total_price)).join(
             BrokerMandate, Trade.mandate_id == BrokerMandate.id
         ).filter(
             BrokerMandate.landowner_account_id == account.id
-        ).scalar() or 0.0
-        
+        ))
         # TODO: Subtract withdrawals when withdrawal functionality is implemented
-        total_withdrawals = 0.0
-        
-        return float(direct_sales) + float(broker_sales) - float(total_withdrawals)
-    
+        return direct_sales + broker_sales
+
     elif account.role == AccountRole.BROKER:
-        # Brokers get balance from house account sales
         # House account sales are broker trades WITHOUT a mandate_id (fee credits, not client credits)
-        house_sales = db.query(func.sum(Trade.total_price)).filter(
+        return total(db.query(func.sum(Trade.total_price)).filter(
             and_(
                 Trade.seller_account_id == account.id,
                 Trade.mandate_id == None  # House account sales have no mandate
             )
-        ).scalar() or 0.0
-        
-        return float(house_sales)
-    
-    else:
+        ))
+
+    return 0.0
+
+
+def compute_reserved_balance(account_id: int, db: Session) -> float:
+    """Recompute the funds held by an account's open LIMIT BUY orders."""
+    reserved = db.query(func.sum(Order.remaining_quantity * Order.price_per_unit)).filter(
+        Order.account_id == account_id,
+        Order.side == "BUY",
+        Order.order_type == "LIMIT",
+        Order.status.in_(OPEN_ORDER_STATUSES)
+    ).scalar()
+    return float(reserved or 0.0)
+
+
+def _get_ledger(account: Account, db: Session, exclude_trade_id: Optional[int] = None) -> AccountBalance:
+    """
+    Get the ledger row for an account, seeding it from trades and open orders if missing.
+    Seeding never flushes, so a trade or order still pending in the session is not counted.
+    """
+    pending = db.info.setdefault("account_balances", {})
+    row = pending.get(account.id)
+    if row is not None and row in db:
+        return row
+
+    row = db.get(AccountBalance, account.id)
+    if row is None:
+        with db.no_autoflush:
+            row = AccountBalance(
+                account_id=account.id,
+                cash_balance=compute_cash_balance(account, db, exclude_trade_id),
+                reserved_balance=compute_reserved_balance(account.id, db)
+            )
+        db.add(row)
+    # Pending rows are not in the identity map, so remember them until flushed
+    pending[account.id] = row
+    return row
+
+
+def get_account_balance(account: Account, db: Session) -> float:
+    """
+    Get the current available balance for an account.
+
+    For developers: Opening balance (£5M) minus purchases
+    For landowners: Sum of direct sales + broker sales (via mandates)
+    For brokers: Sum of house account sales (sales without mandate_id)
+    For others: 0 (not applicable)
+
+    Returns:
+        Current balance in GBP
+    """
+    if account.role not in LEDGER_ROLES:
         # Other roles don't have trading balances
         return 0.0
 
+    balance = _get_ledger(account, db).cash_balance
+    if account.role == AccountRole.DEVELOPER:
+        return max(0.0, balance)  # Don't allow negative balance
+    return balance
+
+
+def get_reserved_balance(account: Account, db: Session) -> float:
+    """Get the funds currently held by the account's open LIMIT BUY orders."""
+    if account.role not in LEDGER_ROLES:
+        return 0.0
+    return _get_ledger(account, db).reserved_balance
+
+
+def _credit(account_id: int, amount: float, trade: Trade, db: Session, roles: Tuple[AccountRole, ...]):
+    account = db.get(Account, account_id)
+    if account is None or account.role not in roles:
+        return
+    ledger = _get_ledger(account, db, exclude_trade_id=trade.id)
+    lock_for_update(ledger, db)
+    ledger.cash_balance += amount
+
+
+def record_trade_cash(trade: Trade, db: Session):
+    """
+    Apply a new trade to the cash ledger. Call before committing the trade so
+    both land in the same transaction.
+    """
+    amount = float(trade.total_price)
+
+    # Developers pay for purchases
+    _credit(trade.buyer_account_id, -amount, trade, db, (AccountRole.DEVELOPER,))
+
+    # Sellers are paid, except brokers selling client credits under a mandate
+    if trade.mandate_id is None:
+        _credit(trade.seller_account_id, amount, trade, db, LEDGER_ROLES)
+    else:
+        _credit(trade.seller_account_id, amount, trade, db, (AccountRole.DEVELOPER, AccountRole.LANDOWNER))
+        # ...where the landowner behind the mandate is paid instead
+        mandate = db.get(BrokerMandate, trade.mandate_id)
+        if mandate:
+            _credit(mandate.landowner_account_id, amount, trade, db, (AccountRole.LANDOWNER,))
+
+
+def _adjust_reserved(order: Order, amount: float, db: Session):
+    if order.side != "BUY" or order.order_type != "LIMIT" or order.price_per_unit is None:
+        return
+    account = db.get(Account, order.account_id)
+    if account is None or account.role not in LEDGER_ROLES:
+        return
+    ledger = _get_ledger(account, db)
+    lock_for_update(ledger, db)
+    ledger.reserved_balance = max(0.0, ledger.reserved_balance + amount)
+
+
+def reserve_order_funds(order: Order, db: Session):
+    """Hold funds for a new LIMIT BUY order. Call before the order is added to the session."""
+    _adjust_reserved(order, order.remaining_quantity * (order.price_per_unit or 0.0), db)
+
+
+def release_order_funds(order: Order, quantity: int, db: Session):
+    """Release funds for `quantity` units of a LIMIT BUY order (filled or cancelled), before its row is updated."""
+    _adjust_reserved(order, -quantity * (order.price_per_unit or 0.0), db)
+
+
+def rebuild_account_balances(db: Session) -> int:
+    """
+    Recompute every ledger row from trades and open orders and commit.
+
+    Returns:
+        Number of accounts rebuilt
+    """
+    accounts = db.query(Account).filter(Account.role.in_(LEDGER_ROLES)).all()
+    for account in accounts:
+        row = db.get(AccountBalance, account.id)
+        if row is None:
+            row = AccountBalance(account_id=account.id)
+            db.add(row)
+        row.cash_balance = compute_cash_balance(account, db)
+        row.reserved_balance = compute_reserved_balance(account.id, db)
+    db.commit()
+    db.info.pop("account_balances", None)
+    return len(accounts)
+
 
 def check_buyer_has_sufficient_balance(
     buyer: Account,
@@ -82,20 +214,16 @@ def check_buyer_has_sufficient_balance(
 ) -> Tuple[bool, float]:
     """
     Check if buyer has sufficient balance to make a purchase.
-    
+
     Args:
         buyer: The buyer account
         required_amount_gbp: The amount required in GBP
         db: Database session
-    
+
     Returns:
         (has_sufficient, available_balance)
     """
     available_balance = get_account_balance(buyer, db)
     has_sufficient = available_balance >= required_amount_gbp
-    
-    return has_sufficient, available_balance
-
-
-
 
+    return has_sufficient, available_balance
@@ -0,0 +1,327 @@
+"""
+Batch order placement and atomic cancel-replace for one market.
+
+Bots used to refresh their quotes by cancelling their orders (one commit) and then
+creating each replacement with its own commit and match_order call. A batch
+carries any number of new limit orders and cancels for one (catchment, unit_type)
+market: everything is validated together, the cancels and new orders are applied
+in one transaction, and only new orders that cross the book are then passed to
+match_order. A refresh that does not trade therefore costs one validation read
+and one commit. On PostgreSQL the crossing check reads the orders table, since
+the in-memory book does not have orders placed through other API processes.
+
+If any item fails validation nothing is applied, and every item's result says
+why the batch was rejected (REJECTED) or that it was not applied (NOT_APPLIED).
+Cancelling an order that has already been filled or cancelled is not an error
+(ALREADY_CLOSED), since a bot's resting order can trade while it is refreshing.
+A new order whose matching fails stays placed, with its fills up to the failure,
+and is reported as MATCH_FAILED with the error.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..db import is_postgresql
+from ..models import Account, Order, Scheme, Trade
+from .balance_check import check_buyer_has_sufficient_balance
+from .exchange import check_seller_has_sufficient_credits
+from .market_actor import run_in_market
+from .order_book import OPEN_ORDER_STATUSES, get_order_book, market_key
+from .reservations import reserve_order, release_order
+from .settlement import resolve_order_funding
+
+MAX_BATCH_ITEMS = 200
+
+UNIT_TYPES = ("nitrate", "phosphate")
+
+
+@dataclass
+class BatchOrder:
+    """A new LIMIT order in a batch."""
+    side: str
+    price_per_unit: float
+    quantity_units: int
+    scheme_id: Optional[int] = None
+    # Bots: whether a SELL sells house credits (see resolve_order_funding)
+    is_house_account: Optional[bool] = None
+
+
+@dataclass
+class BatchItemResult:
+    """Outcome of one new order or cancel in a batch."""
+    index: int
+    status: str  # ACCEPTED, CANCELLED, ALREADY_CLOSED, REJECTED, NOT_APPLIED or MATCH_FAILED
+    order_id: Optional[int] = None
+    error: Optional[str] = None
+    order_status: Optional[str] = None
+    filled_quantity: int = 0
+    remaining_quantity: int = 0
+
+
+@dataclass
+class OrderBatchResult:
+    applied: bool
+    orders: List[BatchItemResult]
+    cancels: List[BatchItemResult]
+    created: List[Order] = field(default_factory=list)
+    trades: List[Trade] = field(default_factory=list)
+
+
+def _reject(result: BatchItemResult, error: str):
+    result.status = "REJECTED"
+    result.error = error
+
+
+def _validate_cancels(
+    account_id: int,
+    market: tuple,
+    cancel_order_ids: List[int],
+    db: Session
+) -> Tuple[List[BatchItemResult], List[Tuple[Order, BatchItemResult]]]:
+    """
+    Load every order to cancel in one query and check it can be cancelled by this account.
+
+    On PostgreSQL the rows are locked (FOR UPDATE, in id order) until the batch
+    commits: a matcher in another API process skips them, and one already filling
+    an order finishes first, so the cancel sees its committed status.
+    """
+    rows = {}
+    if cancel_order_ids:
+        query = db.query(Order).filter(Order.id.in_(set(cancel_order_ids)))
+        if is_postgresql(db):
+            query = query.order_by(Order.id).with_for_update().populate_existing()
+        rows = {order.id: order for order in query.all()}
+
+    results = []
+    to_cancel = []
+    seen = set()
+    for index, order_id in enumerate(cancel_order_ids):
+        result = BatchItemResult(index=index, status="CANCELLED", order_id=order_id)
+        results.append(result)
+        order = rows.get(order_id)
+        if order is None or order.account_id != account_id:
+            _reject(result, "Order not found")
+        elif market_key(order.catchment, order.unit_type) != market:
+            _reject(result, "Order is in a different market")
+        elif order_id in seen:
+            _reject(result, "Order is cancelled twice in this batch")
+        elif order.status not in OPEN_ORDER_STATUSES:
+            result.status = "ALREADY_CLOSED"
+            result.order_status = order.status
+        else:
+            to_cancel.append((order, result))
+        seen.add(order_id)
+    return results, to_cancel
+
+
+def stage_order_batch(
+    account_id: int,
+    catchment: str,
+    unit_type: str,
+    orders: List[BatchOrder],
+    cancel_order_ids: List[int],
+    db: Session,
+    check_funds: bool = True
+) -> OrderBatchResult:
+    """
+    Validate a batch and, if every item is valid, apply its cancels and new orders
+    to the session (flushed, not committed). Use complete_order_batch to commit and match.
+
+    check_funds also checks the buyer's cash for the BUY orders and the seller's free
+    on-chain credits for the SELL orders (net of the SELL orders being cancelled);
+    bots, which trade from their FIFO credit queues, skip it as they always have.
+    """
+    market = market_key(catchment, unit_type)
+    order_results = [
+        BatchItemResult(index=index, status="ACCEPTED", remaining_quantity=order.quantity_units)
+        for index, order in enumerate(orders)
+    ]
+    cancel_results, to_cancel = _validate_cancels(account_id, market, cancel_order_ids, db)
+
+    account = db.get(Account, account_id)
+    if account is None or not account.evm_address:
+        for result in order_results:
+            _reject(result, "Account not found or has no EVM address")
+
+    # Schemes referenced by the batch, plus a default scheme for untagged BUY orders
+    scheme_ids = {order.scheme_id for order in orders if order.scheme_id is not None}
+    schemes: Dict[int, Scheme] = {}
+    if scheme_ids:
+        schemes = {scheme.id: scheme for scheme in db.query(Scheme).filter(Scheme.id.in_(scheme_ids)).all()}
+    default_scheme = None
+    if any(order.side == "BUY" and order.scheme_id is None for order in orders):
+        default_scheme = db.query(Scheme).filter(
+            Scheme.catchment == market[0],
+            Scheme.unit_type == market[1]
+        ).first()
+
+    for order, result in zip(orders, order_results):
+        if result.status == "REJECTED":
+            continue
+        scheme = schemes.get(order.scheme_id) if order.scheme_id is not None else None
+        if order.side not in ("BUY", "SELL"):
+            _reject(result, "Side must be BUY or SELL")
+        elif market[1] not in UNIT_TYPES:
+            _reject(result, "Unit type must be nitrate or phosphate")
+        elif order.quantity_units <= 0:
+            _reject(result, "Quantity must be greater than 0")
+        elif order.price_per_unit is None or order.price_per_unit <= 0:
+            _reject(result, "Price per unit must be greater than 0")
+        elif order.side == "SELL" and order.scheme_id is None:
+            _reject(result, "SELL orders must name the scheme the credits come from")
+        elif order.scheme_id is not None and scheme is None:
+            _reject(result, f"Scheme {order.scheme_id} not found")
+        elif scheme is not None and market_key(scheme.catchment, scheme.unit_type) != market:
+            _reject(result, f"Scheme {scheme.id} is not in {market[0]} {market[1]}")
+
+    if check_funds and account is not None:
+        buy_results = [(order, result) for order, result in zip(orders, order_results) if order.side == "BUY" and result.status == "ACCEPTED"]
+        total_cost = sum(order.quantity_units * order.price_per_unit for order, _ in buy_results)
+        if buy_results:
+            has_sufficient, available_balance = check_buyer_has_sufficient_balance(account, total_cost, db)
+            if not has_sufficient:
+                for _, result in buy_results:
+                    _reject(result, f"Insufficient balance. Available: £{available_balance:,.2f}, Required: £{total_cost:,.2f}")
+
+        required_by_scheme: Dict[int, int] = {}
+        for order, result in zip(orders, order_results):
+            if order.side == "SELL" and result.status == "ACCEPTED":
+                required_by_scheme[order.scheme_id] = required_by_scheme.get(order.scheme_id, 0) + order.quantity_units
+        for cancelled, _ in to_cancel:
+            if cancelled.side == "SELL" and cancelled.scheme_id in required_by_scheme:
+                required_by_scheme[cancelled.scheme_id] -= cancelled.remaining_quantity
+        for scheme_id, required in required_by_scheme.items():
+            if required <= 0:
+                continue
+            scheme = schemes[scheme_id]
+            has_sufficient, available = check_seller_has_sufficient_credits(account, scheme.id, scheme.nft_token_id, required, db)
+            if not has_sufficient:
+                for order, result in zip(orders, order_results):
+                    if order.side == "SELL" and order.scheme_id == scheme_id:
+                        _reject(result, f"Insufficient free credits in scheme {scheme_id}. Available: {available:,}, Required: {required:,}")
+
+    batch = OrderBatchResult(applied=False, orders=order_results, cancels=cancel_results)
+    if any(result.status == "REJECTED" for result in order_results + cancel_results):
+        for result in order_results + cancel_results:
+            if result.status != "REJECTED":
+                result.status = "NOT_APPLIED"
+        print(f"[BATCH] Rejected batch for account {account_id} in {market[0]} {market[1]}")
+        if is_postgresql(db):
+            db.rollback()  # Release the locks on the orders to cancel
+        return batch
+
+    for cancelled, result in to_cancel:
+        release_order(cancelled, cancelled.remaining_quantity, db)
+        cancelled.status = "CANCELLED"
+        result.order_status = "CANCELLED"
+
+    for order, result in zip(orders, order_results):
+        scheme = schemes.get(order.scheme_id) if order.scheme_id is not None else default_scheme
+        row = Order(
+            account_id=account_id,
+            order_type="LIMIT",
+            side=order.side,
+            catchment=market[0],
+            unit_type=market[1],
+            price_per_unit=order.price_per_unit,
+            quantity_units=order.quantity_units,
+            filled_quantity=0,
+            remaining_quantity=order.quantity_units,
+            status="PENDING",
+            scheme_id=scheme.id if scheme else None,
+            nft_token_id=scheme.nft_token_id if scheme else None
+        )
+        resolve_order_funding(row, account, db, is_house_account=order.is_house_account)
+        reserve_order(row, db)
+        db.add(row)
+        batch.created.append(row)
+
+    db.flush()  # Assign order IDs
+    for row, result in zip(batch.created, order_results):
+        result.order_id = row.id
+        result.order_status = row.status
+
+    batch.applied = True
+    print(f"[BATCH] Staged {len(batch.created)} orders and {len(to_cancel)} cancels for account {account_id} in {market[0]} {market[1]}")
+    return batch
+
+
+def _crosses_book(side: str, price: float, catchment: str, unit_type: str, db: Session) -> bool:
+    if is_postgresql(db):
+        opposite_side = "SELL" if side == "BUY" else "BUY"
+        crosses = Order.price_per_unit <= price if side == "BUY" else Order.price_per_unit >= price
+        return db.query(Order.id).filter(
+            Order.catchment == catchment,
+            Order.unit_type == unit_type,
+            Order.side == opposite_side,
+            Order.status.in_(OPEN_ORDER_STATUSES),
+            Order.remaining_quantity > 0,
+            crosses
+        ).first() is not None
+    book = get_order_book(catchment, unit_type, db)
+    if side == "BUY":
+        best_ask = book.best_ask()
+        return best_ask is not None and price >= best_ask
+    best_bid = book.best_bid()
+    return best_bid is not None and price <= best_bid
+
+
+def complete_order_batch(batch: OrderBatchResult, db: Session, match: bool = True) -> OrderBatchResult:
+    """
+    Commit a staged batch, then match the new orders that cross the book.
+
+    Returns:
+        The batch, with results updated for any fills
+    """
+    if not batch.applied:
+        return batch
+    # Read what the crossing check needs before the commit expires the rows
+    plan = [(order.side, order.price_per_unit, order.catchment, order.unit_type) for order in batch.created]
+    db.commit()
+
+    if not match:
+        return batch
+
+    from .order_matching import match_order
+    from .price_history import update_price_history
+
+    for order, result, fields in zip(batch.created, batch.orders, plan):
+        if not _crosses_book(*fields, db):
+            continue
+        try:
+            trades = match_order(order, db)
+            for trade in trades:
+                update_price_history(trade, db)
+            batch.trades.extend(trades)
+        except Exception as e:
+            print(f"[BATCH] Error matching order {result.order_id}: {str(e)}")
+            # Drop the failed fill's uncommitted changes, or the next order's match would commit them
+            db.rollback()
+            result.status = "MATCH_FAILED"
+            result.error = f"Order placed but matching failed: {str(e)}"
+        result.order_status = order.status
+        result.filled_quantity = order.filled_quantity
+        result.remaining_quantity = order.remaining_quantity
+    return batch
+
+
+def apply_order_batch(
+    account_id: int,
+    catchment: str,
+    unit_type: str,
+    orders: List[BatchOrder],
+    cancel_order_ids: List[int],
+    db: Session,
+    check_funds: bool = True,
+    match: bool = True
+) -> OrderBatchResult:
+    """
+    Validate, apply (one transaction) and match a batch of orders and cancels for
+    one market, as one command on the market's actor.
+    """
+    def command() -> OrderBatchResult:
+        batch = stage_order_batch(account_id, catchment, unit_type, orders, cancel_order_ids, db, check_funds=check_funds)
+        return complete_order_batch(batch, db, match=match)
+    
+    return run_in_market(catchment, unit_type, command)
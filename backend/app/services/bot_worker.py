@@ -1,88 +1,214 @@
+"""
+Event-driven scheduler for market-making and sell ladder bots.
+
+The worker used to wake every 60 seconds and refresh every active bot in turn on
+one thread, so one slow market delayed all the others and quotes stayed stale for
+up to a minute after a fill. Now:
+
+- a change to a market's order book (new order, fill or cancel committed by any
+  other thread) schedules a refresh of that market's bots after a short debounce,
+  so a burst of fills causes one refresh;
+- every market with active bots is still refreshed every `interval_seconds` as a
+  fallback (and to pick up newly activated bots);
+- a refresh is a command on the market's actor (services.market_actor), which
+  also runs every match, cancel and batch in that market - a refresh never races
+  the matcher in its own market, never runs twice at once, and markets refresh
+  in parallel on their own actors.
+
+On PostgreSQL, other API processes also place orders, so each refresh first
+reloads its market's book from the database.
+
+Book changes made by a refresh itself are ignored, so bots do not re-trigger
+themselves.
+"""
 import threading
 import time
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from ..db import SessionLocal
+from ..db import SessionLocal, is_postgresql
 from ..models import MarketMakingBot, SellLadderBot
+from .market_actor import get_market_actors, run_in_market
+from .market_lock import market_lock
 from .market_making_bot import place_bot_orders
+from .order_book import get_order_book_registry, market_key
 from .sell_ladder_bot import place_sell_ladder_orders
 
+Market = Tuple[str, str]
+
+# Set while the current thread is refreshing bots, so their own orders are not events
+_refresh_context = threading.local()
+
 
 class BotWorker:
-    """Background worker for executing market making bots."""
-    
-    def __init__(self, interval_seconds: int = 60):
+    """Background scheduler for executing market making and sell ladder bots."""
+
+    def __init__(
+        self,
+        interval_seconds: int = 60,
+        debounce_seconds: float = 1.0,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
         self.interval_seconds = interval_seconds
+        self.debounce_seconds = debounce_seconds
+        self.session_factory = session_factory
         self.thread: Optional[threading.Thread] = None
         self.running = False
         self._stop_event = threading.Event()
-    
+        self._condition = threading.Condition()
+        self._bot_markets: Set[Market] = set()
+        self._due: Dict[Market, float] = {}
+        self._in_progress: Set[Market] = set()
+        self._next_full_cycle = 0.0
+
     def start(self):
-        """Start the bot worker thread."""
+        """Start the scheduler thread."""
         if self.running:
             return
-        
+
         self.running = True
         self._stop_event.clear()
+        self._next_full_cycle = 0.0
+        get_order_book_registry().add_listener(self._on_book_change)
         self.thread = threading.Thread(target=self._run, daemon=True)
         self.thread.start()
-        print(f"Bot worker started (interval: {self.interval_seconds}s)")
-    
+        print(f"Bot worker started (fallback interval: {self.interval_seconds}s, debounce: {self.debounce_seconds}s)")
+
     def stop(self):
-        """Stop the bot worker thread."""
+        """Stop the scheduler; refreshes already running are allowed to finish, queued ones are skipped."""
         if not self.running:
             return
-        
+
         self.running = False
         self._stop_event.set()
-        
+        get_order_book_registry().remove_listener(self._on_book_change)
+        with self._condition:
+            self._condition.notify_all()
+
         if self.thread:
             self.thread.join(timeout=5.0)
-        
+        with self._condition:
+            self._condition.wait_for(lambda: not self._in_progress, timeout=5.0)
+
         print("Bot worker stopped")
-    
+
+    def notify_market(self, catchment: str, unit_type: str):
+        """Schedule a debounced refresh of the bots in a market."""
+        if not self.running or getattr(_refresh_context, "active", False):
+            return
+        market = market_key(catchment, unit_type)
+        with self._condition:
+            if market not in self._bot_markets or market in self._due:
+                return
+            self._due[market] = time.monotonic() + self.debounce_seconds
+            self._condition.notify()
+
+    def _on_book_change(self, book, changes):
+        """Order book listener (runs in the committing thread)."""
+        self.notify_market(book.catchment, book.unit_type)
+
     def _run(self):
-        """Main worker loop."""
+        """Scheduler loop: dispatch due markets to the pool and run the periodic fallback."""
         while self.running and not self._stop_event.is_set():
-            try:
-                self._run_bot_cycle()
-            except Exception as e:
-                print(f"Error in bot worker cycle: {str(e)}")
-            
-            # Wait for interval or stop event
-            self._stop_event.wait(self.interval_seconds)
-    
-    def _run_bot_cycle(self):
-        """Execute one cycle for all active bots."""
-        db: Session = SessionLocal()
-        try:
-            # Get all active market-making bots
-            active_mm_bots = db.query(MarketMakingBot).filter(
-                MarketMakingBot.is_active == 1
-            ).all()
-            
-            for bot in active_mm_bots:
+            if time.monotonic() >= self._next_full_cycle:
                 try:
-                    place_bot_orders(bot.id, db)
+                    self._schedule_all_markets()
                 except Exception as e:
-                    print(f"Error placing orders for market-making bot {bot.id}: {str(e)}")
-            
-            # Get all active sell ladder bots
-            active_sl_bots = db.query(SellLadderBot).filter(
+                    print(f"Error loading bot markets: {str(e)}")
+                self._next_full_cycle = time.monotonic() + self.interval_seconds
+
+            with self._condition:
+                now = time.monotonic()
+                for market, due in list(self._due.items()):
+                    if due <= now and market not in self._in_progress:
+                        del self._due[market]
+                        self._in_progress.add(market)
+                        future = get_market_actors().submit(*market, lambda market=market: self._refresh_market(market))
+                        future.add_done_callback(lambda future, market=market: self._refresh_done(market))
+
+                # Sleep until the next due market (or fallback cycle), or until notified
+                waiting = [due for market, due in self._due.items() if market not in self._in_progress]
+                wake_at = min(waiting + [self._next_full_cycle])
+                if not self._stop_event.is_set():
+                    self._condition.wait(timeout=max(0.0, wake_at - now))
+
+    def _schedule_all_markets(self):
+        markets = self.load_bot_markets()
+        now = time.monotonic()
+        with self._condition:
+            self._bot_markets = set(markets)
+            for market in markets:
+                self._due.setdefault(market, now)
+
+    def load_bot_markets(self) -> List[Market]:
+        """Markets that have at least one active bot."""
+        db: Session = self.session_factory()
+        try:
+            rows = db.query(MarketMakingBot.catchment, MarketMakingBot.unit_type).filter(
+                MarketMakingBot.is_active == 1
+            ).distinct().all()
+            rows += db.query(SellLadderBot.catchment, SellLadderBot.unit_type).filter(
                 SellLadderBot.is_active == 1
-            ).all()
-            
-            for bot in active_sl_bots:
-                try:
-                    place_sell_ladder_orders(bot.id, db)
-                except Exception as e:
-                    print(f"Error placing orders for sell ladder bot {bot.id}: {str(e)}")
+            ).distinct().all()
+        finally:
+            db.close()
+        return sorted({market_key(catchment, unit_type) for catchment, unit_type in rows})
+
+    def _refresh_market(self, market: Market):
+        """Runs on the market's actor."""
+        if not self.running:
+            return
+        try:
+            self.run_market_once(market)
+        except Exception as e:
+            print(f"Error refreshing bots in {market[0]} {market[1]}: {str(e)}")
+
+    def _refresh_done(self, market: Market):
+        with self._condition:
+            self._in_progress.discard(market)
+            self._condition.notify_all()
+
+    def run_market_once(self, market: Market):
+        """Refresh every active bot in one market, as a command on its actor, holding the market lock."""
+        run_in_market(*market, lambda: self._refresh_bots(market))
+
+    def _refresh_bots(self, market: Market):
+        catchment, unit_type = market
+        _refresh_context.active = True
+        db: Session = self.session_factory()
+        try:
+            with market_lock(catchment, unit_type, db):
+                if is_postgresql(db):
+                    get_order_book_registry().load_market(catchment, unit_type, db)
+                active_mm_bots = db.query(MarketMakingBot).filter(
+                    MarketMakingBot.is_active == 1,
+                    func.upper(MarketMakingBot.catchment) == catchment,
+                    func.lower(MarketMakingBot.unit_type) == unit_type
+                ).all()
+                for bot in active_mm_bots:
+                    try:
+                        place_bot_orders(bot.id, db)
+                    except Exception as e:
+                        print(f"Error placing orders for market-making bot {bot.id}: {str(e)}")
+
+                active_sl_bots = db.query(SellLadderBot).filter(
+                    SellLadderBot.is_active == 1,
+                    func.upper(SellLadderBot.catchment) == catchment,
+                    func.lower(SellLadderBot.unit_type) == unit_type
+                ).all()
+                for bot in active_sl_bots:
+                    try:
+                        place_sell_ladder_orders(bot.id, db)
+                    except Exception as e:
+                        print(f"Error placing orders for sell ladder bot {bot.id}: {str(e)}")
         finally:
             db.close()
-    
+            _refresh_context.active = False
+
     def run_cycle_once(self):
-        """Manually run one cycle (for testing)."""
-        self._run_bot_cycle()
+        """Manually refresh every market with active bots, in turn (for testing)."""
+        for market in self.load_bot_markets():
+            self.run_market_once(market)
 
 
 # Global worker instance
@@ -109,4 +235,3 @@ def stop_bot_worker():
     if _worker:
         _worker.stop()
         _worker = None
-
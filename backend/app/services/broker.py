@@ -1,4 +1,5 @@
-from web3 import Web3
+from .chain_client import is_connected, to_checksum
+from .chain_indexer import read_balances
 from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func
@@ -60,9 +61,7 @@ def get_broker_client_holdings(broker: Account, db: Session) -> List[Dict]:
     
     try:
         # Connect to blockchain
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
-        
-        if not w3.is_connected():
+        if not is_connected(rpc_url):
             return []
         
         # Get all schemes from database
@@ -95,26 +94,13 @@ def get_broker_client_holdings(broker: Account, db: Session) -> List[Dict]:
             })
         
         # Prepare batch query for on-chain balances
-        broker_address = Web3.to_checksum_address(broker.evm_address)
-        contract = w3.eth.contract(
-            address=Web3.to_checksum_address(scheme_credits_address),
-            abi=get_scheme_credits_abi()
-        )
-        
+        broker_address = to_checksum(broker.evm_address)
         scheme_ids = [scheme.nft_token_id for scheme in schemes]
-        accounts_array = [broker_address] * len(scheme_ids)
-        
-        # Query balances for all schemes
-        balances = contract.functions.balanceOfBatch(accounts_array, scheme_ids).call()
         
-        # Query locked balances
-        locked_balances = []
-        for scheme_id in scheme_ids:
-            try:
-                locked = contract.functions.lockedBalance(scheme_id, broker_address).call()
-                locked_balances.append(int(locked))
-            except:
-                locked_balances.append(0)
+        # Query balances and locked balances for all schemes (chain index or node cache)
+        cached = read_balances(db, broker_address, scheme_ids, scheme_credits_address, rpc_url)
+        balances = [cached[scheme_id][0] for scheme_id in scheme_ids]
+        locked_balances = [cached[scheme_id][1] for scheme_id in scheme_ids]
         
         # Build summary - only include schemes where broker has balance and has active mandates
         summary = []
@@ -170,9 +156,7 @@ def get_broker_house_holdings(house_address: str, db: Session) -> List[Dict]:
     
     try:
         # Connect to blockchain
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
-        
-        if not w3.is_connected():
+        if not is_connected(rpc_url):
             return []
         
         # Get all schemes from database
@@ -202,26 +186,13 @@ def get_broker_house_holdings(house_address: str, db: Session) -> List[Dict]:
             })
         
         # Prepare batch query for on-chain balances
-        house_address_checksum = Web3.to_checksum_address(house_address)
-        contract = w3.eth.contract(
-            address=Web3.to_checksum_address(scheme_credits_address),
-            abi=get_scheme_credits_abi()
-        )
-        
+        house_address_checksum = to_checksum(house_address)
         scheme_ids = [scheme.nft_token_id for scheme in schemes]
-        accounts_array = [house_address_checksum] * len(scheme_ids)
-        
-        # Query balances for all schemes
-        balances = contract.functions.balanceOfBatch(accounts_array, scheme_ids).call()
         
-        # Query locked balances
-        locked_balances = []
-        for scheme_id in scheme_ids:
-            try:
-                locked = contract.functions.lockedBalance(scheme_id, house_address_checksum).call()
-                locked_balances.append(int(locked))
-            except:
-                locked_balances.append(0)
+        # Query balances and locked balances for all schemes (chain index or node cache)
+        cached = read_balances(db, house_address_checksum, scheme_ids, scheme_credits_address, rpc_url)
+        balances = [cached[scheme_id][0] for scheme_id in scheme_ids]
+        locked_balances = [cached[scheme_id][1] for scheme_id in scheme_ids]
         
         # Build summary - only include schemes where house has balance
         summary = []
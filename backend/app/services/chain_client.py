@@ -0,0 +1,208 @@
+"""
+Process-wide blockchain client.
+
+Building Web3(HTTPProvider(...)) per call opens a fresh HTTP connection, runs an
+is_connected() round trip and re-parses the contract ABI every time. This module
+keeps one Web3 instance per RPC URL backed by a pooled keep-alive session, caches
+contract instances per (address, ABI) and checksummed addresses, and rate-limits
+the health check so a single request does not pay for several handshakes.
+
+use_chain_simulator() points every RPC URL at an in-process ChainSimulator
+(services.chain_simulator) instead, for tests, benchmarks and local runs.
+"""
+from web3 import Web3
+from typing import Dict, List, Optional, Tuple
+from functools import lru_cache
+import json
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_RPC_URL = "http://127.0.0.1:8545"
+
+# A healthy node is re-checked at most this often; a failed check is retried on the next call
+HEALTH_CHECK_TTL_SECONDS = 5.0
+
+# Keep-alive connections per RPC host (bots, settlement and API threads share them)
+POOL_MAXSIZE = 20
+
+# Seconds before an RPC call times out
+REQUEST_TIMEOUT_SECONDS = 30
+
+_lock = threading.Lock()
+_web3_instances: Dict[str, Web3] = {}
+_sessions: Dict[str, requests.Session] = {}
+_contracts: Dict[Tuple[str, str, str], object] = {}
+_last_healthy: Dict[str, float] = {}
+
+# In-process chain answering every RPC URL (services.chain_simulator), if installed
+_simulator = None
+
+
+def get_rpc_url(rpc_url: Optional[str] = None) -> str:
+    """Resolve the RPC URL (argument, then RPC_URL env var, then local Hardhat)."""
+    return rpc_url or os.getenv("RPC_URL", DEFAULT_RPC_URL)
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_web3(rpc_url: Optional[str] = None) -> Web3:
+    """Get the shared Web3 instance for an RPC URL (created on first use)."""
+    rpc_url = get_rpc_url(rpc_url)
+    w3 = _web3_instances.get(rpc_url)
+    if w3 is not None:
+        return w3
+
+    with _lock:
+        w3 = _web3_instances.get(rpc_url)
+        if w3 is None and _simulator is not None:
+            w3 = Web3(_simulator.provider())
+            _web3_instances[rpc_url] = w3
+        elif w3 is None:
+            session = _build_session()
+            provider = Web3.HTTPProvider(
+                rpc_url,
+                request_kwargs={"timeout": REQUEST_TIMEOUT_SECONDS},
+                session=session
+            )
+            w3 = Web3(provider)
+            _sessions[rpc_url] = session
+            _web3_instances[rpc_url] = w3
+        return w3
+
+
+def is_connected(rpc_url: Optional[str] = None) -> bool:
+    """
+    Health-checked connectivity test.
+    A successful check is trusted for HEALTH_CHECK_TTL_SECONDS; failures are never cached.
+    """
+    rpc_url = get_rpc_url(rpc_url)
+    last = _last_healthy.get(rpc_url)
+    if last is not None and time.monotonic() - last < HEALTH_CHECK_TTL_SECONDS:
+        return True
+
+    try:
+        connected = get_web3(rpc_url).is_connected()
+    except Exception:
+        connected = False
+
+    if connected:
+        _last_healthy[rpc_url] = time.monotonic()
+    else:
+        _last_healthy.pop(rpc_url, None)
+    return connected
+
+
+def get_connected_web3(rpc_url: Optional[str] = None) -> Web3:
+    """
+    Get the shared Web3 instance, raising if the node is unreachable.
+
+    Raises:
+        ValueError: If the node does not answer the health check
+    """
+    rpc_url = get_rpc_url(rpc_url)
+    if not is_connected(rpc_url):
+        raise ValueError(f"Cannot connect to blockchain at {rpc_url}")
+    return get_web3(rpc_url)
+
+
+def mark_unhealthy(rpc_url: Optional[str] = None):
+    """Force the next is_connected() call to hit the node (e.g. after an RPC error)."""
+    _last_healthy.pop(get_rpc_url(rpc_url), None)
+
+
+@lru_cache(maxsize=4096)
+def to_checksum(address: str) -> str:
+    """Cached Web3.to_checksum_address (keccak per call otherwise)."""
+    return Web3.to_checksum_address(address)
+
+
+def get_contract(address: str, abi: list, rpc_url: Optional[str] = None):
+    """Get a cached contract instance for an address and ABI on the shared provider."""
+    rpc_url = get_rpc_url(rpc_url)
+    checksum_address = to_checksum(address)
+    key = (rpc_url, checksum_address, json.dumps(abi, sort_keys=True))
+    contract = _contracts.get(key)
+    if contract is not None:
+        return contract
+
+    with _lock:
+        contract = _contracts.get(key)
+        if contract is None:
+            contract = get_web3(rpc_url).eth.contract(address=checksum_address, abi=abi)
+            _contracts[key] = contract
+        return contract
+
+
+def batch_call(calls: List[Tuple[str, str]], rpc_url: Optional[str] = None, block: str = "latest") -> List[bytes]:
+    """
+    Run many eth_calls in one JSON-RPC batch request on the pooled session.
+
+    Web3's own batch_requests() switches the shared provider into batching mode,
+    which would capture calls made by other threads, so the batch is posted directly.
+    Falls back to one eth_call at a time if the node does not accept batches.
+
+    Args:
+        calls: (to_address, calldata hex) pairs
+
+    Returns:
+        Raw return data per call, in order
+    """
+    if not calls:
+        return []
+    rpc_url = get_rpc_url(rpc_url)
+    w3 = get_web3(rpc_url)
+    payload = [
+        {"jsonrpc": "2.0", "id": index, "method": "eth_call", "params": [{"to": to_checksum(to), "data": data}, block]}
+        for index, (to, data) in enumerate(calls)
+    ]
+
+    if _simulator is not None:
+        body = _simulator.handle(payload)
+    else:
+        response = _sessions[rpc_url].post(rpc_url, json=payload, timeout=REQUEST_TIMEOUT_SECONDS)
+        body = response.json()
+    if not isinstance(body, list):
+        # Node rejected the batch as a whole
+        return [bytes(w3.eth.call({"to": to_checksum(to), "data": data}, block)) for to, data in calls]
+
+    results: List[Optional[bytes]] = [None] * len(calls)
+    for item in body:
+        if "error" in item:
+            raise ValueError(f"eth_call {item.get('id')} failed: {item['error']}")
+        results[item["id"]] = bytes.fromhex(item["result"][2:])
+    return results
+
+
+def reset_chain_client():
+    """Drop all cached providers, contracts and health state (tests, RPC URL changes)."""
+    with _lock:
+        _web3_instances.clear()
+        _sessions.clear()
+        _contracts.clear()
+        _last_healthy.clear()
+    to_checksum.cache_clear()
+
+
+def use_chain_simulator(simulator):
+    """
+    Answer every RPC URL from an in-process ChainSimulator, or go back to real
+    nodes with None. Cached providers and contracts are dropped either way.
+    """
+    global _simulator
+    reset_chain_client()
+    with _lock:
+        _simulator = simulator
+
+
+def get_chain_simulator():
+    """The installed ChainSimulator, if any."""
+    return _simulator
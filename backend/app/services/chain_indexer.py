@@ -0,0 +1,378 @@
+"""
+Chain event indexer that materialises credit balances into SQL.
+
+Follows SchemeCredits, SchemeNFT and PlanningLock logs from a checkpointed block
+and writes balance, lock and burn deltas into credit_balance_deltas, applying
+them to credit_balances / scheme_nft_owners. Holdings reads and SchemeNFT owner
+checks then become indexed SQL lookups instead of node queries.
+
+Every applied delta is kept, so a reorg (detected by comparing stored block
+hashes with the node) or an explicit replay undoes the deltas above the fork
+block in reverse order and re-indexes from there.
+"""
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+from eth_abi import decode
+from web3 import Web3
+import os
+import time
+
+from ..models import ChainCursor, IndexedBlock, CreditBalance, CreditBalanceDelta, SchemeNFTOwner
+from .chain_client import get_web3, to_checksum
+from .balance_cache import (
+    TRANSFER_SINGLE_TOPIC, TRANSFER_BATCH_TOPIC, APPLICATION_SUBMITTED_TOPIC,
+    APPLICATION_APPROVED_TOPIC, APPLICATION_REJECTED_TOPIC, get_cached_balances
+)
+
+CURSOR_NAME = "credits"
+
+# Blocks fetched per get_logs call
+MAX_BLOCKS_PER_CYCLE = 2000
+
+# Number of recent block hashes kept for reorg detection
+REORG_WINDOW_BLOCKS = 64
+
+# Reads fall back to the node when the indexer has not caught up for this long
+INDEX_MAX_LAG_SECONDS = 30.0
+
+ZERO_ADDRESS = "0x" + "0" * 40
+
+NFT_TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)")
+
+# monotonic time the indexer last reached the chain head in this process
+_last_caught_up: Optional[float] = None
+
+
+def get_indexed_contracts() -> Dict[str, Optional[str]]:
+    """Lowercase addresses of the contracts the indexer follows."""
+    def _lower(name: str) -> Optional[str]:
+        value = os.getenv(name)
+        return value.lower() if value else None
+
+    return {
+        "credits": _lower("SCHEME_CREDITS_CONTRACT_ADDRESS"),
+        "nft": _lower("SCHEME_NFT_CONTRACT_ADDRESS"),
+        "planning": _lower("PLANNING_LOCK_CONTRACT_ADDRESS"),
+    }
+
+
+def _topic_address(topic) -> str:
+    return ("0x" + bytes(topic)[-20:].hex()).lower()
+
+
+def _topic_int(topic) -> int:
+    return int.from_bytes(bytes(topic), "big")
+
+
+def _transfer_deltas(base: dict, from_address: str, to: str, token_ids: List[int], values: List[int]) -> List[CreditBalanceDelta]:
+    deltas = []
+    for token_id, value in zip(token_ids, values):
+        if from_address != ZERO_ADDRESS:
+            deltas.append(CreditBalanceDelta(
+                holder_address=from_address,
+                nft_token_id=token_id,
+                balance_delta=-value,
+                burned_delta=value if to == ZERO_ADDRESS else 0,
+                **base
+            ))
+        if to != ZERO_ADDRESS:
+            deltas.append(CreditBalanceDelta(holder_address=to, nft_token_id=token_id, balance_delta=value, **base))
+    return deltas
+
+
+def _deltas_for_log(log, contracts: Dict[str, Optional[str]], db: Session) -> List[CreditBalanceDelta]:
+    """Translate one log into balance/lock/owner deltas (empty for unrelated logs)."""
+    topics = log["topics"]
+    if not topics:
+        return []
+    address = log["address"].lower()
+    topic0 = bytes(topics[0])
+    data = bytes(log["data"])
+    base = {
+        "block_number": log["blockNumber"],
+        "transaction_hash": Web3.to_hex(log["transactionHash"]),
+        "log_index": log["logIndex"],
+    }
+
+    if address == contracts["credits"]:
+        if topic0 == TRANSFER_SINGLE_TOPIC:
+            token_id, value = decode(["uint256", "uint256"], data)
+            return _transfer_deltas(dict(base, event="TransferSingle"), _topic_address(topics[2]), _topic_address(topics[3]), [token_id], [value])
+        if topic0 == TRANSFER_BATCH_TOPIC:
+            token_ids, values = decode(["uint256[]", "uint256[]"], data)
+            return _transfer_deltas(dict(base, event="TransferBatch"), _topic_address(topics[2]), _topic_address(topics[3]), list(token_ids), list(values))
+
+    if address == contracts["planning"]:
+        if topic0 == APPLICATION_SUBMITTED_TOPIC:
+            application_id = _topic_int(topics[1])
+            developer = _topic_address(topics[2])
+            _, token_ids, amounts = decode(["bytes32", "uint256[]", "uint256[]"], data)
+            return [
+                CreditBalanceDelta(
+                    event="ApplicationSubmitted", holder_address=developer, nft_token_id=token_id,
+                    locked_delta=amount, application_id=application_id, **base
+                )
+                for token_id, amount in zip(token_ids, amounts)
+            ]
+        if topic0 in (APPLICATION_APPROVED_TOPIC, APPLICATION_REJECTED_TOPIC):
+            # Approval burns (seen as a TransferSingle to zero) and rejection unlocks
+            # exactly what was locked on submission
+            application_id = _topic_int(topics[1])
+            event_name = "ApplicationApproved" if topic0 == APPLICATION_APPROVED_TOPIC else "ApplicationRejected"
+            submitted = db.query(CreditBalanceDelta).filter(
+                CreditBalanceDelta.application_id == application_id,
+                CreditBalanceDelta.event == "ApplicationSubmitted"
+            ).all()
+            return [
+                CreditBalanceDelta(
+                    event=event_name, holder_address=lock.holder_address, nft_token_id=lock.nft_token_id,
+                    locked_delta=-lock.locked_delta, application_id=application_id, **base
+                )
+                for lock in submitted
+            ]
+
+    if address == contracts["nft"] and topic0 == NFT_TRANSFER_TOPIC and len(topics) == 4:
+        return [CreditBalanceDelta(
+            event="SchemeNFTTransfer",
+            holder_address=_topic_address(topics[2]),
+            counterparty=_topic_address(topics[1]),
+            nft_token_id=_topic_int(topics[3]),
+            **base
+        )]
+
+    return []
+
+
+class _RowCache:
+    """Balance/owner rows touched in one cycle (the session does not autoflush)."""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.balances: Dict[Tuple[str, int], CreditBalance] = {}
+        self.owners: Dict[int, SchemeNFTOwner] = {}
+
+    def balance(self, holder: str, token_id: int) -> CreditBalance:
+        key = (holder, token_id)
+        row = self.balances.get(key)
+        if row is None:
+            row = self.db.query(CreditBalance).filter(
+                CreditBalance.holder_address == holder,
+                CreditBalance.nft_token_id == token_id
+            ).first()
+            if row is None:
+                row = CreditBalance(holder_address=holder, nft_token_id=token_id, balance=0, locked=0, burned=0)
+                self.db.add(row)
+            self.balances[key] = row
+        return row
+
+    def owner(self, token_id: int) -> SchemeNFTOwner:
+        row = self.owners.get(token_id)
+        if row is None:
+            row = self.db.get(SchemeNFTOwner, token_id)
+            if row is None:
+                row = SchemeNFTOwner(nft_token_id=token_id)
+                self.db.add(row)
+            self.owners[token_id] = row
+        return row
+
+
+def _apply_delta(delta: CreditBalanceDelta, rows: _RowCache, sign: int = 1):
+    """Apply (sign=1) or undo (sign=-1) one delta."""
+    if delta.event == "SchemeNFTTransfer":
+        row = rows.owner(delta.nft_token_id)
+        owner = delta.holder_address if sign > 0 else delta.counterparty
+        row.owner_address = None if owner == ZERO_ADDRESS else owner
+        row.last_block = delta.block_number if sign > 0 else None
+        return
+
+    row = rows.balance(delta.holder_address, delta.nft_token_id)
+    row.balance += sign * (delta.balance_delta or 0)
+    row.locked += sign * (delta.locked_delta or 0)
+    row.burned += sign * (delta.burned_delta or 0)
+    if sign > 0:
+        row.last_block = delta.block_number
+
+
+def get_cursor(db: Session) -> ChainCursor:
+    """Get or create the indexer checkpoint (starts at CHAIN_INDEXER_START_BLOCK, default 0)."""
+    cursor = db.get(ChainCursor, CURSOR_NAME)
+    if cursor is None:
+        start_block = int(os.getenv("CHAIN_INDEXER_START_BLOCK", "0"))
+        cursor = ChainCursor(name=CURSOR_NAME, last_block=start_block - 1)
+        db.add(cursor)
+        db.flush()
+    return cursor
+
+
+def rollback_to_block(db: Session, block_number: int):
+    """
+    Undo every delta above block_number (newest first) and move the checkpoint back.
+    The caller commits.
+    """
+    rows = _RowCache(db)
+    deltas = db.query(CreditBalanceDelta).filter(
+        CreditBalanceDelta.block_number > block_number
+    ).order_by(CreditBalanceDelta.id.desc()).all()
+    for delta in deltas:
+        _apply_delta(delta, rows, sign=-1)
+        db.delete(delta)
+
+    db.query(IndexedBlock).filter(IndexedBlock.block_number > block_number).delete(synchronize_session=False)
+    cursor = get_cursor(db)
+    cursor.last_block = min(cursor.last_block, block_number)
+    print(f"[INDEXER] Rolled back {len(deltas)} deltas to block {block_number}")
+
+
+def replay_from_block(db: Session, block_number: int):
+    """Discard indexed state from block_number onwards so the next cycles re-index it."""
+    rollback_to_block(db, block_number - 1)
+    db.commit()
+
+
+def _find_fork_block(db: Session, w3) -> Optional[int]:
+    """
+    Compare stored block hashes with the node, newest first.
+    Returns None if the newest stored block is still canonical, otherwise the
+    newest block that is (or one before the oldest stored block).
+    """
+    stored = db.query(IndexedBlock).order_by(IndexedBlock.block_number.desc()).all()
+    for position, block in enumerate(stored):
+        try:
+            chain_block = w3.eth.get_block(block.block_number)
+            chain_hash = Web3.to_hex(chain_block["hash"])
+        except Exception:
+            chain_hash = None
+        if chain_hash == block.block_hash:
+            return None if position == 0 else block.block_number
+    if stored:
+        return stored[-1].block_number - 1
+    return None
+
+
+def index_chain(db: Session, rpc_url: Optional[str] = None, max_blocks: int = MAX_BLOCKS_PER_CYCLE) -> int:
+    """
+    Index the next range of blocks (at most max_blocks) and commit.
+
+    Returns:
+        Number of blocks indexed
+    """
+    global _last_caught_up
+
+    contracts = get_indexed_contracts()
+    if not contracts["credits"]:
+        return 0
+
+    w3 = get_web3(rpc_url)
+    latest = w3.eth.block_number
+    cursor = get_cursor(db)
+
+    if latest < cursor.last_block:
+        # Node was reset (local Hardhat restart) - everything indexed is gone
+        rollback_to_block(db, int(os.getenv("CHAIN_INDEXER_START_BLOCK", "0")) - 1)
+    else:
+        fork_block = _find_fork_block(db, w3)
+        if fork_block is not None:
+            print(f"[INDEXER] Reorg detected, rewinding to block {fork_block}")
+            rollback_to_block(db, fork_block)
+
+    from_block = cursor.last_block + 1
+    if from_block > latest:
+        db.commit()
+        _last_caught_up = time.monotonic()
+        return 0
+    to_block = min(latest, from_block + max_blocks - 1)
+
+    addresses = [to_checksum(address) for address in contracts.values() if address]
+    logs = w3.eth.get_logs({"fromBlock": from_block, "toBlock": to_block, "address": addresses})
+
+    rows = _RowCache(db)
+    for log in sorted(logs, key=lambda entry: (entry["blockNumber"], entry["logIndex"])):
+        for delta in _deltas_for_log(log, contracts, db):
+            db.add(delta)
+            _apply_delta(delta, rows)
+        # Approvals/rejections look up the submission deltas, which may be in this range
+        db.flush()
+
+    db.merge(IndexedBlock(block_number=to_block, block_hash=Web3.to_hex(w3.eth.get_block(to_block)["hash"])))
+    stale = db.query(IndexedBlock.block_number).order_by(
+        IndexedBlock.block_number.desc()
+    ).offset(REORG_WINDOW_BLOCKS).all()
+    if stale:
+        db.query(IndexedBlock).filter(IndexedBlock.block_number <= stale[0][0]).delete(synchronize_session=False)
+
+    cursor.last_block = to_block
+    db.commit()
+
+    if to_block == latest:
+        _last_caught_up = time.monotonic()
+    return to_block - from_block + 1
+
+
+def is_index_ready() -> bool:
+    """True if this process's indexer reached the chain head recently."""
+    return _last_caught_up is not None and time.monotonic() - _last_caught_up < INDEX_MAX_LAG_SECONDS
+
+
+def get_indexed_balances(db: Session, holder: str, token_ids: List[int]) -> Dict[int, Tuple[int, int]]:
+    """
+    Balance and locked balance per token for one holder from credit_balances.
+
+    Returns:
+        Dict of tokenId -> (balance, locked); tokens never seen are (0, 0)
+    """
+    rows = db.query(CreditBalance).filter(
+        CreditBalance.holder_address == holder.lower(),
+        CreditBalance.nft_token_id.in_(token_ids)
+    ).all()
+    result = {token_id: (0, 0) for token_id in token_ids}
+    for row in rows:
+        result[row.nft_token_id] = (row.balance, row.locked)
+    return result
+
+
+def read_balances(
+    db: Session,
+    holder: str,
+    token_ids: List[int],
+    contract_address: str,
+    rpc_url: Optional[str] = None
+) -> Dict[int, Tuple[int, int]]:
+    """
+    Holdings read used by the summary endpoints: indexed SQL when the indexer is
+    current, otherwise the block-aware node cache.
+    """
+    contracts = get_indexed_contracts()
+    if is_index_ready() and contracts["credits"] == contract_address.lower():
+        return get_indexed_balances(db, holder, token_ids)
+    return get_cached_balances(holder, token_ids, contract_address, rpc_url)
+
+
+def get_indexed_nft_owners(db: Session, token_ids: List[int]) -> Dict[int, Optional[str]]:
+    """
+    Current owner per SchemeNFT token from scheme_nft_owners.
+
+    Returns:
+        Dict of tokenId -> lowercase owner address; None for tokens burned or never minted
+    """
+    rows = db.query(SchemeNFTOwner).filter(SchemeNFTOwner.nft_token_id.in_(token_ids)).all()
+    result: Dict[int, Optional[str]] = {token_id: None for token_id in token_ids}
+    for row in rows:
+        result[row.nft_token_id] = row.owner_address
+    return result
+
+
+def read_nft_owners(db: Session, token_ids: List[int], contract_address: str) -> Optional[Dict[int, Optional[str]]]:
+    """
+    SchemeNFT owners from the index when the indexer is current for this
+    contract, otherwise None (ask the node).
+    """
+    contracts = get_indexed_contracts()
+    if is_index_ready() and contracts["nft"] == contract_address.lower():
+        return get_indexed_nft_owners(db, token_ids)
+    return None
+
+
+def reset_index_state():
+    """Forget that the indexer has caught up (tests, shutdown)."""
+    global _last_caught_up
+    _last_caught_up = None
@@ -0,0 +1,91 @@
+import threading
+from typing import Optional
+from sqlalchemy.orm import Session
+from ..db import SessionLocal
+from .chain_indexer import index_chain, reset_index_state, MAX_BLOCKS_PER_CYCLE
+
+
+class ChainIndexerWorker:
+    """Background worker that follows contract logs into the credit balance tables."""
+
+    def __init__(self, interval_seconds: int = 2):
+        self.interval_seconds = interval_seconds
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Start the indexer thread."""
+        if self.running:
+            return
+
+        self.running = True
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print(f"Chain indexer started (interval: {self.interval_seconds}s)")
+
+    def stop(self):
+        """Stop the indexer thread."""
+        if not self.running:
+            return
+
+        self.running = False
+        self._stop_event.set()
+
+        if self.thread:
+            self.thread.join(timeout=5.0)
+
+        reset_index_state()
+        print("Chain indexer stopped")
+
+    def _run(self):
+        """Main worker loop."""
+        while self.running and not self._stop_event.is_set():
+            try:
+                # Keep going without waiting while catching up on a backlog of blocks
+                while self.running and self._run_index_cycle() >= MAX_BLOCKS_PER_CYCLE:
+                    pass
+            except Exception as e:
+                print(f"Error in chain indexer cycle: {str(e)}")
+
+            # Wait for interval or stop event
+            self._stop_event.wait(self.interval_seconds)
+
+    def _run_index_cycle(self) -> int:
+        """Index one range of blocks."""
+        db: Session = SessionLocal()
+        try:
+            return index_chain(db)
+        finally:
+            db.close()
+
+    def run_cycle_once(self) -> int:
+        """Manually run one cycle (for testing)."""
+        return self._run_index_cycle()
+
+
+# Global worker instance
+_worker: Optional[ChainIndexerWorker] = None
+
+
+def get_chain_indexer(interval_seconds: int = 2) -> ChainIndexerWorker:
+    """Get or create the global chain indexer instance."""
+    global _worker
+    if _worker is None:
+        _worker = ChainIndexerWorker(interval_seconds=interval_seconds)
+    return _worker
+
+
+def start_chain_indexer(interval_seconds: int = 2):
+    """Start the global chain indexer."""
+    worker = get_chain_indexer(interval_seconds)
+    worker.start()
+
+
+def stop_chain_indexer():
+    """Stop the global chain indexer."""
+    global _worker
+    if _worker:
+        _worker.stop()
+        _worker = None
@@ -0,0 +1,995 @@
+"""
+In-process simulator of the SchemeNFT, SchemeCredits and PlanningLock contracts.
+
+Tests, benchmarks and local runs otherwise need a Hardhat node and pay a JSON-RPC
+round trip per chain interaction. ChainSimulator keeps the contracts' state in
+Python and answers the JSON-RPC subset the backend uses (eth_call, signed and
+unsigned transactions, receipts, blocks, logs, nonces), so every service runs
+unchanged once the simulator is installed behind the chain client
+(install_chain_simulator, or CHAIN_SIMULATOR=1 for the API).
+
+The contracts follow contracts/*.sol: ERC-1155 balances with lockedBalance and
+the planning-only lock, unlock and burn paths, ERC-721 scheme NFTs, and planning
+applications. Every transaction is mined in its own block (Hardhat automine) and
+emits the same ABI-encoded events as the real contracts, so the chain indexer
+and balance cache read them like any node. A reverted transaction is mined with
+status 0. revert_to() drops blocks, so reorg handling can be exercised.
+
+Deploying from the Hardhat deployer account gives the addresses in
+deployment-addresses.json, so an existing .env works against the simulator.
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import contextlib
+import threading
+import time
+
+import rlp
+from eth_abi import decode, encode
+from eth_account import Account as EthAccount
+from eth_account.typed_transactions import TypedTransaction
+from eth_utils import keccak, to_checksum_address
+from web3.providers.base import BaseProvider
+
+from .chain_client import use_chain_simulator
+
+CHAIN_ID = 31337
+CLIENT_VERSION = "OffsetXChainSimulator/1.0.0"
+
+# Hardhat account #0, which deploys the contracts in scripts/deploy.ts
+HARDHAT_DEPLOYER_ADDRESS = "0xf39Fd6e51aad88F6F4ce6aB8827279cffFb92266"
+
+GAS_PRICE_WEI = 1_000_000_000
+GAS_LIMIT = 30_000_000
+GAS_USED = 50_000
+ACCOUNT_BALANCE_WEI = 10_000 * 10 ** 18
+
+ZERO_ADDRESS = "0x" + "0" * 40
+ZERO_HASH = b"\x00" * 32
+
+ERROR_SELECTOR = keccak(text="Error(string)")[:4]
+
+_MISSING = object()
+
+
+class ContractRevert(Exception):
+    """A require() failed; the transaction or call is reverted."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class RPCError(Exception):
+    """A JSON-RPC error response."""
+
+    def __init__(self, code: int, message: str, data: Optional[str] = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+def require(condition: bool, reason: str):
+    if not condition:
+        raise ContractRevert(reason)
+
+
+def selector(signature: str) -> bytes:
+    return keccak(text=signature)[:4]
+
+
+def _argument_types(signature: str) -> List[str]:
+    inner = signature[signature.index("(") + 1:-1]
+    return inner.split(",") if inner else []
+
+
+def encode_call(signature: str, *args) -> bytes:
+    """Calldata for a function, e.g. encode_call("balanceOf(address,uint256)", holder, 7)."""
+    return selector(signature) + encode(_argument_types(signature), list(args))
+
+
+def _address(value: str) -> str:
+    return value.lower()
+
+
+def _hex(value) -> str:
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    return hex(value)
+
+
+def _to_bytes(value) -> bytes:
+    if value is None:
+        return b""
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+def _to_int(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, int):
+        return value
+    return int(value, 16)
+
+
+def contract_function(signature: str, returns: Sequence[str] = (), view: bool = False):
+    """Mark a SimulatedContract method as the ABI function `signature`."""
+    def decorator(method: Callable) -> Callable:
+        method.abi_signature = signature
+        method.abi_returns = list(returns)
+        method.abi_view = view
+        return method
+    return decorator
+
+
+class SimulatedContract:
+    """
+    Contract whose ABI functions are methods marked with @contract_function.
+    Methods take the caller (msg.sender) first; state lives in the chain so
+    reverts and reorgs can undo it.
+    """
+    _functions: Dict[bytes, Callable] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._functions = {}
+        for klass in reversed(cls.__mro__):
+            for value in vars(klass).values():
+                if hasattr(value, "abi_signature"):
+                    cls._functions[selector(value.abi_signature)] = value
+
+    def __init__(self, chain: "ChainSimulator", address: str):
+        self.chain = chain
+        self.address = to_checksum_address(address)
+
+    def _get(self, *key, default=0):
+        return self.chain.sload((self.address,) + key, default)
+
+    def _set(self, *key, value):
+        self.chain.sstore((self.address,) + key, value)
+
+    def execute(self, sender: str, data: bytes) -> bytes:
+        method = self._functions.get(bytes(data[:4]))
+        require(method is not None, "function selector was not recognized")
+        args = decode(_argument_types(method.abi_signature), bytes(data[4:]))
+        result = method(self, _address(sender), *args)
+        if not method.abi_returns:
+            return b""
+        values = list(result) if len(method.abi_returns) > 1 else [result]
+        return encode(method.abi_returns, values)
+
+    def emit(self, signature: str, indexed: Sequence[Tuple[str, object]] = (), data: Sequence[Tuple[str, object]] = ()):
+        """Record an event log: topic0, one topic per indexed argument, the rest ABI-encoded as data."""
+        topics = [keccak(text=signature)] + [encode([abi_type], [value]) for abi_type, value in indexed]
+        self.chain.log(self.address, topics, encode([t for t, _ in data], [v for _, v in data]))
+
+    def _only_owner(self, sender: str):
+        require(sender == _address(self._get("owner", default=ZERO_ADDRESS)), "OwnableUnauthorizedAccount")
+
+    @contract_function("owner()", returns=["address"], view=True)
+    def owner(self, sender):
+        return self._get("owner", default=ZERO_ADDRESS)
+
+
+class SchemeNFT(SimulatedContract):
+    """ERC-721 scheme NFT (contracts/SchemeNFT.sol)."""
+
+    def __init__(self, chain, address, initial_owner: str):
+        super().__init__(chain, address)
+        self._set("owner", value=_address(initial_owner))
+        self._set("next_token_id", value=1)
+
+    @contract_function("setPlanningContract(address)")
+    def setPlanningContract(self, sender, planning_contract):
+        self._only_owner(sender)
+        self._set("planning", value=_address(planning_contract))
+
+    @contract_function("planningContract()", returns=["address"], view=True)
+    def planningContract(self, sender):
+        return self._get("planning", default=ZERO_ADDRESS)
+
+    @contract_function("mintScheme(string,string,string,uint256,string,string,address)", returns=["uint256"])
+    def mintScheme(self, sender, name, catchment, location, original_tonnes, ipfs_cid, sha256_hash, recipient):
+        self._only_owner(sender)
+        require(_address(recipient) != ZERO_ADDRESS, "ERC721InvalidReceiver")
+        token_id = self._get("next_token_id")
+        self._set("next_token_id", value=token_id + 1)
+        self._set("scheme", token_id, value=(name, catchment, location, original_tonnes, original_tonnes, ipfs_cid, sha256_hash))
+        self._transfer(ZERO_ADDRESS, _address(recipient), token_id)
+        return token_id
+
+    def _transfer(self, from_address: str, to: str, token_id: int):
+        if from_address != ZERO_ADDRESS:
+            self._set("balance", from_address, value=self._get("balance", from_address) - 1)
+        self._set("balance", to, value=self._get("balance", to) + 1)
+        self._set("owner_of", token_id, value=to)
+        self.emit(
+            "Transfer(address,address,uint256)",
+            indexed=[("address", from_address), ("address", to), ("uint256", token_id)]
+        )
+
+    @contract_function("ownerOf(uint256)", returns=["address"], view=True)
+    def ownerOf(self, sender, token_id):
+        owner = self._get("owner_of", token_id, default=None)
+        require(owner is not None, "ERC721NonexistentToken")
+        return owner
+
+    @contract_function("balanceOf(address)", returns=["uint256"], view=True)
+    def balanceOf(self, sender, owner):
+        return self._get("balance", _address(owner))
+
+    @contract_function("setApprovalForAll(address,bool)")
+    def setApprovalForAll(self, sender, operator, approved):
+        self._set("operator", sender, _address(operator), value=approved)
+        self.emit(
+            "ApprovalForAll(address,address,bool)",
+            indexed=[("address", sender), ("address", operator)],
+            data=[("bool", approved)]
+        )
+
+    @contract_function("isApprovedForAll(address,address)", returns=["bool"], view=True)
+    def isApprovedForAll(self, sender, owner, operator):
+        return self._get("operator", _address(owner), _address(operator), default=False)
+
+    @contract_function("transferFrom(address,address,uint256)")
+    def transferFrom(self, sender, from_address, to, token_id):
+        owner = _address(self.ownerOf(sender, token_id))
+        require(owner == _address(from_address), "ERC721IncorrectOwner")
+        require(sender == owner or self.isApprovedForAll(sender, owner, sender), "ERC721InsufficientApproval")
+        require(_address(to) != ZERO_ADDRESS, "ERC721InvalidReceiver")
+        self._transfer(owner, _address(to), token_id)
+
+    @contract_function("safeTransferFrom(address,address,uint256)")
+    def safeTransferFrom(self, sender, from_address, to, token_id):
+        self.transferFrom(sender, from_address, to, token_id)
+
+    @contract_function("schemes(uint256)", returns=["string", "string", "string", "uint256", "uint256", "string", "string"], view=True)
+    def schemes(self, sender, token_id):
+        return self._get("scheme", token_id, default=("", "", "", 0, 0, "", ""))
+
+    @contract_function("reduceRemainingTonnes(uint256,uint256)")
+    def reduceRemainingTonnes(self, sender, token_id, tonnes_to_reduce):
+        require(sender == _address(self.planningContract(sender)), "Only planning contract")
+        require(self._get("owner_of", token_id, default=None) is not None, "Scheme does not exist")
+        scheme = self.schemes(sender, token_id)
+        require(scheme[4] >= tonnes_to_reduce, "Insufficient remaining tonnes")
+        self._set("scheme", token_id, value=scheme[:4] + (scheme[4] - tonnes_to_reduce,) + scheme[5:])
+
+    @contract_function("getSchemeCatchment(uint256)", returns=["string"], view=True)
+    def getSchemeCatchment(self, sender, token_id):
+        return self.schemes(sender, token_id)[1]
+
+
+class SchemeCredits(SimulatedContract):
+    """ERC-1155 scheme credits with planning locks (contracts/SchemeCredits.sol)."""
+
+    def __init__(self, chain, address, initial_owner: str, scheme_nft: str):
+        super().__init__(chain, address)
+        self._set("owner", value=_address(initial_owner))
+        self._set("scheme_nft", value=_address(scheme_nft))
+
+    @contract_function("setPlanningContract(address)")
+    def setPlanningContract(self, sender, planning_contract):
+        self._only_owner(sender)
+        self._set("planning", value=_address(planning_contract))
+
+    @contract_function("planningContract()", returns=["address"], view=True)
+    def planningContract(self, sender):
+        return self._get("planning", default=ZERO_ADDRESS)
+
+    def _only_planning(self, sender: str, action: str):
+        require(sender == _address(self.planningContract(sender)), f"Only planning contract can {action}")
+
+    @contract_function("balanceOf(address,uint256)", returns=["uint256"], view=True)
+    def balanceOf(self, sender, account, token_id):
+        return self._get("balance", token_id, _address(account))
+
+    @contract_function("balanceOfBatch(address[],uint256[])", returns=["uint256[]"], view=True)
+    def balanceOfBatch(self, sender, accounts, token_ids):
+        require(len(accounts) == len(token_ids), "ERC1155InvalidArrayLength")
+        return [self.balanceOf(sender, account, token_id) for account, token_id in zip(accounts, token_ids)]
+
+    @contract_function("lockedBalance(uint256,address)", returns=["uint256"], view=True)
+    def lockedBalance(self, sender, token_id, account):
+        return self._get("locked", token_id, _address(account))
+
+    @contract_function("setApprovalForAll(address,bool)")
+    def setApprovalForAll(self, sender, operator, approved):
+        require(_address(operator) != ZERO_ADDRESS, "ERC1155InvalidOperator")
+        self._set("operator", sender, _address(operator), value=approved)
+        self.emit(
+            "ApprovalForAll(address,address,bool)",
+            indexed=[("address", sender), ("address", operator)],
+            data=[("bool", approved)]
+        )
+
+    @contract_function("isApprovedForAll(address,address)", returns=["bool"], view=True)
+    def isApprovedForAll(self, sender, account, operator):
+        return self._get("operator", _address(account), _address(operator), default=False)
+
+    @contract_function("safeTransferFrom(address,address,uint256,uint256,bytes)")
+    def safeTransferFrom(self, sender, from_address, to, token_id, value, data):
+        self.safeBatchTransferFrom(sender, from_address, to, [token_id], [value], data)
+
+    @contract_function("safeBatchTransferFrom(address,address,uint256[],uint256[],bytes)")
+    def safeBatchTransferFrom(self, sender, from_address, to, token_ids, values, data):
+        from_address = _address(from_address)
+        require(sender == from_address or self.isApprovedForAll(sender, from_address, sender), "ERC1155MissingApprovalForAll")
+        require(_address(to) != ZERO_ADDRESS, "ERC1155InvalidReceiver")
+        require(from_address != ZERO_ADDRESS, "ERC1155InvalidSender")
+        self._update(sender, from_address, _address(to), list(token_ids), list(values))
+
+    @contract_function("mintCredits(uint256,address,uint256)")
+    def mintCredits(self, sender, scheme_id, to, amount):
+        self._only_owner(sender)
+        require(_address(to) != ZERO_ADDRESS, "ERC1155InvalidReceiver")
+        self._update(sender, ZERO_ADDRESS, _address(to), [scheme_id], [amount])
+
+    @contract_function("lockCredits(uint256,address,uint256)")
+    def lockCredits(self, sender, scheme_id, user, amount):
+        self._only_planning(sender, "lock credits")
+        locked = self.lockedBalance(sender, scheme_id, user)
+        require(self.balanceOf(sender, user, scheme_id) >= locked + amount, "Insufficient unlocked balance")
+        self._set("locked", scheme_id, _address(user), value=locked + amount)
+
+    @contract_function("unlockCredits(uint256,address,uint256)")
+    def unlockCredits(self, sender, scheme_id, user, amount):
+        self._only_planning(sender, "unlock credits")
+        locked = self.lockedBalance(sender, scheme_id, user)
+        require(locked >= amount, "Insufficient locked balance")
+        self._set("locked", scheme_id, _address(user), value=locked - amount)
+
+    @contract_function("burnLockedCredits(uint256,address,uint256)")
+    def burnLockedCredits(self, sender, scheme_id, user, amount):
+        self._only_planning(sender, "burn locked credits")
+        locked = self.lockedBalance(sender, scheme_id, user)
+        require(locked >= amount, "Insufficient locked balance")
+        self._set("locked", scheme_id, _address(user), value=locked - amount)
+        self._update(sender, _address(user), ZERO_ADDRESS, [scheme_id], [amount])
+
+    def _update(self, operator: str, from_address: str, to: str, token_ids: List[int], values: List[int]):
+        require(len(token_ids) == len(values), "ERC1155InvalidArrayLength")
+        # Locked credits cannot leave the holder (mints and burns excepted, as in the contract)
+        if from_address != ZERO_ADDRESS and from_address != to:
+            for token_id, value in zip(token_ids, values):
+                free = self._get("balance", token_id, from_address) - self._get("locked", token_id, from_address)
+                require(free >= value, "Cannot transfer locked credits")
+        for token_id, value in zip(token_ids, values):
+            if from_address != ZERO_ADDRESS:
+                balance = self._get("balance", token_id, from_address)
+                require(balance >= value, "ERC1155InsufficientBalance")
+                self._set("balance", token_id, from_address, value=balance - value)
+            if to != ZERO_ADDRESS:
+                self._set("balance", token_id, to, value=self._get("balance", token_id, to) + value)
+
+        indexed = [("address", operator), ("address", from_address), ("address", to)]
+        if len(token_ids) == 1:
+            self.emit(
+                "TransferSingle(address,address,address,uint256,uint256)",
+                indexed=indexed,
+                data=[("uint256", token_ids[0]), ("uint256", values[0])]
+            )
+        else:
+            self.emit(
+                "TransferBatch(address,address,address,uint256[],uint256[])",
+                indexed=indexed,
+                data=[("uint256[]", token_ids), ("uint256[]", values)]
+            )
+
+
+class PlanningLock(SimulatedContract):
+    """Planning applications that lock, burn or release credits (contracts/PlanningLock.sol)."""
+
+    PENDING, APPROVED, REJECTED = 0, 1, 2
+
+    def __init__(self, chain, address, scheme_nft: str, scheme_credits: str):
+        super().__init__(chain, address)
+        self._set("scheme_nft", value=to_checksum_address(scheme_nft))
+        self._set("scheme_credits", value=to_checksum_address(scheme_credits))
+        self._set("next_application_id", value=1)
+
+    def _contracts(self) -> Tuple[SchemeNFT, SchemeCredits]:
+        return self.chain.contract_at(self._get("scheme_nft")), self.chain.contract_at(self._get("scheme_credits"))
+
+    @contract_function("nextApplicationId()", returns=["uint256"], view=True)
+    def nextApplicationId(self, sender):
+        return self._get("next_application_id")
+
+    @contract_function("submitApplication(address,uint256[],uint256[],bytes32)", returns=["uint256"])
+    def submitApplication(self, sender, developer, scheme_ids, amounts, required_catchment):
+        require(_address(developer) != ZERO_ADDRESS, "Invalid developer address")
+        require(len(scheme_ids) == len(amounts), "Arrays length mismatch")
+        require(len(scheme_ids) > 0, "Must include at least one scheme")
+        scheme_nft, scheme_credits = self._contracts()
+        me = _address(self.address)
+        for scheme_id, amount in zip(scheme_ids, amounts):
+            catchment = scheme_nft.getSchemeCatchment(me, scheme_id)
+            require(keccak(text=catchment) == required_catchment, "Scheme catchment mismatch")
+            scheme_credits.lockCredits(me, scheme_id, developer, amount)
+
+        application_id = self.nextApplicationId(sender)
+        self._set("next_application_id", value=application_id + 1)
+        self._set("application", application_id, value=(
+            _address(developer), required_catchment, list(scheme_ids), list(amounts), self.PENDING
+        ))
+        self.emit(
+            "ApplicationSubmitted(uint256,address,bytes32,uint256[],uint256[])",
+            indexed=[("uint256", application_id), ("address", developer)],
+            data=[("bytes32", required_catchment), ("uint256[]", list(scheme_ids)), ("uint256[]", list(amounts))]
+        )
+        return application_id
+
+    def _pending_application(self, application_id: int) -> tuple:
+        application = self._get("application", application_id, default=None)
+        require(application is not None, "Application does not exist")
+        require(application[4] == self.PENDING, "Application not pending")
+        return application
+
+    @contract_function("approveApplication(uint256)")
+    def approveApplication(self, sender, application_id):
+        developer, catchment, scheme_ids, amounts, _ = self._pending_application(application_id)
+        scheme_nft, scheme_credits = self._contracts()
+        me = _address(self.address)
+        for scheme_id, amount in zip(scheme_ids, amounts):
+            scheme_credits.burnLockedCredits(me, scheme_id, developer, amount)
+            # Only whole tonnes (100,000 credits) reduce the scheme's remaining tonnes
+            if amount // 100000 > 0:
+                scheme_nft.reduceRemainingTonnes(me, scheme_id, amount // 100000)
+        self._set("application", application_id, value=(developer, catchment, scheme_ids, amounts, self.APPROVED))
+        self.emit("ApplicationApproved(uint256)", indexed=[("uint256", application_id)])
+
+    @contract_function("rejectApplication(uint256)")
+    def rejectApplication(self, sender, application_id):
+        developer, catchment, scheme_ids, amounts, _ = self._pending_application(application_id)
+        _, scheme_credits = self._contracts()
+        me = _address(self.address)
+        for scheme_id, amount in zip(scheme_ids, amounts):
+            scheme_credits.unlockCredits(me, scheme_id, developer, amount)
+        self._set("application", application_id, value=(developer, catchment, scheme_ids, amounts, self.REJECTED))
+        self.emit("ApplicationRejected(uint256)", indexed=[("uint256", application_id)])
+
+    @contract_function("applications(uint256)", returns=["address", "bytes32", "uint8"], view=True)
+    def applications(self, sender, application_id):
+        developer, catchment, _, _, status = self._get("application", application_id, default=(ZERO_ADDRESS, ZERO_HASH, [], [], 0))
+        return developer, catchment, status
+
+    @contract_function("getApplicationSchemeIds(uint256)", returns=["uint256[]"], view=True)
+    def getApplicationSchemeIds(self, sender, application_id):
+        return self._get("application", application_id, default=(None, None, [], [], 0))[2]
+
+    @contract_function("getApplicationAmounts(uint256)", returns=["uint256[]"], view=True)
+    def getApplicationAmounts(self, sender, application_id):
+        return self._get("application", application_id, default=(None, None, [], [], 0))[3]
+
+
+@dataclass
+class OffsetXContracts:
+    scheme_nft: SchemeNFT
+    scheme_credits: SchemeCredits
+    planning_lock: PlanningLock
+
+    def env(self) -> Dict[str, str]:
+        """The contract address settings the backend reads."""
+        return {
+            "SCHEME_NFT_CONTRACT_ADDRESS": self.scheme_nft.address,
+            "SCHEME_CREDITS_CONTRACT_ADDRESS": self.scheme_credits.address,
+            "PLANNING_LOCK_CONTRACT_ADDRESS": self.planning_lock.address,
+        }
+
+
+@dataclass
+class Block:
+    number: int
+    hash: bytes
+    parent_hash: bytes
+    timestamp: int
+    transactions: List[bytes] = field(default_factory=list)
+    logs: List[dict] = field(default_factory=list)
+    # State changes made in this block, in order, as (key, previous value)
+    undo: List[tuple] = field(default_factory=list)
+
+
+class ChainSimulator:
+    """An automining chain holding the OffsetX contracts, answering JSON-RPC in process."""
+
+    def __init__(self, chain_id: int = CHAIN_ID):
+        self.chain_id = chain_id
+        self._lock = threading.RLock()
+        self._state: Dict[tuple, object] = {}
+        self._journal: List[tuple] = []
+        self._pending_logs: List[Tuple[str, List[bytes], bytes]] = []
+        self._transactions: Dict[bytes, Tuple[dict, dict]] = {}
+        self._reorgs = 0
+        self._genesis_time = int(time.time())
+        self.blocks: List[Block] = [self._new_block(0, ZERO_HASH, [])]
+        self.contracts: Optional[OffsetXContracts] = None
+
+    # State
+
+    def sload(self, key: tuple, default=0):
+        return self._state.get(key, default)
+
+    def sstore(self, key: tuple, value):
+        self._journal.append((key, self._state.get(key, _MISSING)))
+        self._state[key] = value
+
+    def _undo(self, entries: List[tuple]):
+        for key, previous in reversed(entries):
+            if previous is _MISSING:
+                self._state.pop(key, None)
+            else:
+                self._state[key] = previous
+
+    def log(self, address: str, topics: List[bytes], data: bytes):
+        self._pending_logs.append((address, topics, data))
+
+    def contract_at(self, address: str) -> Optional[SimulatedContract]:
+        return self.sload(("code", _address(address)), None)
+
+    def get_nonce(self, address: str) -> int:
+        return self.sload(("nonce", _address(address)))
+
+    @property
+    def block_number(self) -> int:
+        return self.blocks[-1].number
+
+    # Blocks and transactions
+
+    def _new_block(self, number: int, parent_hash: bytes, transactions: List[bytes]) -> Block:
+        block_hash = keccak(parent_hash + number.to_bytes(32, "big") + self._reorgs.to_bytes(32, "big") + b"".join(transactions))
+        return Block(number, block_hash, parent_hash, self._genesis_time + number, list(transactions))
+
+    def _run(self, sender: str, to: Optional[str], data: bytes, create: Optional[Callable[[str], SimulatedContract]] = None):
+        """Execute one call; on revert undo its state changes and drop its logs, then re-raise."""
+        mark, log_mark = len(self._journal), len(self._pending_logs)
+        try:
+            if create is not None:
+                contract = create(to)
+                self.sstore(("code", _address(to)), contract)
+                return b""
+            contract = self.contract_at(to) if to else None
+            if contract is None:
+                return b""  # Plain transfer to an account
+            return contract.execute(sender, data)
+        except ContractRevert:
+            self._undo(self._journal[mark:])
+            del self._journal[mark:]
+            del self._pending_logs[log_mark:]
+            raise
+
+    def call(self, to: str, data: bytes, sender: str = ZERO_ADDRESS) -> bytes:
+        """eth_call: run against the latest state and discard any changes."""
+        with self._lock:
+            mark, log_mark = len(self._journal), len(self._pending_logs)
+            try:
+                return self._run(_address(sender), to, bytes(data))
+            finally:
+                self._undo(self._journal[mark:])
+                del self._journal[mark:]
+                del self._pending_logs[log_mark:]
+
+    def transact(
+        self,
+        sender: str,
+        to: Optional[str],
+        data: bytes,
+        nonce: Optional[int] = None,
+        gas: int = GAS_USED,
+        gas_price: int = GAS_PRICE_WEI,
+        value: int = 0,
+        tx_hash: Optional[bytes] = None,
+        create: Optional[Callable[[str], SimulatedContract]] = None
+    ) -> bytes:
+        """
+        Mine a block with one transaction. A revert still mines it, with status 0.
+
+        Returns:
+            Transaction hash
+        """
+        sender = _address(sender)
+        with self._lock:
+            expected = self.get_nonce(sender)
+            if nonce is None:
+                nonce = expected
+            if nonce != expected:
+                raise RPCError(-32000, f"nonce too {'low' if nonce < expected else 'high'}: expected {expected}, got {nonce}")
+            if create is not None:
+                to = to_checksum_address(keccak(rlp.encode([bytes.fromhex(sender[2:]), nonce]))[12:])
+            if tx_hash is None:
+                tx_hash = keccak(rlp.encode([bytes.fromhex(sender[2:]), nonce, _to_bytes(to), bytes(data), self._reorgs]))
+
+            self._journal = []
+            self._pending_logs = []
+            self.sstore(("nonce", sender), nonce + 1)
+            revert_reason = None
+            try:
+                self._run(sender, to, bytes(data), create)
+            except ContractRevert as e:
+                revert_reason = e.reason
+
+            parent = self.blocks[-1]
+            block = self._new_block(parent.number + 1, parent.hash, [tx_hash])
+            block.undo = self._journal
+            for log_index, (address, topics, log_data) in enumerate(self._pending_logs):
+                block.logs.append({
+                    "address": address,
+                    "topics": topics,
+                    "data": log_data,
+                    "blockNumber": block.number,
+                    "blockHash": block.hash,
+                    "transactionHash": tx_hash,
+                    "transactionIndex": 0,
+                    "logIndex": log_index,
+                    "removed": False,
+                })
+            self._journal = []
+            self._pending_logs = []
+            self.blocks.append(block)
+
+            transaction = {
+                "hash": tx_hash, "from": sender, "to": to, "input": bytes(data), "nonce": nonce,
+                "gas": gas, "gasPrice": gas_price, "value": value,
+            }
+            receipt = {
+                "transactionHash": tx_hash,
+                "transactionIndex": 0,
+                "blockHash": block.hash,
+                "blockNumber": block.number,
+                "from": sender,
+                "to": None if create is not None else to,
+                "contractAddress": to if create is not None and revert_reason is None else None,
+                "cumulativeGasUsed": GAS_USED,
+                "gasUsed": GAS_USED,
+                "effectiveGasPrice": gas_price,
+                "logs": block.logs,
+                "status": 0 if revert_reason else 1,
+                "revertReason": revert_reason,
+            }
+            self._transactions[tx_hash] = (transaction, receipt)
+            return tx_hash
+
+    def send(self, sender: str, to: str, signature: str, *args) -> dict:
+        """Call a contract function as `sender` (no signing) and return the receipt."""
+        tx_hash = self.transact(sender, to, encode_call(signature, *args))
+        return self.get_receipt(tx_hash)
+
+    def deploy(self, deployer: str, create: Callable[[str], SimulatedContract]) -> SimulatedContract:
+        """Deploy a contract at the CREATE address for the deployer's nonce; create(address) builds it."""
+        receipt = self.get_receipt(self.transact(deployer, None, b"", create=create))
+        return self.contract_at(receipt["contractAddress"])
+
+    def deploy_offsetx_contracts(self, deployer: str = HARDHAT_DEPLOYER_ADDRESS) -> OffsetXContracts:
+        """Deploy and wire the three contracts as scripts/deploy.ts does."""
+        scheme_nft = self.deploy(deployer, lambda address: SchemeNFT(self, address, deployer))
+        scheme_credits = self.deploy(deployer, lambda address: SchemeCredits(self, address, deployer, scheme_nft.address))
+        planning_lock = self.deploy(deployer, lambda address: PlanningLock(self, address, scheme_nft.address, scheme_credits.address))
+        self.send(deployer, scheme_credits.address, "setPlanningContract(address)", planning_lock.address)
+        self.send(deployer, scheme_nft.address, "setPlanningContract(address)", planning_lock.address)
+        self.contracts = OffsetXContracts(scheme_nft, scheme_credits, planning_lock)
+        return self.contracts
+
+    def mine(self) -> Block:
+        """Mine an empty block."""
+        with self._lock:
+            parent = self.blocks[-1]
+            block = self._new_block(parent.number + 1, parent.hash, [])
+            self.blocks.append(block)
+            return block
+
+    def revert_to(self, block_number: int):
+        """Drop every block above block_number and undo its state (a reorg once new blocks are mined)."""
+        with self._lock:
+            while self.blocks[-1].number > block_number:
+                block = self.blocks.pop()
+                self._undo(block.undo)
+                for tx_hash in block.transactions:
+                    self._transactions.pop(tx_hash, None)
+            # New blocks at the same heights get different hashes
+            self._reorgs += 1
+
+    def get_block(self, number: int) -> Optional[Block]:
+        return self.blocks[number] if 0 <= number < len(self.blocks) else None
+
+    def get_receipt(self, tx_hash: bytes) -> Optional[dict]:
+        entry = self._transactions.get(bytes(tx_hash))
+        return entry[1] if entry else None
+
+    def get_logs(
+        self,
+        from_block: int,
+        to_block: int,
+        addresses: Optional[Sequence[str]] = None,
+        topics: Optional[Sequence] = None
+    ) -> List[dict]:
+        """Logs in a block range, filtered like eth_getLogs (topic positions may hold alternatives)."""
+        wanted = {_address(a) for a in addresses} if addresses else None
+        result = []
+        with self._lock:
+            for block in self.blocks[max(from_block, 0):max(to_block, -1) + 1]:
+                for log in block.logs:
+                    if wanted is not None and _address(log["address"]) not in wanted:
+                        continue
+                    if topics and not _topics_match(log["topics"], topics):
+                        continue
+                    result.append(log)
+        return result
+
+    # JSON-RPC
+
+    def _block_number_param(self, value) -> int:
+        if value in (None, "latest", "pending", "safe", "finalized"):
+            return self.block_number
+        if value == "earliest":
+            return 0
+        return _to_int(value)
+
+    def _format_block(self, block: Block, full: bool) -> dict:
+        transactions = [
+            self._format_transaction(self._transactions[tx_hash][0], block) if full else _hex(tx_hash)
+            for tx_hash in block.transactions
+            if tx_hash in self._transactions
+        ]
+        return {
+            "number": _hex(block.number),
+            "hash": _hex(block.hash),
+            "parentHash": _hex(block.parent_hash),
+            "timestamp": _hex(block.timestamp),
+            "transactions": transactions,
+            "gasLimit": _hex(GAS_LIMIT),
+            "gasUsed": _hex(GAS_USED * len(block.transactions)),
+            "baseFeePerGas": _hex(GAS_PRICE_WEI),
+            "miner": ZERO_ADDRESS,
+            "difficulty": "0x0",
+            "totalDifficulty": "0x0",
+            "extraData": "0x",
+            "nonce": "0x0000000000000000",
+            "mixHash": _hex(ZERO_HASH),
+            "sha3Uncles": _hex(ZERO_HASH),
+            "logsBloom": _hex(bytes(256)),
+            "transactionsRoot": _hex(ZERO_HASH),
+            "stateRoot": _hex(ZERO_HASH),
+            "receiptsRoot": _hex(ZERO_HASH),
+            "size": _hex(1000),
+            "uncles": [],
+        }
+
+    def _format_transaction(self, transaction: dict, block: Block) -> dict:
+        return {
+            "hash": _hex(transaction["hash"]),
+            "blockHash": _hex(block.hash),
+            "blockNumber": _hex(block.number),
+            "transactionIndex": "0x0",
+            "from": to_checksum_address(transaction["from"]),
+            "to": to_checksum_address(transaction["to"]) if transaction["to"] else None,
+            "input": _hex(transaction["input"]),
+            "nonce": _hex(transaction["nonce"]),
+            "gas": _hex(transaction["gas"]),
+            "gasPrice": _hex(transaction["gasPrice"]),
+            "value": _hex(transaction["value"]),
+            "type": "0x0",
+            "chainId": _hex(self.chain_id),
+            "v": "0x0",
+            "r": "0x0",
+            "s": "0x0",
+        }
+
+    @staticmethod
+    def _format_log(log: dict) -> dict:
+        return {
+            "address": to_checksum_address(log["address"]),
+            "topics": [_hex(topic) for topic in log["topics"]],
+            "data": _hex(log["data"]),
+            "blockNumber": _hex(log["blockNumber"]),
+            "blockHash": _hex(log["blockHash"]),
+            "transactionHash": _hex(log["transactionHash"]),
+            "transactionIndex": _hex(log["transactionIndex"]),
+            "logIndex": _hex(log["logIndex"]),
+            "removed": False,
+        }
+
+    def _format_receipt(self, receipt: dict) -> dict:
+        return {
+            "transactionHash": _hex(receipt["transactionHash"]),
+            "transactionIndex": _hex(receipt["transactionIndex"]),
+            "blockHash": _hex(receipt["blockHash"]),
+            "blockNumber": _hex(receipt["blockNumber"]),
+            "from": to_checksum_address(receipt["from"]),
+            "to": to_checksum_address(receipt["to"]) if receipt["to"] else None,
+            "contractAddress": receipt["contractAddress"],
+            "cumulativeGasUsed": _hex(receipt["cumulativeGasUsed"]),
+            "gasUsed": _hex(receipt["gasUsed"]),
+            "effectiveGasPrice": _hex(receipt["effectiveGasPrice"]),
+            "logs": [self._format_log(log) for log in receipt["logs"]],
+            "logsBloom": _hex(bytes(256)),
+            "status": _hex(receipt["status"]),
+            "type": "0x0",
+        }
+
+    def _send_raw_transaction(self, raw: bytes) -> bytes:
+        sender = EthAccount.recover_transaction(raw)
+        if raw[0] >= 0xc0:
+            # Legacy transaction: rlp([nonce, gasPrice, gas, to, value, data, v, r, s])
+            nonce, gas_price, gas, to, value, data = rlp.decode(raw)[:6]
+            fields = {
+                "nonce": int.from_bytes(nonce, "big"), "gas_price": int.from_bytes(gas_price, "big"),
+                "gas": int.from_bytes(gas, "big"), "to": to, "value": int.from_bytes(value, "big"), "data": data,
+            }
+        else:
+            typed = TypedTransaction.from_bytes(raw).as_dict()
+            fields = {
+                "nonce": typed["nonce"], "gas_price": typed.get("gasPrice", typed.get("maxFeePerGas", GAS_PRICE_WEI)),
+                "gas": typed["gas"], "to": _to_bytes(typed.get("to")), "value": typed.get("value", 0),
+                "data": _to_bytes(typed.get("data")),
+            }
+        to = to_checksum_address(fields["to"]) if fields["to"] else None
+        if to is None:
+            raise RPCError(-32000, "contract creation is not supported by the simulator; use ChainSimulator.deploy")
+        return self.transact(
+            sender, to, fields["data"], nonce=fields["nonce"], gas=fields["gas"], gas_price=fields["gas_price"],
+            value=fields["value"], tx_hash=keccak(raw)
+        )
+
+    def _eth_call(self, transaction: dict, block=None) -> str:
+        try:
+            return _hex(self.call(transaction["to"], _to_bytes(transaction.get("data") or transaction.get("input")), transaction.get("from") or ZERO_ADDRESS))
+        except ContractRevert as e:
+            raise RPCError(3, f"execution reverted: {e.reason}", _hex(ERROR_SELECTOR + encode(["string"], [e.reason])))
+
+    def _get_logs(self, filter_params: dict) -> List[dict]:
+        if filter_params.get("blockHash"):
+            block_hash = _to_bytes(filter_params["blockHash"])
+            numbers = [block.number for block in self.blocks if block.hash == block_hash]
+            from_block = to_block = numbers[0] if numbers else -1
+        else:
+            from_block = self._block_number_param(filter_params.get("fromBlock", "latest"))
+            to_block = self._block_number_param(filter_params.get("toBlock", "latest"))
+        addresses = filter_params.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        topics = [
+            None if topic is None else [_to_bytes(t) for t in topic] if isinstance(topic, list) else [_to_bytes(topic)]
+            for topic in filter_params.get("topics") or []
+        ]
+        return [self._format_log(log) for log in self.get_logs(from_block, to_block, addresses, topics)]
+
+    def _dispatch(self, method: str, params: list):
+        if method == "eth_chainId":
+            return _hex(self.chain_id)
+        if method == "net_version":
+            return str(self.chain_id)
+        if method == "web3_clientVersion":
+            return CLIENT_VERSION
+        if method == "eth_blockNumber":
+            return _hex(self.block_number)
+        if method == "eth_getBlockByNumber":
+            block = self.get_block(self._block_number_param(params[0]))
+            return self._format_block(block, bool(params[1] if len(params) > 1 else False)) if block else None
+        if method == "eth_getBlockByHash":
+            block_hash = _to_bytes(params[0])
+            for block in self.blocks:
+                if block.hash == block_hash:
+                    return self._format_block(block, bool(params[1] if len(params) > 1 else False))
+            return None
+        if method == "eth_getCode":
+            contract = self.contract_at(params[0])
+            return _hex(keccak(text=type(contract).__name__)) if contract else "0x"
+        if method == "eth_getTransactionCount":
+            return _hex(self.get_nonce(params[0]))
+        if method == "eth_getBalance":
+            return _hex(ACCOUNT_BALANCE_WEI)
+        if method in ("eth_gasPrice", "eth_maxPriorityFeePerGas"):
+            return _hex(GAS_PRICE_WEI)
+        if method == "eth_estimateGas":
+            return _hex(GAS_USED)
+        if method == "eth_accounts":
+            return []
+        if method == "eth_call":
+            return self._eth_call(*params)
+        if method == "eth_sendRawTransaction":
+            return _hex(self._send_raw_transaction(_to_bytes(params[0])))
+        if method == "eth_sendTransaction":
+            transaction = params[0]
+            return _hex(self.transact(
+                transaction["from"], transaction.get("to"), _to_bytes(transaction.get("data") or transaction.get("input")),
+                nonce=_to_int(transaction["nonce"]) if transaction.get("nonce") is not None else None,
+                gas=_to_int(transaction.get("gas")) or GAS_USED
+            ))
+        if method == "eth_getTransactionReceipt":
+            receipt = self.get_receipt(_to_bytes(params[0]))
+            return self._format_receipt(receipt) if receipt else None
+        if method == "eth_getTransactionByHash":
+            entry = self._transactions.get(_to_bytes(params[0]))
+            if not entry:
+                return None
+            return self._format_transaction(entry[0], self.blocks[entry[1]["blockNumber"]])
+        if method == "eth_getLogs":
+            return self._get_logs(params[0])
+        if method == "evm_mine":
+            return _hex(self.mine().number)
+        raise RPCError(-32601, f"Method {method} is not supported by the chain simulator")
+
+    def handle(self, request):
+        """Answer one JSON-RPC request (dict) or a batch (list of dicts)."""
+        if isinstance(request, list):
+            return [self.handle(item) for item in request]
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            with self._lock:
+                response["result"] = self._dispatch(request["method"], list(request.get("params") or []))
+        except RPCError as e:
+            response["error"] = {"code": e.code, "message": e.message}
+            if e.data is not None:
+                response["error"]["data"] = e.data
+        return response
+
+    def provider(self) -> "ChainSimulatorProvider":
+        return ChainSimulatorProvider(self)
+
+
+def _topics_match(log_topics: List[bytes], wanted: Sequence) -> bool:
+    for position, alternatives in enumerate(wanted):
+        if alternatives is None:
+            continue
+        if position >= len(log_topics) or bytes(log_topics[position]) not in {bytes(t) for t in alternatives}:
+            return False
+    return True
+
+
+class ChainSimulatorProvider(BaseProvider):
+    """Web3 provider that answers from a ChainSimulator instead of an HTTP node."""
+
+    def __init__(self, simulator: ChainSimulator):
+        super().__init__()
+        self.simulator = simulator
+        self._request_id = 0
+
+    def make_request(self, method, params):
+        self._request_id += 1
+        return self.simulator.handle({"jsonrpc": "2.0", "id": self._request_id, "method": method, "params": params})
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
+
+
+def install_chain_simulator(simulator: Optional[ChainSimulator] = None) -> ChainSimulator:
+    """
+    Serve every RPC URL from a simulator (by default a new chain with the OffsetX
+    contracts deployed) and drop state cached from the previous chain.
+    """
+    from .nonce_manager import reset_nonce_managers
+    from .balance_cache import get_balance_cache
+    from .chain_indexer import reset_index_state
+
+    if simulator is None:
+        simulator = ChainSimulator()
+        simulator.deploy_offsetx_contracts()
+    use_chain_simulator(simulator)
+    reset_nonce_managers()
+    get_balance_cache().clear()
+    reset_index_state()
+    return simulator
+
+
+def uninstall_chain_simulator():
+    """Go back to real RPC nodes."""
+    from .nonce_manager import reset_nonce_managers
+    from .balance_cache import get_balance_cache
+    from .chain_indexer import reset_index_state
+
+    use_chain_simulator(None)
+    reset_nonce_managers()
+    get_balance_cache().clear()
+    reset_index_state()
+
+
+@contextlib.contextmanager
+def simulated_chain(simulator: Optional[ChainSimulator] = None):
+    """Install a simulator for the duration of a block (tests, benchmarks)."""
+    simulator = install_chain_simulator(simulator)
+    try:
+        yield simulator
+    finally:
+        uninstall_chain_simulator()
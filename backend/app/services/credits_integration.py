@@ -1,4 +1,5 @@
-from web3 import Web3
+from .chain_client import get_web3, is_connected, get_contract, to_checksum
+from .nonce_manager import send_transaction
 from typing import Optional
 import os
 
@@ -31,19 +32,12 @@ def mint_scheme_credits(
     """
     try:
         # Connect to Hardhat node
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
-        
-        if not w3.is_connected():
+        if not is_connected(rpc_url):
             raise ConnectionError("Cannot connect to blockchain node")
-        
-        # Get account from private key
-        account = w3.eth.account.from_key(private_key)
+        w3 = get_web3(rpc_url)
         
         # Get contract ABI
-        contract = w3.eth.contract(
-            address=Web3.to_checksum_address(scheme_credits_address),
-            abi=get_scheme_credits_abi()
-        )
+        contract = get_contract(scheme_credits_address, get_scheme_credits_abi(), rpc_url)
         
         # Convert tonnage to credits
         # 1 tonne = 100,000 credits (as per plan.md)
@@ -53,24 +47,12 @@ def mint_scheme_credits(
         # mintCredits(uint256 schemeId, address to, uint256 amount)
         function_call = contract.functions.mintCredits(
             scheme_id,
-            Web3.to_checksum_address(landowner_address),
+            to_checksum(landowner_address),
             credits_amount
         )
         
-        # Build transaction
-        nonce = w3.eth.get_transaction_count(account.address)
-        transaction = function_call.build_transaction({
-            'from': account.address,
-            'nonce': nonce,
-            'gas': 500000,  # Adjust as needed
-            'gasPrice': w3.eth.gas_price
-        })
-        
-        # Sign transaction
-        signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
-        
-        # Send transaction (web3.py v7 uses .raw_transaction)
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+        # Sign and send with a locally allocated nonce
+        tx_hash = send_transaction(function_call, private_key, rpc_url)
         
         # Wait for receipt
         receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -1,4 +1,5 @@
-from web3 import Web3
+from .chain_client import is_connected, to_checksum
+from .chain_indexer import read_balances
 from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func
@@ -77,9 +78,7 @@ def get_account_credits_summary(
     
     try:
         # Connect to blockchain
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
-        
-        if not w3.is_connected():
+        if not is_connected(rpc_url):
             return []
         
         # Get all schemes from database
@@ -89,11 +88,7 @@ def get_account_credits_summary(
             return []
         
         # Prepare batch query
-        account_address = Web3.to_checksum_address(account.evm_address)
-        contract = w3.eth.contract(
-            address=Web3.to_checksum_address(scheme_credits_address),
-            abi=get_scheme_credits_abi()
-        )
+        account_address = to_checksum(account.evm_address)
         
         # Debug logging
         print(f"Credits summary: Checking balances for account {account.id} at address {account_address}")
@@ -101,24 +96,17 @@ def get_account_credits_summary(
         
         # Query balances for all schemes
         scheme_ids = [scheme.nft_token_id for scheme in schemes]
-        accounts_array = [account_address] * len(scheme_ids)
         
         print(f"Credits summary: Querying {len(scheme_ids)} schemes: {scheme_ids}")
         
-        # Use balanceOfBatch for efficiency
-        balances = contract.functions.balanceOfBatch(accounts_array, scheme_ids).call()
+        # Balances and locked balances come from the chain index when it is current,
+        # otherwise from the block-aware node cache
+        cached = read_balances(db, account_address, scheme_ids, scheme_credits_address, rpc_url)
+        balances = [cached[scheme_id][0] for scheme_id in scheme_ids]
+        locked_balances = [cached[scheme_id][1] for scheme_id in scheme_ids]
         
         print(f"Credits summary: Raw balances returned: {balances}")
         
-        # Query locked balances for all schemes
-        locked_balances = []
-        for scheme_id in scheme_ids:
-            try:
-                locked = contract.functions.lockedBalance(scheme_id, account_address).call()
-                locked_balances.append(int(locked))
-            except:
-                locked_balances.append(0)
-        
         # Get assigned credits per scheme from broker mandates
         # Sum up all active, non-recalled mandates for this landowner, grouped by scheme_id
         assigned_credits_query = db.query(
@@ -149,14 +137,10 @@ def get_account_credits_summary(
         trading_account_balances = {}
         if trading_account_address:
             try:
-                trading_address = Web3.to_checksum_address(trading_account_address)
-                trading_balances = contract.functions.balanceOfBatch(
-                    [trading_address] * len(scheme_ids),
-                    scheme_ids
-                ).call()
+                trading_cached = read_balances(db, trading_account_address, scheme_ids, scheme_credits_address, rpc_url)
                 # Create a dict mapping nft_token_id to trading account balance
-                for scheme, trading_balance in zip(schemes, trading_balances):
-                    trading_account_balances[scheme.nft_token_id] = int(trading_balance)
+                for scheme in schemes:
+                    trading_account_balances[scheme.nft_token_id] = trading_cached[scheme.nft_token_id][0]
             except Exception as e:
                 print(f"Warning: Could not query trading account balances: {e}")
         
@@ -1,8 +1,11 @@
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import List, Optional
 from ..models import ExchangeListing, Account, Scheme, Trade, AccountRole
 from ..services.credits_summary import get_account_credits_summary
-from web3 import Web3
+from .chain_client import get_web3, is_connected, get_contract, to_checksum
+from .nonce_manager import send_transaction
+from .balance_cache import get_cached_balances, fetch_balances
+from .reservations import get_reserved_credits
 import os
 
 
@@ -22,6 +25,19 @@ def get_scheme_credits_abi() -> list:
             "outputs": [],
             "type": "function"
         },
+        {
+            "constant": False,
+            "inputs": [
+                {"name": "from", "type": "address"},
+                {"name": "to", "type": "address"},
+                {"name": "ids", "type": "uint256[]"},
+                {"name": "amounts", "type": "uint256[]"},
+                {"name": "data", "type": "bytes"}
+            ],
+            "name": "safeBatchTransferFrom",
+            "outputs": [],
+            "type": "function"
+        },
         {
             "constant": True,
             "inputs": [
@@ -32,6 +48,16 @@ def get_scheme_credits_abi() -> list:
             "outputs": [{"name": "", "type": "uint256"}],
             "type": "function"
         },
+        {
+            "constant": True,
+            "inputs": [
+                {"name": "accounts", "type": "address[]"},
+                {"name": "ids", "type": "uint256[]"}
+            ],
+            "name": "balanceOfBatch",
+            "outputs": [{"name": "", "type": "uint256[]"}],
+            "type": "function"
+        },
         {
             "constant": True,
             "inputs": [
@@ -91,57 +117,28 @@ def check_seller_has_sufficient_credits(
     
     try:
         # Connect to blockchain
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
-        
-        if not w3.is_connected():
+        if not is_connected(rpc_url):
             return False, 0
         
-        # Get contract
-        contract = w3.eth.contract(
-            address=Web3.to_checksum_address(scheme_credits_address),
-            abi=get_scheme_credits_abi()
-        )
-        
-        seller_address = Web3.to_checksum_address(seller_address_to_check)
+        seller_address = to_checksum(seller_address_to_check)
 
-        # Get on-chain total balance for this ERC-1155 ID (scheme NFT tokenId)
-        balance = contract.functions.balanceOf(
+        # On-chain total and locked balance for this ERC-1155 ID (scheme NFT tokenId),
+        # served from the block-aware cache when nothing has moved since the last read
+        balance, locked = get_cached_balances(
             seller_address,
-            scheme_nft_token_id
-        ).call()
-
-        # Get locked balance from SchemeCredits.lockedBalance mapping
-        locked = contract.functions.lockedBalance(
-            scheme_nft_token_id,
-            seller_address
-        ).call()
+            [scheme_nft_token_id],
+            scheme_credits_address,
+            rpc_url
+        )[scheme_nft_token_id]
 
         # Available on-chain credits = total balance - locked credits
         available_credits = int(balance) - int(locked)
         if available_credits < 0:
             available_credits = 0
 
-        # Check existing ACTIVE listings and PENDING/PARTIALLY_FILLED orders for this seller
-        # These represent already-reserved units that shouldn't be double-listed.
-        # IMPORTANT: Only count reservations for the SAME scheme (same NFT token ID)
-        from ..models import Order
-        existing_listings = db.query(ExchangeListing).filter(
-            ExchangeListing.owner_account_id == seller.id,
-            ExchangeListing.scheme_id == db_scheme_id,
-            ExchangeListing.status == "ACTIVE"
-        ).all()
-        
-        # Only count orders for the same scheme (same NFT token ID)
-        existing_orders = db.query(Order).filter(
-            Order.account_id == seller.id,
-            Order.side == "SELL",
-            Order.status.in_(["PENDING", "PARTIALLY_FILLED"]),
-            Order.nft_token_id == scheme_nft_token_id  # Only count orders for this specific scheme
-        ).all()
-
-        # Reserved credits across listings and orders (for this specific scheme only)
-        reserved_credits = sum(listing.quantity_units for listing in existing_listings)
-        reserved_credits += sum(order.remaining_quantity for order in existing_orders)
+        # Credits already reserved by ACTIVE listings and open SELL orders for this scheme,
+        # so they aren't double-listed
+        reserved_credits = get_reserved_credits(seller.id, db_scheme_id, db)
 
         # Free credits = available on-chain (excluding locked) minus credits already listed
         free_credits = available_credits - reserved_credits
@@ -156,7 +153,59 @@ def check_seller_has_sufficient_credits(
         return False, 0
 
 
-def transfer_credits_on_chain(
+def _check_signer_can_transfer(
+    seller_address: str,
+    seller_private_key: str,
+    scheme_credits_address: str,
+    rpc_url: str
+) -> str:
+    """
+    Check the private key owns (or is an approved operator for) the seller address.
+    
+    Returns:
+        Checksummed seller address
+    """
+    # Connect to blockchain
+    if not is_connected(rpc_url):
+        raise ConnectionError("Cannot connect to blockchain node")
+    w3 = get_web3(rpc_url)
+    
+    # Get seller account from private key
+    seller_account = w3.eth.account.from_key(seller_private_key)
+    seller_address_from_key = to_checksum(seller_account.address)
+    seller_address_checksum = to_checksum(seller_address)
+    
+    # Check if private key matches seller address OR if operator is approved
+    key_matches = seller_address_from_key == seller_address_checksum
+    is_approved = False
+    
+    if not key_matches:
+        # Check if the private key's address is approved to transfer on behalf of seller
+        contract = get_contract(scheme_credits_address, get_scheme_credits_abi(), rpc_url)
+        try:
+            is_approved = contract.functions.isApprovedForAll(
+                seller_address_checksum,
+                seller_address_from_key
+            ).call()
+        except:
+            pass
+    
+    # CRITICAL: Validate that the private key matches the seller address OR operator is approved
+    # This prevents ERC1155MissingApprovalForAll errors
+    if not key_matches and not is_approved:
+        raise ValueError(
+            f"Private key mismatch and no approval! "
+            f"The provided private key corresponds to address {seller_address_from_key}, "
+            f"but the seller address is {seller_address_checksum}. "
+            f"Operator {seller_address_from_key} is not approved to transfer on behalf of {seller_address_checksum}. "
+            f"This will cause an ERC1155MissingApprovalForAll error. "
+            f"Either use the private key that matches the seller address, or set up an approval."
+        )
+    
+    return seller_address_checksum
+
+
+def submit_credit_transfer(
     seller_address: str,
     buyer_address: str,
     scheme_id: int,
@@ -166,111 +215,151 @@ def transfer_credits_on_chain(
     rpc_url: str = "http://127.0.0.1:8545"
 ) -> str:
     """
-    Transfer credits from seller to buyer on-chain.
+    Validate, sign and send a safeTransferFrom of credits from seller to buyer.
+    Does not wait for the transaction to be mined (see wait_for_transfer_receipt).
     
     Returns:
         Transaction hash
     """
-    try:
-        # Connect to blockchain
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
-        
-        if not w3.is_connected():
-            raise ConnectionError("Cannot connect to blockchain node")
-        
-        # Get seller account from private key
-        seller_account = w3.eth.account.from_key(seller_private_key)
-        seller_address_from_key = Web3.to_checksum_address(seller_account.address)
-        seller_address_checksum = Web3.to_checksum_address(seller_address)
-        
-        # Check if private key matches seller address OR if operator is approved
-        key_matches = seller_address_from_key == seller_address_checksum
-        is_approved = False
-        
-        if not key_matches:
-            # Check if the private key's address is approved to transfer on behalf of seller
-            contract = w3.eth.contract(
-                address=Web3.to_checksum_address(scheme_credits_address),
-                abi=get_scheme_credits_abi()
-            )
-            try:
-                is_approved = contract.functions.isApprovedForAll(
-                    seller_address_checksum,
-                    seller_address_from_key
-                ).call()
-            except:
-                pass
-        
-        # CRITICAL: Validate that the private key matches the seller address OR operator is approved
-        # This prevents ERC1155MissingApprovalForAll errors
-        if not key_matches and not is_approved:
-            raise ValueError(
-                f"Private key mismatch and no approval! "
-                f"The provided private key corresponds to address {seller_address_from_key}, "
-                f"but the seller address is {seller_address_checksum}. "
-                f"Operator {seller_address_from_key} is not approved to transfer on behalf of {seller_address_checksum}. "
-                f"This will cause an ERC1155MissingApprovalForAll error. "
-                f"Either use the private key that matches the seller address, or set up an approval."
-            )
-        
-        # Get contract
-        contract = w3.eth.contract(
-            address=Web3.to_checksum_address(scheme_credits_address),
-            abi=get_scheme_credits_abi()
+    seller_checksum = _check_signer_can_transfer(
+        seller_address, seller_private_key, scheme_credits_address, rpc_url
+    )
+    
+    # Get contract
+    contract = get_contract(scheme_credits_address, get_scheme_credits_abi(), rpc_url)
+    
+    # Debug: Log what we're checking
+    print(f"Balance check: address={seller_checksum}, scheme_id={scheme_id}")
+    
+    # Check available (unlocked) balance before attempting transfer (one batched round trip, uncached)
+    total_balance, locked_balance = fetch_balances(
+        [(seller_checksum, scheme_id)], scheme_credits_address, rpc_url
+    )[(seller_checksum.lower(), scheme_id)]
+    available_credits = total_balance - locked_balance
+    
+    # Debug: Log the results
+    print(f"Balance check result: Total={total_balance}, Locked={locked_balance}, Available={available_credits}")
+    
+    if available_credits < quantity_credits:
+        raise ValueError(
+            f"Insufficient unlocked credits. "
+            f"Total: {total_balance}, Locked: {locked_balance}, "
+            f"Available: {available_credits}, Requested: {quantity_credits}"
         )
-        
-        # Check available (unlocked) balance before attempting transfer
-        seller_checksum = Web3.to_checksum_address(seller_address)
-        
-        # Debug: Log what we're checking
-        print(f"Balance check: address={seller_checksum}, scheme_id={scheme_id}")
-        
-        total_balance = contract.functions.balanceOf(seller_checksum, scheme_id).call()
-        locked_balance = contract.functions.lockedBalance(scheme_id, seller_checksum).call()
-        available_credits = int(total_balance) - int(locked_balance)
-        
-        # Debug: Log the results
-        print(f"Balance check result: Total={total_balance}, Locked={locked_balance}, Available={available_credits}")
-        
-        if available_credits < quantity_credits:
+    
+    # Prepare safeTransferFrom call
+    function_call = contract.functions.safeTransferFrom(
+        seller_checksum,
+        to_checksum(buyer_address),
+        scheme_id,
+        quantity_credits,
+        b""  # Empty data
+    )
+    
+    # Sign and send with a locally allocated nonce (does not wait for earlier transfers)
+    return send_transaction(function_call, seller_private_key, rpc_url)
+
+
+def submit_batch_credit_transfer(
+    seller_address: str,
+    buyer_address: str,
+    scheme_ids: List[int],
+    quantities: List[int],
+    seller_private_key: str,
+    scheme_credits_address: str,
+    rpc_url: str = "http://127.0.0.1:8545"
+) -> str:
+    """
+    Validate, sign and send one safeBatchTransferFrom moving several schemes' credits
+    from seller to buyer. Does not wait for the transaction to be mined.
+    
+    Returns:
+        Transaction hash
+    """
+    seller_checksum = _check_signer_can_transfer(
+        seller_address, seller_private_key, scheme_credits_address, rpc_url
+    )
+    
+    contract = get_contract(scheme_credits_address, get_scheme_credits_abi(), rpc_url)
+    
+    # Check available (unlocked) balance for every scheme in the batch (one batched round trip)
+    balances = fetch_balances(
+        [(seller_checksum, scheme_id) for scheme_id in scheme_ids], scheme_credits_address, rpc_url
+    )
+    for scheme_id, quantity in zip(scheme_ids, quantities):
+        total_balance, locked_balance = balances[(seller_checksum.lower(), scheme_id)]
+        available_credits = total_balance - locked_balance
+        if available_credits < quantity:
             raise ValueError(
-                f"Insufficient unlocked credits. "
+                f"Insufficient unlocked credits for scheme {scheme_id}. "
                 f"Total: {total_balance}, Locked: {locked_balance}, "
-                f"Available: {available_credits}, Requested: {quantity_credits}"
+                f"Available: {available_credits}, Requested: {quantity}"
             )
-        
-        # Prepare safeTransferFrom call
-        function_call = contract.functions.safeTransferFrom(
-            seller_checksum,
-            Web3.to_checksum_address(buyer_address),
-            scheme_id,
-            quantity_credits,
-            b""  # Empty data
+    
+    function_call = contract.functions.safeBatchTransferFrom(
+        seller_checksum,
+        to_checksum(buyer_address),
+        scheme_ids,
+        quantities,
+        b""  # Empty data
+    )
+    
+    return send_transaction(function_call, seller_private_key, rpc_url)
+
+
+def wait_for_transfer_receipt(
+    tx_hash: str,
+    rpc_url: str = "http://127.0.0.1:8545",
+    timeout: int = 120
+) -> str:
+    """
+    Wait for a submitted transfer to be mined and check it succeeded.
+    
+    Returns:
+        Transaction hash
+    """
+    if not is_connected(rpc_url):
+        raise ConnectionError("Cannot connect to blockchain node")
+    w3 = get_web3(rpc_url)
+    
+    if not tx_hash.startswith("0x"):
+        tx_hash = "0x" + tx_hash
+    
+    receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+    
+    if receipt.status != 1:
+        raise ValueError("Transaction failed")
+    
+    # Return transaction hash (web3.py v7 uses .transactionHash or .hash)
+    return receipt.transactionHash.hex() if hasattr(receipt, 'transactionHash') else receipt.hash.hex()
+
+
+def transfer_credits_on_chain(
+    seller_address: str,
+    buyer_address: str,
+    scheme_id: int,
+    quantity_credits: int,
+    seller_private_key: str,
+    scheme_credits_address: str,
+    rpc_url: str = "http://127.0.0.1:8545"
+) -> str:
+    """
+    Transfer credits from seller to buyer on-chain and wait for the receipt.
+    
+    Returns:
+        Transaction hash
+    """
+    try:
+        tx_hash = submit_credit_transfer(
+            seller_address=seller_address,
+            buyer_address=buyer_address,
+            scheme_id=scheme_id,
+            quantity_credits=quantity_credits,
+            seller_private_key=seller_private_key,
+            scheme_credits_address=scheme_credits_address,
+            rpc_url=rpc_url
         )
-        
-        # Build transaction
-        nonce = w3.eth.get_transaction_count(seller_account.address)
-        transaction = function_call.build_transaction({
-            'from': seller_account.address,
-            'nonce': nonce,
-            'gas': 500000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
-        # Sign transaction
-        signed_txn = w3.eth.account.sign_transaction(transaction, seller_private_key)
-        
-        # Send transaction (web3.py v7 uses .raw_transaction)
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        
-        # Wait for receipt
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        if receipt.status != 1:
-            raise ValueError("Transaction failed")
-        
-        # Return transaction hash (web3.py v7 uses .transactionHash or .hash)
-        return receipt.transactionHash.hex() if hasattr(receipt, 'transactionHash') else receipt.hash.hex()
+        return wait_for_transfer_receipt(tx_hash, rpc_url)
     
     except Exception as e:
         raise ValueError(f"Failed to transfer credits on-chain: {str(e)}")
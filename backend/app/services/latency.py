@@ -0,0 +1,218 @@
+"""
+Stage-level latency tracing for the order pipeline.
+
+A traced call (the order endpoints and match_order) times the stages it goes
+through and, when it returns, adds each stage's time to a per-(pipeline, stage)
+histogram. A stage is timed either as a span:
+
+    with stage("match"):
+        trades = match_order(order, db)
+
+or as a lap, which charges the time since the previous lap or span to the named
+stage - handy in long functions with early returns and loops:
+
+    account = ...
+    lap("validation")
+
+A stage hit several times in one call (a lap inside the matching loop) adds up
+to one observation per call, so the histograms answer "how long did requests
+spend in this stage". Calls slower than LATENCY_SLOW_MS (default 1000) also
+print one structured "[LATENCY]" JSON line with their stage breakdown.
+
+Recording is a few perf_counter() calls and one short lock per traced call, so
+it is left on by default; set LATENCY_TRACING=0 to turn it off. Outside a traced
+call, stage() and lap() do nothing.
+"""
+import functools
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Histogram bucket upper bounds, in milliseconds (the last bucket is unbounded)
+BUCKET_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+
+TOTAL_STAGE = "total"
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("latency_trace", default=None)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, in milliseconds."""
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKET_BOUNDS_MS)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float):
+        for i, bound in enumerate(BUCKET_BOUNDS_MS):
+            if value_ms <= bound:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.sum_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (capped at the max seen)."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for bound, bucket_count in zip(BUCKET_BOUNDS_MS, self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum_ms / self.count, 3) if self.count else None,
+            "p50_ms": _round(self.percentile(0.5)),
+            "p95_ms": _round(self.percentile(0.95)),
+            "p99_ms": _round(self.percentile(0.99)),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": [
+                {"le_ms": "inf" if math.isinf(bound) else bound, "count": bucket_count}
+                for bound, bucket_count in zip(BUCKET_BOUNDS_MS, self.buckets)
+            ],
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+class Trace:
+    """Stage timings for one traced call."""
+
+    __slots__ = ("pipeline", "started", "last", "stages")
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.started = self.last = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def lap(self, name: str):
+        now = time.perf_counter()
+        self.add(name, now - self.last)
+        self.last = now
+
+
+class LatencyRecorder:
+    """Process-wide stage histograms, keyed by (pipeline, stage)."""
+
+    def __init__(self, enabled: bool = True, slow_ms: float = 1000.0):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._errors: Dict[str, int] = {}
+
+    def record(self, trace: Trace, total_seconds: float, failed: bool = False):
+        total_ms = total_seconds * 1000
+        stages_ms = [(name, seconds * 1000) for name, seconds in trace.stages.items()]
+        with self._lock:
+            for name, value_ms in stages_ms + [(TOTAL_STAGE, total_ms)]:
+                key = (trace.pipeline, name)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.observe(value_ms)
+            if failed:
+                self._errors[trace.pipeline] = self._errors.get(trace.pipeline, 0) + 1
+
+        if total_ms >= self.slow_ms:
+            print("[LATENCY] " + json.dumps({
+                "pipeline": trace.pipeline,
+                "total_ms": round(total_ms, 3),
+                "failed": failed,
+                "stages_ms": {name: round(value_ms, 3) for name, value_ms in stages_ms},
+            }))
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Per-pipeline stage stats, stages in descending order of total time."""
+        with self._lock:
+            pipelines: Dict[str, List[Tuple[str, Histogram]]] = {}
+            for (pipeline, name), histogram in self._histograms.items():
+                pipelines.setdefault(pipeline, []).append((name, histogram))
+            return {
+                pipeline: {
+                    "errors": self._errors.get(pipeline, 0),
+                    "stages": {
+                        name: histogram.snapshot()
+                        for name, histogram in sorted(stages, key=lambda item: -item[1].sum_ms)
+                    },
+                }
+                for pipeline, stages in sorted(pipelines.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._errors.clear()
+
+
+# Global recorder instance
+_recorder = LatencyRecorder(
+    enabled=os.getenv("LATENCY_TRACING", "1").lower() not in ("0", "false", "no", "off"),
+    slow_ms=float(os.getenv("LATENCY_SLOW_MS", "1000")),
+)
+
+
+def get_latency_recorder() -> LatencyRecorder:
+    return _recorder
+
+
+def traced(pipeline: str) -> Callable:
+    """Decorator: trace each call as `pipeline`, recording its stages and total time."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _recorder.enabled:
+                return func(*args, **kwargs)
+            trace = Trace(pipeline)
+            token = _current_trace.set(trace)
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _current_trace.reset(token)
+                _recorder.record(trace, time.perf_counter() - trace.started, failed)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as a stage of the current trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.last = time.perf_counter()
+        trace.add(name, trace.last - started)
+
+
+def lap(name: str):
+    """Charge the time since the previous lap or stage of the current trace to `name`."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.lap(name)
@@ -0,0 +1,154 @@
+"""
+Single-writer actors for order book markets.
+
+Each (catchment, unit_type) market is owned by one actor: a thread with an inbound
+command queue. Everything that changes a market's resting orders - matching a new
+order, cancels, cancel-replace batches and bot refreshes - is a command run on
+that thread, one at a time and in arrival order. Matching within a market is
+therefore strictly sequential without threads contending on a lock, while each
+market's actor runs in parallel with the others.
+
+Commands are plain callables. A caller hands its Session to the command and waits
+for the result (run_in_market), so a command sees the caller's uncommitted work
+and nothing else uses the Session meanwhile. Commands issued from the actor's own
+thread (a bot refresh matching its replacement orders) run inline.
+
+An actor starts with its market's first command and exits after IDLE_SECONDS
+without one, so markets nobody trades hold no thread.
+
+The actor only serialises commands within this process. On PostgreSQL, matching
+also holds the market's advisory lock (services.market_lock) against other API
+processes.
+"""
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from .order_book import market_key
+
+Market = Tuple[str, str]
+T = TypeVar("T")
+
+IDLE_SECONDS = 60.0
+
+_STOP = object()
+
+# The market whose actor the current thread is
+_actor_context = threading.local()
+
+
+class MarketActor:
+    """Thread that runs one market's commands in order."""
+
+    def __init__(self, market: Market, retire: Callable[["MarketActor"], bool], idle_seconds: float = IDLE_SECONDS):
+        self.market = market
+        self.idle_seconds = idle_seconds
+        self._retire = retire
+        self._inbox: "queue.Queue" = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f"market-{market[0]}-{market[1]}", daemon=True)
+        self.thread.start()
+
+    def submit(self, command: Callable[[], T]) -> "Future[T]":
+        """Queue a command. It runs in the caller's contextvars context (for latency traces)."""
+        future: "Future[T]" = Future()
+        self._inbox.put((contextvars.copy_context(), command, future))
+        return future
+
+    def queue_depth(self) -> int:
+        return self._inbox.qsize()
+
+    def stop(self, timeout: float = 5.0):
+        """Finish the queued commands, then exit."""
+        self._inbox.put(_STOP)
+        self.thread.join(timeout=timeout)
+
+    def _run(self):
+        _actor_context.market = self.market
+        while True:
+            try:
+                item = self._inbox.get(timeout=self.idle_seconds)
+            except queue.Empty:
+                if self._retire(self):
+                    return
+                continue
+            if item is _STOP:
+                return
+            context, command, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = context.run(command)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class MarketActorRegistry:
+    """Process-wide actor per market, started on first use."""
+
+    def __init__(self, idle_seconds: float = IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._actors: Dict[Market, MarketActor] = {}
+
+    def submit(self, catchment: str, unit_type: str, command: Callable[[], T]) -> "Future[T]":
+        """Queue a command on the market's actor, starting the actor if needed."""
+        key = market_key(catchment, unit_type)
+        # Queued under the lock, so an idle actor never retires with a command waiting
+        with self._lock:
+            actor = self._actors.get(key)
+            if actor is None:
+                actor = MarketActor(key, self._retire, self.idle_seconds)
+                self._actors[key] = actor
+            return actor.submit(command)
+
+    def run(self, catchment: str, unit_type: str, command: Callable[[], T]) -> T:
+        """Run a command on the market's actor and wait for its result (or exception)."""
+        if current_market() == market_key(catchment, unit_type):
+            return command()
+        return self.submit(catchment, unit_type, command).result()
+
+    def _retire(self, actor: MarketActor) -> bool:
+        with self._lock:
+            if actor.queue_depth():
+                return False
+            if self._actors.get(actor.market) is actor:
+                del self._actors[actor.market]
+            return True
+
+    def queue_depths(self) -> Dict[Market, int]:
+        with self._lock:
+            return {market: actor.queue_depth() for market, actor in self._actors.items()}
+
+    def stop(self):
+        """Stop every actor after its queued commands; the next command starts a new one."""
+        with self._lock:
+            actors = list(self._actors.values())
+            self._actors.clear()
+        for actor in actors:
+            actor.stop()
+
+
+# Global registry instance
+_registry = MarketActorRegistry()
+
+
+def get_market_actors() -> MarketActorRegistry:
+    return _registry
+
+
+def current_market() -> Optional[Market]:
+    """The market whose actor is running the current thread, if any."""
+    return getattr(_actor_context, "market", None)
+
+
+def run_in_market(catchment: str, unit_type: str, command: Callable[[], T]) -> T:
+    """Run a command on the market's actor (inline if already on it) and return its result."""
+    return _registry.run(catchment, unit_type, command)
+
+
+def stop_market_actors():
+    _registry.stop()
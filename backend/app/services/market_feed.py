@@ -0,0 +1,387 @@
+"""
+Push feed of order book levels and trade prints for each market.
+
+Clients that used to poll /exchange/orderbook and /exchange/trades subscribe to
+a (catchment, unit_type) market instead (see the /exchange/stream WebSocket and
+/exchange/stream/sse endpoints). A subscriber first receives a snapshot of the
+aggregated book, then every change after it in order:
+
+    {"type": "snapshot", "seq": 41, "bids": [[price, quantity], ...], "asks": [...]}
+    {"type": "levels", "seq": 42, "changes": [{"side": "SELL", "price": 12.0, "quantity": 0}]}
+    {"type": "trade", "seq": 43, "trade_id": 7, "price": 12.0, "quantity": 5, "timestamp": "..."}
+
+Sequence numbers are per market and increase by one per message, so a gap means
+messages were lost and the client should reconnect for a fresh snapshot. Level
+changes come from the order book registry (one message per committed
+transaction); trade prints come from Trade rows committed by the matching path.
+Snapshots are taken under the registry lock, so no change can fall between a
+snapshot and the first delta.
+
+On PostgreSQL the registry only sees this process's commits, so the feed does
+not use it. Every transaction that changes an order or prints a trade sends a
+NOTIFY on FEED_CHANNEL (delivered to every API process when it commits). Each
+process with subscribers LISTENs on a dedicated connection: a "levels"
+notification makes it re-read the market's level totals from the database
+(read_order_book) and publish the levels that differ from what it last sent, a
+"trade" notification is published as is. Snapshots are the last levels sent,
+read from the database when a market gets its first subscriber (after LISTEN,
+so no commit can fall between the snapshot and the first delta). If the LISTEN
+connection drops, the listener reconnects and re-reads every subscribed market;
+trade prints committed while it was down are not replayed.
+"""
+import asyncio
+import json
+import select
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..db import is_postgresql
+from ..models import Order, Trade
+from .order_book import LevelChange, OrderBook, get_order_book_registry, market_key, read_order_book, scheme_market
+
+_PENDING_KEY = "market_feed_pending_trades"
+
+# PostgreSQL NOTIFY channel carrying committed level changes and trade prints to every API process
+FEED_CHANNEL = "offsetx_market_feed"
+
+Levels = Dict[Tuple[str, float], int]
+
+# A subscriber this far behind is disconnected rather than buffering without bound
+DEFAULT_MAX_PENDING = 1000
+
+
+class FeedSubscription:
+    """One client's queue of feed messages, consumed on the event loop that created it."""
+
+    def __init__(self, market: Tuple[str, str], loop: asyncio.AbstractEventLoop, max_pending: int):
+        self.market = market
+        self.max_pending = max_pending
+        self.closed = False
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def deliver(self, message: Dict):
+        """Queue a message from any thread."""
+        try:
+            self._loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # Event loop has shut down; the hub drops closed subscriptions
+            self.closed = True
+
+    def _put(self, message: Optional[Dict]):
+        if self.closed:
+            return
+        if message is not None and self._queue.qsize() >= self.max_pending:
+            # Too slow to keep up: drop the backlog and end the stream
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait({"type": "error", "reason": "slow_consumer"})
+            message = None
+        if message is None:
+            self.closed = True
+        self._queue.put_nowait(message)
+
+    def close(self):
+        """End the stream; get() returns None once queued messages are consumed."""
+        try:
+            self._loop.call_soon_threadsafe(self._put, None)
+        except RuntimeError:
+            self.closed = True
+
+    async def get(self) -> Optional[Dict]:
+        """Next message, or None when the stream has ended."""
+        return await self._queue.get()
+
+
+def _book_levels(book: OrderBook) -> Levels:
+    return {(side, price): quantity for side in ("BUY", "SELL") for price, quantity in book.depth(side)}
+
+
+def _levels_message(changes: List[LevelChange]) -> Dict:
+    return {
+        "type": "levels",
+        "changes": [{"side": side, "price": price, "quantity": quantity} for side, price, quantity in changes]
+    }
+
+
+class FeedListener:
+    """PostgreSQL: LISTENs on FEED_CHANNEL in a background thread and hands notifications to the hub."""
+
+    def __init__(self, hub: "MarketFeedHub", bind: Engine, poll_seconds: float = 0.5):
+        self.hub = hub
+        self.bind = bind
+        self.poll_seconds = poll_seconds
+        self.listening = threading.Event()
+        self._stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self, timeout: float = 5.0):
+        """Start the thread and wait until it is listening."""
+        self.thread.start()
+        if not self.listening.wait(timeout):
+            self.stop()
+            raise RuntimeError("Market feed could not listen for changes from other API processes")
+
+    def stop(self):
+        self._stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5.0)
+
+    def _run(self):
+        reconnected = False
+        while not self._stop_event.is_set():
+            connection = None
+            try:
+                connection = self.bind.raw_connection()
+                driver = connection.driver_connection
+                # Autocommit for LISTEN; detached so it is closed rather than returned to the pool
+                connection.detach()
+                driver.autocommit = True
+                driver.cursor().execute(f"LISTEN {FEED_CHANNEL}")
+                self.listening.set()
+                if reconnected:
+                    # Level changes notified while disconnected were missed
+                    self.hub.refresh_levels()
+                while not self._stop_event.is_set():
+                    if select.select([driver], [], [], self.poll_seconds)[0]:
+                        driver.poll()
+                        while driver.notifies:
+                            self.hub.on_notification(json.loads(driver.notifies.pop(0).payload))
+            except Exception as e:
+                print(f"[MARKET_FEED] Listener error: {str(e)}")
+                reconnected = True
+                self._stop_event.wait(self.poll_seconds)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+class MarketFeedHub:
+    """Process-wide fan-out of book and trade changes to subscribers, one sequence per market."""
+
+    def __init__(self):
+        self._seq: Dict[Tuple[str, str], int] = {}
+        self._subscribers: Dict[Tuple[str, str], List[FeedSubscription]] = {}
+        # PostgreSQL only: the LISTEN thread, and the level totals last published per subscribed market
+        self._listener: Optional[FeedListener] = None
+        self._levels: Dict[Tuple[str, str], Levels] = {}
+        self._levels_lock = threading.RLock()
+
+    @property
+    def lock(self) -> threading.RLock:
+        # Shared with the order book so snapshots and level changes are ordered
+        return get_order_book_registry().lock
+
+    def has_subscribers(self) -> bool:
+        return any(self._subscribers.values())
+
+    def subscribe(
+        self,
+        catchment: str,
+        unit_type: str,
+        db: Session,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        max_pending: int = DEFAULT_MAX_PENDING
+    ) -> Tuple[FeedSubscription, Dict]:
+        """
+        Subscribe to a market.
+
+        Returns:
+            (subscription, snapshot message)
+        """
+        market = market_key(catchment, unit_type)
+        subscription = FeedSubscription(market, loop or asyncio.get_running_loop(), max_pending)
+        if is_postgresql(db):
+            return subscription, self._subscribe_shared(subscription, db)
+
+        registry = get_order_book_registry()
+        registry.ensure_loaded(db)
+        with self.lock:
+            snapshot = self._snapshot(market, _book_levels(registry.book(*market)))
+            self._subscribers.setdefault(market, []).append(subscription)
+        return subscription, snapshot
+
+    def _subscribe_shared(self, subscription: FeedSubscription, db: Session) -> Dict:
+        """PostgreSQL: subscribe with a snapshot of the book in the database."""
+        market = subscription.market
+        with self._levels_lock:
+            if self._listener is None:
+                listener = FeedListener(self, db.get_bind())
+                listener.start()
+                self._listener = listener
+            levels = self._levels.get(market)
+            if levels is None:
+                levels = self._levels[market] = _book_levels(read_order_book(*market, db))
+            with self.lock:
+                snapshot = self._snapshot(market, levels)
+                self._subscribers.setdefault(market, []).append(subscription)
+        return snapshot
+
+    def _snapshot(self, market: Tuple[str, str], levels: Levels) -> Dict:
+        return {
+            "type": "snapshot",
+            "seq": self._seq.get(market, 0),
+            "catchment": market[0],
+            "unit_type": market[1],
+            "bids": sorted(([price, quantity] for (side, price), quantity in levels.items() if side == "BUY"), reverse=True),
+            "asks": sorted([price, quantity] for (side, price), quantity in levels.items() if side == "SELL")
+        }
+
+    def unsubscribe(self, subscription: FeedSubscription):
+        with self.lock:
+            subscribers = self._subscribers.get(subscription.market, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+
+    def publish(self, market: Tuple[str, str], message: Dict):
+        """Stamp a message with the market's next sequence number and deliver it."""
+        with self.lock:
+            subscribers = self._subscribers.get(market)
+            if not subscribers:
+                return
+            seq = self._seq.get(market, 0) + 1
+            self._seq[market] = seq
+            message["seq"] = seq
+            for subscription in list(subscribers):
+                if subscription.closed:
+                    subscribers.remove(subscription)
+                else:
+                    subscription.deliver(message)
+
+    def on_book_change(self, book: OrderBook, changes: List[LevelChange]):
+        """Order book listener: publish the levels one transaction changed."""
+        if self._listener is not None:
+            # PostgreSQL: this process's commits arrive with everyone else's through the listener
+            return
+        self.publish((book.catchment, book.unit_type), _levels_message(changes))
+
+    def on_notification(self, message: Dict):
+        """FeedListener callback: publish a trade print, or re-read a market whose levels changed."""
+        market = market_key(message.pop("catchment"), message.pop("unit_type"))
+        if message["type"] == "trade":
+            message["timestamp"] = datetime.utcnow().isoformat()
+            self.publish(market, message)
+        else:
+            self.refresh_levels([market])
+
+    def refresh_levels(self, markets: Optional[List[Tuple[str, str]]] = None):
+        """PostgreSQL: re-read subscribed markets' level totals and publish the levels that changed."""
+        with self._levels_lock:
+            listener = self._listener
+            if listener is None:
+                return
+            db = None
+            try:
+                for market in (markets if markets is not None else list(self._levels)):
+                    if market not in self._levels:
+                        continue
+                    with self.lock:
+                        watched = bool(self._subscribers.get(market))
+                    if not watched:
+                        # Read again when the market next gets a subscriber
+                        del self._levels[market]
+                        continue
+                    db = db or Session(bind=listener.bind)
+                    previous, levels = self._levels[market], _book_levels(read_order_book(*market, db))
+                    self._levels[market] = levels
+                    changes = [
+                        (side, price, levels.get((side, price), 0))
+                        for side, price in sorted(set(previous) | set(levels))
+                        if levels.get((side, price), 0) != previous.get((side, price), 0)
+                    ]
+                    if changes:
+                        self.publish(market, _levels_message(changes))
+            finally:
+                if db is not None:
+                    db.close()
+
+    def reset(self):
+        """End every subscription and forget sequence numbers."""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+        with self._levels_lock, self.lock:
+            for subscribers in self._subscribers.values():
+                for subscription in subscribers:
+                    subscription.close()
+            self._subscribers.clear()
+            self._seq.clear()
+            self._levels.clear()
+
+
+# Global hub instance
+_hub = MarketFeedHub()
+get_order_book_registry().add_listener(_hub.on_book_change)
+
+
+def get_market_feed() -> MarketFeedHub:
+    return _hub
+
+
+# Session event hooks: collect trade prints as Trade rows are flushed and publish
+# them once the transaction commits. On PostgreSQL, NOTIFY every API process of
+# the changed markets and trade prints instead (delivered on commit).
+
+def _notify_changes(session: Session):
+    payloads: Dict[str, None] = {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Order) and obj.catchment:
+            catchment, unit_type = market_key(obj.catchment, obj.unit_type)
+            payloads[json.dumps({"type": "levels", "catchment": catchment, "unit_type": unit_type})] = None
+    for obj in session.new:
+        if isinstance(obj, Trade) and obj.id is not None and obj.scheme_id is not None:
+            market = scheme_market(obj.scheme_id, session)
+            if market is None:
+                continue
+            payloads[json.dumps({
+                "type": "trade",
+                "catchment": market[0],
+                "unit_type": market[1],
+                "trade_id": obj.id,
+                "price": obj.price_per_unit,
+                "quantity": obj.quantity_units
+            })] = None
+    connection = session.connection()
+    for payload in payloads:
+        connection.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": FEED_CHANNEL, "payload": payload})
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_trades(session: Session, flush_context):
+    if is_postgresql(session):
+        _notify_changes(session)
+        return
+    if not _hub.has_subscribers():
+        return
+    for obj in session.new:
+        if isinstance(obj, Trade) and obj.id is not None and obj.scheme_id is not None:
+            market = scheme_market(obj.scheme_id, session)
+            if market is None:
+                continue
+            session.info.setdefault(_PENDING_KEY, []).append((market, {
+                "type": "trade",
+                "trade_id": obj.id,
+                "price": obj.price_per_unit,
+                "quantity": obj.quantity_units
+            }))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_trades(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    timestamp = datetime.utcnow().isoformat()
+    for market, message in pending:
+        message["timestamp"] = timestamp
+        _hub.publish(market, message)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_trades(session: Session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,166 @@
+"""
+Market and worker locks that hold across API processes.
+
+Within one process, matching and bot refreshes in a market are serialised by
+the order book registry's per-market RLock. That is all SQLite needs: it only
+supports one writer anyway. On PostgreSQL several uvicorn workers share the
+database, so the market lock also takes a session-level advisory lock keyed by
+the market, on a dedicated autocommit connection:
+
+- the thread lock is taken first, so each process holds at most one advisory
+  lock per market, and re-entrant use (a bot refresh placing an order that
+  matches) reuses it instead of blocking on itself;
+- the connection is separate from the caller's Session, because match_order
+  commits after every fill and the Session returns its connection to the pool.
+
+Advisory locks are released by PostgreSQL if the process dies, so a crashed
+worker never leaves a market locked.
+
+acquire_worker_lock() elects one process to run a background worker (settlement,
+bots, chain indexer) - those keep process-local state such as signer nonces and
+must not run twice against one database. The lock lives as long as its
+connection: holding_worker_lock() checks the connection is still up and still
+holds the lock (services.worker_election polls it, and retries the lock in the
+processes that do not hold it).
+"""
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from ..db import engine as default_engine, is_postgresql
+from .order_book import get_order_book_registry, market_key
+
+# First key of every advisory lock taken here, so they cannot collide with other users of the database
+ADVISORY_NAMESPACE = 0x4E4D
+
+_held_markets: Dict[Tuple[str, str], Tuple[Connection, int]] = {}
+_worker_locks: Dict[str, Connection] = {}
+_worker_locks_guard = threading.Lock()
+
+
+def advisory_key(name: str) -> int:
+    """Stable signed 32-bit key for a lock name (the same in every process)."""
+    key = zlib.crc32(name.encode("utf-8"))
+    return key - (1 << 32) if key >= (1 << 31) else key
+
+
+def _autocommit_connection(bind: Engine) -> Connection:
+    return bind.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+@contextmanager
+def market_lock(catchment: str, unit_type: str, db: Session):
+    """Hold a market exclusively: against other threads and, on PostgreSQL, other processes."""
+    key = market_key(catchment, unit_type)
+    with get_order_book_registry().market_lock(*key):
+        if not is_postgresql(db):
+            yield
+            return
+
+        # Only the thread holding the market's RLock reads or writes its entry
+        held = _held_markets.get(key)
+        if held is not None:
+            connection, depth = held
+            _held_markets[key] = (connection, depth + 1)
+            try:
+                yield
+            finally:
+                _held_markets[key] = (connection, depth)
+            return
+
+        connection = _autocommit_connection(db.get_bind())
+        lock_args = {"namespace": ADVISORY_NAMESPACE, "key": advisory_key("market:%s:%s" % key)}
+        try:
+            connection.execute(text("SELECT pg_advisory_lock(:namespace, :key)"), lock_args)
+            _held_markets[key] = (connection, 1)
+            try:
+                yield
+            finally:
+                del _held_markets[key]
+                connection.execute(text("SELECT pg_advisory_unlock(:namespace, :key)"), lock_args)
+        finally:
+            connection.close()
+
+
+def acquire_worker_lock(name: str, bind: Optional[Engine] = None) -> bool:
+    """
+    Try to become the process that runs background worker `name`.
+
+    Always True on SQLite. On PostgreSQL the first process to ask wins and keeps
+    the lock until release_worker_lock() or until it exits; the others get False.
+    """
+    bind = bind or default_engine
+    if not is_postgresql(bind):
+        return True
+    with _worker_locks_guard:
+        if name in _worker_locks:
+            return True
+        connection = _autocommit_connection(bind)
+        acquired = connection.execute(
+            text("SELECT pg_try_advisory_lock(:namespace, :key)"),
+            {"namespace": ADVISORY_NAMESPACE, "key": advisory_key("worker:" + name)}
+        ).scalar()
+        if not acquired:
+            connection.close()
+            return False
+        _worker_locks[name] = connection
+        return True
+
+
+def holding_worker_lock(name: str, bind: Optional[Engine] = None) -> bool:
+    """
+    Whether this process still holds worker lock `name`.
+
+    Always True on SQLite once acquired. On PostgreSQL the lock's connection is
+    asked whether its session still holds the lock; if the connection was closed
+    or reset (which drops session locks silently) the lock is forgotten, so the
+    caller must stop the worker and may try acquire_worker_lock() again.
+    """
+    bind = bind or default_engine
+    with _worker_locks_guard:
+        if not is_postgresql(bind):
+            return True
+        connection = _worker_locks.get(name)
+        if connection is None:
+            return False
+        key = advisory_key("worker:" + name)
+        try:
+            # A two-key advisory lock is listed with its keys as unsigned classid / objid and objsubid 2
+            held = connection.execute(
+                text(
+                    "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND classid = :classid"
+                    " AND objid = :objid AND objsubid = 2 AND pid = pg_backend_pid() AND granted)"
+                ),
+                {"classid": ADVISORY_NAMESPACE, "objid": key & 0xFFFFFFFF}
+            ).scalar()
+        except Exception as e:
+            print(f"[WORKER_LOCK] Lock connection for {name} failed: {str(e)}")
+            held = False
+        if not held:
+            del _worker_locks[name]
+            try:
+                # Never hand a connection in an unknown session state back to the pool
+                connection.invalidate()
+                connection.close()
+            except Exception:
+                pass
+        return bool(held)
+
+
+def release_worker_lock(name: str):
+    """Let another process take over background worker `name`."""
+    with _worker_locks_guard:
+        connection = _worker_locks.pop(name, None)
+    if connection is not None:
+        try:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:namespace, :key)"),
+                {"namespace": ADVISORY_NAMESPACE, "key": advisory_key("worker:" + name)}
+            )
+        finally:
+            connection.close()
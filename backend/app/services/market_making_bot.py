@@ -3,10 +3,17 @@ from typing import List, Dict, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
 from datetime import datetime, timezone
+from ..db import lock_for_update
 from ..models import (
     MarketMakingBot, BotAssignment, FIFOCreditQueue, BotOrder,
-    Account, BrokerMandate, Scheme, Trade, Order, AccountRole
+    Account, BrokerMandate, Scheme, Order, AccountRole
 )
+from .reservations import reserve_order, release_order
+from .batch_orders import BatchOrder, stage_order_batch, complete_order_batch
+from .market_actor import current_market, run_in_market
+from .market_state import get_market_state, get_market_state_cache
+from .order_book import OPEN_ORDER_STATUSES, market_key
+from .settlement import market_making_bot_is_house, resolve_order_funding
 
 
 # Bot Management Functions
@@ -386,60 +393,31 @@ def update_queue_after_trade(queue_entry_id: int, credits_traded: int, db: Sessi
 
 def is_market_new(catchment: str, unit_type: str, db: Session) -> bool:
     """Check if market has any trades yet."""
-    trade_count = db.query(Trade).join(Scheme).filter(
-        Scheme.catchment == catchment,
-        Scheme.unit_type == unit_type
-    ).count()
-    
-    return trade_count == 0
+    return get_market_state(catchment, unit_type, db).is_new
 
 
 def get_best_bid_price(catchment: str, unit_type: str, db: Session) -> Optional[float]:
     """Get best (highest) current bid price."""
-    best_order = db.query(Order).join(Scheme).filter(
-        Order.side == "BUY",
-        Order.status.in_(["PENDING", "PARTIALLY_FILLED"]),
-        Scheme.catchment == catchment,
-        Scheme.unit_type == unit_type,
-        Order.price_per_unit.isnot(None)
-    ).order_by(Order.price_per_unit.desc()).first()
-    
-    return best_order.price_per_unit if best_order else None
+    return get_market_state(catchment, unit_type, db).best_bid
 
 
 def get_best_ask_price(catchment: str, unit_type: str, db: Session) -> Optional[float]:
     """Get best (lowest) current ask price."""
-    best_order = db.query(Order).join(Scheme).filter(
-        Order.side == "SELL",
-        Order.status.in_(["PENDING", "PARTIALLY_FILLED"]),
-        Scheme.catchment == catchment,
-        Scheme.unit_type == unit_type,
-        Order.price_per_unit.isnot(None)
-    ).order_by(Order.price_per_unit.asc()).first()
-    
-    return best_order.price_per_unit if best_order else None
+    return get_market_state(catchment, unit_type, db).best_ask
 
 
 def calculate_reference_price(catchment: str, unit_type: str, db: Session, bot_config: Dict) -> float:
     """Calculate reference price with fallbacks for new markets."""
+    state = get_market_state(catchment, unit_type, db)
+    
     # Priority 1: Recent trades
-    recent_trades = db.query(Trade).join(Scheme).filter(
-        Scheme.catchment == catchment,
-        Scheme.unit_type == unit_type
-    ).order_by(Trade.created_at.desc()).limit(10).all()
-    
-    if recent_trades:
-        total_weight = 0
-        weighted_sum = 0
-        for i, trade in enumerate(recent_trades):
-            weight = 10 - i
-            weighted_sum += trade.price_per_unit * weight
-            total_weight += weight
-        return weighted_sum / total_weight
+    trade_price = state.weighted_trade_price()
+    if trade_price is not None:
+        return trade_price
     
     # Priority 2: Best bid/ask
-    best_bid = get_best_bid_price(catchment, unit_type, db)
-    best_ask = get_best_ask_price(catchment, unit_type, db)
+    best_bid = state.best_bid
+    best_ask = state.best_ask
     
     if best_bid and best_ask:
         return (best_bid + best_ask) / 2.0
@@ -479,34 +457,14 @@ def calculate_bid_ask_prices(reference_price: float, spread_pct: float, inventor
 
 def get_inventory_ratio(bot_id: int, db: Session) -> float:
     """Calculate current inventory ratio (0.0 to 1.0)."""
-    # Get total assigned credits
-    assignments = get_bot_assignments(bot_id, db)
-    
-    total_assigned = 0
-    total_available = 0
-    
-    for assignment in assignments:
-        if assignment.is_house_account == 1:
-            # For house account, get from FIFO queues (already initialized)
-            queues = db.query(FIFOCreditQueue).filter(
-                FIFOCreditQueue.assignment_id == assignment.id
-            ).all()
-            for queue in queues:
-                total_assigned += queue.credits_available + queue.credits_traded
-                total_available += queue.credits_available
-        else:
-            # For client mandates, get from FIFO queues
-            queues = db.query(FIFOCreditQueue).filter(
-                FIFOCreditQueue.assignment_id == assignment.id
-            ).all()
-            for queue in queues:
-                total_assigned += queue.credits_available + queue.credits_traded
-                total_available += queue.credits_available
-    
-    if total_assigned == 0:
-        return 0.5  # Default to middle if no inventory
-    
-    return total_available / total_assigned
+    cache = get_market_state_cache()
+    market = cache.bot_market(bot_id)
+    if market is None:
+        bot = db.get(MarketMakingBot, bot_id)
+        if not bot:
+            return 0.5  # Default to middle if no inventory
+        market = (bot.catchment, bot.unit_type)
+    return cache.inventory(bot_id, *market, db).ratio()
 
 
 def should_place_bid(inventory_ratio: float, threshold_low: float) -> bool:
@@ -557,6 +515,9 @@ def place_bot_orders(bot_id: int, db: Session):
     if bot.is_active == 0:
         print(f"[BOT SKIP] Bot {bot_id} is not active")
         return
+    if current_market() != market_key(bot.catchment, bot.unit_type):
+        # A refresh is one command on the market's actor
+        return run_in_market(bot.catchment, bot.unit_type, lambda: place_bot_orders(bot_id, db))
     
     print(f"[BOT] Placing orders for bot {bot_id} ({bot.name}) - {bot.catchment} {bot.unit_type}")
     
@@ -589,10 +550,8 @@ def place_bot_orders(bot_id: int, db: Session):
     )
     print(f"[BOT] Bid price: £{bid_price:.2f}, Ask price: £{ask_price:.2f}")
     
-    # Cancel existing bot orders
-    cancel_bot_orders(bot_id, db)
-    
-    # Place new orders
+    # Work out the new quotes, then cancel the old orders and place these as one batch
+    quotes = []
     if is_new_market:
         # New market: Place both orders
         initial_size_pct = config.get('initial_order_size_percentage', 0.1)
@@ -608,11 +567,7 @@ def place_bot_orders(bot_id: int, db: Session):
             credits_from_queue, queue_id = get_next_credits_from_queue(bot_id, credits_to_sell, db)
             print(f"[BOT] Got {credits_from_queue:,} credits from queue (queue_id: {queue_id})")
             if credits_from_queue > 0:
-                order_id = create_bot_limit_order(bot, 'SELL', ask_price, credits_from_queue, db)
-                if order_id:
-                    create_bot_order_record(bot_id, order_id, ask_price, 'ASK', db)
-                else:
-                    print(f"[BOT ERROR] Failed to create SELL order")
+                quotes.append(('SELL', ask_price, credits_from_queue))
             else:
                 print(f"[BOT ERROR] No credits available from queue")
         else:
@@ -625,11 +580,7 @@ def place_bot_orders(bot_id: int, db: Session):
         )
         print(f"[BOT] Credits to buy: {credits_to_buy:,}")
         if credits_to_buy >= config.get('min_order_size_credits', 10000):
-            order_id = create_bot_limit_order(bot, 'BUY', bid_price, credits_to_buy, db)
-            if order_id:
-                create_bot_order_record(bot_id, order_id, bid_price, 'BID', db)
-            else:
-                print(f"[BOT ERROR] Failed to create BUY order")
+            quotes.append(('BUY', bid_price, credits_to_buy))
         else:
             print(f"[BOT SKIP] Credits to buy ({credits_to_buy:,}) below minimum ({config.get('min_order_size_credits', 10000):,})")
     else:
@@ -637,40 +588,96 @@ def place_bot_orders(bot_id: int, db: Session):
         if should_place_bid(inventory_ratio, config.get('inventory_threshold_low', 0.2)):
             credits_to_buy = calculate_order_size(bot, 'BID', db)
             if credits_to_buy > 0:
-                order_id = create_bot_limit_order(bot, 'BUY', bid_price, credits_to_buy, db)
-                if order_id:
-                    create_bot_order_record(bot_id, order_id, bid_price, 'BID', db)
+                quotes.append(('BUY', bid_price, credits_to_buy))
         
         if should_place_ask(inventory_ratio, config.get('inventory_threshold_high', 0.8)):
             credits_to_sell = calculate_order_size(bot, 'ASK', db)
             credits_from_queue, queue_id = get_next_credits_from_queue(bot_id, credits_to_sell, db)
             if credits_from_queue > 0:
-                order_id = create_bot_limit_order(bot, 'SELL', ask_price, credits_from_queue, db)
-                if order_id:
-                    create_bot_order_record(bot_id, order_id, ask_price, 'ASK', db)
+                quotes.append(('SELL', ask_price, credits_from_queue))
+    
+    replace_bot_orders(bot, quotes, db)
+
+
+def get_bot_order_scheme(bot: MarketMakingBot, db: Session) -> Optional[Scheme]:
+    """Scheme the bot's orders are booked against (for order tracking)."""
+    # Use case-insensitive matching for catchment
+    scheme = db.query(Scheme).filter(
+        func.upper(Scheme.catchment) == bot.catchment.upper(),
+        Scheme.unit_type == bot.unit_type.lower()
+    ).first()
+    
+    if not scheme:
+        print(f"[BOT ERROR] No scheme found for catchment '{bot.catchment}' and unit_type '{bot.unit_type}'")
+        # Try to find any scheme from the FIFO queue as fallback
+        queue_entry = db.query(FIFOCreditQueue).filter(
+            FIFOCreditQueue.bot_id == bot.id,
+            FIFOCreditQueue.credits_available > 0
+        ).first()
+        if queue_entry:
+            scheme = db.query(Scheme).filter(Scheme.id == queue_entry.scheme_id).first()
+            if scheme:
+                print(f"[BOT FALLBACK] Using scheme {scheme.id} from FIFO queue")
+    return scheme
+
+
+def replace_bot_orders(bot: MarketMakingBot, quotes: List[Tuple[str, float, int]], db: Session):
+    """
+    Cancel the bot's open orders and place `quotes` ((side, price, quantity)) as one
+    batch: one transaction for the cancels, new orders and BotOrder records, then
+    matching only for quotes that cross the book.
+    """
+    open_order_ids = [
+        order_id for (order_id,) in db.query(BotOrder.order_id).join(Order).filter(
+            BotOrder.bot_id == bot.id,
+            Order.status.in_(["PENDING", "PARTIALLY_FILLED"])
+        ).all()
+    ]
+    
+    scheme = get_bot_order_scheme(bot, db) if quotes else None
+    if quotes and not scheme:
+        print(f"[BOT ERROR] Cannot create orders: No scheme available")
+        quotes = []
+    
+    # Whether the bot's SELL quotes sell house or client credits (stored on the orders for settlement)
+    is_house_account = None
+    if any(side == 'SELL' for side, _, _ in quotes):
+        is_house_account = market_making_bot_is_house(bot.id, scheme.id, db)
+    
+    batch = stage_order_batch(
+        bot.broker_account_id,
+        bot.catchment,
+        bot.unit_type,
+        [
+            BatchOrder(side=side, price_per_unit=price, quantity_units=quantity, scheme_id=scheme.id, is_house_account=is_house_account)
+            for side, price, quantity in quotes
+        ],
+        open_order_ids,
+        db,
+        check_funds=False
+    )
+    if not batch.applied:
+        errors = [result.error for result in batch.orders + batch.cancels if result.error]
+        print(f"[BOT ERROR] Order refresh for bot {bot.id} rejected: {errors}")
+        return
+    
+    for order, (side, price, quantity) in zip(batch.created, quotes):
+        db.add(BotOrder(
+            bot_id=bot.id,
+            order_id=order.id,
+            strategy_price=price,
+            order_type='ASK' if side == 'SELL' else 'BID'
+        ))
+        print(f"[BOT SUCCESS] Created {side} order {order.id}: {quantity:,} credits at £{price:.2f} for {bot.catchment.upper()} {bot.unit_type.lower()}")
+    
+    complete_order_batch(batch, db)
 
 
 def create_bot_limit_order(bot: MarketMakingBot, side: str, price: float, quantity: int, db: Session) -> Optional[int]:
     """Create a limit order on behalf of the bot."""
     try:
         # Get a scheme for this catchment/unit_type (for order tracking)
-        # Use case-insensitive matching for catchment
-        scheme = db.query(Scheme).filter(
-            func.upper(Scheme.catchment) == bot.catchment.upper(),
-            Scheme.unit_type == bot.unit_type.lower()
-        ).first()
-        
-        if not scheme:
-            print(f"[BOT ERROR] No scheme found for catchment '{bot.catchment}' and unit_type '{bot.unit_type}'")
-            # Try to find any scheme from the FIFO queue as fallback
-            queue_entry = db.query(FIFOCreditQueue).filter(
-                FIFOCreditQueue.bot_id == bot.id,
-                FIFOCreditQueue.credits_available > 0
-            ).first()
-            if queue_entry:
-                scheme = db.query(Scheme).filter(Scheme.id == queue_entry.scheme_id).first()
-                if scheme:
-                    print(f"[BOT FALLBACK] Using scheme {scheme.id} from FIFO queue")
+        scheme = get_bot_order_scheme(bot, db)
         
         if not scheme:
             print(f"[BOT ERROR] Cannot create order: No scheme available")
@@ -692,7 +699,12 @@ def create_bot_limit_order(bot: MarketMakingBot, side: str, price: float, quanti
             scheme_id=scheme.id,
             nft_token_id=scheme.nft_token_id
         )
+        if side == "SELL":
+            broker = db.get(Account, bot.broker_account_id)
+            if broker:
+                resolve_order_funding(order, broker, db, is_house_account=market_making_bot_is_house(bot.id, scheme.id, db))
         
+        reserve_order(order, db)
         db.add(order)
         db.commit()
         db.refresh(order)
@@ -725,21 +737,30 @@ def create_bot_order_record(bot_id: int, order_id: int, strategy_price: float, o
 
 
 def cancel_bot_orders(bot_id: int, db: Session):
-    """Cancel all active bot orders."""
+    """Cancel all active bot orders (as a command on the bot's market actor)."""
+    bot = get_bot(bot_id, db)
+    if bot is not None and current_market() != market_key(bot.catchment, bot.unit_type):
+        return run_in_market(bot.catchment, bot.unit_type, lambda: cancel_bot_orders(bot_id, db))
+    
     bot_orders = db.query(BotOrder).join(Order).filter(
         BotOrder.bot_id == bot_id,
         Order.status.in_(["PENDING", "PARTIALLY_FILLED"])
     ).all()
     
     for bot_order in bot_orders:
-        bot_order.order.status = "CANCELLED"
+        order = bot_order.order
+        # PostgreSQL: wait for a fill in another API process to commit, and see it
+        lock_for_update(order, db)
+        if order.status not in OPEN_ORDER_STATUSES:
+            continue
+        release_order(order, order.remaining_quantity, db)
+        order.status = "CANCELLED"
     
     db.commit()
 
 
 def update_bot_orders(bot_id: int, db: Session):
     """Update existing bot orders based on new prices."""
-    # Cancel old orders and place new ones
-    cancel_bot_orders(bot_id, db)
+    # place_bot_orders cancels the old orders and places new ones in one batch
     place_bot_orders(bot_id, db)
 
@@ -0,0 +1,294 @@
+"""
+Per-market state for market-making quote calculation.
+
+Every place_bot_orders pass used to count the market's trades, query the best
+bid and ask (joined to schemes), read the last 10 trades for the reference price
+and sum the bot's FIFO queues for its inventory ratio. MarketState keeps those
+inputs in memory for each (catchment, unit_type) market:
+
+- best bid / ask are read from the in-memory order book, which the matcher
+  already keeps up to date;
+- the trade count and a rolling window of the most recent trades (for the
+  reference price and a VWAP) are updated from Trade rows as they are committed;
+- each bot's inventory (its FIFO queue rows and active assignments) is updated
+  from FIFOCreditQueue and BotAssignment rows as they are committed.
+
+A market is loaded from the database on first use and again whenever its order
+book is rebuilt (registry reset or reload), so the two never drift apart. Once
+loaded, quoting a market needs no database queries.
+
+On PostgreSQL other API processes commit trades, orders and queue changes that
+never pass through this process's session events, so nothing is kept: every
+state() and inventory() call reads the database (the queries the cache replaced),
+and bots in every process quote from the same data.
+"""
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..db import is_postgresql
+from ..models import BotAssignment, FIFOCreditQueue, MarketMakingBot, Scheme, Trade
+from .order_book import OrderBook, get_order_book, read_order_book, scheme_market
+
+# Trades behind the reference price (and VWAP), newest first
+REFERENCE_TRADES = 10
+
+_PENDING_KEY = "market_state_pending"
+
+
+@dataclass
+class TradePrint:
+    trade_id: int
+    price_per_unit: float
+    quantity_units: int
+
+
+@dataclass
+class QueueInventory:
+    """The fields of one FIFOCreditQueue row the inventory ratio needs."""
+    assignment_id: int
+    credits_available: int
+    credits_traded: int
+
+
+class BotInventory:
+    """A bot's FIFO queue rows and which of its assignments are active."""
+
+    def __init__(self, active_assignments: Set[int], queues: Dict[int, QueueInventory]):
+        self.active_assignments = active_assignments
+        self.queues = queues
+
+    def ratio(self) -> float:
+        """Available / assigned credits over active assignments (0.5 with no inventory)."""
+        total_assigned = 0
+        total_available = 0
+        for queue in self.queues.values():
+            if queue.assignment_id in self.active_assignments:
+                total_assigned += queue.credits_available + queue.credits_traded
+                total_available += queue.credits_available
+        if total_assigned == 0:
+            return 0.5
+        return total_available / total_assigned
+
+
+class MarketState:
+    """Quote inputs for one market."""
+
+    def __init__(self, book: OrderBook, trade_count: int, recent_trades: List[TradePrint]):
+        self.book = book
+        self.catchment = book.catchment
+        self.unit_type = book.unit_type
+        self.trade_count = trade_count
+        # Newest first, like the query it replaces
+        self.recent_trades: Deque[TradePrint] = deque(recent_trades, maxlen=REFERENCE_TRADES)
+        self.last_trade_id = max((trade.trade_id for trade in recent_trades), default=0)
+        self.inventories: Dict[int, BotInventory] = {}
+
+    @property
+    def is_new(self) -> bool:
+        return self.trade_count == 0
+
+    @property
+    def best_bid(self) -> Optional[float]:
+        return self.book.best_bid()
+
+    @property
+    def best_ask(self) -> Optional[float]:
+        return self.book.best_ask()
+
+    def weighted_trade_price(self) -> Optional[float]:
+        """Average of the recent trades weighted 10, 9, ... from the newest (None before any trade)."""
+        if not self.recent_trades:
+            return None
+        total_weight = 0
+        weighted_sum = 0
+        for i, trade in enumerate(self.recent_trades):
+            weight = REFERENCE_TRADES - i
+            weighted_sum += trade.price_per_unit * weight
+            total_weight += weight
+        return weighted_sum / total_weight
+
+    def vwap(self) -> Optional[float]:
+        """Volume-weighted average price of the recent trades."""
+        volume = sum(trade.quantity_units for trade in self.recent_trades)
+        if not volume:
+            return None
+        return sum(trade.price_per_unit * trade.quantity_units for trade in self.recent_trades) / volume
+
+    def record_trade(self, trade: TradePrint):
+        # Trades at or below the last one loaded were already read from the database
+        if trade.trade_id <= self.last_trade_id:
+            return
+        self.last_trade_id = trade.trade_id
+        self.trade_count += 1
+        self.recent_trades.appendleft(trade)
+
+
+class MarketStateCache:
+    """Process-wide MarketState per market, plus which market each loaded bot trades in."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._states: Dict[Tuple[str, str], MarketState] = {}
+        self._bot_markets: Dict[int, Tuple[str, str]] = {}
+
+    def state(self, catchment: str, unit_type: str, db: Session) -> MarketState:
+        """State for a market, loading it on first use or after its order book was rebuilt."""
+        if is_postgresql(db):
+            return self._load(read_order_book(catchment, unit_type, db), db)
+        book = get_order_book(catchment, unit_type, db)
+        with self._lock:
+            state = self._states.get((book.catchment, book.unit_type))
+            if state is None or state.book is not book:
+                # Loaded under the lock so no committed trade is missed or counted twice
+                state = self._load(book, db)
+                self._states[(book.catchment, book.unit_type)] = state
+            return state
+
+    def _load(self, book: OrderBook, db: Session) -> MarketState:
+        in_market = (Scheme.catchment == book.catchment, Scheme.unit_type == book.unit_type)
+        trade_count = db.query(Trade).join(Scheme).filter(*in_market).count()
+        recent = db.query(Trade).join(Scheme).filter(*in_market).order_by(
+            Trade.created_at.desc(), Trade.id.desc()
+        ).limit(REFERENCE_TRADES).all()
+        return MarketState(
+            book,
+            trade_count,
+            [TradePrint(trade.id, trade.price_per_unit, trade.quantity_units) for trade in recent]
+        )
+
+    def bot_market(self, bot_id: int) -> Optional[Tuple[str, str]]:
+        """Market of a bot whose inventory is loaded."""
+        with self._lock:
+            return self._bot_markets.get(bot_id)
+
+    def inventory(self, bot_id: int, catchment: str, unit_type: str, db: Session) -> BotInventory:
+        """A bot's inventory, loading it on first use."""
+        if is_postgresql(db):
+            return self._load_inventory(bot_id, db)
+        state = self.state(catchment, unit_type, db)
+        with self._lock:
+            inventory = state.inventories.get(bot_id)
+            if inventory is None:
+                inventory = self._load_inventory(bot_id, db)
+                state.inventories[bot_id] = inventory
+                self._bot_markets[bot_id] = (state.catchment, state.unit_type)
+            return inventory
+
+    def _load_inventory(self, bot_id: int, db: Session) -> BotInventory:
+        active = {
+            assignment_id for (assignment_id,) in db.query(BotAssignment.id).filter(
+                BotAssignment.bot_id == bot_id,
+                BotAssignment.is_active == 1
+            ).all()
+        }
+        queues = {
+            queue.id: QueueInventory(queue.assignment_id, queue.credits_available or 0, queue.credits_traded or 0)
+            for queue in db.query(FIFOCreditQueue).filter(FIFOCreditQueue.bot_id == bot_id).all()
+        }
+        return BotInventory(active, queues)
+
+    def _bot_inventory(self, bot_id: int) -> Optional[BotInventory]:
+        market = self._bot_markets.get(bot_id)
+        state = self._states.get(market) if market else None
+        return state.inventories.get(bot_id) if state else None
+
+    def apply(self, changes: List[Tuple]):
+        """Apply one committed transaction's changes to the markets and bots already loaded."""
+        with self._lock:
+            for change in changes:
+                kind = change[0]
+                if kind == "trade":
+                    _, market, trade = change
+                    state = self._states.get(market)
+                    if state is not None:
+                        state.record_trade(trade)
+                elif kind == "queue":
+                    _, bot_id, queue_id, queue = change
+                    inventory = self._bot_inventory(bot_id)
+                    if inventory is not None:
+                        if queue is None:
+                            inventory.queues.pop(queue_id, None)
+                        else:
+                            inventory.queues[queue_id] = queue
+                elif kind == "assignment":
+                    _, bot_id, assignment_id, active = change
+                    inventory = self._bot_inventory(bot_id)
+                    if inventory is not None:
+                        if active:
+                            inventory.active_assignments.add(assignment_id)
+                        else:
+                            inventory.active_assignments.discard(assignment_id)
+                elif kind == "bot_deleted":
+                    _, bot_id = change
+                    market = self._bot_markets.pop(bot_id, None)
+                    state = self._states.get(market) if market else None
+                    if state is not None:
+                        state.inventories.pop(bot_id, None)
+
+    def reset(self):
+        with self._lock:
+            self._states.clear()
+            self._bot_markets.clear()
+
+
+# Global cache instance
+_cache = MarketStateCache()
+
+
+def get_market_state_cache() -> MarketStateCache:
+    return _cache
+
+
+def get_market_state(catchment: str, unit_type: str, db: Session) -> MarketState:
+    return _cache.state(catchment, unit_type, db)
+
+
+# Session event hooks: snapshot trades, FIFO queue rows and assignments as they
+# are flushed and apply them once the transaction commits.
+
+@event.listens_for(Session, "after_flush")
+def _collect_state_changes(session: Session, flush_context):
+    pending = None
+    for obj in list(session.new) + list(session.dirty):
+        change = None
+        if isinstance(obj, Trade) and obj in session.new and obj.id is not None and obj.scheme_id is not None:
+            market = scheme_market(obj.scheme_id, session)
+            if market is not None:
+                change = ("trade", market, TradePrint(obj.id, obj.price_per_unit, obj.quantity_units))
+        elif isinstance(obj, FIFOCreditQueue) and obj.id is not None:
+            change = ("queue", obj.bot_id, obj.id, QueueInventory(
+                obj.assignment_id, obj.credits_available or 0, obj.credits_traded or 0
+            ))
+        elif isinstance(obj, BotAssignment) and obj.id is not None:
+            change = ("assignment", obj.bot_id, obj.id, obj.is_active != 0)
+        if change is not None:
+            if pending is None:
+                pending = session.info.setdefault(_PENDING_KEY, [])
+            pending.append(change)
+    for obj in session.deleted:
+        change = None
+        if isinstance(obj, FIFOCreditQueue):
+            change = ("queue", obj.bot_id, obj.id, None)
+        elif isinstance(obj, MarketMakingBot):
+            change = ("bot_deleted", obj.id)
+        if change is not None:
+            if pending is None:
+                pending = session.info.setdefault(_PENDING_KEY, [])
+            pending.append(change)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_state_changes(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        _cache.apply(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_state_changes(session: Session):
+    session.info.pop(_PENDING_KEY, None)
@@ -1,4 +1,5 @@
-from web3 import Web3
+from .chain_client import get_web3, is_connected, get_contract, to_checksum
+from .nonce_manager import send_transaction
 from typing import Optional
 import os
 from ..models import SchemeSubmission
@@ -35,13 +36,12 @@ def mint_scheme_nft(
     """
     try:
         # Connect to Hardhat node
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
-        
-        if not w3.is_connected():
+        if not is_connected(rpc_url):
             raise ConnectionError("Cannot connect to blockchain node")
+        w3 = get_web3(rpc_url)
         
         # Check if contract is deployed BEFORE trying to use it
-        scheme_nft_checksum = Web3.to_checksum_address(scheme_nft_address)
+        scheme_nft_checksum = to_checksum(scheme_nft_address)
         contract_code = w3.eth.get_code(scheme_nft_checksum)
         if not contract_code or contract_code == b'':
             raise ValueError(
@@ -49,14 +49,8 @@ def mint_scheme_nft(
                 "Please deploy the SchemeNFT contract first using: npx hardhat run scripts/deploy.ts --network localhost"
             )
         
-        # Get account from private key
-        account = w3.eth.account.from_key(private_key)
-        
         # Get contract ABI (simplified - in production, load from artifacts)
-        contract = w3.eth.contract(
-            address=scheme_nft_checksum,
-            abi=get_scheme_nft_abi()
-        )
+        contract = get_contract(scheme_nft_checksum, get_scheme_nft_abi(), rpc_url)
         
         # Prepare mintScheme call
         # mintScheme(
@@ -68,7 +62,7 @@ def mint_scheme_nft(
         #   string sha256Hash,
         #   address recipient
         # )
-        landowner_checksum = Web3.to_checksum_address(landowner_address)
+        landowner_checksum = to_checksum(landowner_address)
         function_call = contract.functions.mintScheme(
             submission.scheme_name,
             submission.catchment,
@@ -79,20 +73,8 @@ def mint_scheme_nft(
             landowner_checksum
         )
         
-        # Build transaction
-        nonce = w3.eth.get_transaction_count(account.address)
-        transaction = function_call.build_transaction({
-            'from': account.address,
-            'nonce': nonce,
-            'gas': 500000,  # Adjust as needed
-            'gasPrice': w3.eth.gas_price
-        })
-        
-        # Sign transaction
-        signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
-        
-        # Send transaction
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+        # Sign and send with the signer's locally allocated nonce (the same key mints credits)
+        tx_hash = send_transaction(function_call, private_key, rpc_url)
         
         # Wait for receipt
         receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -123,7 +105,7 @@ def mint_scheme_nft(
         # Check if contract is actually deployed and accessible
         try:
             # Try to call a view function to verify contract is deployed
-            contract_code = w3.eth.get_code(Web3.to_checksum_address(scheme_nft_address))
+            contract_code = w3.eth.get_code(scheme_nft_checksum)
             if not contract_code or contract_code == b'':
                 raise ValueError(
                     f"Contract not deployed at address {scheme_nft_address}. "
@@ -140,7 +122,7 @@ def mint_scheme_nft(
         raise ValueError(
             f"Could not determine minted token ID from transaction receipt. "
             f"No Transfer event found from zero address. "
-            f"Transaction hash: {tx_hash.hex()}, "
+            f"Transaction hash: {tx_hash}, "
             f"Receipt status: {receipt.status}, "
             f"Logs count: {len(receipt.logs) if receipt.logs else 0}. "
             f"Please check that the contract is deployed and the ABI matches the contract."
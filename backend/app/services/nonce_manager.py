@@ -0,0 +1,153 @@
+"""
+Local nonce allocation and pipelined transaction submission.
+
+Fetching get_transaction_count and gas_price for every transaction and waiting
+for each receipt before sending the next serialises everything a signer sends.
+A NonceManager per signer hands out nonces locally (seeded from the node's
+pending count), so many signed transactions can be in flight at once; gas price
+is cached for a short TTL. When a send fails the manager resyncs from the node
+so a gap cannot stall the signer's later transactions.
+
+The counter is only read from the node once, so every transaction a key signs
+in this process (credit mints, NFT mints, planning decisions, transfers) must go
+through send_transaction; a send that picks its own nonce leaves it stale.
+"""
+from typing import Dict, List, Optional, Tuple
+import threading
+import time
+
+from .chain_client import get_web3, get_rpc_url, to_checksum
+
+# Gas price is re-read from the node at most this often
+GAS_PRICE_TTL_SECONDS = 10.0
+
+DEFAULT_GAS_LIMIT = 500000
+
+
+class NonceManager:
+    """Allocates nonces for one signer address on one RPC endpoint."""
+
+    def __init__(self, address: str, rpc_url: str):
+        self.address = to_checksum(address)
+        self.rpc_url = rpc_url
+        self._lock = threading.Lock()
+        self._next_nonce: Optional[int] = None
+
+    def allocate(self) -> int:
+        """Reserve the next nonce (seeded from the node's pending count on first use)."""
+        with self._lock:
+            if self._next_nonce is None:
+                w3 = get_web3(self.rpc_url)
+                self._next_nonce = w3.eth.get_transaction_count(self.address, "pending")
+            nonce = self._next_nonce
+            self._next_nonce += 1
+            return nonce
+
+    def resync(self):
+        """Forget the local counter; the next allocate() re-reads it from the node."""
+        with self._lock:
+            self._next_nonce = None
+
+
+_lock = threading.Lock()
+_managers: Dict[Tuple[str, str], NonceManager] = {}
+_gas_prices: Dict[str, Tuple[int, float]] = {}
+
+
+def get_nonce_manager(address: str, rpc_url: Optional[str] = None) -> NonceManager:
+    """Get the shared nonce manager for a signer address."""
+    rpc_url = get_rpc_url(rpc_url)
+    key = (rpc_url, to_checksum(address))
+    with _lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = NonceManager(address, rpc_url)
+            _managers[key] = manager
+        return manager
+
+
+def resync_nonce(address: str, rpc_url: Optional[str] = None):
+    """Resync a signer's nonce after a dropped or failed transaction."""
+    get_nonce_manager(address, rpc_url).resync()
+
+
+def get_gas_price(rpc_url: Optional[str] = None) -> int:
+    """Gas price from the node, cached for GAS_PRICE_TTL_SECONDS."""
+    rpc_url = get_rpc_url(rpc_url)
+    cached = _gas_prices.get(rpc_url)
+    if cached and time.monotonic() - cached[1] < GAS_PRICE_TTL_SECONDS:
+        return cached[0]
+
+    gas_price = get_web3(rpc_url).eth.gas_price
+    _gas_prices[rpc_url] = (gas_price, time.monotonic())
+    return gas_price
+
+
+def send_transaction(
+    function_call,
+    private_key: str,
+    rpc_url: Optional[str] = None,
+    gas: int = DEFAULT_GAS_LIMIT
+) -> str:
+    """
+    Build, sign and send a contract call with a locally allocated nonce.
+    Does not wait for the receipt (see wait_for_receipts).
+
+    Returns:
+        Transaction hash (hex, 0x-prefixed)
+    """
+    rpc_url = get_rpc_url(rpc_url)
+    w3 = get_web3(rpc_url)
+    account = w3.eth.account.from_key(private_key)
+    manager = get_nonce_manager(account.address, rpc_url)
+
+    nonce = manager.allocate()
+    try:
+        transaction = function_call.build_transaction({
+            'from': account.address,
+            'nonce': nonce,
+            'gas': gas,
+            'gasPrice': get_gas_price(rpc_url)
+        })
+        signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
+        tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+    except Exception:
+        # The nonce was never used - resync so later transactions do not leave a gap
+        manager.resync()
+        raise
+
+    return w3.to_hex(tx_hash)
+
+
+def wait_for_receipts(
+    tx_hashes: List[str],
+    rpc_url: Optional[str] = None,
+    timeout: int = 120
+) -> Dict[str, object]:
+    """
+    Wait for a batch of in-flight transactions.
+    All are already submitted, so the total wait is bounded by the slowest one
+    rather than the sum.
+
+    Returns:
+        Dict of tx_hash -> receipt, TimeExhausted (still pending) or the exception raised
+    """
+    w3 = get_web3(rpc_url)
+    deadline = time.monotonic() + timeout
+    results: Dict[str, object] = {}
+
+    for tx_hash in tx_hashes:
+        remaining = max(deadline - time.monotonic(), 0.1)
+        try:
+            results[tx_hash] = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=remaining)
+        except Exception as e:
+            results[tx_hash] = e
+
+    return results
+
+
+def reset_nonce_managers():
+    """Drop all nonce managers and cached gas prices (tests, node restarts)."""
+    with _lock:
+        _managers.clear()
+        _gas_prices.clear()
@@ -0,0 +1,437 @@
+"""
+In-memory order book for the exchange.
+
+Each (catchment, unit_type) market keeps its resting limit orders in memory:
+price levels are held in a sorted list (bisect, O(log n) per level lookup) and
+each level is a FIFO queue of orders in arrival order. Books are loaded from the
+orders table on first use (or at startup) and kept in sync by SQLAlchemy session
+events, so every committed create, fill or cancel of an Order is reflected here
+without the call sites having to remember to update the book.
+
+Listeners registered with OrderBookRegistry.add_listener are told which price
+levels each committed transaction changed (see market_feed).
+"""
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..models import Order, Scheme
+
+OPEN_ORDER_STATUSES = ("PENDING", "PARTIALLY_FILLED")
+
+_PENDING_KEY = "order_book_pending"
+
+
+def market_key(catchment: str, unit_type: str) -> Tuple[str, str]:
+    """Normalise a market key the same way orders are stored (UPPER catchment, lower unit type)."""
+    return (catchment or "").upper(), (unit_type or "").lower()
+
+
+_scheme_markets: Dict[int, Tuple[str, str]] = {}
+
+
+def scheme_market(scheme_id: int, db: Session) -> Optional[Tuple[str, str]]:
+    """Market key of a scheme (cached; a scheme's catchment and unit type never change)."""
+    market = _scheme_markets.get(scheme_id)
+    if market is None:
+        scheme = db.get(Scheme, scheme_id)
+        if scheme is None:
+            return None
+        market = market_key(scheme.catchment, scheme.unit_type)
+        _scheme_markets[scheme_id] = market
+    return market
+
+
+@dataclass
+class RestingOrder:
+    """Snapshot of the fields of an Order the book needs."""
+    order_id: int
+    account_id: int
+    side: str
+    catchment: str
+    unit_type: str
+    order_type: str
+    price_per_unit: Optional[float]
+    remaining_quantity: int
+    status: str
+
+    @classmethod
+    def from_order(cls, order: Order) -> "RestingOrder":
+        return cls(
+            order_id=order.id,
+            account_id=order.account_id,
+            side=order.side,
+            catchment=order.catchment,
+            unit_type=order.unit_type,
+            order_type=order.order_type,
+            price_per_unit=order.price_per_unit,
+            remaining_quantity=order.remaining_quantity or 0,
+            status=order.status or "PENDING",
+        )
+
+    @property
+    def is_resting(self) -> bool:
+        """Only priced orders with something left to fill sit in the book."""
+        return (
+            self.status in OPEN_ORDER_STATUSES
+            and self.price_per_unit is not None
+            and self.remaining_quantity > 0
+        )
+
+
+class PriceLevel:
+    """All resting orders at one price, in time priority (dicts keep insertion order)."""
+
+    def __init__(self, price: float):
+        self.price = price
+        self.orders: Dict[int, RestingOrder] = {}
+        self.quantity = 0
+
+    def append(self, entry: RestingOrder):
+        self.orders[entry.order_id] = entry
+        self.quantity += entry.remaining_quantity
+
+    def update(self, entry: RestingOrder):
+        previous = self.orders[entry.order_id]
+        self.quantity += entry.remaining_quantity - previous.remaining_quantity
+        # Replace in place so the order keeps its queue position
+        self.orders[entry.order_id] = entry
+
+    def remove(self, order_id: int):
+        entry = self.orders.pop(order_id, None)
+        if entry:
+            self.quantity -= entry.remaining_quantity
+
+    def __len__(self):
+        return len(self.orders)
+
+
+class BookSide:
+    """One side of a book. Prices are kept ascending; bids are walked from the top."""
+
+    def __init__(self, side: str):
+        self.side = side
+        self.prices: List[float] = []
+        self.levels: Dict[float, PriceLevel] = {}
+
+    def add(self, entry: RestingOrder):
+        price = entry.price_per_unit
+        level = self.levels.get(price)
+        if level is None:
+            level = PriceLevel(price)
+            self.levels[price] = level
+            insort(self.prices, price)
+        level.append(entry)
+
+    def remove(self, order_id: int, price: float):
+        level = self.levels.get(price)
+        if level is None:
+            return
+        level.remove(order_id)
+        if not level:
+            del self.levels[price]
+            index = bisect_left(self.prices, price)
+            if index < len(self.prices) and self.prices[index] == price:
+                self.prices.pop(index)
+
+    def best_price(self) -> Optional[float]:
+        if not self.prices:
+            return None
+        return self.prices[-1] if self.side == "BUY" else self.prices[0]
+
+    def next_price(self, price: float) -> Optional[float]:
+        """The next worse price after `price` (lower for bids, higher for asks)."""
+        if self.side == "BUY":
+            index = bisect_left(self.prices, price) - 1
+            return self.prices[index] if index >= 0 else None
+        index = bisect_right(self.prices, price)
+        return self.prices[index] if index < len(self.prices) else None
+
+    def order_count(self) -> int:
+        return sum(len(level) for level in self.levels.values())
+
+
+class OrderBook:
+    """Resting limit orders for a single (catchment, unit_type) market."""
+
+    def __init__(self, catchment: str, unit_type: str):
+        self.catchment, self.unit_type = market_key(catchment, unit_type)
+        self.bids = BookSide("BUY")
+        self.asks = BookSide("SELL")
+        self._index: Dict[int, RestingOrder] = {}
+
+    def _side(self, side: str) -> BookSide:
+        return self.bids if side == "BUY" else self.asks
+
+    def apply(self, entry: RestingOrder):
+        """Insert, update or remove an order so the book matches its latest state."""
+        current = self._index.get(entry.order_id)
+
+        if not entry.is_resting:
+            if current:
+                self._side(current.side).remove(current.order_id, current.price_per_unit)
+                del self._index[entry.order_id]
+            return
+
+        if current and current.price_per_unit == entry.price_per_unit and current.side == entry.side:
+            self._side(entry.side).levels[entry.price_per_unit].update(entry)
+        else:
+            if current:
+                self._side(current.side).remove(current.order_id, current.price_per_unit)
+            self._side(entry.side).add(entry)
+        self._index[entry.order_id] = entry
+
+    def remove(self, order_id: int):
+        current = self._index.pop(order_id, None)
+        if current:
+            self._side(current.side).remove(order_id, current.price_per_unit)
+
+    def get(self, order_id: int) -> Optional[RestingOrder]:
+        return self._index.get(order_id)
+
+    def best_bid(self) -> Optional[float]:
+        return self.bids.best_price()
+
+    def best_ask(self) -> Optional[float]:
+        return self.asks.best_price()
+
+    def iter_levels(self, side: str) -> Iterator[Tuple[float, List[RestingOrder]]]:
+        """
+        Walk price levels from best to worst, yielding (price, orders in FIFO order).
+
+        Each level is snapshotted when it is reached and the next level is found by
+        bisecting from the last price, so the book may be updated (fills committed)
+        while the caller is still iterating.
+        """
+        book_side = self._side(side)
+        price = book_side.best_price()
+        while price is not None:
+            level = book_side.levels.get(price)
+            if level is not None:
+                yield price, list(level.orders.values())
+            price = book_side.next_price(price)
+
+    def depth(self, side: str) -> List[Tuple[float, int]]:
+        """Aggregated (price, quantity) per level from best to worst."""
+        book_side = self._side(side)
+        prices = list(book_side.prices)
+        if side == "BUY":
+            prices.reverse()
+        levels = [book_side.levels.get(price) for price in prices]
+        return [(level.price, level.quantity) for level in levels if level is not None]
+
+    def level_quantity(self, side: str, price: float) -> int:
+        level = self._side(side).levels.get(price)
+        return level.quantity if level is not None else 0
+
+    def order_count(self, side: str) -> int:
+        return self._side(side).order_count()
+
+
+# (side, price, quantity after the change); quantity 0 means the level is gone
+LevelChange = Tuple[str, float, int]
+
+
+class OrderBookRegistry:
+    """Process-wide collection of order books, one per market."""
+
+    def __init__(self):
+        self._books: Dict[Tuple[str, str], OrderBook] = {}
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[OrderBook, List[LevelChange]], None]] = []
+        self._market_locks: Dict[Tuple[str, str], threading.RLock] = {}
+        self.loaded = False
+
+    @property
+    def lock(self) -> threading.RLock:
+        return self._lock
+
+    def book(self, catchment: str, unit_type: str) -> OrderBook:
+        key = market_key(catchment, unit_type)
+        with self._lock:
+            book = self._books.get(key)
+            if book is None:
+                book = OrderBook(*key)
+                self._books[key] = book
+            return book
+
+    def market_lock(self, catchment: str, unit_type: str) -> threading.RLock:
+        """Per-market lock held by the matcher and bot refreshes so they never interleave in one market."""
+        key = market_key(catchment, unit_type)
+        with self._lock:
+            lock = self._market_locks.get(key)
+            if lock is None:
+                lock = threading.RLock()
+                self._market_locks[key] = lock
+            return lock
+
+    def books(self) -> List[OrderBook]:
+        with self._lock:
+            return list(self._books.values())
+
+    def load(self, db: Session) -> int:
+        """(Re)build every book from the open orders in the database."""
+        open_orders = db.query(Order).filter(
+            Order.status.in_(OPEN_ORDER_STATUSES),
+            Order.price_per_unit.isnot(None),
+            Order.remaining_quantity > 0
+        ).order_by(Order.created_at.asc(), Order.id.asc()).all()
+
+        with self._lock:
+            self._books.clear()
+            for order in open_orders:
+                self.book(order.catchment, order.unit_type).apply(RestingOrder.from_order(order))
+            self.loaded = True
+
+        print(f"[ORDER_BOOK] Loaded {len(open_orders)} resting orders into {len(self._books)} books")
+        return len(open_orders)
+
+    def load_market(self, catchment: str, unit_type: str, db: Session) -> OrderBook:
+        """
+        Rebuild one market's book from the database, e.g. to pick up orders that
+        other API processes placed. Hold the market lock so no fill is missed.
+        """
+        book = read_order_book(catchment, unit_type, db)
+        with self._lock:
+            self._books[(book.catchment, book.unit_type)] = book
+        return book
+
+    def ensure_loaded(self, db: Session):
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    self.load(db)
+
+    def apply(self, entry: RestingOrder):
+        with self._lock:
+            self.book(entry.catchment, entry.unit_type).apply(entry)
+
+    def remove(self, entry: RestingOrder):
+        with self._lock:
+            self.book(entry.catchment, entry.unit_type).remove(entry.order_id)
+
+    def apply_changes(self, changes: Iterable[Tuple[str, RestingOrder]]):
+        """
+        Apply one committed transaction's ("apply" | "remove", entry) changes and
+        tell listeners which levels of which books ended up with a new quantity.
+        """
+        with self._lock:
+            touched: Dict[Tuple[str, str], Dict[Tuple[str, float], int]] = {}
+            for action, entry in changes:
+                book = self.book(entry.catchment, entry.unit_type)
+                before = touched.setdefault((book.catchment, book.unit_type), {})
+                for resting in (book.get(entry.order_id), entry):
+                    if resting is not None and resting.price_per_unit is not None:
+                        level = (resting.side, resting.price_per_unit)
+                        if level not in before:
+                            before[level] = book.level_quantity(*level)
+                if action == "remove":
+                    book.remove(entry.order_id)
+                else:
+                    book.apply(entry)
+
+            if not self._listeners:
+                return
+            for market, before in touched.items():
+                book = self._books[market]
+                changed = [
+                    (side, price, book.level_quantity(side, price))
+                    for (side, price), quantity in before.items()
+                    if book.level_quantity(side, price) != quantity
+                ]
+                if not changed:
+                    continue
+                for listener in self._listeners:
+                    try:
+                        listener(book, changed)
+                    except Exception as e:
+                        print(f"[ORDER_BOOK] Listener error: {str(e)}")
+
+    def add_listener(self, listener: Callable[[OrderBook, List[LevelChange]], None]):
+        """Call `listener(book, changes)` (under the registry lock) after each committed change to a book."""
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[OrderBook, List[LevelChange]], None]):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def reset(self):
+        """Drop all books (and cached scheme markets); the next access reloads from the database."""
+        with self._lock:
+            self._books.clear()
+            _scheme_markets.clear()
+            self.loaded = False
+
+
+# Global registry instance
+_registry = OrderBookRegistry()
+
+
+def get_order_book_registry() -> OrderBookRegistry:
+    return _registry
+
+
+def read_order_book(catchment: str, unit_type: str, db: Session) -> OrderBook:
+    """
+    Build a market's book from the open orders in the database, without touching
+    the registry. On PostgreSQL this is the current book across all API processes.
+    """
+    key = market_key(catchment, unit_type)
+    open_orders = db.query(Order).filter(
+        Order.catchment == key[0],
+        Order.unit_type == key[1],
+        Order.status.in_(OPEN_ORDER_STATUSES),
+        Order.price_per_unit.isnot(None),
+        Order.remaining_quantity > 0
+    ).order_by(Order.created_at.asc(), Order.id.asc()).all()
+
+    book = OrderBook(*key)
+    for order in open_orders:
+        book.apply(RestingOrder.from_order(order))
+    return book
+
+
+def get_order_book(catchment: str, unit_type: str, db: Session) -> OrderBook:
+    """Get the book for a market, loading all books from the database on first use."""
+    _registry.ensure_loaded(db)
+    return _registry.book(catchment, unit_type)
+
+
+def load_order_books(db: Session) -> int:
+    """Load (or reload) all order books from the orders table."""
+    return _registry.load(db)
+
+
+# Session event hooks: snapshot Order rows as they are flushed, apply them once
+# the transaction commits, and throw them away if it rolls back.
+
+@event.listens_for(Session, "after_flush")
+def _collect_order_changes(session: Session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Order) and obj.id is not None:
+            pending[obj.id] = ("apply", RestingOrder.from_order(obj))
+    for obj in session.deleted:
+        if isinstance(obj, Order) and obj.id is not None:
+            pending[obj.id] = ("remove", RestingOrder.from_order(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_order_changes(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending or not _registry.loaded:
+        # Nothing to do; an unloaded registry will read these rows when it loads
+        return
+    _registry.apply_changes(pending.values())
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_order_changes(session: Session):
+    session.info.pop(_PENDING_KEY, None)
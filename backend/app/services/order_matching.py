@@ -3,20 +3,72 @@ Order matching engine for the exchange.
 Implements price-time priority matching by catchment + unit_type.
 """
 from sqlalchemy.orm import Session
-from typing import List, Tuple
-from ..models import Order, Trade, Account, Scheme, AccountRole, BrokerMandate
-from .exchange import transfer_credits_on_chain
-from .balance_check import check_buyer_has_sufficient_balance
-import os
+from typing import Iterator, List, Set, Tuple
+from ..db import is_postgresql
+from ..models import Order, Trade, Account, Scheme, AccountRole
+from .balance_check import check_buyer_has_sufficient_balance, record_trade_cash
+from .reservations import release_order
+from .order_book import OrderBook, get_order_book, OPEN_ORDER_STATUSES
+from .market_actor import run_in_market
+from .market_lock import market_lock
+from .settlement import order_funding, enqueue_settlement
+from .settlement_worker import notify_settlement_worker
+from .latency import traced, lap
 from datetime import datetime
 
-# Hardhat default account #1 (trading account) private key
-# This is the standard Hardhat test account private key
-# Address: 0x70997970C51812dc3A010C7d01b50e0d17dc79C8
-# HARDCODED to prevent ERC1155MissingApprovalForAll errors
-HARDHAT_TRADING_ACCOUNT_PRIVATE_KEY = "0x59c6995e998f97a5a0044966f0945389dc9e86dae88c7a8412f4603b6b78690d"
 
+def _iter_matching_orders(new_order: Order, book: OrderBook, opposite_side: str, db: Session) -> Iterator[Order]:
+    """
+    Yield resting orders from the book in price-time priority (best price first,
+    then earliest order), loading each Order row by primary key only when it is reached.
+    """
+    for price, entries in book.iter_levels(opposite_side):
+        for entry in entries:
+            if entry.order_id == new_order.id:
+                continue  # Don't match with itself
+            matching_order = db.get(Order, entry.order_id)
+            # Skip anything that has been filled or cancelled since the level was read
+            if (
+                matching_order is None
+                or matching_order.status not in OPEN_ORDER_STATUSES
+                or matching_order.price_per_unit is None
+                or matching_order.remaining_quantity <= 0
+            ):
+                continue
+            yield matching_order
+
+
+def _iter_locked_matching_orders(new_order: Order, opposite_side: str, db: Session) -> Iterator[Order]:
+    """
+    PostgreSQL: yield resting orders straight from the orders table in price-time
+    priority, each claimed with SELECT ... FOR UPDATE SKIP LOCKED.
+
+    Other API processes place orders this process's in-memory book has not seen,
+    so the table is the source of truth here. The next order is read after the
+    previous fill committed (which released its row lock); a row locked by a
+    concurrent cancel or bot replace is skipped rather than waited on.
+    """
+    best_price_first = Order.price_per_unit.asc() if opposite_side == "SELL" else Order.price_per_unit.desc()
+    seen: Set[int] = {new_order.id}
+    while True:
+        matching_order = db.query(Order).filter(
+            Order.catchment == new_order.catchment,
+            Order.unit_type == new_order.unit_type,
+            Order.side == opposite_side,
+            Order.status.in_(OPEN_ORDER_STATUSES),
+            Order.price_per_unit.isnot(None),
+            Order.remaining_quantity > 0,
+            Order.id.notin_(seen)
+        ).order_by(
+            best_price_first, Order.created_at.asc(), Order.id.asc()
+        ).with_for_update(skip_locked=True).populate_existing().first()
+        if matching_order is None:
+            return
+        seen.add(matching_order.id)
+        yield matching_order
 
+
+@traced("match_order")
 def match_order(new_order: Order, db: Session) -> List[Trade]:
     """
     Match a new order against existing orders using price-time priority.
@@ -28,50 +80,55 @@ def match_order(new_order: Order, db: Session) -> List[Trade]:
     - Price-time priority: best price first, then earliest order
     - Partial fills are supported
     
+    Matching runs as a command on the market's actor (see services.market_actor),
+    so it never interleaves with another match, cancel or bot refresh in the same
+    market; the caller waits, and its session is used for the match. It also
+    holds the market's lock (see services.market_lock), which on PostgreSQL keeps
+    other API processes out of the market.
+    Each call is traced (see services.latency), stage by stage.
+    
     Returns:
         List of Trade objects created from matches
     """
-    trades = []
-    
-    # Find matching orders (opposite side, same catchment + unit_type, pending status)
-    opposite_side = "SELL" if new_order.side == "BUY" else "BUY"
+    def command() -> List[Trade]:
+        lap("queue_wait")
+        with market_lock(new_order.catchment, new_order.unit_type, db):
+            lap("lock_wait")
+            return _match_order(new_order, db)
     
-    matching_orders_query = db.query(Order).filter(
-        Order.side == opposite_side,
-        Order.catchment == new_order.catchment,
-        Order.unit_type == new_order.unit_type,
-        Order.status.in_(["PENDING", "PARTIALLY_FILLED"]),
-        Order.id != new_order.id  # Don't match with itself
+    return run_in_market(new_order.catchment, new_order.unit_type, command)
+
+
+def _match_order(new_order: Order, db: Session) -> List[Trade]:
+    # Bot bookkeeping for fills of bot orders (imported here: the bot modules import this one)
+    from ..models import BotOrder, SellLadderBotOrder, FIFOCreditQueue
+    from ..services.market_making_bot import update_queue_after_trade
+    from ..services.sell_ladder_bot import (
+        update_queue_after_trade as update_sell_ladder_queue_after_trade,
+        replenish_filled_level
     )
+
+    trades = []
     
-    # Sort by price-time priority
-    # Note: Filter out orders with NULL price_per_unit (shouldn't happen for limit orders, but handle it)
-    if new_order.side == "BUY":
-        # For BUY orders, match against SELL orders sorted by price ASC (lowest ask first)
-        # Only match against limit orders (market orders shouldn't be in order book)
-        matching_orders_query = matching_orders_query.filter(
-            Order.price_per_unit.isnot(None)
-        ).order_by(
-            Order.price_per_unit.asc(),
-            Order.created_at.asc()
-        )
-    else:
-        # For SELL orders, match against BUY orders sorted by price DESC (highest bid first)
-        matching_orders_query = matching_orders_query.filter(
-            Order.price_per_unit.isnot(None)
-        ).order_by(
-            Order.price_per_unit.desc(),
-            Order.created_at.asc()
-        )
-    
-    matching_orders = matching_orders_query.all()
+    # Walk the opposite side of the in-memory book (same catchment + unit_type), or on
+    # PostgreSQL the orders table, which other API processes write to as well
+    opposite_side = "SELL" if new_order.side == "BUY" else "BUY"
+    book = get_order_book(new_order.catchment, new_order.unit_type, db)
     
     print(f"[ORDER_MATCHING] New {new_order.order_type} {new_order.side} order for {new_order.catchment} {new_order.unit_type}, quantity: {new_order.remaining_quantity}")
-    print(f"[ORDER_MATCHING] Found {len(matching_orders)} potential matching orders")
+    print(f"[ORDER_MATCHING] Found {book.order_count(opposite_side)} potential matching orders")
     
     remaining_to_fill = new_order.remaining_quantity
     
+    lap("book")
+    
+    if is_postgresql(db):
+        matching_orders = _iter_locked_matching_orders(new_order, opposite_side, db)
+    else:
+        matching_orders = _iter_matching_orders(new_order, book, opposite_side, db)
+    
     for matching_order in matching_orders:
+        lap("opposite_side")
         if remaining_to_fill <= 0:
             break
         
@@ -113,11 +170,12 @@ def match_order(new_order: Order, db: Session) -> List[Trade]:
         
         # Get accounts for on-chain transfer
         if new_order.side == "BUY":
-            buyer = db.query(Account).filter(Account.id == new_order.account_id).first()
-            seller = db.query(Account).filter(Account.id == matching_order.account_id).first()
+            buyer = db.get(Account, new_order.account_id)
+            seller = db.get(Account, matching_order.account_id)
         else:
-            buyer = db.query(Account).filter(Account.id == matching_order.account_id).first()
-            seller = db.query(Account).filter(Account.id == new_order.account_id).first()
+            buyer = db.get(Account, matching_order.account_id)
+            seller = db.get(Account, new_order.account_id)
+        lap("accounts")
         
         if not buyer or not seller:
             print(f"[ORDER_MATCHING] ERROR: Buyer or seller account not found. Buyer ID: {new_order.account_id if new_order.side == 'BUY' else matching_order.account_id}, Seller ID: {matching_order.account_id if new_order.side == 'BUY' else new_order.account_id}")
@@ -131,12 +189,14 @@ def match_order(new_order: Order, db: Session) -> List[Trade]:
         # For catchment-based matching, we need to find a scheme from the seller
         # that matches the catchment + unit_type
         scheme = None
+        seller_order = matching_order if matching_order.side == "SELL" else new_order
         
-        # First, try to use the scheme_id from the matching order (if it's a sell order)
-        if matching_order.scheme_id:
-            scheme = db.query(Scheme).filter(Scheme.id == matching_order.scheme_id).first()
+        # First, try to use the scheme_id from the sell order, then the matching order
+        scheme_id = seller_order.scheme_id or matching_order.scheme_id
+        if scheme_id:
+            scheme = db.get(Scheme, scheme_id)
             if scheme:
-                print(f"[ORDER_MATCHING] Using scheme {scheme.id} from matching order (scheme_id: {matching_order.scheme_id})")
+                print(f"[ORDER_MATCHING] Using scheme {scheme.id} from {'sell' if scheme_id == seller_order.scheme_id else 'matching'} order (scheme_id: {scheme_id})")
         
         if not scheme:
             # Find any scheme with matching catchment + unit_type from seller
@@ -168,6 +228,7 @@ def match_order(new_order: Order, db: Session) -> List[Trade]:
             continue  # Skip if no scheme found
         
         print(f"[ORDER_MATCHING] Using scheme {scheme.id} (nft_token_id: {scheme.nft_token_id}) for transfer")
+        lap("scheme")
         
         # Check buyer balance before creating trade (for BUY orders)
         if new_order.side == "BUY":
@@ -182,161 +243,18 @@ def match_order(new_order: Order, db: Session) -> List[Trade]:
                 print(f"[ORDER_MATCHING] Buyer {buyer.id} has insufficient balance. Available: £{available_balance:,.2f}, Required: £{trade_cost:,.2f}. Skipping this match.")
                 # Stop matching if buyer can't afford this trade
                 break
+            lap("balance_check")
         
-        # For landowners selling credits, ALWAYS use trading account address
-        # Landowners transfer credits they want to trade into the trading account
-        # All trades must be settled from the trading account
-        trading_account_address = os.getenv("TRADING_ACCOUNT_ADDRESS", "0x70997970C51812dc3A010C7d01b50e0d17dc79C8")
-        
-        # Determine the actual seller address to use for transfer
-        actual_seller_address = seller.evm_address
-        seller_private_key = None
-        
-        if seller.role == AccountRole.LANDOWNER:
-            actual_seller_address = trading_account_address
-            print(f"[ORDER_MATCHING] Seller is a landowner, using trading account address: {actual_seller_address}")
+        # Work out which wallet the credits leave from (stored on the sell order when it
+        # was placed). The on-chain transfer is not executed here: the trade is recorded
+        # as PENDING_SETTLEMENT with an outbox row and the settlement worker submits it,
+        # so matching never waits on the chain.
+        actual_seller_address, signer, mandate_id = order_funding(seller_order, seller, scheme, db)
+        lap("funding")
+        if mandate_id:
+            print(f"[ORDER_MATCHING] Broker sale linked to mandate #{mandate_id}")
         elif seller.role == AccountRole.BROKER:
-            # Broker credits can be in two places:
-            # 1. Client credits (95%) -> broker.evm_address
-            # 2. House credits (5%) -> BROKER_HOUSE_ADDRESS
-            # Check if this is a bot order (sell ladder or market-making) to determine which address to use
-            from ..models import SellLadderBotOrder, SellLadderFIFOCreditQueue, SellLadderBotAssignment, BotOrder, FIFOCreditQueue, BotAssignment
-            
-            # Check for sell ladder bot order first
-            sell_ladder_order = db.query(SellLadderBotOrder).filter(SellLadderBotOrder.order_id == matching_order.id).first()
-            is_house_account = None
-            
-            if sell_ladder_order and sell_ladder_order.fifo_queue_id:
-                # Get the FIFO queue entry to check if it's house or client
-                fifo_queue = db.query(SellLadderFIFOCreditQueue).filter(
-                    SellLadderFIFOCreditQueue.id == sell_ladder_order.fifo_queue_id
-                ).first()
-                
-                if fifo_queue and fifo_queue.assignment_id:
-                    assignment = db.query(SellLadderBotAssignment).filter(
-                        SellLadderBotAssignment.id == fifo_queue.assignment_id
-                    ).first()
-                    
-                    if assignment:
-                        is_house_account = assignment.is_house_account == 1
-            
-            # Check for market-making bot order if not a sell ladder bot order
-            if is_house_account is None:
-                bot_order = db.query(BotOrder).filter(BotOrder.order_id == matching_order.id).first()
-                
-                if bot_order:
-                    # Find the FIFO queue entry for this scheme
-                    fifo_queue = db.query(FIFOCreditQueue).filter(
-                        FIFOCreditQueue.bot_id == bot_order.bot_id,
-                        FIFOCreditQueue.scheme_id == scheme.id,
-                        FIFOCreditQueue.credits_available > 0
-                    ).order_by(
-                        FIFOCreditQueue.queue_position.asc(),
-                        FIFOCreditQueue.id.asc()
-                    ).first()
-                    
-                    if fifo_queue and fifo_queue.assignment_id:
-                        assignment = db.query(BotAssignment).filter(
-                            BotAssignment.id == fifo_queue.assignment_id
-                        ).first()
-                        
-                        if assignment:
-                            is_house_account = assignment.is_house_account == 1
-            
-            # Use the appropriate address based on whether it's house or client
-            if is_house_account == 1:
-                # House account credits -> use house address
-                house_address = os.getenv("BROKER_HOUSE_ADDRESS")
-                if house_address:
-                    actual_seller_address = house_address
-                    print(f"[ORDER_MATCHING] Seller is broker (house account), using house address: {actual_seller_address}")
-                else:
-                    print(f"[ORDER_MATCHING] WARNING: BROKER_HOUSE_ADDRESS not set, using broker address")
-            elif is_house_account == 0:
-                # Client account credits -> use broker address
-                print(f"[ORDER_MATCHING] Seller is broker (client account), using broker address: {actual_seller_address}")
-            else:
-                # Could not determine - assume broker address
-                print(f"[ORDER_MATCHING] Seller is broker (could not determine house/client), using broker address: {actual_seller_address}")
-        
-        # Execute on-chain transfer
-        tx_hash = None
-        try:
-            scheme_credits_address = os.getenv("SCHEME_CREDITS_CONTRACT_ADDRESS")
-            rpc_url = os.getenv("RPC_URL", "http://127.0.0.1:8545")
-            
-            # Determine which private key to use based on the seller address
-            # CRITICAL: The private key MUST match the seller address to avoid ERC1155MissingApprovalForAll errors
-            if not seller_private_key:  # Only set if not already determined above
-                if actual_seller_address.lower() == trading_account_address.lower():
-                    # Transferring FROM trading account - need trading account's private key
-                    seller_private_key = os.getenv("TRADING_ACCOUNT_PRIVATE_KEY")
-                    if not seller_private_key:
-                        # Fallback: Hardhat account #1 private key (default trading account)
-                        # This is hardcoded to prevent future issues
-                        seller_private_key = HARDHAT_TRADING_ACCOUNT_PRIVATE_KEY
-                        print(f"[ORDER_MATCHING] Using hardcoded Hardhat account #1 key for trading account")
-                    else:
-                        print(f"[ORDER_MATCHING] Using TRADING_ACCOUNT_PRIVATE_KEY from environment")
-                elif seller.role == AccountRole.BROKER:
-                    # Broker account - check if it's house or client
-                    house_address = os.getenv("BROKER_HOUSE_ADDRESS", "")
-                    if actual_seller_address.lower() == house_address.lower():
-                        # House account - use house address's private key directly
-                        # Hardhat account #9 private key (0xa0Ee7A142d267C1f36714E4a8F75612F20a79720)
-                        # This is the standard Hardhat test account #9 private key
-                        HARDHAT_ACCOUNT_9_PRIVATE_KEY = "0x4bbbf85ce3377467afe5d46f804f221813b2bb87f24d81f60f1fcdbf7cbf4356"
-                        seller_private_key = os.getenv("BROKER_HOUSE_PRIVATE_KEY") or HARDHAT_ACCOUNT_9_PRIVATE_KEY
-                        print(f"[ORDER_MATCHING] Using house address private key for house account: {actual_seller_address}")
-                    else:
-                        # Client account - use broker private key
-                        seller_private_key = os.getenv("BROKER_PRIVATE_KEY")
-                        if not seller_private_key:
-                            seller_private_key = os.getenv("REGULATOR_PRIVATE_KEY")
-                        print(f"[ORDER_MATCHING] Using BROKER/REGULATOR private key for broker client account: {actual_seller_address}")
-                else:
-                    # Transferring FROM landowner/regulator - use their private key
-                    seller_private_key = os.getenv("LANDOWNER_PRIVATE_KEY")
-                    if not seller_private_key:
-                        seller_private_key = os.getenv("REGULATOR_PRIVATE_KEY")
-                    print(f"[ORDER_MATCHING] Using LANDOWNER/REGULATOR private key for seller: {actual_seller_address}")
-            
-            if scheme_credits_address and seller_private_key:
-                print(f"[ORDER_MATCHING] Executing on-chain transfer: {fill_quantity} credits from {actual_seller_address} to {buyer.evm_address}")
-                tx_hash = transfer_credits_on_chain(
-                    seller_address=actual_seller_address,
-                    buyer_address=buyer.evm_address,
-                    scheme_id=scheme.nft_token_id,
-                    quantity_credits=fill_quantity,
-                    seller_private_key=seller_private_key,
-                    scheme_credits_address=scheme_credits_address,
-                    rpc_url=rpc_url
-                )
-                print(f"[ORDER_MATCHING] On-chain transfer successful, tx_hash: {tx_hash}")
-            else:
-                print(f"[ORDER_MATCHING] WARNING: Skipping on-chain transfer (scheme_credits_address: {scheme_credits_address}, seller_private_key: {'set' if seller_private_key else 'not set'})")
-                tx_hash = None  # Skip on-chain if not configured
-        except Exception as e:
-            print(f"[ORDER_MATCHING] ERROR executing on-chain transfer: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            tx_hash = None  # Continue with trade record even if on-chain fails
-        
-        # Look up mandate_id if seller is a broker (for client funds tracking)
-        mandate_id = None
-        if seller.role == AccountRole.BROKER:
-            # Find the client mandate for this broker + scheme
-            mandate = db.query(BrokerMandate).filter(
-                BrokerMandate.broker_account_id == seller.id,
-                BrokerMandate.scheme_id == scheme.id,
-                BrokerMandate.is_recalled == 0
-            ).order_by(BrokerMandate.created_at.desc()).first()
-            
-            if mandate:
-                mandate_id = mandate.id
-                print(f"[ORDER_MATCHING] Broker sale linked to mandate #{mandate_id} (landowner: {mandate.landowner_account_id})")
-            else:
-                print(f"[ORDER_MATCHING] Broker sale - no client mandate found (house account sale)")
+            print("[ORDER_MATCHING] Broker sale - no client mandate found (house account sale)")
         
         # Create trade record
         trade = Trade(
@@ -347,34 +265,36 @@ def match_order(new_order: Order, db: Session) -> List[Trade]:
             quantity_units=fill_quantity,
             price_per_unit=execution_price,
             total_price=fill_quantity * execution_price,
-            transaction_hash=tx_hash,
-            mandate_id=mandate_id
+            transaction_hash=None,  # Written back by the settlement worker
+            mandate_id=mandate_id,
+            buy_order_id=new_order.id if new_order.side == "BUY" else matching_order.id,
+            sell_order_id=seller_order.id
         )
         db.add(trade)
+        enqueue_settlement(
+            trade=trade,
+            from_address=actual_seller_address,
+            to_address=buyer.evm_address,
+            nft_token_id=scheme.nft_token_id,
+            quantity_units=fill_quantity,
+            signer=signer,
+            db=db
+        )
+        record_trade_cash(trade, db)
         trades.append(trade)
         print(f"[ORDER_MATCHING] Created trade {trade.id}: {fill_quantity} credits at £{execution_price} = £{fill_quantity * execution_price}")
+        lap("trade")
         
         # Update FIFO queue if this is a bot order being filled
         # Check if the seller order is a bot order (market-making or sell ladder)
-        from ..models import BotOrder, SellLadderBotOrder
-        from ..services.market_making_bot import update_queue_after_trade
-        from ..services.sell_ladder_bot import (
-            update_queue_after_trade as update_sell_ladder_queue_after_trade,
-            get_sell_ladder_bot_order_by_order_id,
-            replenish_filled_level
-        )
-        
-        bot_order_seller = db.query(BotOrder).filter(BotOrder.order_id == matching_order.id).first()
-        if bot_order_seller and matching_order.side == "SELL":
+        # Bots trade from broker accounts, so only a broker's orders can be bot orders
+        seller_is_broker = seller.role == AccountRole.BROKER
+        bot_order_seller = None
+        if seller_is_broker and matching_order.side == "SELL":
+            bot_order_seller = db.query(BotOrder).filter(BotOrder.order_id == matching_order.id).first()
+        if bot_order_seller:
             # This is a bot sell order being filled - update FIFO queue
-            from ..services.market_making_bot import update_queue_after_trade, get_bot_order_by_order_id
-            from ..services.sell_ladder_bot import (
-                update_queue_after_trade as update_sell_ladder_queue_after_trade,
-                get_sell_ladder_bot_order_by_order_id,
-                replenish_filled_level
-            )
             # Find the queue entry for this scheme (FIFO - first available)
-            from ..models import FIFOCreditQueue
             queue_entry = db.query(FIFOCreditQueue).filter(
                 FIFOCreditQueue.bot_id == bot_order_seller.bot_id,
                 FIFOCreditQueue.scheme_id == scheme.id,
@@ -409,8 +329,10 @@ def match_order(new_order: Order, db: Session) -> List[Trade]:
                 print(f"[ORDER_MATCHING] WARNING: No FIFO queue entry found for bot {bot_order_seller.bot_id}, scheme {scheme.id}")
         
         # Check for sell ladder bot order
-        sell_ladder_order = db.query(SellLadderBotOrder).filter(SellLadderBotOrder.order_id == matching_order.id).first()
-        if sell_ladder_order and matching_order.side == "SELL":
+        sell_ladder_order = None
+        if seller_is_broker and matching_order.side == "SELL":
+            sell_ladder_order = db.query(SellLadderBotOrder).filter(SellLadderBotOrder.order_id == matching_order.id).first()
+        if sell_ladder_order:
             # This is a sell ladder bot order being filled
             if sell_ladder_order.fifo_queue_id:
                 update_sell_ladder_queue_after_trade(sell_ladder_order.fifo_queue_id, fill_quantity, db)
@@ -422,10 +344,17 @@ def match_order(new_order: Order, db: Session) -> List[Trade]:
                 print(f"[ORDER_MATCHING] Replenished sell ladder bot {sell_ladder_order.bot_id} level {sell_ladder_order.price_level}")
         
         # Also check if the buyer order is a bot order (for buy orders)
-        bot_order_buyer = db.query(BotOrder).filter(BotOrder.order_id == new_order.id).first()
-        if bot_order_buyer and new_order.side == "BUY":
+        bot_order_buyer = None
+        if buyer.role == AccountRole.BROKER and new_order.side == "BUY":
+            bot_order_buyer = db.query(BotOrder).filter(BotOrder.order_id == new_order.id).first()
+        if bot_order_buyer:
             # Bot bought credits - we don't update FIFO queue for buys, but we could track inventory
             print(f"[ORDER_MATCHING] Bot {bot_order_buyer.bot_id} bought {fill_quantity} credits")
+        lap("bot_queues")
+        
+        # Release reserved funds (buy side) and credits (sell side) before remaining quantities change
+        release_order(new_order, fill_quantity, db)
+        release_order(matching_order, fill_quantity, db)
         
         # Update order quantities
         new_order.filled_quantity += fill_quantity
@@ -446,12 +375,14 @@ def match_order(new_order: Order, db: Session) -> List[Trade]:
             matching_order.status = "PARTIALLY_FILLED"
         
         remaining_to_fill = new_order.remaining_quantity
+        lap("fill")
         
         # Commit after each match to ensure consistency
         try:
             db.commit()
             db.refresh(new_order)
             db.refresh(matching_order)
+            lap("commit")
         except Exception as e:
             print(f"[ORDER_MATCHING] ERROR committing trade: {str(e)}")
             db.rollback()
@@ -459,5 +390,9 @@ def match_order(new_order: Order, db: Session) -> List[Trade]:
             trades.pop()
             raise
     
+    if trades:
+        # Wake the settlement worker rather than waiting for its next poll
+        notify_settlement_worker()
+    
     return trades
 
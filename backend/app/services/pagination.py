@@ -0,0 +1,100 @@
+"""
+Keyset (cursor) pagination for newest-first history listings.
+
+Listings such as /exchange/trades, /exchange/orders/completed and
+/landowner/notifications are ordered by (created_at, id) descending. Instead of
+LIMIT/OFFSET, or ever larger limits, each page ends with an opaque cursor naming
+its last row; the next page is the rows strictly after that row in the same
+order. With an index ending in (created_at, id), every page is a range scan of
+`limit` rows wherever it starts in the history.
+
+The cursor holds the row's id only; its created_at is read back from the table.
+On SQLite a server-side now() stores whole seconds while a bound datetime carries
+microseconds, so comparing against the stored value keeps ties on the same second
+in order.
+
+Routes return the page's rows as before and the cursor for the next page in the
+X-Next-Cursor header (absent on the last page).
+"""
+import base64
+import json
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Query
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+@dataclass
+class Page:
+    """One page of a listing and the cursor for the next (None on the last page)."""
+    items: List[Any]
+    next_cursor: Optional[str] = None
+
+
+def encode_cursor(listing: str, row_id: int) -> str:
+    """Opaque cursor for the row `row_id` of a listing."""
+    raw = json.dumps({"l": listing, "id": row_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(listing: str, cursor: str) -> int:
+    """
+    Row id named by a cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed or belongs to another listing
+    """
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        row_id = decoded["id"]
+        if decoded["l"] != listing or not isinstance(row_id, int):
+            raise ValueError(cursor)
+    except (ValueError, KeyError, TypeError):
+        raise ValueError(f"Invalid cursor for {listing}")
+    return row_id
+
+
+def parse_cursor(listing: str, cursor: Optional[str]) -> Optional[int]:
+    """decode_cursor for a route's optional query parameter; a bad cursor is a 400."""
+    if not cursor:
+        return None
+    try:
+        return decode_cursor(listing, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def newest_first(query: Query, model, limit: int, after_id: Optional[int] = None) -> List[Any]:
+    """
+    Up to limit + 1 rows of `query` in (created_at, id) descending order, starting
+    after the row `after_id`. The extra row tells the caller whether a page follows.
+    """
+    if after_id is not None:
+        anchor_created_at = select(model.created_at).where(model.id == after_id).scalar_subquery()
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(anchor_created_at, after_id))
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+
+
+def merge_newest_first(*row_lists: Iterable[Any]) -> List[Any]:
+    """Merge newest-first row lists from several index ranges, dropping rows seen twice."""
+    rows = {row.id: row for row_list in row_lists for row in row_list}
+    return sorted(rows.values(), key=lambda row: (row.created_at, row.id), reverse=True)
+
+
+def page_of(listing: str, rows: List[Any], limit: int) -> Page:
+    """The first `limit` rows, with a cursor if more rows were fetched."""
+    if len(rows) > limit:
+        return Page(rows[:limit], encode_cursor(listing, rows[limit - 1].id))
+    return Page(rows)
+
+
+def set_next_cursor(response: Response, page: Page):
+    if page.next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page.next_cursor
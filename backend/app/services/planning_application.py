@@ -3,6 +3,9 @@ from typing import List, Dict, Tuple, Optional
 from ..models import Account, Scheme
 from ..services.credits_summary import get_account_credits_summary
 from web3 import Web3
+from .chain_client import get_web3, is_connected
+from .chain_indexer import read_nft_owners
+from .nonce_manager import send_transaction
 import os
 import uuid
 
@@ -114,6 +117,13 @@ def get_scheme_nft_abi() -> list:
     ]
 
 
+def _scheme_owner(scheme_nft_contract, scheme_id: int, indexed_owners: Optional[Dict[int, Optional[str]]]) -> str:
+    """Owner of a SchemeNFT from the chain index if given, otherwise from the node (zero address if none)."""
+    if indexed_owners is not None:
+        return indexed_owners.get(scheme_id) or '0x0000000000000000000000000000000000000000'
+    return scheme_nft_contract.functions.ownerOf(scheme_id).call()
+
+
 def submit_planning_application_on_chain(
     developer_address: str,
     scheme_ids: List[int],
@@ -122,24 +132,24 @@ def submit_planning_application_on_chain(
     planning_lock_address: str,
     developer_private_key: str,
     rpc_url: str = "http://127.0.0.1:8545",
-    scheme_nft_address: Optional[str] = None
+    scheme_nft_address: Optional[str] = None,
+    db: Optional[Session] = None
 ) -> int:
     """
     Submit planning application to PlanningLock contract on-chain.
+    With a db session, scheme existence is checked against the chain index
+    (scheme_nft_owners) when it is current instead of one ownerOf call per scheme.
     
     Returns:
         Application ID from PlanningLock contract
     """
     try:
         # Connect to blockchain
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
+        w3 = get_web3(rpc_url)
         
-        if not w3.is_connected():
+        if not is_connected(rpc_url):
             raise ConnectionError("Cannot connect to blockchain node")
         
-        # Get developer account
-        developer_account = w3.eth.account.from_key(developer_private_key)
-        
         # Query actual catchment from first scheme on-chain (if SchemeNFT address provided)
         # This ensures we use the exact format stored on-chain
         actual_catchment = required_catchment.upper()  # Default to required catchment
@@ -151,10 +161,11 @@ def submit_planning_application_on_chain(
                     address=Web3.to_checksum_address(scheme_nft_address),
                     abi=scheme_nft_abi
                 )
+                indexed_owners = read_nft_owners(db, scheme_ids, scheme_nft_address) if db is not None else None
                 
                 # First check if scheme exists by trying to get owner
                 try:
-                    scheme_owner = scheme_nft_contract.functions.ownerOf(scheme_ids[0]).call()
+                    scheme_owner = _scheme_owner(scheme_nft_contract, scheme_ids[0], indexed_owners)
                     if scheme_owner == '0x0000000000000000000000000000000000000000':
                         raise ValueError(f"Scheme {scheme_ids[0]} does not exist on-chain")
                 except Exception as e:
@@ -185,7 +196,7 @@ def submit_planning_application_on_chain(
                 for scheme_id in scheme_ids:
                     # Check if scheme exists
                     try:
-                        scheme_owner = scheme_nft_contract.functions.ownerOf(scheme_id).call()
+                        scheme_owner = _scheme_owner(scheme_nft_contract, scheme_id, indexed_owners)
                         if scheme_owner == '0x0000000000000000000000000000000000000000':
                             raise ValueError(f"Scheme {scheme_id} does not exist on-chain")
                     except Exception as e:
@@ -247,23 +258,8 @@ def submit_planning_application_on_chain(
             catchment_hash
         )
         
-        # Build transaction
-        nonce = w3.eth.get_transaction_count(developer_account.address)
-        transaction = function_call.build_transaction({
-            'from': developer_account.address,
-            'nonce': nonce,
-            'gas': 1000000,  # Higher gas for multiple scheme operations
-            'gasPrice': w3.eth.gas_price
-        })
-        
-        # Sign transaction
-        signed_txn = w3.eth.account.sign_transaction(transaction, developer_private_key)
-        
-        # Send transaction (handle both web3.py v6 and v7)
-        raw_tx = getattr(signed_txn, 'rawTransaction', getattr(signed_txn, 'raw_transaction', None))
-        if raw_tx is None:
-            raise ValueError("Could not get raw transaction from signed transaction")
-        tx_hash = w3.eth.send_raw_transaction(raw_tx)
+        # Sign and send with the signer's locally allocated nonce (higher gas for multiple scheme operations)
+        tx_hash = send_transaction(function_call, developer_private_key, rpc_url, gas=1000000)
         
         # Wait for receipt
         receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -331,14 +327,11 @@ def approve_planning_application_on_chain(
     """
     try:
         # Connect to blockchain
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
+        w3 = get_web3(rpc_url)
         
-        if not w3.is_connected():
+        if not is_connected(rpc_url):
             raise ConnectionError("Cannot connect to blockchain node")
         
-        # Get regulator account
-        regulator_account = w3.eth.account.from_key(regulator_private_key)
-        
         # Get contract
         contract = w3.eth.contract(
             address=Web3.to_checksum_address(planning_lock_address),
@@ -348,23 +341,8 @@ def approve_planning_application_on_chain(
         # Prepare approveApplication call
         function_call = contract.functions.approveApplication(application_id)
         
-        # Build transaction
-        nonce = w3.eth.get_transaction_count(regulator_account.address)
-        transaction = function_call.build_transaction({
-            'from': regulator_account.address,
-            'nonce': nonce,
-            'gas': 1000000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
-        # Sign transaction
-        signed_txn = w3.eth.account.sign_transaction(transaction, regulator_private_key)
-        
-        # Send transaction (handle both web3.py v6 and v7)
-        raw_tx = getattr(signed_txn, 'rawTransaction', getattr(signed_txn, 'raw_transaction', None))
-        if raw_tx is None:
-            raise ValueError("Could not get raw transaction from signed transaction")
-        tx_hash = w3.eth.send_raw_transaction(raw_tx)
+        # Sign and send with the signer's locally allocated nonce (higher gas for multiple scheme operations)
+        tx_hash = send_transaction(function_call, regulator_private_key, rpc_url, gas=1000000)
         
         # Wait for receipt
         receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -392,14 +370,11 @@ def reject_planning_application_on_chain(
     """
     try:
         # Connect to blockchain
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
+        w3 = get_web3(rpc_url)
         
-        if not w3.is_connected():
+        if not is_connected(rpc_url):
             raise ConnectionError("Cannot connect to blockchain node")
         
-        # Get regulator account
-        regulator_account = w3.eth.account.from_key(regulator_private_key)
-        
         # Get contract
         contract = w3.eth.contract(
             address=Web3.to_checksum_address(planning_lock_address),
@@ -409,23 +384,8 @@ def reject_planning_application_on_chain(
         # Prepare rejectApplication call
         function_call = contract.functions.rejectApplication(application_id)
         
-        # Build transaction
-        nonce = w3.eth.get_transaction_count(regulator_account.address)
-        transaction = function_call.build_transaction({
-            'from': regulator_account.address,
-            'nonce': nonce,
-            'gas': 1000000,
-            'gasPrice': w3.eth.gas_price
-        })
-        
-        # Sign transaction
-        signed_txn = w3.eth.account.sign_transaction(transaction, regulator_private_key)
-        
-        # Send transaction (handle both web3.py v6 and v7)
-        raw_tx = getattr(signed_txn, 'rawTransaction', getattr(signed_txn, 'raw_transaction', None))
-        if raw_tx is None:
-            raise ValueError("Could not get raw transaction from signed transaction")
-        tx_hash = w3.eth.send_raw_transaction(raw_tx)
+        # Sign and send with the signer's locally allocated nonce (higher gas for multiple scheme operations)
+        tx_hash = send_transaction(function_call, regulator_private_key, rpc_url, gas=1000000)
         
         # Wait for receipt
         receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
@@ -1,12 +1,33 @@
 """
 Price history aggregation service for candlestick charts.
 Aggregates trades into OHLCV (Open, High, Low, Close, Volume) data by timeframe.
+
+Candles are kept in memory by a process-wide CandleAggregator. Each trade
+updates its 1-minute candle and folds into the enclosing candle of every higher
+timeframe (O(1) per trade, no queries). Changed candles are marked dirty and
+written to price_history in batches by the flush worker (write-behind).
+When a market is first touched, its 1-minute candles are loaded from the database
+and the higher timeframes are derived from them by rollup_candles; the
+backfill command (backfill_price_history.py) rebuilds the table from trades
+the same way.
+
+On PostgreSQL several API processes record trades into the same candles, so no
+process holds a whole candle. Each keeps only the trades it recorded since its
+last flush; the flush merges them into the rows in SQL (volume added, high and
+low widened, close replaced, open kept) under a per-series advisory lock, and
+reads come from price_history with the process's unflushed trades folded in.
 """
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
-from typing import List, Dict
-from ..models import Trade, PriceHistory
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import threading
+from ..db import is_postgresql
+from ..models import Trade, PriceHistory, Scheme
+from .market_lock import ADVISORY_NAMESPACE, advisory_key
+from .read_cache import get_read_cache, market_version
 
 
 TIMEFRAME_MINUTES = {
@@ -18,11 +39,13 @@ TIMEFRAME_MINUTES = {
     "1day": 1440
 }
 
+BASE_TIMEFRAME = "1min"
+
 
 def round_timestamp_to_timeframe(timestamp: datetime, timeframe: str) -> datetime:
     """
     Round a timestamp to the start of its timeframe period.
-    
+
     Examples:
     - 1min: round to minute
     - 5min: round to 5-minute boundary
@@ -30,7 +53,7 @@ def round_timestamp_to_timeframe(timestamp: datetime, timeframe: str) -> datetim
     - 1day: round to day
     """
     minutes = TIMEFRAME_MINUTES.get(timeframe, 60)
-    
+
     if timeframe == "1day":
         # Round to start of day (midnight)
         return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -46,62 +69,340 @@ def round_timestamp_to_timeframe(timestamp: datetime, timeframe: str) -> datetim
         return timestamp.replace(hour=hours, minute=mins, second=0, microsecond=0)
 
 
+def _naive_utc(timestamp: datetime) -> datetime:
+    """Candles are keyed by naive UTC timestamps (as stored by SQLite)."""
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _aware_utc(timestamp: datetime) -> datetime:
+    """A candle timestamp for PostgreSQL, which would read a naive one in the server's time zone."""
+    return _naive_utc(timestamp).replace(tzinfo=timezone.utc)
+
+
+@dataclass
+class Candle:
+    timestamp: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int
+
+    @classmethod
+    def from_trade(cls, timestamp: datetime, price: float, volume: int) -> "Candle":
+        return cls(timestamp, price, price, price, price, volume)
+
+    def add_trade(self, price: float, volume: int):
+        self.high = max(self.high, price)
+        self.low = min(self.low, price)
+        self.close = price
+        self.volume += volume
+
+    def merge(self, later: "Candle"):
+        """Fold in a candle that starts after this one (keeps this open, takes its close)."""
+        self.high = max(self.high, later.high)
+        self.low = min(self.low, later.low)
+        self.close = later.close
+        self.volume += later.volume
+
+    def to_dict(self) -> Dict:
+        return {
+            "timestamp": self.timestamp.isoformat() if self.timestamp else "",
+            "open": self.open,
+            "high": self.high,
+            "low": self.low,
+            "close": self.close,
+            "volume": self.volume
+        }
+
+
+def rollup_candles(candles: Iterable[Candle], timeframe: str) -> List[Candle]:
+    """Derive candles for a higher timeframe from 1-minute candles (sorted by timestamp)."""
+    rolled: List[Candle] = []
+    for candle in candles:
+        bucket = round_timestamp_to_timeframe(candle.timestamp, timeframe)
+        if rolled and rolled[-1].timestamp == bucket:
+            rolled[-1].merge(candle)
+        else:
+            rolled.append(Candle(bucket, candle.open, candle.high, candle.low, candle.close, candle.volume))
+    return rolled
+
+
+# (catchment, unit_type, timeframe)
+SeriesKey = Tuple[str, str, str]
+
+
+class CandleAggregator:
+    """In-memory OHLCV candles per market and timeframe, flushed to price_history in batches."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._candles: Dict[SeriesKey, Dict[datetime, Candle]] = {}
+        self._timestamps: Dict[SeriesKey, List[datetime]] = {}
+        self._loaded: Set[Tuple[str, str]] = set()
+        # Trades recorded since the last flush, per candle
+        self._unflushed: Dict[Tuple[SeriesKey, datetime], Candle] = {}
+
+    def reset(self):
+        """Drop all in-memory candles (unflushed changes are lost)."""
+        with self._lock:
+            self._candles.clear()
+            self._timestamps.clear()
+            self._loaded.clear()
+            self._unflushed.clear()
+
+    def _put(self, key: SeriesKey, candle: Candle):
+        series = self._candles.setdefault(key, {})
+        if candle.timestamp not in series:
+            insort(self._timestamps.setdefault(key, []), candle.timestamp)
+        series[candle.timestamp] = candle
+
+    def _ensure_loaded(self, catchment: str, unit_type: str, db: Session):
+        """Load a market's 1-minute candles and derive the higher timeframes from them."""
+        if (catchment, unit_type) in self._loaded:
+            return
+        rows = db.query(PriceHistory).filter(
+            PriceHistory.catchment == catchment,
+            PriceHistory.unit_type == unit_type,
+            PriceHistory.timeframe == BASE_TIMEFRAME
+        ).order_by(PriceHistory.timestamp.asc()).all()
+        minute_candles = [
+            Candle(_naive_utc(row.timestamp), row.open_price, row.high_price, row.low_price, row.close_price, row.volume or 0)
+            for row in rows
+        ]
+
+        with self._lock:
+            if (catchment, unit_type) in self._loaded:
+                return
+            for timeframe in TIMEFRAME_MINUTES:
+                key = (catchment, unit_type, timeframe)
+                candles = minute_candles if timeframe == BASE_TIMEFRAME else rollup_candles(minute_candles, timeframe)
+                for candle in candles:
+                    self._put(key, Candle(**vars(candle)))
+            self._loaded.add((catchment, unit_type))
+
+    def record_trade(self, catchment: str, unit_type: str, price: float, volume: int, trade_time: datetime, db: Session):
+        """Fold one trade into the candle of every timeframe."""
+        shared = is_postgresql(db)
+        if not shared:
+            self._ensure_loaded(catchment, unit_type, db)
+        trade_time = _naive_utc(trade_time)
+        with self._lock:
+            for timeframe in TIMEFRAME_MINUTES:
+                key = (catchment, unit_type, timeframe)
+                period_start = round_timestamp_to_timeframe(trade_time, timeframe)
+                if not shared:
+                    candle = self._candles.get(key, {}).get(period_start)
+                    if candle:
+                        candle.add_trade(price, volume)
+                    else:
+                        self._put(key, Candle.from_trade(period_start, price, volume))
+                unflushed = self._unflushed.get((key, period_start))
+                if unflushed:
+                    unflushed.add_trade(price, volume)
+                else:
+                    self._unflushed[(key, period_start)] = Candle.from_trade(period_start, price, volume)
+        # Cached /price-history responses for this market are now stale
+        get_read_cache().bump(market_version(catchment, unit_type))
+
+    def get_candles(
+        self,
+        catchment: str,
+        unit_type: str,
+        timeframe: str,
+        db: Session,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: int = 100
+    ) -> List[Candle]:
+        """Candles with start <= timestamp <= end, oldest first, at most `limit`."""
+        key = (catchment, unit_type, timeframe)
+        if is_postgresql(db):
+            return self._read_candles(key, db, start, end, limit)
+        self._ensure_loaded(catchment, unit_type, db)
+        with self._lock:
+            timestamps = self._timestamps.get(key, [])
+            lo = bisect_left(timestamps, _naive_utc(start)) if start else 0
+            hi = bisect_right(timestamps, _naive_utc(end)) if end else len(timestamps)
+            series = self._candles[key] if timestamps else {}
+            return [Candle(**vars(series[ts])) for ts in timestamps[lo:min(hi, lo + limit)]]
+
+    def _read_candles(
+        self, key: SeriesKey, db: Session, start: Optional[datetime], end: Optional[datetime], limit: int
+    ) -> List[Candle]:
+        """PostgreSQL: candles from price_history, with this process's unflushed trades folded in."""
+        catchment, unit_type, timeframe = key
+        query = db.query(PriceHistory).filter(
+            PriceHistory.catchment == catchment,
+            PriceHistory.unit_type == unit_type,
+            PriceHistory.timeframe == timeframe
+        )
+        if start:
+            query = query.filter(PriceHistory.timestamp >= _aware_utc(start))
+        if end:
+            query = query.filter(PriceHistory.timestamp <= _aware_utc(end))
+        candles = {
+            _naive_utc(row.timestamp): Candle(
+                _naive_utc(row.timestamp), row.open_price, row.high_price, row.low_price, row.close_price, row.volume or 0
+            )
+            for row in query.order_by(PriceHistory.timestamp.asc()).limit(limit)
+        }
+        with self._lock:
+            for (unflushed_key, ts), unflushed in self._unflushed.items():
+                if unflushed_key != key or (start and ts < _naive_utc(start)) or (end and ts > _naive_utc(end)):
+                    continue
+                if ts in candles:
+                    candles[ts].merge(unflushed)
+                else:
+                    candles[ts] = Candle(**vars(unflushed))
+        return [candles[ts] for ts in sorted(candles)[:limit]]
+
+    def dirty_count(self) -> int:
+        with self._lock:
+            return len(self._unflushed)
+
+    def flush(self, db: Session) -> int:
+        """
+        Write dirty candles to price_history in one transaction. On PostgreSQL
+        the trades recorded since the last flush are merged into the rows.
+
+        Returns:
+            Number of candles written
+        """
+        shared = is_postgresql(db)
+        with self._lock:
+            if not self._unflushed:
+                return 0
+            unflushed = self._unflushed
+            self._unflushed = {}
+            if shared:
+                snapshot = unflushed
+            else:
+                snapshot = {(key, ts): Candle(**vars(self._candles[key][ts])) for key, ts in unflushed}
+
+        try:
+            by_series: Dict[SeriesKey, List[datetime]] = {}
+            for key, ts in snapshot:
+                by_series.setdefault(key, []).append(ts)
+
+            # Sorted, so processes flushing the same series take their locks in the same order
+            for series in sorted(by_series):
+                if shared:
+                    self._merge_series(series, by_series[series], snapshot, db)
+                    continue
+                catchment, unit_type, timeframe = series
+                timestamps = by_series[series]
+                existing = {
+                    _naive_utc(row.timestamp): row
+                    for row in db.query(PriceHistory).filter(
+                        PriceHistory.catchment == catchment,
+                        PriceHistory.unit_type == unit_type,
+                        PriceHistory.timeframe == timeframe,
+                        PriceHistory.timestamp.in_(timestamps)
+                    ).all()
+                }
+                for ts in timestamps:
+                    candle = snapshot[((catchment, unit_type, timeframe), ts)]
+                    row = existing.get(ts)
+                    if row is None:
+                        db.add(PriceHistory(
+                            catchment=catchment,
+                            unit_type=unit_type,
+                            timeframe=timeframe,
+                            timestamp=ts,
+                            open_price=candle.open,
+                            high_price=candle.high,
+                            low_price=candle.low,
+                            close_price=candle.close,
+                            volume=candle.volume
+                        ))
+                    else:
+                        row.open_price = candle.open
+                        row.high_price = candle.high
+                        row.low_price = candle.low
+                        row.close_price = candle.close
+                        row.volume = candle.volume
+                        row.updated_at = datetime.utcnow()
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Keep the candles dirty so the next flush retries them (with any trades recorded since)
+            with self._lock:
+                for candle_key, candle in unflushed.items():
+                    later = self._unflushed.get(candle_key)
+                    if later:
+                        candle.merge(later)
+                    self._unflushed[candle_key] = candle
+            raise
+        return len(snapshot)
+
+    def _merge_series(
+        self, series: SeriesKey, timestamps: List[datetime], snapshot: Dict[Tuple[SeriesKey, datetime], Candle], db: Session
+    ):
+        """PostgreSQL: merge one series' unflushed trades into its rows, holding the series until commit."""
+        catchment, unit_type, timeframe = series
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(:namespace, :key)"),
+            {"namespace": ADVISORY_NAMESPACE, "key": advisory_key("candles:%s:%s:%s" % series)}
+        )
+        for ts in timestamps:
+            candle = snapshot[(series, ts)]
+            merged = db.query(PriceHistory).filter(
+                PriceHistory.catchment == catchment,
+                PriceHistory.unit_type == unit_type,
+                PriceHistory.timeframe == timeframe,
+                PriceHistory.timestamp == _aware_utc(ts)
+            ).update({
+                PriceHistory.high_price: func.greatest(PriceHistory.high_price, candle.high),
+                PriceHistory.low_price: func.least(PriceHistory.low_price, candle.low),
+                PriceHistory.close_price: candle.close,
+                PriceHistory.volume: func.coalesce(PriceHistory.volume, 0) + candle.volume,
+                PriceHistory.updated_at: datetime.utcnow()
+            }, synchronize_session=False)
+            if not merged:
+                db.add(PriceHistory(
+                    catchment=catchment,
+                    unit_type=unit_type,
+                    timeframe=timeframe,
+                    timestamp=_aware_utc(ts),
+                    open_price=candle.open,
+                    high_price=candle.high,
+                    low_price=candle.low,
+                    close_price=candle.close,
+                    volume=candle.volume
+                ))
+
+
+_aggregator = CandleAggregator()
+
+
+def get_candle_aggregator() -> CandleAggregator:
+    """Get the process-wide candle aggregator."""
+    return _aggregator
+
+
 def update_price_history(trade: Trade, db: Session) -> None:
     """
     Update price history for all timeframes after a trade executes.
-    Creates or updates OHLCV candles for the trade's catchment + unit_type.
+    Updates the in-memory OHLCV candles for the trade's catchment + unit_type;
+    the flush worker persists them.
     """
     # Get scheme to determine catchment and unit_type
-    from ..models import Scheme
-    scheme = db.query(Scheme).filter(Scheme.id == trade.scheme_id).first()
+    scheme = db.get(Scheme, trade.scheme_id)
     if not scheme:
         return
-    
-    catchment = scheme.catchment
-    unit_type = scheme.unit_type
-    price = trade.price_per_unit
-    volume = trade.quantity_units
+
     trade_time = trade.created_at if trade.created_at else datetime.utcnow()
-    
-    # Update all timeframes
-    for timeframe in TIMEFRAME_MINUTES.keys():
-        period_start = round_timestamp_to_timeframe(trade_time, timeframe)
-        
-        # Find or create price history record
-        price_history = db.query(PriceHistory).filter(
-            PriceHistory.catchment == catchment,
-            PriceHistory.unit_type == unit_type,
-            PriceHistory.timeframe == timeframe,
-            PriceHistory.timestamp == period_start
-        ).first()
-        
-        if price_history:
-            # Update existing candle
-            # High: max of current high and new price
-            price_history.high_price = max(price_history.high_price, price)
-            # Low: min of current low and new price
-            price_history.low_price = min(price_history.low_price, price)
-            # Close: always the latest price
-            price_history.close_price = price
-            # Volume: add to existing volume
-            price_history.volume += volume
-            price_history.updated_at = datetime.utcnow()
-        else:
-            # Create new candle
-            price_history = PriceHistory(
-                catchment=catchment,
-                unit_type=unit_type,
-                timeframe=timeframe,
-                timestamp=period_start,
-                open_price=price,
-                high_price=price,
-                low_price=price,
-                close_price=price,
-                volume=volume
-            )
-            db.add(price_history)
-    
-    db.commit()
+    _aggregator.record_trade(
+        scheme.catchment.upper(),
+        scheme.unit_type.lower(),
+        trade.price_per_unit,
+        trade.quantity_units,
+        trade_time,
+        db
+    )
 
 
 def get_price_history(
@@ -109,37 +410,68 @@ def get_price_history(
     unit_type: str,
     timeframe: str,
     limit: int = 100,
-    db: Session = None
+    db: Session = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
 ) -> List[Dict]:
     """
-    Get price history (candlestick data) for a catchment + unit_type + timeframe.
-    
+    Get price history (candlestick data) for a catchment + unit_type + timeframe,
+    optionally limited to candles starting between `start` and `end` (inclusive).
+
     Returns:
         List of OHLCV candles sorted by timestamp ASC
     """
     if timeframe not in TIMEFRAME_MINUTES:
         return []
-    
-    query = db.query(PriceHistory).filter(
-        PriceHistory.catchment == catchment.upper(),
-        PriceHistory.unit_type == unit_type.lower(),
-        PriceHistory.timeframe == timeframe
-    ).order_by(PriceHistory.timestamp.asc()).limit(limit)
-    
-    candles = query.all()
-    
-    return [
-        {
-            "timestamp": candle.timestamp.isoformat() if candle.timestamp else "",
-            "open": candle.open_price,
-            "high": candle.high_price,
-            "low": candle.low_price,
-            "close": candle.close_price,
-            "volume": candle.volume
-        }
-        for candle in candles
-    ]
 
+    candles = _aggregator.get_candles(catchment.upper(), unit_type.lower(), timeframe, db, start, end, limit)
+    return [candle.to_dict() for candle in candles]
 
 
+def rebuild_price_history(db: Session) -> int:
+    """
+    Rebuild every candle from the trades table: 1-minute candles from trades,
+    higher timeframes rolled up from them. Replaces price_history and resets the aggregator.
+
+    Returns:
+        Number of candles written
+    """
+    trades = db.query(Trade, Scheme.catchment, Scheme.unit_type).join(
+        Scheme, Trade.scheme_id == Scheme.id
+    ).order_by(Trade.created_at.asc(), Trade.id.asc()).all()
 
+    minute_candles: Dict[Tuple[str, str], List[Candle]] = {}
+    for trade, catchment, unit_type in trades:
+        if trade.created_at is None:
+            continue
+        series = minute_candles.setdefault((catchment.upper(), unit_type.lower()), [])
+        period_start = round_timestamp_to_timeframe(_naive_utc(trade.created_at), BASE_TIMEFRAME)
+        if series and series[-1].timestamp == period_start:
+            series[-1].add_trade(trade.price_per_unit, trade.quantity_units)
+        else:
+            series.append(Candle.from_trade(period_start, trade.price_per_unit, trade.quantity_units))
+
+    _aggregator.reset()
+    db.query(PriceHistory).delete()
+    written = 0
+    for (catchment, unit_type), candles in minute_candles.items():
+        for timeframe in TIMEFRAME_MINUTES:
+            rolled = candles if timeframe == BASE_TIMEFRAME else rollup_candles(candles, timeframe)
+            db.add_all([
+                PriceHistory(
+                    catchment=catchment,
+                    unit_type=unit_type,
+                    timeframe=timeframe,
+                    timestamp=candle.timestamp,
+                    open_price=candle.open,
+                    high_price=candle.high,
+                    low_price=candle.low,
+                    close_price=candle.close,
+                    volume=candle.volume
+                )
+                for candle in rolled
+            ])
+            written += len(rolled)
+    db.commit()
+    get_read_cache().bump(*(market_version(catchment, unit_type) for catchment, unit_type in minute_candles))
+    return written
@@ -0,0 +1,94 @@
+import threading
+from typing import Optional
+from sqlalchemy.orm import Session
+from ..db import SessionLocal
+from .price_history import get_candle_aggregator
+
+
+class PriceHistoryFlushWorker:
+    """Background worker that writes dirty in-memory candles to price_history in batches."""
+
+    def __init__(self, interval_seconds: int = 5):
+        self.interval_seconds = interval_seconds
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Start the flush thread."""
+        if self.running:
+            return
+
+        self.running = True
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print(f"Price history flush worker started (interval: {self.interval_seconds}s)")
+
+    def stop(self):
+        """Stop the flush thread, writing any remaining dirty candles."""
+        if not self.running:
+            return
+
+        self.running = False
+        self._stop_event.set()
+
+        if self.thread:
+            self.thread.join(timeout=5.0)
+
+        try:
+            self._run_flush_cycle()
+        except Exception as e:
+            print(f"Error flushing price history on shutdown: {str(e)}")
+        print("Price history flush worker stopped")
+
+    def _run(self):
+        """Main worker loop."""
+        while self.running and not self._stop_event.is_set():
+            try:
+                self._run_flush_cycle()
+            except Exception as e:
+                print(f"Error in price history flush cycle: {str(e)}")
+
+            # Wait for interval or stop event
+            self._stop_event.wait(self.interval_seconds)
+
+    def _run_flush_cycle(self) -> int:
+        """Write the current batch of dirty candles."""
+        if not get_candle_aggregator().dirty_count():
+            return 0
+        db: Session = SessionLocal()
+        try:
+            return get_candle_aggregator().flush(db)
+        finally:
+            db.close()
+
+    def run_cycle_once(self) -> int:
+        """Manually run one cycle (for testing)."""
+        return self._run_flush_cycle()
+
+
+# Global worker instance
+_worker: Optional[PriceHistoryFlushWorker] = None
+
+
+def get_price_history_worker(interval_seconds: int = 5) -> PriceHistoryFlushWorker:
+    """Get or create the global flush worker instance."""
+    global _worker
+    if _worker is None:
+        _worker = PriceHistoryFlushWorker(interval_seconds=interval_seconds)
+    return _worker
+
+
+def start_price_history_worker(interval_seconds: int = 5):
+    """Start the global flush worker."""
+    worker = get_price_history_worker(interval_seconds)
+    worker.start()
+
+
+def stop_price_history_worker():
+    """Stop the global flush worker."""
+    global _worker
+    if _worker:
+        _worker.stop()
+        _worker = None
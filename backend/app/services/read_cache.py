@@ -0,0 +1,197 @@
+"""
+Versioned read-model cache for exchange GET endpoints.
+
+Read endpoints such as /exchange/orderbook, /exchange/price-history,
+/exchange/trades and /regulator/schemes used to recompute the same response for
+every caller. Each response now depends on one version counter:
+
+    ("market", CATCHMENT, unit_type)  orders and trades in that market, and its candles
+    ("trades",)                       any trade
+    ("schemes",)                      any scheme
+
+Counters are bumped after a transaction that changed the rows they cover
+commits (SQLAlchemy session events, like the order book). Responses are cached
+under (endpoint, params, version) and served with an ETag derived from the same
+key, so a client sending If-None-Match gets a 304 - and any caller gets the
+cached body - without a database query while the version is unchanged.
+
+Versions are kept per process, like the order book; a boot id in every ETag
+keeps tags from a previous process from matching. That is only correct while
+one process writes the database, so on PostgreSQL (several API processes, see
+services.market_lock) the cache is disabled: cached_response computes every
+response from the database and sends no ETag. Cross-process invalidation
+(LISTEN/NOTIFY on every commit) would keep the hit rate, but a missed
+notification would serve stale data with nothing to correct it.
+
+A paginated listing computes a pagination.Page; its next-page cursor is cached
+with the body and sent back as the X-Next-Cursor header.
+"""
+import hashlib
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..db import engine, is_postgresql
+from ..models import Order, Scheme, Trade
+from .order_book import market_key, scheme_market
+from .pagination import NEXT_CURSOR_HEADER, Page
+
+VersionKey = Tuple[str, ...]
+
+SCHEMES_VERSION: VersionKey = ("schemes",)
+TRADES_VERSION: VersionKey = ("trades",)
+
+_PENDING_KEY = "read_cache_pending_bumps"
+
+DEFAULT_MAX_ENTRIES = 1024
+
+
+def market_version(catchment: str, unit_type: str) -> VersionKey:
+    return ("market",) + market_key(catchment, unit_type)
+
+
+class ReadModelCache:
+    """Version counters plus an LRU of encoded responses keyed by (endpoint, params, version)."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, enabled: bool = True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.RLock()
+        self._boot_id = uuid.uuid4().hex[:8]
+        self._versions: Dict[VersionKey, int] = {}
+        self._entries: "OrderedDict[str, Tuple[bytes, Dict[str, str]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, key: VersionKey) -> int:
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def bump(self, *keys: VersionKey):
+        """Invalidate every cached response that depends on `keys`."""
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def etag(self, endpoint: str, params: Dict[str, Any], version_key: VersionKey) -> str:
+        """Strong ETag for an endpoint + params at the current version of `version_key`."""
+        encoded = json.dumps(params, sort_keys=True, default=str)
+        digest = hashlib.sha1(f"{endpoint}|{encoded}".encode()).hexdigest()[:16]
+        return f'"{self._boot_id}-{self.version(version_key)}-{digest}"'
+
+    def get_or_compute(self, etag: str, compute: Callable[[], Any]) -> Tuple[bytes, Dict[str, str]]:
+        """Cached JSON body (and extra headers) for `etag`, computing and storing them on a miss."""
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is not None:
+                self._entries.move_to_end(etag)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = _encode(compute())
+        with self._lock:
+            self._entries[etag] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def reset(self):
+        """Drop all entries and versions; a new boot id keeps old ETags from matching."""
+        with self._lock:
+            self._boot_id = uuid.uuid4().hex[:8]
+            self._versions.clear()
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def _encode(result: Any) -> Tuple[bytes, Dict[str, str]]:
+    """JSON body and extra headers for a computed response."""
+    headers = {}
+    if isinstance(result, Page):
+        if result.next_cursor:
+            headers[NEXT_CURSOR_HEADER] = result.next_cursor
+        result = result.items
+    return json.dumps(jsonable_encoder(result)).encode(), headers
+
+
+# Global cache instance (disabled when API processes share a PostgreSQL database)
+_cache = ReadModelCache(enabled=not is_postgresql(engine))
+
+
+def get_read_cache() -> ReadModelCache:
+    return _cache
+
+
+def cached_response(
+    request: Request,
+    endpoint: str,
+    params: Dict[str, Any],
+    version_key: VersionKey,
+    compute: Callable[[], Any]
+) -> Response:
+    """
+    Serve a GET endpoint from the read cache.
+
+    Returns 304 when the client's If-None-Match matches the current ETag, otherwise
+    the cached (or freshly computed) JSON body with its ETag. With the cache
+    disabled, the body is computed on every request and sent without an ETag.
+    """
+    if not _cache.enabled:
+        body, extra_headers = _encode(compute())
+        return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-cache", **extra_headers})
+    etag = _cache.etag(endpoint, params, version_key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    body, extra_headers = _cache.get_or_compute(etag, compute)
+    return Response(content=body, media_type="application/json", headers={**headers, **extra_headers})
+
+
+# Session event hooks: work out which versions a flush touched and bump them once
+# the transaction commits (after the data - and the in-memory order book - changed).
+
+def _versions_for(obj: Any, session: Session) -> Set[VersionKey]:
+    if isinstance(obj, Order):
+        return {market_version(obj.catchment, obj.unit_type)}
+    if isinstance(obj, Trade):
+        keys = {TRADES_VERSION}
+        market = scheme_market(obj.scheme_id, session) if obj.scheme_id is not None else None
+        if market is not None:
+            keys.add(("market",) + market)
+        return keys
+    if isinstance(obj, Scheme):
+        return {SCHEMES_VERSION}
+    return set()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_bumps(session: Session, flush_context):
+    pending: Optional[Set[VersionKey]] = None
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        keys = _versions_for(obj, session)
+        if keys:
+            if pending is None:
+                pending = session.info.setdefault(_PENDING_KEY, set())
+            pending |= keys
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_bumps(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        _cache.bump(*pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_bumps(session: Session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,140 @@
+"""
+Reservation counters for credits held by open SELL orders and ACTIVE listings.
+
+Free-credit checks used to load every open SELL order and ACTIVE listing for the
+seller and sum them in Python. credit_reservations keeps one counter per
+(account, scheme) - with the scheme's catchment and unit_type alongside for
+catchment-wide checks - maintained in the same transaction as order creation,
+fills and cancels (reserve_order / release_order) and listing creation and
+purchases (reserve_listing / release_listing).
+
+reserve_order / release_order also hold and release buyer funds for LIMIT BUY
+orders (see balance_check), so every order lifecycle change has one hook.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from typing import Dict, Optional
+from ..db import lock_for_update
+from ..models import CreditReservation, ExchangeListing, Order, Scheme
+from .balance_check import reserve_order_funds, release_order_funds
+from .order_book import OPEN_ORDER_STATUSES
+
+
+def _get_reservation(account_id: int, scheme_id: int, db: Session) -> Optional[CreditReservation]:
+    """Get (or create) the counter row for an account and scheme."""
+    pending = db.info.setdefault("credit_reservations", {})
+    row = pending.get((account_id, scheme_id))
+    if row is not None and row in db:
+        return row
+
+    row = db.query(CreditReservation).filter(
+        CreditReservation.account_id == account_id,
+        CreditReservation.scheme_id == scheme_id
+    ).first()
+    if row is None:
+        scheme = db.get(Scheme, scheme_id)
+        if scheme is None:
+            return None
+        row = CreditReservation(
+            account_id=account_id,
+            scheme_id=scheme_id,
+            catchment=scheme.catchment.upper(),
+            unit_type=scheme.unit_type.lower(),
+            reserved_units=0
+        )
+        db.add(row)
+    # Pending rows are not visible to queries until flushed, so remember them
+    pending[(account_id, scheme_id)] = row
+    return row
+
+
+def _adjust(account_id: int, scheme_id: Optional[int], units: int, db: Session):
+    if scheme_id is None or not units:
+        return
+    row = _get_reservation(account_id, scheme_id, db)
+    if row is not None:
+        lock_for_update(row, db)
+        row.reserved_units = max(0, (row.reserved_units or 0) + units)
+
+
+def reserve_order(order: Order, db: Session):
+    """Reserve credits (SELL) or funds (LIMIT BUY) for a new order. Call before the order is added to the session."""
+    if order.side == "SELL":
+        _adjust(order.account_id, order.scheme_id, order.remaining_quantity, db)
+    else:
+        reserve_order_funds(order, db)
+
+
+def release_order(order: Order, quantity: int, db: Session):
+    """Release `quantity` units of an open order that were filled or cancelled, before its row is updated."""
+    if order.status not in OPEN_ORDER_STATUSES:
+        return
+    if order.side == "SELL":
+        _adjust(order.account_id, order.scheme_id, -quantity, db)
+    else:
+        release_order_funds(order, quantity, db)
+
+
+def reserve_listing(listing: ExchangeListing, db: Session):
+    """Reserve credits for a new ACTIVE listing."""
+    _adjust(listing.owner_account_id, listing.scheme_id, listing.quantity_units, db)
+
+
+def release_listing(listing: ExchangeListing, quantity: int, db: Session):
+    """Release `quantity` units of an ACTIVE listing that were sold or withdrawn."""
+    if listing.status != "ACTIVE":
+        return
+    _adjust(listing.owner_account_id, listing.scheme_id, -quantity, db)
+
+
+def get_reserved_credits(account_id: int, scheme_id: int, db: Session) -> int:
+    """Credits an account has reserved in listings and open SELL orders for one scheme."""
+    row = _get_reservation(account_id, scheme_id, db)
+    return row.reserved_units if row is not None else 0
+
+
+def get_reserved_credits_by_scheme(account_id: int, catchment: str, unit_type: str, db: Session) -> Dict[int, int]:
+    """
+    Reserved credits per scheme for an account within a catchment + unit_type.
+
+    Returns:
+        Dict of scheme_id -> reserved units
+    """
+    rows = db.query(CreditReservation).filter(
+        CreditReservation.account_id == account_id,
+        CreditReservation.catchment == catchment.upper(),
+        CreditReservation.unit_type == unit_type.lower()
+    ).all()
+    return {row.scheme_id: row.reserved_units for row in rows}
+
+
+def rebuild_credit_reservations(db: Session) -> int:
+    """
+    Recompute every counter from ACTIVE listings and open SELL orders and commit.
+
+    Returns:
+        Number of (account, scheme) counters with reserved credits
+    """
+    totals: Dict[tuple, int] = {}
+    listing_totals = db.query(
+        ExchangeListing.owner_account_id, ExchangeListing.scheme_id, func.sum(ExchangeListing.quantity_units)
+    ).filter(
+        ExchangeListing.status == "ACTIVE"
+    ).group_by(ExchangeListing.owner_account_id, ExchangeListing.scheme_id).all()
+    order_totals = db.query(
+        Order.account_id, Order.scheme_id, func.sum(Order.remaining_quantity)
+    ).filter(
+        Order.side == "SELL",
+        Order.status.in_(OPEN_ORDER_STATUSES),
+        Order.scheme_id != None
+    ).group_by(Order.account_id, Order.scheme_id).all()
+    for account_id, scheme_id, units in list(listing_totals) + list(order_totals):
+        totals[(account_id, scheme_id)] = totals.get((account_id, scheme_id), 0) + int(units or 0)
+
+    db.query(CreditReservation).delete()
+    db.info.pop("credit_reservations", None)
+    for (account_id, scheme_id), units in totals.items():
+        _adjust(account_id, scheme_id, units, db)
+    db.commit()
+    db.info.pop("credit_reservations", None)
+    return len(totals)
@@ -3,6 +3,7 @@ from typing import List, Dict, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
 from datetime import datetime, timezone
+from ..db import lock_for_update
 from ..models import (
     SellLadderBot, SellLadderBotAssignment, SellLadderFIFOCreditQueue, SellLadderBotOrder,
     Account, BrokerMandate, Scheme, Trade, Order, AccountRole
@@ -10,6 +11,12 @@ from ..models import (
 from .market_making_bot import (
     calculate_reference_price, is_market_new, get_best_bid_price, get_best_ask_price
 )
+from .reservations import reserve_order, release_order
+from .batch_orders import BatchOrder, stage_order_batch, complete_order_batch
+from .market_actor import current_market, run_in_market
+from .market_state import get_market_state
+from .order_book import OPEN_ORDER_STATUSES, market_key
+from .settlement import resolve_order_funding, sell_ladder_queue_is_house
 
 
 # Bot Management Functions
@@ -287,7 +294,11 @@ def remove_sell_ladder_assignment(assignment_id: int, db: Session):
         
         for bot_order in bot_orders:
             order = bot_order.order
-            if order and order.status in ["PENDING", "PARTIALLY_FILLED"]:
+            if order:
+                # PostgreSQL: wait for a fill in another API process to commit, and see it
+                lock_for_update(order, db)
+            if order and order.status in OPEN_ORDER_STATUSES:
+                release_order(order, order.remaining_quantity, db)
                 order.status = "CANCELLED"
                 order.updated_at = datetime.now(timezone.utc)
     
@@ -480,6 +491,9 @@ def place_sell_ladder_orders(bot_id: int, db: Session):
     if bot.is_active == 0:
         print(f"[SELL_LADDER_BOT SKIP] Bot {bot_id} is not active")
         return
+    if current_market() != market_key(bot.catchment, bot.unit_type):
+        # A refresh is one command on the market's actor
+        return run_in_market(bot.catchment, bot.unit_type, lambda: place_sell_ladder_orders(bot_id, db))
     
     print(f"[SELL_LADDER_BOT] Placing orders for bot {bot_id} ({bot.name}) - {bot.catchment} {bot.unit_type}")
     
@@ -493,11 +507,7 @@ def place_sell_ladder_orders(bot_id: int, db: Session):
     base_price_per_tonne = config.get('base_price_per_tonne', 100.0)  # Default fallback price
     
     # Check if this is a new market (no trades yet)
-    from ..models import Trade, Scheme
-    trade_count = db.query(Trade).join(Scheme).filter(
-        Scheme.catchment == bot.catchment,
-        Scheme.unit_type == bot.unit_type
-    ).count()
+    trade_count = get_market_state(bot.catchment, bot.unit_type, db).trade_count
     
     is_new_market = trade_count == 0
     
@@ -533,23 +543,9 @@ def place_sell_ladder_orders(bot_id: int, db: Session):
         price_levels.append((level, price))
         print(f"[SELL_LADDER_BOT] Level {level}: £{price:.6f}")
     
-    # Cancel existing orders that are no longer needed or at wrong prices
-    cancel_sell_ladder_orders(bot_id, db)
-    
-    # Place orders for each price level
+    # Size every level first, then cancel the old ladder and place the new one as one batch
+    levels = []
     for level, price in price_levels:
-        # Check if order already exists at this level
-        existing_order = db.query(SellLadderBotOrder).join(Order).filter(
-            SellLadderBotOrder.bot_id == bot_id,
-            SellLadderBotOrder.price_level == level,
-            Order.status.in_(["PENDING", "PARTIALLY_FILLED"])
-        ).first()
-        
-        if existing_order:
-            # Order already exists at this level, skip
-            print(f"[SELL_LADDER_BOT] Order already exists at level {level}")
-            continue
-        
         # Get credits from FIFO queue
         total_available = get_total_available_credits(bot_id, db)
         credits_to_sell = min(order_size_per_level, total_available)
@@ -568,20 +564,13 @@ def place_sell_ladder_orders(bot_id: int, db: Session):
             continue
         
         print(f"[SELL_LADDER_BOT] Placing order at level {level}: {credits_from_queue:,} credits at £{price:.6f}")
-        
-        # Create sell order
-        order_id = create_sell_ladder_limit_order(bot, price, credits_from_queue, db)
-        
-        if order_id:
-            # Create bot order record
-            create_sell_ladder_bot_order_record(bot_id, order_id, price, level, queue_id, db)
-            print(f"[SELL_LADDER_BOT] Order {order_id} created at level {level}")
-        else:
-            print(f"[SELL_LADDER_BOT ERROR] Failed to create order at level {level}")
+        levels.append((level, price, credits_from_queue, queue_id))
+    
+    replace_sell_ladder_orders(bot, levels, db)
 
 
-def create_sell_ladder_limit_order(bot: SellLadderBot, price: float, quantity: int, db: Session) -> Optional[int]:
-    """Create a limit sell order for sell ladder bot."""
+def get_sell_ladder_order_scheme(bot: SellLadderBot, db: Session) -> Optional[Scheme]:
+    """Scheme the next ladder orders sell from: the first FIFO queue entry with credits."""
     # Find matching scheme from FIFO queue
     queue_entry = db.query(SellLadderFIFOCreditQueue).filter(
         SellLadderFIFOCreditQueue.bot_id == bot.id,
@@ -604,6 +593,77 @@ def create_sell_ladder_limit_order(bot: SellLadderBot, price: float, quantity: i
         print(f"  Bot unit_type: {bot.unit_type}, Scheme unit_type: {scheme.unit_type}")
         return None
     
+    return scheme
+
+
+def replace_sell_ladder_orders(bot: SellLadderBot, levels: List[Tuple[int, float, int, Optional[int]]], db: Session):
+    """
+    Cancel the bot's open ladder orders and place `levels` ((level, price, quantity,
+    fifo_queue_id)) as one batch, with their SellLadderBotOrder records, in one transaction.
+    Ladder orders rest in the book without being matched on placement.
+    """
+    open_order_ids = [
+        order_id for (order_id,) in db.query(SellLadderBotOrder.order_id).join(Order).filter(
+            SellLadderBotOrder.bot_id == bot.id,
+            Order.status.in_(["PENDING", "PARTIALLY_FILLED"])
+        ).all()
+    ]
+    
+    scheme = get_sell_ladder_order_scheme(bot, db) if levels else None
+    if levels:
+        # Get broker account
+        broker = db.query(Account).filter(Account.id == bot.broker_account_id).first()
+        if not broker or not broker.evm_address:
+            print(f"[SELL_LADDER_BOT ERROR] Broker account {bot.broker_account_id} not found or missing EVM address")
+            scheme = None
+    if levels and not scheme:
+        levels = []
+    
+    # Whether each level sells house or client credits (stored on the orders for settlement)
+    house_by_queue = {queue_id: sell_ladder_queue_is_house(queue_id, db) for queue_id in {level[3] for level in levels}}
+    
+    batch = stage_order_batch(
+        bot.broker_account_id,
+        bot.catchment,
+        bot.unit_type,
+        [
+            BatchOrder(side="SELL", price_per_unit=price, quantity_units=quantity, scheme_id=scheme.id, is_house_account=house_by_queue.get(queue_id))
+            for _, price, quantity, queue_id in levels
+        ],
+        open_order_ids,
+        db,
+        check_funds=False
+    )
+    if not batch.applied:
+        errors = [result.error for result in batch.orders + batch.cancels if result.error]
+        print(f"[SELL_LADDER_BOT ERROR] Order refresh for bot {bot.id} rejected: {errors}")
+        return
+    
+    for order, (level, price, _, queue_id) in zip(batch.created, levels):
+        db.add(SellLadderBotOrder(
+            bot_id=bot.id,
+            order_id=order.id,
+            strategy_price=price,
+            price_level=level,
+            fifo_queue_id=queue_id
+        ))
+        print(f"[SELL_LADDER_BOT] Order {order.id} created at level {level}")
+    
+    complete_order_batch(batch, db, match=False)
+
+
+def create_sell_ladder_limit_order(
+    bot: SellLadderBot,
+    price: float,
+    quantity: int,
+    db: Session,
+    fifo_queue_id: Optional[int] = None
+) -> Optional[int]:
+    """Create a limit sell order for sell ladder bot."""
+    scheme = get_sell_ladder_order_scheme(bot, db)
+    if not scheme:
+        return None
+    
     # Get broker account
     broker = db.query(Account).filter(Account.id == bot.broker_account_id).first()
     if not broker or not broker.evm_address:
@@ -627,7 +687,9 @@ def create_sell_ladder_limit_order(bot: SellLadderBot, price: float, quantity: i
         scheme_id=scheme.id,
         nft_token_id=scheme.nft_token_id
     )
+    resolve_order_funding(order, broker, db, is_house_account=sell_ladder_queue_is_house(fifo_queue_id, db))
     
+    reserve_order(order, db)
     db.add(order)
     db.commit()
     db.refresh(order)
@@ -657,7 +719,11 @@ def create_sell_ladder_bot_order_record(
 
 
 def cancel_sell_ladder_orders(bot_id: int, db: Session):
-    """Cancel all active orders for a sell ladder bot."""
+    """Cancel all active orders for a sell ladder bot (as a command on the bot's market actor)."""
+    bot = get_sell_ladder_bot(bot_id, db)
+    if bot is not None and current_market() != market_key(bot.catchment, bot.unit_type):
+        return run_in_market(bot.catchment, bot.unit_type, lambda: cancel_sell_ladder_orders(bot_id, db))
+    
     bot_orders = db.query(SellLadderBotOrder).join(Order).filter(
         SellLadderBotOrder.bot_id == bot_id,
         Order.status.in_(["PENDING", "PARTIALLY_FILLED"])
@@ -666,6 +732,10 @@ def cancel_sell_ladder_orders(bot_id: int, db: Session):
     for bot_order in bot_orders:
         order = bot_order.order
         if order:
+            # PostgreSQL: wait for a fill in another API process to commit, and see it
+            lock_for_update(order, db)
+        if order and order.status in OPEN_ORDER_STATUSES:
+            release_order(order, order.remaining_quantity, db)
             order.status = "CANCELLED"
             order.updated_at = datetime.now(timezone.utc)
     
@@ -691,11 +761,7 @@ def replenish_filled_level(bot_id: int, price_level: int, db: Session):
     base_price_per_tonne = config.get('base_price_per_tonne', 100.0)
     
     # Check if this is a new market (same logic as place_sell_ladder_orders)
-    from ..models import Trade, Scheme
-    trade_count = db.query(Trade).join(Scheme).filter(
-        Scheme.catchment == bot.catchment,
-        Scheme.unit_type == bot.unit_type
-    ).count()
+    trade_count = get_market_state(bot.catchment, bot.unit_type, db).trade_count
     
     is_new_market = trade_count == 0
     
@@ -764,7 +830,7 @@ def replenish_filled_level(bot_id: int, price_level: int, db: Session):
         return
     
     # Create sell order at the new higher level
-    order_id = create_sell_ladder_limit_order(bot, price, credits_from_queue, db)
+    order_id = create_sell_ladder_limit_order(bot, price, credits_from_queue, db, fifo_queue_id=queue_id)
     
     if order_id:
         # Create bot order record at the new level
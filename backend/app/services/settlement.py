@@ -0,0 +1,495 @@
+"""
+On-chain settlement of exchange trades.
+
+Matching records each fill as a Trade in PENDING_SETTLEMENT together with a
+SettlementInstruction (outbox row) in the same commit. The settlement worker
+drains the outbox: it submits the ERC-1155 transfer, records the transaction
+hash, waits for the receipt and writes the final status back to the trade.
+Order placement therefore never waits on the chain.
+"""
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+from web3.exceptions import TimeExhausted
+from eth_account import Account as EthAccount
+import os
+
+from ..models import (
+    Account, AccountRole, Order, Scheme, Trade, SettlementInstruction,
+    SellLadderBotOrder, SellLadderFIFOCreditQueue, SellLadderBotAssignment,
+    BotOrder, FIFOCreditQueue, BotAssignment, BrokerMandate
+)
+from .exchange import submit_credit_transfer, submit_batch_credit_transfer
+from .nonce_manager import wait_for_receipts, resync_nonce
+from .balance_cache import invalidate_balances
+
+# Trade settlement statuses
+TRADE_PENDING_SETTLEMENT = "PENDING_SETTLEMENT"
+TRADE_SETTLED = "SETTLED"
+TRADE_SETTLEMENT_FAILED = "SETTLEMENT_FAILED"
+
+# Outbox statuses
+INSTRUCTION_PENDING = "PENDING"
+INSTRUCTION_SUBMITTED = "SUBMITTED"
+INSTRUCTION_SETTLED = "SETTLED"
+INSTRUCTION_FAILED = "FAILED"
+
+# Give up (and mark the trade SETTLEMENT_FAILED) after this many attempts
+MAX_SETTLEMENT_ATTEMPTS = 5
+
+# Hardhat default account #1 (trading account) private key
+# This is the standard Hardhat test account private key
+# Address: 0x70997970C51812dc3A010C7d01b50e0d17dc79C8
+# HARDCODED to prevent ERC1155MissingApprovalForAll errors
+HARDHAT_TRADING_ACCOUNT_PRIVATE_KEY = "0x59c6995e998f97a5a0044966f0945389dc9e86dae88c7a8412f4603b6b78690d"
+
+# Hardhat account #9 private key (0xa0Ee7A142d267C1f36714E4a8F75612F20a79720)
+# Default broker house account
+HARDHAT_ACCOUNT_9_PRIVATE_KEY = "0x4bbbf85ce3377467afe5d46f804f221813b2bb87f24d81f60f1fcdbf7cbf4356"
+
+
+def get_trading_account_address() -> str:
+    return os.getenv("TRADING_ACCOUNT_ADDRESS", "0x70997970C51812dc3A010C7d01b50e0d17dc79C8")
+
+
+def sell_ladder_queue_is_house(fifo_queue_id: Optional[int], db: Session) -> Optional[bool]:
+    """Whether a sell ladder FIFO queue entry holds house credits (None if unknown)."""
+    if not fifo_queue_id:
+        return None
+    fifo_queue = db.query(SellLadderFIFOCreditQueue).filter(
+        SellLadderFIFOCreditQueue.id == fifo_queue_id
+    ).first()
+
+    if fifo_queue and fifo_queue.assignment_id:
+        assignment = db.query(SellLadderBotAssignment).filter(
+            SellLadderBotAssignment.id == fifo_queue.assignment_id
+        ).first()
+
+        if assignment:
+            return assignment.is_house_account == 1
+    return None
+
+
+def market_making_bot_is_house(bot_id: int, scheme_id: int, db: Session) -> Optional[bool]:
+    """Whether a market-making bot's next credits in a scheme are house credits (None if unknown)."""
+    # Find the FIFO queue entry for this scheme
+    fifo_queue = db.query(FIFOCreditQueue).filter(
+        FIFOCreditQueue.bot_id == bot_id,
+        FIFOCreditQueue.scheme_id == scheme_id,
+        FIFOCreditQueue.credits_available > 0
+    ).order_by(
+        FIFOCreditQueue.queue_position.asc(),
+        FIFOCreditQueue.id.asc()
+    ).first()
+
+    if fifo_queue and fifo_queue.assignment_id:
+        assignment = db.query(BotAssignment).filter(
+            BotAssignment.id == fifo_queue.assignment_id
+        ).first()
+
+        if assignment:
+            return assignment.is_house_account == 1
+    return None
+
+
+def _is_house_bot_order(matching_order: Order, scheme: Scheme, db: Session) -> Optional[bool]:
+    """
+    Work out whether a broker's resting order sells house or client credits.
+    Returns None if the order is not a bot order (or the assignment cannot be found).
+    """
+    # Check for sell ladder bot order first
+    sell_ladder_order = db.query(SellLadderBotOrder).filter(SellLadderBotOrder.order_id == matching_order.id).first()
+
+    if sell_ladder_order and sell_ladder_order.fifo_queue_id:
+        is_house_account = sell_ladder_queue_is_house(sell_ladder_order.fifo_queue_id, db)
+        if is_house_account is not None:
+            return is_house_account
+
+    # Check for market-making bot order if not a sell ladder bot order
+    bot_order = db.query(BotOrder).filter(BotOrder.order_id == matching_order.id).first()
+
+    if bot_order:
+        return market_making_bot_is_house(bot_order.bot_id, scheme.id, db)
+
+    return None
+
+
+def seller_source(seller: Account, is_house_account: Optional[bool]) -> Tuple[str, str]:
+    """
+    Determine which wallet the credits leave from and which configured key signs.
+
+    - Landowners always sell from the trading account
+    - Brokers sell house credits from BROKER_HOUSE_ADDRESS and client credits from their own address
+    - Everyone else sells from their own address
+
+    Returns:
+        (source_address, signer)
+    """
+    trading_account_address = get_trading_account_address()
+
+    if seller.role == AccountRole.LANDOWNER:
+        print(f"[SETTLEMENT] Seller is a landowner, using trading account address: {trading_account_address}")
+        return trading_account_address, "TRADING_ACCOUNT"
+
+    if seller.role == AccountRole.BROKER:
+        if is_house_account:
+            # House account credits -> use house address
+            house_address = os.getenv("BROKER_HOUSE_ADDRESS")
+            if house_address:
+                print(f"[SETTLEMENT] Seller is broker (house account), using house address: {house_address}")
+                return house_address, "BROKER_HOUSE"
+            print(f"[SETTLEMENT] WARNING: BROKER_HOUSE_ADDRESS not set, using broker address")
+        elif is_house_account is False:
+            print(f"[SETTLEMENT] Seller is broker (client account), using broker address: {seller.evm_address}")
+        else:
+            print(f"[SETTLEMENT] Seller is broker (could not determine house/client), using broker address: {seller.evm_address}")
+        return seller.evm_address, "BROKER"
+
+    if seller.evm_address and seller.evm_address.lower() == trading_account_address.lower():
+        return seller.evm_address, "TRADING_ACCOUNT"
+
+    return seller.evm_address, "LANDOWNER"
+
+
+def resolve_seller_source(
+    seller: Account,
+    matching_order: Order,
+    scheme: Scheme,
+    db: Session
+) -> Tuple[str, str]:
+    """
+    seller_source for an order placed before funding was stored on orders: for a
+    broker, probe the bot tables for whether it sells house or client credits.
+
+    Returns:
+        (source_address, signer)
+    """
+    is_house_account = None
+    if seller.role == AccountRole.BROKER:
+        is_house_account = _is_house_bot_order(matching_order, scheme, db)
+    return seller_source(seller, is_house_account)
+
+
+def find_broker_mandate_id(broker_id: int, scheme_id: int, db: Session) -> Optional[int]:
+    """The broker's most recent unrecalled client mandate for a scheme (None for house sales)."""
+    mandate = db.query(BrokerMandate).filter(
+        BrokerMandate.broker_account_id == broker_id,
+        BrokerMandate.scheme_id == scheme_id,
+        BrokerMandate.is_recalled == 0
+    ).order_by(BrokerMandate.created_at.desc()).first()
+    return mandate.id if mandate else None
+
+
+def resolve_order_funding(order: Order, seller: Account, db: Session, is_house_account: Optional[bool] = None):
+    """
+    Resolve once, when a SELL order is created, which wallet its credits leave from,
+    which key signs the transfer and (for a broker) which client mandate it sells
+    under, and store them on the order so fills read them instead of probing.
+
+    Bots pass `is_house_account` from the FIFO queue the order sells from; for any
+    other order it is None, which is what resolve_seller_source finds for an order
+    that is not a bot order.
+    """
+    if order.side != "SELL":
+        return
+    order.source_address, order.funding_source = seller_source(seller, is_house_account)
+    order.mandate_id = None
+    if seller.role == AccountRole.BROKER and order.scheme_id is not None:
+        order.mandate_id = find_broker_mandate_id(seller.id, order.scheme_id, db)
+
+
+def order_funding(seller_order: Order, seller: Account, scheme: Scheme, db: Session) -> Tuple[str, str, Optional[int]]:
+    """
+    Source address, signer and mandate id for a fill of `seller_order`: as stored on
+    the order, or worked out now for orders created before they were stored.
+
+    Returns:
+        (source_address, signer, mandate_id)
+    """
+    if seller_order.funding_source and seller_order.source_address:
+        return seller_order.source_address, seller_order.funding_source, seller_order.mandate_id
+
+    source_address, signer = resolve_seller_source(seller, seller_order, scheme, db)
+    mandate_id = None
+    if seller.role == AccountRole.BROKER:
+        mandate_id = find_broker_mandate_id(seller.id, scheme.id, db)
+    return source_address, signer, mandate_id
+
+
+def get_signer_private_key(signer: str) -> Optional[str]:
+    """
+    Resolve the private key for a signer name.
+    CRITICAL: The key must match the source address to avoid ERC1155MissingApprovalForAll errors.
+    """
+    if signer == "TRADING_ACCOUNT":
+        # Fallback: Hardhat account #1 private key (default trading account)
+        return os.getenv("TRADING_ACCOUNT_PRIVATE_KEY") or HARDHAT_TRADING_ACCOUNT_PRIVATE_KEY
+    if signer == "BROKER_HOUSE":
+        return os.getenv("BROKER_HOUSE_PRIVATE_KEY") or HARDHAT_ACCOUNT_9_PRIVATE_KEY
+    if signer == "BROKER":
+        return os.getenv("BROKER_PRIVATE_KEY") or os.getenv("REGULATOR_PRIVATE_KEY")
+    # Transferring FROM landowner/regulator - use their private key
+    return os.getenv("LANDOWNER_PRIVATE_KEY") or os.getenv("REGULATOR_PRIVATE_KEY")
+
+
+def enqueue_settlement(
+    trade: Trade,
+    from_address: str,
+    to_address: str,
+    nft_token_id: int,
+    quantity_units: int,
+    signer: str,
+    db: Session
+) -> SettlementInstruction:
+    """
+    Add an outbox row for a trade. The caller commits it together with the trade,
+    so a trade can never exist without its settlement instruction.
+    """
+    trade.status = TRADE_PENDING_SETTLEMENT
+    instruction = SettlementInstruction(
+        trade=trade,
+        from_address=from_address,
+        to_address=to_address,
+        nft_token_id=nft_token_id,
+        quantity_units=quantity_units,
+        signer=signer,
+        status=INSTRUCTION_PENDING,
+        attempts=0
+    )
+    db.add(instruction)
+    return instruction
+
+
+def _finish(instruction: SettlementInstruction, tx_hash: Optional[str]):
+    invalidate_balances([instruction.from_address, instruction.to_address], [instruction.nft_token_id])
+    instruction.status = INSTRUCTION_SETTLED
+    instruction.transaction_hash = tx_hash
+    instruction.last_error = None
+    if instruction.trade:
+        instruction.trade.transaction_hash = tx_hash
+        instruction.trade.status = TRADE_SETTLED
+
+
+def _record_failure(instruction: SettlementInstruction, error: Exception):
+    instruction.attempts = (instruction.attempts or 0) + 1
+    instruction.last_error = str(error)[:500]
+    # A failed or dropped transaction is resubmitted from scratch
+    instruction.transaction_hash = None
+    if instruction.attempts >= MAX_SETTLEMENT_ATTEMPTS:
+        instruction.status = INSTRUCTION_FAILED
+        if instruction.trade:
+            instruction.trade.status = TRADE_SETTLEMENT_FAILED
+        print(f"[SETTLEMENT] Trade {instruction.trade_id} FAILED after {instruction.attempts} attempts: {error}")
+    else:
+        instruction.status = INSTRUCTION_PENDING
+        print(f"[SETTLEMENT] Trade {instruction.trade_id} attempt {instruction.attempts} failed, will retry: {error}")
+
+
+@dataclass
+class SettlementBatch:
+    """
+    Net transfer between one (from, to) pair: quantities per scheme token and the
+    outbox rows it settles. A batch with no quantities settles its rows by netting alone.
+    """
+    from_address: str
+    to_address: str
+    signer: str
+    quantities: Dict[int, int] = field(default_factory=dict)
+    instructions: List[SettlementInstruction] = field(default_factory=list)
+
+
+def build_settlement_batches(instructions: List[SettlementInstruction]) -> List[SettlementBatch]:
+    """
+    Group pending instructions by wallet pair and net opposing fills per scheme token.
+
+    Fills A->B and B->A for the same token cancel out, so only the net quantity
+    moves, in one transfer per direction. Every instruction ends up in exactly one
+    batch so it can be mapped back to the transaction that settles it.
+    """
+    pairs: Dict[Tuple[str, str], List[SettlementInstruction]] = {}
+    for instruction in instructions:
+        key = tuple(sorted((instruction.from_address.lower(), instruction.to_address.lower())))
+        pairs.setdefault(key, []).append(instruction)
+
+    batches: List[SettlementBatch] = []
+    for (first, second), pair_instructions in pairs.items():
+        # Net quantity per token, positive meaning first -> second
+        net: Dict[int, int] = {}
+        for instruction in pair_instructions:
+            sign = 1 if instruction.from_address.lower() == first else -1
+            net[instruction.nft_token_id] = net.get(instruction.nft_token_id, 0) + sign * instruction.quantity_units
+
+        directions: Dict[str, SettlementBatch] = {}
+        netted = None
+        for instruction in pair_instructions:
+            token_net = net[instruction.nft_token_id]
+            if token_net == 0:
+                if netted is None:
+                    netted = SettlementBatch(instruction.from_address, instruction.to_address, instruction.signer)
+                netted.instructions.append(instruction)
+                continue
+
+            source = first if token_net > 0 else second
+            batch = directions.get(source)
+            if batch is None:
+                batch = SettlementBatch(
+                    from_address=instruction.from_address if instruction.from_address.lower() == source else instruction.to_address,
+                    to_address=instruction.to_address if instruction.from_address.lower() == source else instruction.from_address,
+                    signer=instruction.signer
+                )
+                directions[source] = batch
+            if instruction.from_address.lower() == source:
+                # The net transfer is signed with the key of a fill in its own direction
+                batch.signer = instruction.signer
+            batch.quantities[instruction.nft_token_id] = abs(token_net)
+            batch.instructions.append(instruction)
+
+        batches.extend(directions.values())
+        if netted is not None:
+            batches.append(netted)
+
+    return batches
+
+
+def submit_batch(
+    batch: SettlementBatch,
+    db: Session,
+    scheme_credits_address: str,
+    rpc_url: str
+) -> bool:
+    """
+    Sign and send the transfer for one batch without waiting for it.
+    A single token uses safeTransferFrom, several use safeBatchTransferFrom; every
+    instruction in the batch records the same transaction hash. The hash is
+    committed straight away so a restart resumes waiting on the same transaction
+    instead of sending a second transfer.
+    """
+    if not batch.quantities:
+        for instruction in batch.instructions:
+            _finish(instruction, None)
+        db.commit()
+        print(f"[SETTLEMENT] Trades {[i.trade_id for i in batch.instructions]} netted out, no transfer needed")
+        return True
+
+    trade_ids = [i.trade_id for i in batch.instructions]
+    try:
+        private_key = get_signer_private_key(batch.signer)
+        if not private_key:
+            raise ValueError(f"No private key configured for signer {batch.signer}")
+
+        scheme_ids = sorted(batch.quantities)
+        quantities = [batch.quantities[scheme_id] for scheme_id in scheme_ids]
+        print(f"[SETTLEMENT] Submitting trades {trade_ids}: tokens {scheme_ids} quantities {quantities} from {batch.from_address} to {batch.to_address}")
+
+        if len(scheme_ids) == 1:
+            tx_hash = submit_credit_transfer(
+                seller_address=batch.from_address,
+                buyer_address=batch.to_address,
+                scheme_id=scheme_ids[0],
+                quantity_credits=quantities[0],
+                seller_private_key=private_key,
+                scheme_credits_address=scheme_credits_address,
+                rpc_url=rpc_url
+            )
+        else:
+            tx_hash = submit_batch_credit_transfer(
+                seller_address=batch.from_address,
+                buyer_address=batch.to_address,
+                scheme_ids=scheme_ids,
+                quantities=quantities,
+                seller_private_key=private_key,
+                scheme_credits_address=scheme_credits_address,
+                rpc_url=rpc_url
+            )
+
+        for instruction in batch.instructions:
+            instruction.status = INSTRUCTION_SUBMITTED
+            instruction.transaction_hash = tx_hash
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        for instruction in batch.instructions:
+            _record_failure(instruction, e)
+        db.commit()
+        return False
+
+
+def confirm_instructions(
+    instructions: List[SettlementInstruction],
+    db: Session,
+    rpc_url: str,
+    timeout: int = 120
+) -> int:
+    """
+    Wait for the receipts of all SUBMITTED instructions together and write back the outcome.
+    A transaction the node no longer knows about resyncs its signer's nonce and is retried.
+
+    Returns:
+        Number of trades settled
+    """
+    submitted = [i for i in instructions if i.status == INSTRUCTION_SUBMITTED and i.transaction_hash]
+    if not submitted:
+        return 0
+
+    # Batched instructions share a transaction hash; wait for each transaction once
+    tx_hashes = list(dict.fromkeys(i.transaction_hash for i in submitted))
+    receipts = wait_for_receipts(tx_hashes, rpc_url, timeout)
+
+    settled = 0
+    for instruction in submitted:
+        result = receipts.get(instruction.transaction_hash)
+        if isinstance(result, TimeExhausted):
+            # Still in the mempool - keep the hash and wait again on the next pass
+            print(f"[SETTLEMENT] Trade {instruction.trade_id} still pending on-chain (tx_hash: {instruction.transaction_hash})")
+            continue
+        if isinstance(result, Exception):
+            private_key = get_signer_private_key(instruction.signer)
+            if private_key:
+                resync_nonce(EthAccount.from_key(private_key).address, rpc_url)
+            _record_failure(instruction, result)
+        elif result.status != 1:
+            _record_failure(instruction, ValueError("Transaction failed"))
+        else:
+            _finish(instruction, instruction.transaction_hash)
+            settled += 1
+            print(f"[SETTLEMENT] Trade {instruction.trade_id} settled, tx_hash: {instruction.transaction_hash}")
+
+    db.commit()
+    return settled
+
+
+def get_pending_instructions(db: Session, limit: int = 50) -> List[SettlementInstruction]:
+    """Oldest unsettled outbox rows first."""
+    return db.query(SettlementInstruction).filter(
+        SettlementInstruction.status.in_([INSTRUCTION_PENDING, INSTRUCTION_SUBMITTED])
+    ).order_by(SettlementInstruction.id.asc()).limit(limit).all()
+
+
+def settle_pending_trades(db: Session, limit: int = 50) -> int:
+    """
+    Drain up to `limit` outbox rows: net and group PENDING fills into one transfer per
+    wallet pair and direction, submit them all (nonces are allocated locally, so they
+    are all in flight at once), then confirm the receipts together.
+
+    Returns:
+        Number of trades settled
+    """
+    scheme_credits_address = os.getenv("SCHEME_CREDITS_CONTRACT_ADDRESS")
+    rpc_url = os.getenv("RPC_URL", "http://127.0.0.1:8545")
+
+    if not scheme_credits_address:
+        # Leave rows pending; they settle once the chain is configured
+        return 0
+
+    instructions = get_pending_instructions(db, limit)
+    to_submit = [
+        i for i in instructions
+        if i.status == INSTRUCTION_PENDING or not i.transaction_hash
+    ]
+    settled = 0
+    for batch in build_settlement_batches(to_submit):
+        if submit_batch(batch, db, scheme_credits_address, rpc_url) and not batch.quantities:
+            settled += len(batch.instructions)
+
+    return settled + confirm_instructions(instructions, db, rpc_url)
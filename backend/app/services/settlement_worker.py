@@ -0,0 +1,107 @@
+import threading
+from typing import Optional
+from sqlalchemy.orm import Session
+from ..db import SessionLocal
+from .settlement import settle_pending_trades
+
+
+class SettlementWorker:
+    """Background worker that drains the settlement outbox and submits on-chain transfers."""
+
+    def __init__(self, interval_seconds: int = 5, batch_size: int = 50, batch_window_seconds: float = 0.5):
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        # After a wake-up, wait this long so fills from the same sweep are netted into one batch
+        self.batch_window_seconds = batch_window_seconds
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def start(self):
+        """Start the settlement worker thread."""
+        if self.running:
+            return
+
+        self.running = True
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print(f"Settlement worker started (interval: {self.interval_seconds}s)")
+
+    def stop(self):
+        """Stop the settlement worker thread."""
+        if not self.running:
+            return
+
+        self.running = False
+        self._stop_event.set()
+        self._wake_event.set()
+
+        if self.thread:
+            self.thread.join(timeout=5.0)
+
+        print("Settlement worker stopped")
+
+    def notify(self):
+        """Wake the worker early (called after matching records new trades)."""
+        self._wake_event.set()
+
+    def _run(self):
+        """Main worker loop."""
+        while self.running and not self._stop_event.is_set():
+            self._wake_event.clear()
+            try:
+                # Keep draining while full batches come back
+                while self.running and self._run_settlement_cycle() >= self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"Error in settlement worker cycle: {str(e)}")
+
+            # Wait for interval, a new trade, or stop event
+            if self._wake_event.wait(self.interval_seconds) and self.batch_window_seconds:
+                self._stop_event.wait(self.batch_window_seconds)
+
+    def _run_settlement_cycle(self) -> int:
+        """Settle one batch of pending trades."""
+        db: Session = SessionLocal()
+        try:
+            return settle_pending_trades(db, limit=self.batch_size)
+        finally:
+            db.close()
+
+    def run_cycle_once(self) -> int:
+        """Manually run one cycle (for testing)."""
+        return self._run_settlement_cycle()
+
+
+# Global worker instance
+_worker: Optional[SettlementWorker] = None
+
+
+def get_settlement_worker(interval_seconds: int = 5) -> SettlementWorker:
+    """Get or create the global settlement worker instance."""
+    global _worker
+    if _worker is None:
+        _worker = SettlementWorker(interval_seconds=interval_seconds)
+    return _worker
+
+
+def start_settlement_worker(interval_seconds: int = 5):
+    """Start the global settlement worker."""
+    worker = get_settlement_worker(interval_seconds)
+    worker.start()
+
+
+def stop_settlement_worker():
+    """Stop the global settlement worker."""
+    global _worker
+    if _worker:
+        _worker.stop()
+        _worker = None
+
+
+def notify_settlement_worker():
+    """Wake the settlement worker if it is running."""
+    if _worker:
+        _worker.notify()
@@ -0,0 +1,172 @@
+"""
+Elects the API process that runs each single-instance background worker.
+
+The settlement worker, bot worker and chain indexer keep process-local state
+(signer nonces, queued refreshes, the last indexed block) and must run in one
+process only. Each is registered here with the functions that start and stop
+it, and runs in the process holding its worker lock (see services.market_lock).
+
+On SQLite there is one process and the lock is always granted. On PostgreSQL a
+lock taken once at startup is not enough: the process holding it may exit, or
+its lock connection may be closed or reset, which silently drops the lock. So
+every `interval_seconds` the election thread:
+
+- in the process running a worker, checks the lock is still held and stops the
+  worker if it is not;
+- in the other processes, retries the lock. A process that gets it starts the
+  worker one interval later, by which time a previous holder that lost its
+  connection has noticed and stopped.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.engine import Engine
+
+from ..db import engine as default_engine, is_postgresql
+from .market_lock import acquire_worker_lock, holding_worker_lock, release_worker_lock
+
+
+@dataclass
+class ElectedWorker:
+    name: str
+    start: Callable[[], None]
+    stop: Callable[[], None]
+    running: bool = False
+    # Lock taken by the election thread; the worker starts on the next cycle
+    pending: bool = False
+
+
+class WorkerElection:
+    """Runs each registered worker in the process that holds its worker lock."""
+
+    def __init__(self, interval_seconds: int = 5, bind: Optional[Engine] = None):
+        self.interval_seconds = interval_seconds
+        self.bind = bind or default_engine
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self._stop_event = threading.Event()
+        self._lock = threading.RLock()
+        self._workers: Dict[str, ElectedWorker] = {}
+
+    def register(self, name: str, start: Callable[[], None], stop: Callable[[], None]) -> bool:
+        """
+        Register a worker and start it now if this process gets its lock.
+
+        Returns:
+            Whether the worker is running in this process
+        """
+        with self._lock:
+            worker = ElectedWorker(name, start, stop)
+            self._workers[name] = worker
+            if acquire_worker_lock(name, self.bind):
+                self._start_worker(worker)
+            return worker.running
+
+    def resign(self, name: str):
+        """Stop a worker if it runs here and release its lock to another process."""
+        with self._lock:
+            worker = self._workers.pop(name, None)
+            if worker is not None and worker.running:
+                worker.running = False
+                worker.stop()
+        release_worker_lock(name)
+
+    def is_running(self, name: str) -> bool:
+        with self._lock:
+            worker = self._workers.get(name)
+            return worker is not None and worker.running
+
+    def _start_worker(self, worker: ElectedWorker):
+        try:
+            worker.start()
+        except Exception:
+            release_worker_lock(worker.name)
+            raise
+        worker.running = True
+
+    def _elect(self, worker: ElectedWorker):
+        if worker.pending:
+            worker.pending = False
+            if holding_worker_lock(worker.name, self.bind):
+                self._start_worker(worker)
+                print(f"[WORKER_ELECTION] Took over {worker.name}")
+            return
+
+        if worker.running:
+            if holding_worker_lock(worker.name, self.bind):
+                return
+            print(f"[WORKER_ELECTION] Lost the {worker.name} lock; stopping it in this process")
+            worker.running = False
+            worker.stop()
+
+        if acquire_worker_lock(worker.name, self.bind):
+            worker.pending = True
+
+    def run_cycle_once(self):
+        """Check or retry every registered worker's lock once (for testing)."""
+        with self._lock:
+            for worker in list(self._workers.values()):
+                try:
+                    self._elect(worker)
+                except Exception as e:
+                    print(f"[WORKER_ELECTION] Error electing {worker.name}: {str(e)}")
+
+    def start(self):
+        """Start the election thread (only needed on PostgreSQL)."""
+        if self.running or not is_postgresql(self.bind):
+            return
+
+        self.running = True
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print(f"Worker election started (interval: {self.interval_seconds}s)")
+
+    def stop(self):
+        """Stop the election thread; registered workers keep running until resigned."""
+        if not self.running:
+            return
+
+        self.running = False
+        self._stop_event.set()
+
+        if self.thread:
+            self.thread.join(timeout=5.0)
+        print("Worker election stopped")
+
+    def _run(self):
+        """Main loop."""
+        while self.running and not self._stop_event.wait(self.interval_seconds):
+            self.run_cycle_once()
+
+
+# Global election instance
+_election: Optional[WorkerElection] = None
+
+
+def get_worker_election(interval_seconds: int = 5) -> WorkerElection:
+    """Get or create the global worker election."""
+    global _election
+    if _election is None:
+        _election = WorkerElection(interval_seconds=interval_seconds)
+    return _election
+
+
+def elect_worker(name: str, start: Callable[[], None], stop: Callable[[], None]) -> bool:
+    """Run worker `name` in whichever API process holds its lock; True if that is this process now."""
+    election = get_worker_election()
+    election.start()
+    return election.register(name, start, stop)
+
+
+def resign_worker(name: str):
+    """Stop worker `name` in this process and let another process take it over."""
+    if _election is not None:
+        _election.resign(name)
+
+
+def stop_worker_election():
+    """Stop the global election thread (workers are stopped by resign_worker)."""
+    if _election:
+        _election.stop()
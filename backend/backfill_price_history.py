@@ -0,0 +1,57 @@
+"""
+Backfill script for OHLCV price history.
+
+Creates the price_history series index if it is missing, then rebuilds every
+candle from the trades table: 1-minute candles are aggregated from trades and
+the 5min/15min/1hr/4hr/1day candles are rolled up from them. Safe to re-run at
+any time; existing price_history rows are replaced.
+
+Usage:
+    python backfill_price_history.py
+"""
+from sqlalchemy import inspect
+import os
+import sys
+
+# Adjust path to import from parent directory
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from app.db import engine, SessionLocal
+from app.models import PriceHistory
+from app.services.price_history import rebuild_price_history
+
+
+def run_migration():
+    """Create the price_history table and series index if they don't exist."""
+    print(f"Connecting to database: {engine.url}")
+
+    inspector = inspect(engine)
+    if 'price_history' not in inspector.get_table_names():
+        PriceHistory.__table__.create(engine, checkfirst=True)
+        print("[OK] Created table: price_history")
+        return
+
+    existing_indexes = {index["name"] for index in inspector.get_indexes('price_history')}
+    for index in PriceHistory.__table__.indexes:
+        if index.name in existing_indexes:
+            print(f"[SKIP] Index {index.name} already exists")
+            continue
+        try:
+            index.create(engine, checkfirst=True)
+            print(f"[OK] Created index: {index.name}")
+        except Exception as e:
+            print(f"[ERROR] Failed to create index {index.name}: {str(e)}")
+
+
+def backfill():
+    """Rebuild every candle from trades."""
+    db = SessionLocal()
+    try:
+        count = rebuild_price_history(db)
+        print(f"[OK] Rebuilt {count} candles from trades")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    run_migration()
+    backfill()
@@ -0,0 +1,45 @@
+"""
+Migration script for the account cash ledger.
+
+Creates the account_balances table and rebuilds every row from the trades
+table and open BUY orders. Safe to re-run at any time to recompute the ledger.
+
+Usage:
+    python migrate_account_balances.py
+"""
+from sqlalchemy import inspect
+import os
+import sys
+
+# Adjust path to import from parent directory
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from app.db import engine, SessionLocal
+from app.models import AccountBalance
+from app.services.balance_check import rebuild_account_balances
+
+
+def run_migration():
+    """Create the account_balances table if it doesn't exist."""
+    print(f"Connecting to database: {engine.url}")
+
+    if 'account_balances' in inspect(engine).get_table_names():
+        print("[SKIP] Table account_balances already exists")
+    else:
+        print("Creating table: account_balances")
+        AccountBalance.__table__.create(engine, checkfirst=True)
+        print("[OK] Created table: account_balances")
+
+
+def rebuild():
+    """Recompute every ledger row from trades."""
+    db = SessionLocal()
+    try:
+        count = rebuild_account_balances(db)
+        print(f"[OK] Rebuilt balances for {count} accounts")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    run_migration()
+    rebuild()
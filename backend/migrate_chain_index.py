@@ -0,0 +1,68 @@
+"""
+Migration script for the chain event indexer.
+
+Creates the checkpoint, block hash, balance, delta and SchemeNFT owner tables.
+Pass --replay-from BLOCK to discard indexed state from that block onwards; the
+indexer re-indexes it on its next cycles.
+
+Usage:
+    python migrate_chain_index.py
+    python migrate_chain_index.py --replay-from 0
+"""
+from sqlalchemy import inspect
+import argparse
+import os
+import sys
+
+# Adjust path to import from parent directory
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from app.db import engine, SessionLocal
+from app.models import ChainCursor, IndexedBlock, CreditBalance, CreditBalanceDelta, SchemeNFTOwner
+from app.services.chain_indexer import replay_from_block
+
+
+def run_migration():
+    """Create chain index tables if they don't exist."""
+    print(f"Connecting to database: {engine.url}")
+
+    inspector = inspect(engine)
+    existing_tables = inspector.get_table_names()
+
+    tables_to_create = [
+        ('chain_cursors', ChainCursor),
+        ('indexed_blocks', IndexedBlock),
+        ('credit_balances', CreditBalance),
+        ('credit_balance_deltas', CreditBalanceDelta),
+        ('scheme_nft_owners', SchemeNFTOwner)
+    ]
+
+    for table_name, model_class in tables_to_create:
+        if table_name in existing_tables:
+            print(f"[SKIP] Table {table_name} already exists")
+        else:
+            print(f"Creating table: {table_name}")
+            try:
+                model_class.__table__.create(engine, checkfirst=True)
+                print(f"[OK] Created table: {table_name}")
+            except Exception as e:
+                print(f"[ERROR] Failed to create table {table_name}: {str(e)}")
+
+
+def replay(block_number: int):
+    """Roll indexed state back so the indexer replays from block_number."""
+    db = SessionLocal()
+    try:
+        replay_from_block(db, block_number)
+        print(f"[OK] Indexer will replay from block {block_number}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replay-from", type=int, default=None, help="Block to re-index from")
+    args = parser.parse_args()
+
+    run_migration()
+    if args.replay_from is not None:
+        replay(args.replay_from)
@@ -0,0 +1,45 @@
+"""
+Migration script for credit reservation counters.
+
+Creates the credit_reservations table and rebuilds every counter from ACTIVE
+listings and open SELL orders. Safe to re-run at any time to recompute them.
+
+Usage:
+    python migrate_credit_reservations.py
+"""
+from sqlalchemy import inspect
+import os
+import sys
+
+# Adjust path to import from parent directory
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from app.db import engine, SessionLocal
+from app.models import CreditReservation
+from app.services.reservations import rebuild_credit_reservations
+
+
+def run_migration():
+    """Create the credit_reservations table if it doesn't exist."""
+    print(f"Connecting to database: {engine.url}")
+
+    if 'credit_reservations' in inspect(engine).get_table_names():
+        print("[SKIP] Table credit_reservations already exists")
+    else:
+        print("Creating table: credit_reservations")
+        CreditReservation.__table__.create(engine, checkfirst=True)
+        print("[OK] Created table: credit_reservations")
+
+
+def rebuild():
+    """Recompute every counter from listings and open orders."""
+    db = SessionLocal()
+    try:
+        count = rebuild_credit_reservations(db)
+        print(f"[OK] Rebuilt {count} reservation counters")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    run_migration()
+    rebuild()
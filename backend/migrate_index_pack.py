@@ -0,0 +1,51 @@
+"""
+Migration script for the exchange index pack.
+
+Creates the composite and partial indexes declared in models.py for the hot
+exchange queries (order matching and book loads, open/completed orders, trades,
+best bid/ask, listings and bot FIFO queues) on an existing database.
+tests/test_query_plans.py checks that those queries use them.
+
+Usage:
+    python migrate_index_pack.py
+"""
+from sqlalchemy import inspect
+import os
+import sys
+
+# Adjust path to import from parent directory
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from app.db import engine
+from app.models import (
+    Scheme, ExchangeListing, Trade, Order, FIFOCreditQueue, BotOrder,
+    SellLadderFIFOCreditQueue, SellLadderBotOrder
+)
+
+
+def run_migration():
+    """Create any missing indexes on the exchange tables."""
+    print(f"Connecting to database: {engine.url}")
+
+    inspector = inspect(engine)
+    existing_tables = inspector.get_table_names()
+
+    for model_class in (Scheme, ExchangeListing, Trade, Order, FIFOCreditQueue, BotOrder, SellLadderFIFOCreditQueue, SellLadderBotOrder):
+        table = model_class.__table__
+        if table.name not in existing_tables:
+            print(f"[SKIP] Table {table.name} does not exist")
+            continue
+
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name in existing_indexes:
+                print(f"[SKIP] Index {index.name} already exists")
+                continue
+            try:
+                index.create(engine, checkfirst=True)
+                print(f"[OK] Created index: {index.name}")
+            except Exception as e:
+                print(f"[ERROR] Failed to create index {index.name}: {str(e)}")
+
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,62 @@
+"""
+Migration script for keyset pagination indexes.
+
+/exchange/trades, /exchange/orders/completed and /landowner/notifications page
+through history by (created_at, id). This creates the indexes declared in
+models.py that end in those columns, and drops the (..., created_at) indexes
+they replace.
+
+Usage:
+    python migrate_keyset_indexes.py
+"""
+from sqlalchemy import inspect, text
+import os
+import sys
+
+# Adjust path to import from parent directory
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from app.db import engine
+from app.models import Notification, Order, Trade
+
+# Superseded by ix_trades_buyer_created_id, ix_trades_seller_created_id and
+# ix_orders_account_status_created_id
+REPLACED_INDEXES = {
+    "trades": ["ix_trades_buyer_created", "ix_trades_seller_created"],
+    "orders": ["ix_orders_account_status_created"],
+}
+
+
+def run_migration():
+    """Create the keyset indexes, then drop the indexes they replace."""
+    print(f"Connecting to database: {engine.url}")
+
+    inspector = inspect(engine)
+    existing_tables = inspector.get_table_names()
+
+    for model_class in (Trade, Order, Notification):
+        table = model_class.__table__
+        if table.name not in existing_tables:
+            print(f"[SKIP] Table {table.name} does not exist")
+            continue
+
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name in existing_indexes:
+                print(f"[SKIP] Index {index.name} already exists")
+                continue
+            try:
+                index.create(engine, checkfirst=True)
+                print(f"[OK] Created index: {index.name}")
+            except Exception as e:
+                print(f"[ERROR] Failed to create index {index.name}: {str(e)}")
+
+        for name in REPLACED_INDEXES.get(table.name, []):
+            if name not in existing_indexes:
+                continue
+            with engine.begin() as connection:
+                connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            print(f"[OK] Dropped replaced index: {name}")
+
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,78 @@
+"""
+Migration script to store each SELL order's funding source on the order.
+
+Adds funding_source, source_address and mandate_id columns to the orders table,
+then resolves them for open SELL orders the same way fills used to (probing the
+bot tables and broker mandates), so resting orders stop being probed per fill.
+Orders that are left unresolved are still resolved at fill time.
+
+Usage:
+    python migrate_order_funding.py
+"""
+import sqlite3
+import os
+import sys
+
+# Adjust path to import from parent directory
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from app.db import SessionLocal
+from app.models import Account, Order, Scheme
+from app.services.settlement import order_funding
+
+COLUMNS = (
+    ("funding_source", "VARCHAR"),
+    ("source_address", "VARCHAR"),
+    ("mandate_id", "INTEGER REFERENCES broker_mandates(id)"),
+)
+
+
+def migrate():
+    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'offsetx.db')
+
+    print(f"Connecting to database: {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA table_info(orders)")
+    columns = [col[1] for col in cursor.fetchall()]
+
+    for name, column_type in COLUMNS:
+        if name in columns:
+            print(f"[SKIP] Column '{name}' already exists in orders table")
+        else:
+            cursor.execute(f"ALTER TABLE orders ADD COLUMN {name} {column_type}")
+            print(f"[OK] Added column '{name}' to orders table")
+    conn.commit()
+    conn.close()
+
+
+def backfill():
+    """Resolve funding for open SELL orders that do not have it yet."""
+    db = SessionLocal()
+    try:
+        orders = db.query(Order).filter(
+            Order.side == "SELL",
+            Order.status.in_(["PENDING", "PARTIALLY_FILLED"]),
+            Order.funding_source.is_(None)
+        ).all()
+        print(f"Found {len(orders)} open SELL orders without a funding source")
+
+        updated = 0
+        for order in orders:
+            seller = db.get(Account, order.account_id)
+            scheme = db.get(Scheme, order.scheme_id) if order.scheme_id else None
+            if not seller or not scheme:
+                print(f"  [SKIP] Order #{order.id}: seller or scheme not found")
+                continue
+            order.source_address, order.funding_source, order.mandate_id = order_funding(order, seller, scheme, db)
+            updated += 1
+
+        db.commit()
+        print(f"[OK] Resolved funding for {updated} orders")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    migrate()
+    backfill()
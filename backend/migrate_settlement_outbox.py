@@ -0,0 +1,60 @@
+"""
+Migration script for asynchronous trade settlement.
+
+Adds a status column to the trades table (existing trades were settled
+synchronously, so they are marked SETTLED) and creates the settlement_outbox
+table drained by the settlement worker.
+"""
+import sqlite3
+import os
+
+
+def migrate():
+    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'offsetx.db')
+
+    print(f"Connecting to database: {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # Step 1: Add status column to trades
+    cursor.execute("PRAGMA table_info(trades)")
+    columns = [col[1] for col in cursor.fetchall()]
+
+    if 'status' in columns:
+        print("Column 'status' already exists in trades table")
+    else:
+        print("Adding 'status' column to trades table...")
+        cursor.execute("ALTER TABLE trades ADD COLUMN status VARCHAR")
+        cursor.execute("UPDATE trades SET status = 'SETTLED' WHERE status IS NULL")
+        conn.commit()
+        print("Column added and existing trades marked SETTLED")
+
+    # Step 2: Create settlement_outbox table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS settlement_outbox (
+            id INTEGER NOT NULL PRIMARY KEY,
+            trade_id INTEGER NOT NULL REFERENCES trades(id),
+            from_address VARCHAR NOT NULL,
+            to_address VARCHAR NOT NULL,
+            nft_token_id INTEGER NOT NULL,
+            quantity_units INTEGER NOT NULL,
+            signer VARCHAR NOT NULL,
+            status VARCHAR,
+            attempts INTEGER,
+            last_error VARCHAR,
+            transaction_hash VARCHAR,
+            created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+            updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_settlement_outbox_id ON settlement_outbox (id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_settlement_outbox_trade_id ON settlement_outbox (trade_id)")
+    conn.commit()
+    print("Table 'settlement_outbox' ready")
+
+    conn.close()
+    print("\nMigration complete!")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,101 @@
+"""
+Migration script to link trades to the buy and sell orders they filled.
+
+Adds buy_order_id and sell_order_id columns (and their indexes) to the trades
+table. match_order fills them in for new trades. Existing order-book trades are
+backfilled with the closest matching order on each side:
+
+- the same account and side, in the trade's market;
+- at least partly filled, and created no later than the trade;
+- preferring the trade's scheme and price, then the order last updated nearest
+  the trade time.
+
+Listing purchases have no orders and keep NULL links.
+
+Usage:
+    python migrate_trade_order_links.py
+"""
+import sqlite3
+import os
+
+CANDIDATE_ORDER_SQL = """
+    SELECT o.id
+    FROM orders o
+    WHERE o.account_id = ? AND o.side = ?
+      AND o.catchment = UPPER(?) AND o.unit_type = LOWER(?)
+      AND o.filled_quantity > 0
+      AND (o.created_at IS NULL OR ? IS NULL OR o.created_at <= ?)
+    ORDER BY
+      (o.scheme_id = ?) DESC,
+      (o.price_per_unit = ?) DESC,
+      ABS(julianday(o.updated_at) - julianday(?)) ASC,
+      o.id DESC
+    LIMIT 1
+"""
+
+
+def migrate():
+    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'offsetx.db')
+
+    print(f"Connecting to database: {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    # Step 1: Add the columns and indexes
+    cursor.execute("PRAGMA table_info(trades)")
+    columns = [col[1] for col in cursor.fetchall()]
+
+    for name in ("buy_order_id", "sell_order_id"):
+        if name in columns:
+            print(f"[SKIP] Column '{name}' already exists in trades table")
+        else:
+            cursor.execute(f"ALTER TABLE trades ADD COLUMN {name} INTEGER REFERENCES orders(id)")
+            print(f"[OK] Added column '{name}' to trades table")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_trades_{name} ON trades ({name})")
+    conn.commit()
+
+    # Step 2: Backfill existing order-book trades
+    print("\nBackfilling order links for existing trades...")
+    cursor.execute("""
+        SELECT t.id, t.buyer_account_id, t.seller_account_id, t.scheme_id, t.price_per_unit,
+               t.created_at, s.catchment, s.unit_type, t.buy_order_id, t.sell_order_id
+        FROM trades t
+        JOIN schemes s ON s.id = t.scheme_id
+        WHERE t.listing_id IS NULL AND (t.buy_order_id IS NULL OR t.sell_order_id IS NULL)
+    """)
+    trades = cursor.fetchall()
+    print(f"Found {len(trades)} trades without order links")
+
+    linked = 0
+    for (trade_id, buyer_id, seller_id, scheme_id, price, created_at,
+         catchment, unit_type, buy_order_id, sell_order_id) in trades:
+        links = {}
+        for column, current, account_id, side in (
+            ("buy_order_id", buy_order_id, buyer_id, "BUY"),
+            ("sell_order_id", sell_order_id, seller_id, "SELL"),
+        ):
+            if current is not None:
+                continue
+            cursor.execute(CANDIDATE_ORDER_SQL, (
+                account_id, side, catchment, unit_type, created_at, created_at, scheme_id, price, created_at
+            ))
+            row = cursor.fetchone()
+            if row:
+                links[column] = row[0]
+
+        if links:
+            assignments = ", ".join(f"{column} = ?" for column in links)
+            cursor.execute(f"UPDATE trades SET {assignments} WHERE id = ?", (*links.values(), trade_id))
+            linked += 1
+        else:
+            print(f"  Trade #{trade_id}: no matching orders found")
+
+    conn.commit()
+    print(f"\n[OK] Linked {linked} of {len(trades)} trades to their orders")
+
+    conn.close()
+    print("\nMigration complete!")
+
+
+if __name__ == "__main__":
+    migrate()
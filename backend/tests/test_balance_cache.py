@@ -0,0 +1,101 @@
+import pytest
+from eth_abi import decode, encode
+from app.services import balance_cache
+
+CONTRACT = "0x" + "c" * 40
+HOLDER = "0x" + "1" * 40
+OTHER = "0x" + "2" * 40
+
+
+def _address_topic(address):
+    return bytes(12) + bytes.fromhex(address[2:])
+
+
+class FakeNode:
+    """Minimal stand-in for the node: block number, logs and batched eth_calls"""
+
+    def __init__(self):
+        self.block_number = 10
+        self.balances = {}
+        self.locked = {}
+        self.logs = []
+        self.calls = []
+        self.eth = self
+
+    def get_logs(self, params):
+        self.calls.append("get_logs")
+        return [log for log in self.logs if params["fromBlock"] <= log["blockNumber"] <= params["toBlock"]]
+
+    def batch_call(self, calls, rpc_url=None):
+        self.calls.append(("batch", len(calls)))
+        results = []
+        for _, data in calls:
+            raw = bytes.fromhex(data[2:])
+            if raw[:4] == balance_cache.BALANCE_OF_BATCH_SELECTOR:
+                holders, token_ids = decode(["address[]", "uint256[]"], raw[4:])
+                results.append(encode(["uint256[]"], [[self.balances.get((h.lower(), t), 0) for h, t in zip(holders, token_ids)]]))
+            else:
+                token_id, holder = decode(["uint256", "address"], raw[4:])
+                results.append(encode(["uint256"], [self.locked.get((holder.lower(), token_id), 0)]))
+        return results
+
+
+@pytest.fixture
+def node(monkeypatch):
+    """Fresh cache that polls the fake node on every read"""
+    fake = FakeNode()
+    monkeypatch.setattr(balance_cache, "get_web3", lambda rpc_url=None: fake)
+    monkeypatch.setattr(balance_cache, "batch_call", fake.batch_call)
+    monkeypatch.setattr(balance_cache, "POLL_INTERVAL_SECONDS", 0)
+    monkeypatch.setattr(balance_cache, "_balance_cache", balance_cache.BalanceCache())
+    return fake
+
+
+def _read(token_ids, holder=HOLDER):
+    return balance_cache.get_cached_balances(holder, token_ids, CONTRACT, "http://node")
+
+
+def test_repeated_reads_within_a_block_hit_the_cache(node):
+    """Test that only the first read of a (holder, token) pair calls the node, in one batch"""
+    node.balances[(HOLDER, 1)] = 500
+    node.locked[(HOLDER, 1)] = 100
+
+    assert _read([1, 2]) == {1: (500, 100), 2: (0, 0)}
+    # One balanceOfBatch plus a lockedBalance per token, in a single round trip
+    assert node.calls == [("batch", 3)]
+
+    node.calls.clear()
+    assert _read([1, 2]) == {1: (500, 100), 2: (0, 0)}
+    assert node.calls == []
+
+
+def test_transfer_events_invalidate_only_touched_entries(node):
+    """Test that a TransferSingle drops the sender's and receiver's entries for that token"""
+    node.balances[(HOLDER, 1)] = 500
+    node.balances[(HOLDER, 2)] = 50
+    _read([1, 2])
+
+    node.balances[(HOLDER, 1)] = 400
+    node.balances[(OTHER, 1)] = 100
+    node.block_number = 11
+    node.logs.append({
+        "blockNumber": 11,
+        "topics": [balance_cache.TRANSFER_SINGLE_TOPIC, _address_topic(HOLDER), _address_topic(HOLDER), _address_topic(OTHER)],
+        "data": encode(["uint256", "uint256"], [1, 100])
+    })
+    node.calls.clear()
+
+    assert _read([1, 2]) == {1: (400, 0), 2: (50, 0)}
+    assert node.calls == ["get_logs", ("batch", 2)]
+
+
+def test_unattributable_lock_events_clear_the_contract(node):
+    """Test that an application rejection (unlock) drops every cached entry"""
+    node.locked[(HOLDER, 1)] = 100
+    _read([1])
+
+    node.locked[(HOLDER, 1)] = 0
+    node.block_number = 12
+    node.logs.append({"blockNumber": 12, "topics": [balance_cache.APPLICATION_REJECTED_TOPIC, bytes(32)], "data": b""})
+
+    assert _read([1]) == {1: (0, 0)}
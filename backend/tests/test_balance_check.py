@@ -0,0 +1,143 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import Account, AccountBalance, BrokerMandate, Scheme, Order, AccountRole
+from app.services import balance_check
+from app.services.order_book import get_order_book_registry
+from app.services.order_matching import match_order
+
+
+@pytest.fixture
+def db_session():
+    """Create an in-memory SQLite database for testing"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = TestingSessionLocal()
+    get_order_book_registry().reset()
+    try:
+        yield session
+    finally:
+        session.close()
+        get_order_book_registry().reset()
+
+
+@pytest.fixture
+def accounts(db_session):
+    """Landowner, broker (with a mandate from the landowner), developer and a scheme"""
+    landowner = Account(name="Landowner", role=AccountRole.LANDOWNER, evm_address="0x" + "1" * 40)
+    broker = Account(name="Broker", role=AccountRole.BROKER, evm_address="0x" + "3" * 40)
+    developer = Account(name="Developer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    db_session.add_all([landowner, broker, developer])
+    db_session.commit()
+    scheme = Scheme(
+        nft_token_id=7,
+        name="Solent Scheme",
+        catchment="SOLENT",
+        location="Solent",
+        unit_type="nitrate",
+        original_tonnage=10.0,
+        remaining_tonnage=10.0,
+        created_by_account_id=landowner.id
+    )
+    db_session.add(scheme)
+    db_session.commit()
+    db_session.add(BrokerMandate(
+        landowner_account_id=landowner.id,
+        broker_account_id=broker.id,
+        scheme_id=scheme.id,
+        credits_amount=1000,
+        fee_percentage=5.0
+    ))
+    db_session.commit()
+    return landowner, broker, developer, scheme
+
+
+def _place(db, account, side, price, quantity, scheme):
+    order = Order(
+        account_id=account.id,
+        order_type="LIMIT",
+        side=side,
+        catchment="SOLENT",
+        unit_type="nitrate",
+        price_per_unit=price,
+        quantity_units=quantity,
+        filled_quantity=0,
+        remaining_quantity=quantity,
+        status="PENDING",
+        scheme_id=scheme.id,
+        nft_token_id=scheme.nft_token_id
+    )
+    balance_check.reserve_order_funds(order, db)
+    db.add(order)
+    db.commit()
+    return order
+
+
+def _ledger(db, account):
+    return db.get(AccountBalance, account.id)
+
+
+def test_trades_update_ledger_in_step_with_trades_table(db_session, accounts):
+    """Test that direct and mandate sales keep the ledger equal to the trades aggregate"""
+    landowner, broker, developer, scheme = accounts
+
+    _place(db_session, landowner, "SELL", 2.0, 100, scheme)
+    match_order(_place(db_session, developer, "BUY", 2.0, 100, scheme), db_session)
+    _place(db_session, broker, "SELL", 3.0, 10, scheme)
+    match_order(_place(db_session, developer, "BUY", 3.0, 10, scheme), db_session)
+
+    assert balance_check.get_account_balance(developer, db_session) == pytest.approx(5000000.0 - 230.0)
+    # Broker sold client credits under the mandate, so the landowner is paid
+    assert balance_check.get_account_balance(landowner, db_session) == pytest.approx(230.0)
+    assert balance_check.get_account_balance(broker, db_session) == 0.0
+
+    for account in (landowner, broker, developer):
+        assert balance_check.get_account_balance(account, db_session) == pytest.approx(balance_check.compute_cash_balance(account, db_session))
+
+
+def test_balance_read_is_a_primary_key_lookup(db_session, accounts):
+    """Test that once seeded, balance checks do not aggregate the trades table"""
+    landowner, _, developer, scheme = accounts
+    _place(db_session, landowner, "SELL", 2.0, 100, scheme)
+    match_order(_place(db_session, developer, "BUY", 2.0, 100, scheme), db_session)
+
+    statements = []
+    engine = db_session.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        has_sufficient, available = balance_check.check_buyer_has_sufficient_balance(developer, 1000.0, db_session)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert has_sufficient and available == pytest.approx(5000000.0 - 200.0)
+    assert not any("trades" in statement for statement in statements)
+
+
+def test_reserved_funds_follow_fills_and_cancels_and_rebuild(db_session, accounts):
+    """Test that open BUY orders hold funds until filled or cancelled, and rebuild agrees"""
+    landowner, _, developer, scheme = accounts
+
+    bid = _place(db_session, developer, "BUY", 2.0, 100, scheme)
+    assert balance_check.get_reserved_balance(developer, db_session) == pytest.approx(200.0)
+
+    # Partial fill at the bid price releases the filled units
+    match_order(_place(db_session, landowner, "SELL", 2.0, 40, scheme), db_session)
+    assert _ledger(db_session, developer).reserved_balance == pytest.approx(120.0)
+
+    balance_check.release_order_funds(bid, bid.remaining_quantity, db_session)
+    bid.status = "CANCELLED"
+    db_session.commit()
+    assert _ledger(db_session, developer).reserved_balance == 0.0
+
+    # Corrupt the ledger, then rebuild it from trades and open orders
+    _ledger(db_session, developer).cash_balance = 0.0
+    _ledger(db_session, developer).reserved_balance = 999.0
+    db_session.commit()
+    assert balance_check.rebuild_account_balances(db_session) == 3
+    assert _ledger(db_session, developer).cash_balance == pytest.approx(5000000.0 - 80.0)
+    assert _ledger(db_session, developer).reserved_balance == 0.0
+    assert _ledger(db_session, landowner).cash_balance == pytest.approx(80.0)
@@ -0,0 +1,179 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import Account, AccountRole, BotOrder, MarketMakingBot, Order, Scheme, Trade
+from app.routes import broker as broker_routes
+from app.services import order_matching, reservations
+from app.services.balance_check import get_reserved_balance
+from app.services.batch_orders import BatchOrder, apply_order_batch
+from app.services.market_making_bot import replace_bot_orders
+from app.services.order_book import get_order_book, get_order_book_registry
+
+
+@pytest.fixture
+def db_session():
+    """Create an in-memory SQLite database for testing"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = TestingSessionLocal()
+    get_order_book_registry().reset()
+    try:
+        yield session
+    finally:
+        session.close()
+        get_order_book_registry().reset()
+
+
+@pytest.fixture
+def market(db_session):
+    """A seller, a buyer (developer), a broker and one Solent nitrate scheme"""
+    seller = Account(name="Seller", role=AccountRole.DEVELOPER, evm_address="0x" + "1" * 40)
+    buyer = Account(name="Buyer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    broker = Account(name="Broker", role=AccountRole.BROKER, evm_address="0x" + "3" * 40)
+    db_session.add_all([seller, buyer, broker])
+    db_session.commit()
+    scheme = Scheme(
+        nft_token_id=7, name="Solent Scheme", catchment="SOLENT", location="Solent", unit_type="nitrate",
+        original_tonnage=10.0, remaining_tonnage=10.0, created_by_account_id=seller.id
+    )
+    db_session.add(scheme)
+    db_session.commit()
+    return seller, buyer, broker, scheme
+
+
+def _count_commits(db):
+    commits = []
+    event.listen(db.get_bind(), "commit", lambda conn: commits.append(1))
+    return commits
+
+
+def test_cancel_replace_is_one_transaction(db_session, market):
+    """Test that a non-crossing refresh cancels and places everything with a single commit"""
+    _, buyer, _, scheme = market
+    first = apply_order_batch(buyer.id, "Solent", "nitrate", [BatchOrder("BUY", 2.0, 100), BatchOrder("BUY", 1.5, 100)], [], db_session)
+    assert first.applied and get_reserved_balance(buyer, db_session) == pytest.approx(350.0)
+    old_ids = [result.order_id for result in first.orders]
+
+    commits = _count_commits(db_session)
+    batch = apply_order_batch(
+        buyer.id, "SOLENT", "nitrate",
+        [BatchOrder("BUY", 2.1, 50), BatchOrder("BUY", 1.9, 50), BatchOrder("BUY", 1.7, 50, scheme_id=scheme.id)],
+        old_ids,
+        db_session
+    )
+
+    assert batch.applied and len(commits) == 1
+    assert [result.status for result in batch.cancels] == ["CANCELLED", "CANCELLED"]
+    assert [result.status for result in batch.orders] == ["ACCEPTED"] * 3
+    assert get_reserved_balance(buyer, db_session) == pytest.approx(285.0)
+    assert get_order_book("SOLENT", "nitrate", db_session).depth("BUY") == [(2.1, 50), (1.9, 50), (1.7, 50)]
+
+
+def test_invalid_item_rejects_whole_batch(db_session, market):
+    """Test that one invalid order leaves the cancels and other orders unapplied"""
+    _, buyer, _, scheme = market
+    resting = apply_order_batch(buyer.id, "SOLENT", "nitrate", [BatchOrder("BUY", 2.0, 100)], [], db_session)
+    resting_id = resting.orders[0].order_id
+
+    batch = apply_order_batch(
+        buyer.id, "SOLENT", "nitrate",
+        [BatchOrder("BUY", 2.5, 10), BatchOrder("SELL", 3.0, 10), BatchOrder("BUY", 0, 10)],
+        [resting_id, 999],
+        db_session
+    )
+
+    assert not batch.applied
+    assert [result.status for result in batch.orders] == ["NOT_APPLIED", "REJECTED", "REJECTED"]
+    assert [result.status for result in batch.cancels] == ["NOT_APPLIED", "REJECTED"]
+    assert db_session.get(Order, resting_id).status == "PENDING"
+    assert db_session.query(Order).count() == 1
+
+
+def test_crossing_orders_match_and_closed_cancels_are_reported(db_session, market):
+    """Test that a crossing batch order trades and cancelling a filled order is not an error"""
+    seller, buyer, _, scheme = market
+    ask = apply_order_batch(seller.id, "SOLENT", "nitrate", [BatchOrder("SELL", 2.0, 40, scheme_id=scheme.id)], [], db_session, check_funds=False)
+    ask_id = ask.orders[0].order_id
+
+    batch = apply_order_batch(buyer.id, "SOLENT", "nitrate", [BatchOrder("BUY", 2.0, 40), BatchOrder("BUY", 1.0, 40)], [], db_session)
+    assert len(batch.trades) == 1
+    assert (batch.orders[0].order_status, batch.orders[0].filled_quantity) == ("FILLED", 40)
+    assert batch.orders[1].order_status == "PENDING"
+
+    refresh = apply_order_batch(seller.id, "SOLENT", "nitrate", [BatchOrder("SELL", 2.5, 10, scheme_id=scheme.id)], [ask_id], db_session, check_funds=False)
+    assert refresh.applied
+    assert (refresh.cancels[0].status, refresh.cancels[0].order_status) == ("ALREADY_CLOSED", "FILLED")
+    assert reservations.get_reserved_credits(seller.id, scheme.id, db_session) == 10
+
+
+def test_market_making_refresh_replaces_orders_and_records(db_session, market):
+    """Test that a bot refresh cancels its open orders and books new ones with BotOrder records in one commit"""
+    _, _, broker, scheme = market
+    bot = MarketMakingBot(broker_account_id=broker.id, catchment="Solent", unit_type="nitrate", name="MM", strategy_config="{}")
+    db_session.add(bot)
+    db_session.commit()
+    replace_bot_orders(bot, [("BUY", 1.0, 100), ("SELL", 3.0, 100)], db_session)
+    old_ids = {bot_order.order_id for bot_order in db_session.query(BotOrder).all()}
+
+    commits = _count_commits(db_session)
+    replace_bot_orders(bot, [("BUY", 1.1, 80), ("SELL", 2.9, 80)], db_session)
+
+    assert len(commits) == 1
+    assert {order.status for order in db_session.query(Order).filter(Order.id.in_(old_ids))} == {"CANCELLED"}
+    open_orders = db_session.query(Order).filter(Order.status == "PENDING").all()
+    assert sorted((order.side, order.price_per_unit) for order in open_orders) == [("BUY", 1.1), ("SELL", 2.9)]
+    recorded = {(bot_order.order_id, bot_order.order_type) for bot_order in db_session.query(BotOrder).all()}
+    assert {(order.id, "BID" if order.side == "BUY" else "ASK") for order in open_orders} <= recorded
+
+
+def test_bot_trades_are_found_through_trade_order_links(db_session, market):
+    """Test that fills record their buy and sell orders and broker trade history follows those links"""
+    seller, buyer, broker, scheme = market
+    bot = MarketMakingBot(broker_account_id=broker.id, catchment="SOLENT", unit_type="nitrate", name="MM", strategy_config="{}")
+    db_session.add(bot)
+    db_session.commit()
+    replace_bot_orders(bot, [("BUY", 1.0, 100), ("SELL", 3.0, 100)], db_session)
+    bot_bid, bot_ask = [order.id for order in db_session.query(Order).order_by(Order.side).all()]
+
+    lift = apply_order_batch(buyer.id, "SOLENT", "nitrate", [BatchOrder("BUY", 3.0, 30)], [], db_session)
+    hit = apply_order_batch(seller.id, "SOLENT", "nitrate", [BatchOrder("SELL", 1.0, 20, scheme_id=scheme.id)], [], db_session, check_funds=False)
+    assert (lift.trades[0].buy_order_id, lift.trades[0].sell_order_id) == (lift.orders[0].order_id, bot_ask)
+    assert (hit.trades[0].buy_order_id, hit.trades[0].sell_order_id) == (bot_bid, hit.orders[0].order_id)
+
+    history = broker_routes.get_broker_trades(broker_account_id=broker.id, bot_id=None, db=db_session)
+    assert sorted((item.side, item.quantity_units, item.counterparty_account_id) for item in history.trades) == [
+        ("BUY", 20, seller.id), ("SELL", 30, buyer.id)
+    ]
+    assert history.total_pnl == 0.0
+
+
+def test_failed_match_is_rolled_back_and_reported(db_session, market, monkeypatch):
+    """Test that a match failing before its commit leaves nothing for the next match to commit, and is reported"""
+    seller, buyer, _, scheme = market
+    apply_order_batch(seller.id, "SOLENT", "nitrate", [BatchOrder("SELL", 2.0, 40, scheme_id=scheme.id)], [], db_session, check_funds=False)
+    real_match_order = order_matching.match_order
+    calls = []
+
+    def match_order(order, db):
+        calls.append(order.id)
+        if len(calls) == 1:
+            # A half-applied fill: staged, then the match fails before committing
+            order.filled_quantity, order.remaining_quantity, order.status = 10, 10, "PARTIALLY_FILLED"
+            db.add(Trade(buyer_account_id=buyer.id, seller_account_id=seller.id, scheme_id=scheme.id,
+                         quantity_units=10, price_per_unit=2.0, total_price=20.0))
+            db.flush()
+            raise RuntimeError("chain node unavailable")
+        return real_match_order(order, db)
+
+    monkeypatch.setattr(order_matching, "match_order", match_order)
+    batch = apply_order_batch(buyer.id, "SOLENT", "nitrate", [BatchOrder("BUY", 2.0, 20), BatchOrder("BUY", 2.0, 20)], [], db_session)
+
+    failed, matched = batch.orders
+    assert (failed.status, failed.order_status, failed.filled_quantity) == ("MATCH_FAILED", "PENDING", 0)
+    assert "chain node unavailable" in failed.error
+    assert (matched.status, matched.order_status, matched.filled_quantity) == ("ACCEPTED", "FILLED", 20)
+    assert [(trade.buy_order_id, trade.quantity_units) for trade in db_session.query(Trade).all()] == [(matched.order_id, 20)]
+    assert db_session.get(Order, failed.order_id).remaining_quantity == 20
@@ -0,0 +1,56 @@
+import pytest
+from benchmark_exchange import MARKETS, generate_flow, percentile, run_benchmark
+
+# SQL statements per step on SQLite (measured at about 20 / 7 / 6.5 / 18), with some
+# headroom. A change that adds queries to the hot path trips these.
+QUERY_BUDGETS = {
+    "sweeps": 24,
+    "ladders": 9,
+    "cancels": 8,
+    "bot_refresh": 22,
+}
+
+
+def test_flows_are_reproducible():
+    """Test that a profile replays the same steps for a seed, and cancels only refer to earlier placements"""
+    first = generate_flow("mixed", 200, MARKETS[:2], 5, seed=3)
+    assert first == generate_flow("mixed", 200, MARKETS[:2], 5, seed=3)
+    assert first != generate_flow("mixed", 200, MARKETS[:2], 5, seed=4)
+
+    placed = set()
+    for op in first:
+        if op.kind == "place":
+            placed.add(op.tag)
+        elif op.kind == "cancel":
+            assert op.tag in placed
+    assert {op.kind for op in first} == {"place", "cancel", "bot_refresh"}
+
+
+def test_percentile_is_nearest_rank():
+    """Test the latency percentile on a known distribution"""
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 99) == 0.0
+
+
+@pytest.mark.parametrize("profile", sorted(QUERY_BUDGETS))
+def test_direct_profiles_stay_within_query_budget(profile):
+    """Test that each profile runs cleanly against match_order within its queries-per-step budget"""
+    result = run_benchmark(profile, "direct", orders=60)
+    assert result.ops == 60 and result.errors == 0
+    if profile in ("sweeps", "bot_refresh"):
+        assert result.trades > 0
+    assert result.queries_per_op <= QUERY_BUDGETS[profile]
+    summary = result.summary()
+    assert 0 < summary["p50_ms"] <= summary["p99_ms"]
+
+
+def test_http_target_matches_direct_trades():
+    """Test that replaying a flow through the routes produces the same trades as calling match_order"""
+    http = run_benchmark("sweeps", "http", orders=30)
+    direct = run_benchmark("sweeps", "direct", orders=30)
+    assert http.errors == direct.errors == 0
+    assert http.trades == direct.trades > 0
+    # Every request went through the traced route
+    assert http.stages["create_limit_order"]["stages"]["match"]["count"] == 30
@@ -0,0 +1,122 @@
+import time
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import Account, AccountRole, MarketMakingBot, Order, SellLadderBot
+from app.services import bot_worker
+from app.services.bot_worker import BotWorker
+from app.services.order_book import get_order_book_registry
+
+
+class RecordingWorker(BotWorker):
+    """Bot worker that records refreshes instead of placing orders (optionally taking some time)"""
+
+    def __init__(self, *args, refresh_seconds=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.refresh_seconds = refresh_seconds
+        self.refreshes = []
+
+    def run_market_once(self, market):
+        with get_order_book_registry().market_lock(*market):
+            self.refreshes.append((market, time.monotonic()))
+            time.sleep(self.refresh_seconds)
+
+
+@pytest.fixture
+def session_factory():
+    """In-memory database shared across threads, with an active bot in two markets"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    get_order_book_registry().reset()
+    db = factory()
+    broker = Account(name="Broker", role=AccountRole.BROKER, evm_address="0x" + "3" * 40)
+    db.add(broker)
+    db.commit()
+    db.add_all([
+        MarketMakingBot(broker_account_id=broker.id, catchment="Solent", unit_type="nitrate", name="MM", strategy_config="{}", is_active=1),
+        SellLadderBot(broker_account_id=broker.id, catchment="HUMBER", unit_type="phosphate", name="Ladder", strategy_config="{}", is_active=1),
+        MarketMakingBot(broker_account_id=broker.id, catchment="SEVERN", unit_type="nitrate", name="Idle", strategy_config="{}", is_active=0)
+    ])
+    db.commit()
+    db.close()
+    try:
+        yield factory
+    finally:
+        get_order_book_registry().reset()
+
+
+def _wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def _place(factory, catchment, unit_type):
+    db = factory()
+    db.add(Order(
+        account_id=1, order_type="LIMIT", side="BUY", catchment=catchment, unit_type=unit_type,
+        price_per_unit=1.0, quantity_units=10, filled_quantity=0, remaining_quantity=10, status="PENDING"
+    ))
+    db.commit()
+    db.close()
+
+
+def test_book_changes_trigger_debounced_refresh_of_that_market(session_factory, monkeypatch):
+    """Test that a burst of orders in a bot market causes one refresh, other markets none, and bots' own orders none"""
+    refreshed = []
+
+    def place_orders(bot_id, db):
+        # Stand-in for a bot refresh: record it and quote into its own market
+        bot = db.get(MarketMakingBot, bot_id)
+        refreshed.append(bot.catchment)
+        _place(session_factory, bot.catchment, bot.unit_type)
+
+    monkeypatch.setattr(bot_worker, "place_bot_orders", place_orders)
+    monkeypatch.setattr(bot_worker, "place_sell_ladder_orders", lambda bot_id, db: refreshed.append("HUMBER"))
+    worker = BotWorker(interval_seconds=3600, debounce_seconds=0.2, session_factory=session_factory)
+    get_order_book_registry().ensure_loaded(session_factory())
+    worker.start()
+    try:
+        # Startup refreshes every market with active bots once
+        assert _wait_for(lambda: len(refreshed) == 2)
+        time.sleep(0.4)
+        assert sorted(refreshed) == ["HUMBER", "Solent"]
+        refreshed.clear()
+
+        for _ in range(3):
+            _place(session_factory, "SOLENT", "nitrate")
+        _place(session_factory, "SEVERN", "nitrate")
+        assert _wait_for(lambda: len(refreshed) >= 1)
+        time.sleep(0.4)
+        assert refreshed == ["Solent"]
+    finally:
+        worker.stop()
+
+
+def test_markets_refresh_concurrently_but_wait_for_their_market_lock(session_factory):
+    """Test that slow refreshes in different markets overlap, and a held market lock delays its refresh"""
+    worker = RecordingWorker(interval_seconds=3600, debounce_seconds=0.0, refresh_seconds=0.5, session_factory=session_factory)
+    lock = get_order_book_registry().market_lock("SOLENT", "nitrate")
+    lock.acquire()
+    released_at = None
+    try:
+        worker.start()
+        assert _wait_for(lambda: len(worker.refreshes) == 1)
+        assert worker.refreshes[0][0] == ("HUMBER", "phosphate")
+        time.sleep(0.2)
+        released_at = time.monotonic()
+        lock.release()
+        assert _wait_for(lambda: len(worker.refreshes) == 2)
+        humber_started, solent_started = worker.refreshes[0][1], worker.refreshes[1][1]
+        # Solent ran while Humber's 0.5s refresh was still in progress, once the lock was free
+        assert released_at <= solent_started < humber_started + 0.5
+    finally:
+        if released_at is None:
+            lock.release()
+        worker.stop()
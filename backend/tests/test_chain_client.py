@@ -0,0 +1,75 @@
+import pytest
+from web3 import Web3
+from app.services import chain_client
+from app.services.credits_summary import get_scheme_credits_abi
+
+RPC_URL = "http://127.0.0.1:8545"
+CONTRACT_ADDRESS = "0x" + "ab" * 20
+
+
+@pytest.fixture(autouse=True)
+def fresh_client():
+    """Reset the process-wide client around each test"""
+    chain_client.reset_chain_client()
+    yield
+    chain_client.reset_chain_client()
+
+
+def test_web3_and_contracts_are_shared():
+    """Test that providers and contract instances are built once per URL/address/ABI"""
+    w3 = chain_client.get_web3(RPC_URL)
+    assert chain_client.get_web3(RPC_URL) is w3
+    assert chain_client.get_web3("http://127.0.0.1:9545") is not w3
+
+    contract = chain_client.get_contract(CONTRACT_ADDRESS, get_scheme_credits_abi(), RPC_URL)
+    assert chain_client.get_contract(CONTRACT_ADDRESS.upper().replace("0X", "0x"), get_scheme_credits_abi(), RPC_URL) is contract
+    assert contract.address == Web3.to_checksum_address(CONTRACT_ADDRESS)
+    assert chain_client.get_contract(CONTRACT_ADDRESS, get_scheme_credits_abi()[:1], RPC_URL) is not contract
+
+
+def test_health_check_is_cached_only_when_healthy(monkeypatch):
+    """Test that a healthy node is not re-probed within the TTL and failures are retried"""
+    calls = []
+    results = [False, True, False]
+
+    def fake_is_connected(self, show_traceback=False):
+        calls.append(1)
+        return results[len(calls) - 1]
+
+    monkeypatch.setattr(Web3, "is_connected", fake_is_connected)
+
+    assert chain_client.is_connected(RPC_URL) is False
+    assert chain_client.is_connected(RPC_URL) is True
+    assert chain_client.is_connected(RPC_URL) is True
+    assert len(calls) == 2
+
+    chain_client.mark_unhealthy(RPC_URL)
+    with pytest.raises(ValueError):
+        chain_client.get_connected_web3(RPC_URL)
+    assert len(calls) == 3
+
+
+def test_batch_call_posts_one_request_and_keeps_order():
+    """Test that eth_calls go out as one JSON-RPC batch and results map back by id"""
+    posted = []
+
+    class FakeResponse:
+        def __init__(self, body):
+            self.body = body
+
+        def json(self):
+            return self.body
+
+    class FakeSession:
+        def post(self, url, json, timeout):
+            posted.append(json)
+            # Nodes may answer batch items in any order
+            return FakeResponse([{"jsonrpc": "2.0", "id": item["id"], "result": "0x0" + str(item["id"])} for item in reversed(json)])
+
+    chain_client.get_web3(RPC_URL)
+    chain_client._sessions[RPC_URL] = FakeSession()
+
+    results = chain_client.batch_call([(CONTRACT_ADDRESS, "0x01"), (CONTRACT_ADDRESS, "0x02")], RPC_URL)
+
+    assert len(posted) == 1 and [item["method"] for item in posted[0]] == ["eth_call", "eth_call"]
+    assert results == [bytes([0]), bytes([1])]
@@ -0,0 +1,180 @@
+import pytest
+from eth_abi import encode
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.db import Base
+from app.models import CreditBalance, SchemeNFTOwner, ChainCursor
+from app.services import chain_indexer
+from app.services.balance_cache import (
+    TRANSFER_SINGLE_TOPIC, TRANSFER_BATCH_TOPIC, APPLICATION_SUBMITTED_TOPIC, APPLICATION_APPROVED_TOPIC
+)
+
+CREDITS = "0x" + "c" * 40
+NFT = "0x" + "d" * 40
+PLANNING = "0x" + "e" * 40
+ZERO = "0x" + "0" * 40
+LANDOWNER = "0x" + "1" * 40
+DEVELOPER = "0x" + "2" * 40
+
+
+def _address_topic(address):
+    return bytes(12) + bytes.fromhex(address[2:])
+
+
+def _int_topic(value):
+    return value.to_bytes(32, "big")
+
+
+class FakeNode:
+    """Chain stand-in: blocks with hashes and logs that tests can rewrite to simulate reorgs"""
+
+    def __init__(self):
+        self.block_number = 0
+        self.logs = []
+        self.hashes = {}
+        self.eth = self
+
+    def mine(self, *logs, fork="a"):
+        self.block_number += 1
+        self.hashes[self.block_number] = bytes([self.block_number]) + fork.encode() * 31
+        for index, (address, topics, data) in enumerate(logs):
+            self.logs.append({
+                "address": address,
+                "topics": topics,
+                "data": data,
+                "blockNumber": self.block_number,
+                "logIndex": index,
+                "transactionHash": bytes(32)
+            })
+
+    def reorg_to(self, block_number):
+        self.logs = [log for log in self.logs if log["blockNumber"] <= block_number]
+        self.hashes = {n: h for n, h in self.hashes.items() if n <= block_number}
+        self.block_number = block_number
+
+    def get_block(self, number):
+        return {"hash": self.hashes[number]}
+
+    def get_logs(self, params):
+        addresses = {a.lower() for a in params["address"]}
+        return [
+            log for log in self.logs
+            if params["fromBlock"] <= log["blockNumber"] <= params["toBlock"] and log["address"] in addresses
+        ]
+
+
+def _mint(to, token_id, amount):
+    return (CREDITS, [TRANSFER_SINGLE_TOPIC, _address_topic(to), _address_topic(ZERO), _address_topic(to)], encode(["uint256", "uint256"], [token_id, amount]))
+
+
+def _transfer_batch(frm, to, token_ids, amounts):
+    return (CREDITS, [TRANSFER_BATCH_TOPIC, _address_topic(frm), _address_topic(frm), _address_topic(to)], encode(["uint256[]", "uint256[]"], [token_ids, amounts]))
+
+
+@pytest.fixture
+def db_session(monkeypatch):
+    """In-memory database and a fake node wired into the indexer"""
+    monkeypatch.setenv("SCHEME_CREDITS_CONTRACT_ADDRESS", CREDITS)
+    monkeypatch.setenv("SCHEME_NFT_CONTRACT_ADDRESS", NFT)
+    monkeypatch.setenv("PLANNING_LOCK_CONTRACT_ADDRESS", PLANNING)
+    monkeypatch.delenv("CHAIN_INDEXER_START_BLOCK", raising=False)
+    node = FakeNode()
+    monkeypatch.setattr(chain_indexer, "get_web3", lambda rpc_url=None: node)
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    chain_indexer.reset_index_state()
+    try:
+        yield session, node
+    finally:
+        session.close()
+        chain_indexer.reset_index_state()
+
+
+def _balances(db):
+    return {(r.holder_address, r.nft_token_id): (r.balance, r.locked, r.burned) for r in db.query(CreditBalance).all()}
+
+
+def test_indexes_transfers_locks_and_burns(db_session):
+    """Test that mints, batch transfers, planning locks and approval burns materialise correctly"""
+    db, node = db_session
+    node.mine(
+        (NFT, [chain_indexer.NFT_TRANSFER_TOPIC, _address_topic(ZERO), _address_topic(LANDOWNER), _int_topic(1)], b""),
+        _mint(LANDOWNER, 1, 1000),
+        _mint(LANDOWNER, 2, 500)
+    )
+    node.mine(_transfer_batch(LANDOWNER, DEVELOPER, [1, 2], [300, 100]))
+    node.mine((
+        PLANNING,
+        [APPLICATION_SUBMITTED_TOPIC, _int_topic(7), _address_topic(DEVELOPER)],
+        encode(["bytes32", "uint256[]", "uint256[]"], [bytes(32), [1], [200]])
+    ))
+
+    assert chain_indexer.index_chain(db) == 4  # blocks 0-3
+    assert chain_indexer.is_index_ready()
+    assert _balances(db)[(DEVELOPER, 1)] == (300, 200, 0)
+    assert db.get(SchemeNFTOwner, 1).owner_address == LANDOWNER
+
+    # Approval burns the locked credits: TransferSingle to zero, then ApplicationApproved
+    node.mine(
+        (CREDITS, [TRANSFER_SINGLE_TOPIC, _address_topic(PLANNING), _address_topic(DEVELOPER), _address_topic(ZERO)], encode(["uint256", "uint256"], [1, 200])),
+        (PLANNING, [APPLICATION_APPROVED_TOPIC, _int_topic(7)], b"")
+    )
+    assert chain_indexer.index_chain(db) == 1
+
+    balances = _balances(db)
+    assert balances[(DEVELOPER, 1)] == (100, 0, 200)
+    assert balances[(LANDOWNER, 1)] == (700, 0, 0)
+    assert balances[(LANDOWNER, 2)] == (400, 0, 0)
+    assert chain_indexer.get_indexed_balances(db, DEVELOPER.upper().replace("0X", "0x"), [1, 2, 3]) == {1: (100, 0), 2: (100, 0), 3: (0, 0)}
+    assert chain_indexer.index_chain(db) == 0
+
+
+def _nft_transfer(frm, to, token_id):
+    return (NFT, [chain_indexer.NFT_TRANSFER_TOPIC, _address_topic(frm), _address_topic(to), _int_topic(token_id)], b"")
+
+
+def test_scheme_nft_owners_are_read_from_the_index(db_session):
+    """Test that SchemeNFT owner reads come from the index once it is current, with burned tokens ownerless"""
+    db, node = db_session
+    node.mine(_nft_transfer(ZERO, LANDOWNER, 1), _nft_transfer(ZERO, LANDOWNER, 2))
+    node.mine(_nft_transfer(LANDOWNER, DEVELOPER, 1), _nft_transfer(LANDOWNER, ZERO, 2))
+    assert chain_indexer.read_nft_owners(db, [1, 2], NFT) is None  # not caught up: ask the node
+
+    chain_indexer.index_chain(db)
+    assert chain_indexer.read_nft_owners(db, [1, 2, 3], NFT.upper().replace("0X", "0x")) == {1: DEVELOPER, 2: None, 3: None}
+    assert chain_indexer.read_nft_owners(db, [1], "0x" + "9" * 40) is None  # not the indexed contract
+
+
+def test_reorg_rolls_back_orphaned_blocks(db_session):
+    """Test that a changed block hash undoes the orphaned deltas and re-indexes the new branch"""
+    db, node = db_session
+    node.mine(_mint(LANDOWNER, 1, 1000))
+    chain_indexer.index_chain(db)
+    node.mine(_transfer_batch(LANDOWNER, DEVELOPER, [1], [300]))
+    chain_indexer.index_chain(db)
+    assert _balances(db)[(DEVELOPER, 1)] == (300, 0, 0)
+
+    node.reorg_to(1)
+    node.mine(_transfer_batch(LANDOWNER, DEVELOPER, [1], [50]), fork="b")
+    chain_indexer.index_chain(db)
+
+    balances = _balances(db)
+    assert balances[(DEVELOPER, 1)] == (50, 0, 0)
+    assert balances[(LANDOWNER, 1)] == (950, 0, 0)
+
+
+def test_replay_from_block_reindexes(db_session):
+    """Test that replaying from a block rewinds the checkpoint and reproduces the same state"""
+    db, node = db_session
+    node.mine(_mint(LANDOWNER, 1, 1000))
+    node.mine(_transfer_batch(LANDOWNER, DEVELOPER, [1], [300]))
+    chain_indexer.index_chain(db)
+    before = _balances(db)
+
+    chain_indexer.replay_from_block(db, 2)
+    assert db.get(ChainCursor, chain_indexer.CURSOR_NAME).last_block == 1
+    assert _balances(db)[(DEVELOPER, 1)] == (0, 0, 0)
+
+    chain_indexer.index_chain(db)
+    assert _balances(db) == before
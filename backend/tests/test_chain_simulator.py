@@ -0,0 +1,166 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from web3 import Web3
+from app.db import Base
+from app.models import CreditBalance, SchemeNFTOwner, SchemeSubmission
+from app.services import chain_indexer
+from app.services.balance_cache import fetch_balances
+from app.services.chain_client import get_contract, get_web3
+from app.services.chain_simulator import HARDHAT_DEPLOYER_ADDRESS, ChainSimulator, simulated_chain
+from app.services.credits_integration import mint_scheme_credits
+from app.services.exchange import get_scheme_credits_abi
+from app.services.nft_integration import mint_scheme_nft
+from app.services.nonce_manager import send_transaction, wait_for_receipts
+from app.services.planning_application import (
+    approve_planning_application_on_chain, reject_planning_application_on_chain, submit_planning_application_on_chain
+)
+
+# Hardhat accounts #0 (deployer and regulator), #1 (landowner) and #2 (developer)
+REGULATOR_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+LANDOWNER_KEY = "0x59c6995e998f97a5a0044966f0945389dc9e86dae88c7a8412f4603b6b78690d"
+DEVELOPER_KEY = "0x5de4111afa1a4b94908f83103eb1f1706367c2e68ca870fc3fb9a804cdab365a"
+LANDOWNER = Web3().eth.account.from_key(LANDOWNER_KEY).address
+DEVELOPER = Web3().eth.account.from_key(DEVELOPER_KEY).address
+RPC_URL = "http://127.0.0.1:8545"
+
+
+@pytest.fixture
+def chain(monkeypatch):
+    """A fresh simulated chain behind the chain client, with one minted scheme holding 10 tonnes of credits"""
+    with simulated_chain() as simulator:
+        for name, address in simulator.contracts.env().items():
+            monkeypatch.setenv(name, address)
+        submission = SchemeSubmission(scheme_name="Solent Wetland", catchment="SOLENT", location="Hampshire", total_tonnage=10)
+        token_id = mint_scheme_nft(
+            submission, "bafy-cid", "ab" * 32, simulator.contracts.scheme_nft.address, REGULATOR_KEY, LANDOWNER, RPC_URL
+        )
+        mint_scheme_credits(token_id, LANDOWNER, 10, simulator.contracts.scheme_credits.address, REGULATOR_KEY, RPC_URL)
+        yield simulator
+
+
+def test_services_mint_and_transfer_credits(chain):
+    """Test that the NFT and credit minting services and a signed safeTransferFrom run against the simulator"""
+    credits_address = chain.contracts.scheme_credits.address
+    assert chain.contracts.scheme_nft.ownerOf(None, 1) == LANDOWNER.lower()
+    assert fetch_balances([(LANDOWNER, 1)], credits_address) == {(LANDOWNER.lower(), 1): (1_000_000, 0)}
+
+    contract = get_contract(credits_address, get_scheme_credits_abi())
+    tx_hash = send_transaction(contract.functions.safeTransferFrom(LANDOWNER, DEVELOPER, 1, 250_000, b""), LANDOWNER_KEY)
+    receipt = wait_for_receipts([tx_hash])[tx_hash]
+    assert receipt.status == 1
+
+    assert contract.functions.balanceOfBatch([LANDOWNER, DEVELOPER], [1, 1]).call() == [750_000, 250_000]
+    (transfer,) = get_web3().eth.get_logs({"fromBlock": receipt.blockNumber, "toBlock": receipt.blockNumber, "address": credits_address})
+    assert transfer["topics"][0] == Web3.keccak(text="TransferSingle(address,address,address,uint256,uint256)")
+    assert transfer["transactionHash"] == receipt.transactionHash
+
+    # Only the landowner (or an approved operator) can move the landowner's credits
+    stolen = send_transaction(contract.functions.safeTransferFrom(LANDOWNER, DEVELOPER, 1, 1, b""), DEVELOPER_KEY)
+    assert wait_for_receipts([stolen])[stolen].status == 0
+    assert chain.get_receipt(bytes.fromhex(stolen[2:]))["revertReason"] == "ERC1155MissingApprovalForAll"
+    assert contract.functions.balanceOf(DEVELOPER, 1).call() == 250_000
+
+
+def test_nft_and_credit_mints_share_the_signers_nonces(chain):
+    """Test that NFT mints and credit mints from one key keep using consecutive nonces"""
+    contracts = chain.contracts
+    # The fixture already minted an NFT and its credits with the regulator key
+    for tonnage in (5, 7):
+        submission = SchemeSubmission(scheme_name="Humber Reedbed", catchment="HUMBER", location="Hull", total_tonnage=tonnage)
+        token_id = mint_scheme_nft(
+            submission, "bafy-cid", "cd" * 32, contracts.scheme_nft.address, REGULATOR_KEY, LANDOWNER, RPC_URL
+        )
+        assert mint_scheme_credits(token_id, LANDOWNER, tonnage, contracts.scheme_credits.address, REGULATOR_KEY, RPC_URL)
+
+    assert fetch_balances([(LANDOWNER, 2), (LANDOWNER, 3)], contracts.scheme_credits.address) == {
+        (LANDOWNER.lower(), 2): (500_000, 0), (LANDOWNER.lower(), 3): (700_000, 0)
+    }
+    # Deployment (5 transactions) plus six mints
+    assert chain.get_nonce(HARDHAT_DEPLOYER_ADDRESS) == 11
+
+
+def test_planning_applications_lock_burn_and_release_credits(chain):
+    """Test that submitting locks credits against transfer, approval burns them and rejection releases them"""
+    contracts = chain.contracts
+    credits = get_contract(contracts.scheme_credits.address, get_scheme_credits_abi())
+    send_transaction(credits.functions.safeTransferFrom(LANDOWNER, DEVELOPER, 1, 300_000, b""), LANDOWNER_KEY)
+
+    first = submit_planning_application_on_chain(
+        DEVELOPER, [1], [200_000], "SOLENT", contracts.planning_lock.address, DEVELOPER_KEY, RPC_URL, contracts.scheme_nft.address
+    )
+    assert first == 1
+    assert credits.functions.lockedBalance(1, DEVELOPER).call() == 200_000
+
+    # Locked credits cannot be transferred away; the failed transaction still uses its nonce
+    blocked = send_transaction(credits.functions.safeTransferFrom(DEVELOPER, LANDOWNER, 1, 150_000, b""), DEVELOPER_KEY)
+    assert wait_for_receipts([blocked])[blocked].status == 0
+    assert chain.get_receipt(bytes.fromhex(blocked[2:]))["revertReason"] == "Cannot transfer locked credits"
+
+    assert approve_planning_application_on_chain(first, contracts.planning_lock.address, REGULATOR_KEY, RPC_URL)
+    assert credits.functions.balanceOf(DEVELOPER, 1).call() == 100_000
+    assert credits.functions.lockedBalance(1, DEVELOPER).call() == 0
+    # Two whole tonnes came off the scheme
+    assert contracts.scheme_nft.schemes(None, 1)[4] == 8
+
+    second = submit_planning_application_on_chain(
+        DEVELOPER, [1], [100_000], "SOLENT", contracts.planning_lock.address, DEVELOPER_KEY, RPC_URL, contracts.scheme_nft.address
+    )
+    assert reject_planning_application_on_chain(second, contracts.planning_lock.address, REGULATOR_KEY, RPC_URL)
+    assert credits.functions.balanceOf(DEVELOPER, 1).call() == 100_000
+    assert credits.functions.lockedBalance(1, DEVELOPER).call() == 0
+
+
+def test_calls_do_not_change_state_and_reverts_are_reported():
+    """Test that eth_call leaves no trace and a reverting call answers with the revert reason"""
+    simulator = ChainSimulator()
+    contracts = simulator.deploy_offsetx_contracts()
+    block = simulator.block_number
+
+    response = simulator.handle({
+        "jsonrpc": "2.0", "id": 1, "method": "eth_call",
+        "params": [{"to": contracts.scheme_credits.address, "data": Web3.to_hex(
+            Web3.keccak(text="mintCredits(uint256,address,uint256)")[:4] + bytes(64) + (5).to_bytes(32, "big")
+        ), "from": LANDOWNER}, "latest"]
+    })
+    assert response["error"]["code"] == 3
+    assert response["error"]["message"] == "execution reverted: OwnableUnauthorizedAccount"
+
+    # The failed call mined nothing; a real mint by the owner does
+    assert simulator.block_number == block
+    receipt = simulator.send(HARDHAT_DEPLOYER_ADDRESS, contracts.scheme_credits.address, "mintCredits(uint256,address,uint256)", 1, LANDOWNER, 5)
+    assert receipt["status"] == 1 and simulator.block_number == block + 1
+    assert contracts.scheme_credits.balanceOf(None, LANDOWNER, 1) == 5
+
+    unknown = simulator.handle([{"jsonrpc": "2.0", "id": 7, "method": "debug_traceTransaction", "params": []}])
+    assert unknown == [{"jsonrpc": "2.0", "id": 7, "error": {"code": -32601, "message": unknown[0]["error"]["message"]}}]
+
+
+def test_indexer_follows_the_simulated_chain_through_a_reorg(chain):
+    """Test that the chain indexer materialises simulated events and rolls back blocks dropped by a reorg"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        chain_indexer.index_chain(db)
+        holding = db.query(CreditBalance).filter_by(holder_address=LANDOWNER.lower(), nft_token_id=1).one()
+        assert holding.balance == 1_000_000
+        assert db.query(SchemeNFTOwner).filter_by(nft_token_id=1).one().owner_address == LANDOWNER.lower()
+
+        fork_point = chain.block_number
+        credits = get_contract(chain.contracts.scheme_credits.address, get_scheme_credits_abi())
+        send_transaction(credits.functions.safeTransferFrom(LANDOWNER, DEVELOPER, 1, 400_000, b""), LANDOWNER_KEY)
+        chain_indexer.index_chain(db)
+        assert db.query(CreditBalance).filter_by(holder_address=DEVELOPER.lower(), nft_token_id=1).one().balance == 400_000
+
+        # The transfer's block is orphaned and replaced by a different one
+        chain.revert_to(fork_point)
+        chain.mine()
+        chain_indexer.index_chain(db)
+        db.expire_all()
+        assert db.query(CreditBalance).filter_by(holder_address=LANDOWNER.lower(), nft_token_id=1).one().balance == 1_000_000
+        developer = db.query(CreditBalance).filter_by(holder_address=DEVELOPER.lower(), nft_token_id=1).first()
+        assert developer is None or developer.balance == 0
+    finally:
+        db.close()
@@ -0,0 +1,140 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import Account, AccountRole, Order, Scheme
+from app.routes import exchange as exchange_routes, operator as operator_routes
+from app.services import latency
+from app.services.order_book import get_order_book_registry
+from app.services.price_history import get_candle_aggregator
+from app.services.read_cache import get_read_cache
+
+
+@pytest.fixture
+def recorder():
+    recorder = latency.get_latency_recorder()
+    enabled = recorder.enabled
+    recorder.enabled = True
+    recorder.reset()
+    try:
+        yield recorder
+    finally:
+        recorder.enabled = enabled
+        recorder.reset()
+
+
+@pytest.fixture
+def env(recorder):
+    """Exchange and operator routers on an in-memory database, with a resting ask of 50 at £12"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    get_order_book_registry().reset()
+    get_candle_aggregator().reset()
+    get_read_cache().reset()
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(exchange_routes.router, prefix="/exchange")
+    app.include_router(operator_routes.router, prefix="/operator")
+    app.dependency_overrides[exchange_routes.get_db] = override_get_db
+    app.dependency_overrides[operator_routes.get_db] = override_get_db
+
+    db = factory()
+    seller = Account(name="Seller", role=AccountRole.DEVELOPER, evm_address="0x" + "1" * 40)
+    buyer = Account(name="Buyer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    db.add_all([seller, buyer])
+    db.commit()
+    scheme = Scheme(
+        nft_token_id=7, name="Solent Scheme", catchment="SOLENT", location="Solent", unit_type="nitrate",
+        original_tonnage=10.0, remaining_tonnage=10.0, created_by_account_id=seller.id
+    )
+    db.add(scheme)
+    db.commit()
+    db.add(Order(
+        account_id=seller.id, order_type="LIMIT", side="SELL", catchment="SOLENT", unit_type="nitrate",
+        price_per_unit=12.0, quantity_units=50, filled_quantity=0, remaining_quantity=50,
+        status="PENDING", scheme_id=scheme.id, nft_token_id=scheme.nft_token_id
+    ))
+    db.commit()
+    try:
+        yield TestClient(app), buyer.id
+    finally:
+        db.close()
+        get_order_book_registry().reset()
+        get_candle_aggregator().reset()
+        get_read_cache().reset()
+
+
+def test_stages_are_aggregated_per_call(recorder):
+    """Test that laps and spans add up per call, and nothing is recorded outside a trace or when disabled"""
+    @latency.traced("pipeline")
+    def call(fail=False):
+        latency.lap("setup")
+        for _ in range(3):
+            with latency.stage("loop"):
+                pass
+            latency.lap("between")
+        if fail:
+            raise ValueError("boom")
+
+    latency.lap("ignored")
+    with latency.stage("ignored"):
+        pass
+    call()
+    with pytest.raises(ValueError):
+        call(fail=True)
+    recorder.enabled = False
+    call()
+
+    stats = recorder.snapshot()["pipeline"]
+    assert stats["errors"] == 1
+    assert set(stats["stages"]) == {"setup", "loop", "between", "total"}
+    # One observation per call, however many times the stage was hit
+    assert all(stage["count"] == 2 for stage in stats["stages"].values())
+    assert stats["stages"]["total"]["max_ms"] >= stats["stages"]["loop"]["max_ms"]
+
+
+def test_percentiles_come_from_the_buckets():
+    """Test that percentiles are bucket upper bounds, capped at the largest observation"""
+    histogram = latency.Histogram()
+    for value_ms in [0.05] * 90 + [3.0] * 9 + [40.0]:
+        histogram.observe(value_ms)
+    assert histogram.percentile(0.5) == 0.1
+    assert histogram.percentile(0.95) == 5
+    assert histogram.percentile(0.99) == 5
+    assert histogram.percentile(1.0) == 40.0
+    assert latency.Histogram().percentile(0.5) is None
+
+
+def test_order_pipeline_latency_endpoint(env):
+    """Test that a limit order that fills reports its endpoint and matching stages from the operator endpoint"""
+    client, buyer_id = env
+    response = client.post("/exchange/orders/limit", json={
+        "account_id": buyer_id, "side": "BUY", "catchment": "solent", "unit_type": "nitrate",
+        "price_per_unit": 12.0, "quantity_units": 20
+    })
+    assert response.status_code == 200
+    assert response.json()["status"] == "FILLED"
+
+    report = client.get("/operator/latency").json()
+    assert report["enabled"] is True
+    endpoint = report["pipelines"]["create_limit_order"]["stages"]
+    assert {"validation", "balance_check", "persist", "match", "price_history", "total"} <= set(endpoint)
+    matching = report["pipelines"]["match_order"]["stages"]
+    assert {"lock_wait", "opposite_side", "accounts", "scheme", "funding", "trade", "commit", "total"} <= set(matching)
+    assert matching["total"]["count"] == 1
+    assert endpoint["match"]["max_ms"] >= matching["total"]["max_ms"]
+    assert sum(bucket["count"] for bucket in endpoint["total"]["buckets"]) == 1
+
+    assert client.delete("/operator/latency").status_code == 200
+    assert client.get("/operator/latency").json()["pipelines"] == {}
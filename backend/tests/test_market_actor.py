@@ -0,0 +1,85 @@
+import threading
+import time
+import pytest
+from app.services.market_actor import MarketActorRegistry, current_market
+
+
+@pytest.fixture
+def actors():
+    registry = MarketActorRegistry(idle_seconds=0.2)
+    try:
+        yield registry
+    finally:
+        registry.stop()
+
+
+def _slow(log, name, seconds=0.2):
+    def command():
+        log.append((name, "start", current_market(), time.monotonic()))
+        time.sleep(seconds)
+        log.append((name, "end", current_market(), time.monotonic()))
+        return name
+    return command
+
+
+def _in_threads(*calls):
+    results = {}
+    threads = [threading.Thread(target=lambda call=call: results.setdefault(call[0], call[1]())) for call in calls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_commands_are_sequential_per_market_and_parallel_across_markets(actors):
+    """Test that one market runs its commands one at a time on its actor while another market runs alongside"""
+    log = []
+    results = _in_threads(
+        ("a1", lambda: actors.run("solent", "NITRATE", _slow(log, "a1"))),
+        ("a2", lambda: actors.run("SOLENT", "nitrate", _slow(log, "a2"))),
+        ("b1", lambda: actors.run("HUMBER", "phosphate", _slow(log, "b1"))),
+    )
+    assert results == {"a1": "a1", "a2": "a2", "b1": "b1"}
+
+    events = {(name, edge): (market, at) for name, edge, market, at in log}
+    assert {events[(name, "start")][0] for name in ("a1", "a2")} == {("SOLENT", "nitrate")}
+    assert events[("b1", "start")][0] == ("HUMBER", "phosphate")
+    # The two Solent commands never overlap...
+    first, second = sorted(("a1", "a2"), key=lambda name: events[(name, "start")][1])
+    assert events[(second, "start")][1] >= events[(first, "end")][1]
+    # ...while Humber ran during the first of them
+    assert events[("b1", "start")][1] < events[(first, "end")][1]
+
+
+def test_nested_commands_run_inline_and_errors_reach_the_caller(actors):
+    """Test that a command can issue commands for its own market without deadlocking, and exceptions propagate"""
+    def outer():
+        return actors.run("SOLENT", "nitrate", lambda: ("inner", current_market()))
+
+    assert actors.run("SOLENT", "nitrate", outer) == ("inner", ("SOLENT", "nitrate"))
+    assert current_market() is None
+
+    def fail():
+        raise ValueError("rejected")
+
+    with pytest.raises(ValueError, match="rejected"):
+        actors.run("SOLENT", "nitrate", fail)
+    # The actor survives a failed command
+    assert actors.run("SOLENT", "nitrate", lambda: 42) == 42
+
+
+def test_idle_actors_retire_and_restart(actors):
+    """Test that an idle market's actor exits and a later command starts a new one"""
+    threads = [actors.run("SOLENT", "nitrate", lambda: threading.current_thread())]
+    assert ("SOLENT", "nitrate") in actors.queue_depths()
+
+    deadline = time.monotonic() + 3.0
+    while ("SOLENT", "nitrate") in actors.queue_depths() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert ("SOLENT", "nitrate") not in actors.queue_depths()
+    threads[0].join(timeout=1.0)
+    assert not threads[0].is_alive()
+
+    threads.append(actors.run("SOLENT", "nitrate", lambda: threading.current_thread()))
+    assert threads[1] is not threads[0]
@@ -0,0 +1,141 @@
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import Account, AccountRole, Order, Scheme
+from app.routes import exchange as exchange_routes
+from app.services.market_feed import get_market_feed
+from app.services.order_book import get_order_book, get_order_book_registry
+from app.services.order_matching import match_order
+
+
+@pytest.fixture
+def session_factory():
+    """In-memory database shared across threads (the WebSocket test runs the app in another thread)"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    get_order_book_registry().reset()
+    get_market_feed().reset()
+    try:
+        yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    finally:
+        get_market_feed().reset()
+        get_order_book_registry().reset()
+
+
+@pytest.fixture
+def market(session_factory):
+    """A seller and a buyer (both developers) and one Solent nitrate scheme"""
+    db = session_factory()
+    seller = Account(name="Seller", role=AccountRole.DEVELOPER, evm_address="0x" + "1" * 40)
+    buyer = Account(name="Buyer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    db.add_all([seller, buyer])
+    db.commit()
+    scheme = Scheme(
+        nft_token_id=7, name="Solent Scheme", catchment="SOLENT", location="Solent", unit_type="nitrate",
+        original_tonnage=10.0, remaining_tonnage=10.0, created_by_account_id=seller.id
+    )
+    db.add(scheme)
+    db.commit()
+    ids = seller.id, buyer.id, scheme.id
+    db.close()
+    return ids
+
+
+def _place(db, account_id, side, price, quantity, scheme_id):
+    order = Order(
+        account_id=account_id, order_type="LIMIT", side=side, catchment="SOLENT", unit_type="nitrate",
+        price_per_unit=price, quantity_units=quantity, filled_quantity=0, remaining_quantity=quantity,
+        status="PENDING", scheme_id=scheme_id, nft_token_id=7
+    )
+    db.add(order)
+    db.commit()
+    return order
+
+
+async def _drain(subscription):
+    messages = []
+    while True:
+        try:
+            message = await asyncio.wait_for(subscription.get(), timeout=0.2)
+        except asyncio.TimeoutError:
+            return messages
+        messages.append(message)
+
+
+def test_snapshot_plus_deltas_reproduce_the_book(session_factory, market):
+    """Test that applying level deltas to the snapshot gives the live book, with trade prints in sequence"""
+    seller_id, buyer_id, scheme_id = market
+    db = session_factory()
+    _place(db, seller_id, "SELL", 12.0, 50, scheme_id)
+
+    async def run():
+        subscription, snapshot = get_market_feed().subscribe("solent", "NITRATE", db)
+        _place(db, seller_id, "SELL", 11.0, 30, scheme_id)
+        _place(db, buyer_id, "BUY", 9.0, 10, scheme_id)
+        match_order(_place(db, buyer_id, "BUY", 12.0, 40, scheme_id), db)
+        return snapshot, await _drain(subscription)
+
+    snapshot, messages = asyncio.run(run())
+
+    assert snapshot["asks"] == [[12.0, 50]] and snapshot["bids"] == []
+    assert [message["seq"] for message in messages] == list(range(snapshot["seq"] + 1, snapshot["seq"] + 1 + len(messages)))
+    trades = [(message["price"], message["quantity"]) for message in messages if message["type"] == "trade"]
+    assert trades == [(11.0, 30), (12.0, 10)]
+
+    levels = {"BUY": dict(map(tuple, snapshot["bids"])), "SELL": dict(map(tuple, snapshot["asks"]))}
+    for message in messages:
+        for change in message.get("changes", []):
+            levels[change["side"]][change["price"]] = change["quantity"]
+    book = get_order_book("SOLENT", "nitrate", db)
+    for side in ("BUY", "SELL"):
+        assert sorted((price, quantity) for price, quantity in levels[side].items() if quantity) == sorted(book.depth(side))
+    db.close()
+
+
+def test_slow_consumer_is_disconnected(session_factory, market):
+    """Test that a subscriber that falls too far behind gets an error and its stream ends"""
+    seller_id, _, scheme_id = market
+    db = session_factory()
+
+    async def run():
+        subscription, _ = get_market_feed().subscribe("SOLENT", "nitrate", db, max_pending=2)
+        for price in (10.0, 11.0, 12.0):
+            _place(db, seller_id, "SELL", price, 5, scheme_id)
+        return await _drain(subscription)
+
+    messages = asyncio.run(run())
+    assert messages == [{"type": "error", "reason": "slow_consumer"}, None]
+    db.close()
+
+
+def test_websocket_streams_snapshot_then_changes(session_factory, market):
+    """Test that /exchange/stream sends a snapshot and then the level change for a new order"""
+    seller_id, _, scheme_id = market
+    app = FastAPI()
+    app.include_router(exchange_routes.router, prefix="/exchange")
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[exchange_routes.get_db] = override_get_db
+
+    with TestClient(app).websocket_connect("/exchange/stream?catchment=Solent&unit_type=nitrate") as websocket:
+        snapshot = websocket.receive_json()
+        assert (snapshot["type"], snapshot["bids"], snapshot["asks"]) == ("snapshot", [], [])
+
+        db = session_factory()
+        _place(db, seller_id, "SELL", 12.0, 25, scheme_id)
+        db.close()
+
+        message = websocket.receive_json()
+        assert message["type"] == "levels" and message["seq"] == snapshot["seq"] + 1
+        assert message["changes"] == [{"side": "SELL", "price": 12.0, "quantity": 25}]
@@ -0,0 +1,126 @@
+import json
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import (
+    Account, AccountRole, BotAssignment, FIFOCreditQueue, MarketMakingBot, Order, Scheme, Trade
+)
+from app.services import market_making_bot
+from app.services.market_state import get_market_state
+from app.services.order_book import get_order_book_registry
+
+
+@pytest.fixture
+def db_session():
+    """Create an in-memory SQLite database for testing"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = TestingSessionLocal()
+    get_order_book_registry().reset()
+    try:
+        yield session
+    finally:
+        session.close()
+        get_order_book_registry().reset()
+
+
+@pytest.fixture
+def market(db_session):
+    """A Solent nitrate scheme with one trade, a resting bid and a bot holding 300 of 400 credits"""
+    seller = Account(name="Seller", role=AccountRole.DEVELOPER, evm_address="0x" + "1" * 40)
+    buyer = Account(name="Buyer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    broker = Account(name="Broker", role=AccountRole.BROKER, evm_address="0x" + "3" * 40)
+    db_session.add_all([seller, buyer, broker])
+    db_session.commit()
+    scheme = Scheme(
+        nft_token_id=7, name="Solent Scheme", catchment="SOLENT", location="Solent", unit_type="nitrate",
+        original_tonnage=10.0, remaining_tonnage=10.0, created_by_account_id=seller.id
+    )
+    db_session.add(scheme)
+    db_session.commit()
+    db_session.add_all([
+        Trade(buyer_account_id=buyer.id, seller_account_id=seller.id, scheme_id=scheme.id,
+              quantity_units=100, price_per_unit=10.0, total_price=1000.0),
+        Order(account_id=buyer.id, order_type="LIMIT", side="BUY", catchment="SOLENT", unit_type="nitrate",
+              price_per_unit=9.0, quantity_units=50, filled_quantity=0, remaining_quantity=50, status="PENDING",
+              scheme_id=scheme.id)
+    ])
+    bot = MarketMakingBot(broker_account_id=broker.id, catchment="SOLENT", unit_type="nitrate", name="MM",
+                          is_active=1, strategy_config=json.dumps({"spread_percentage": 4.0}))
+    db_session.add(bot)
+    db_session.commit()
+    assignment = BotAssignment(bot_id=bot.id, is_house_account=1, priority_order=1)
+    db_session.add(assignment)
+    db_session.commit()
+    queue = FIFOCreditQueue(bot_id=bot.id, assignment_id=assignment.id, scheme_id=scheme.id,
+                            credits_available=300, credits_traded=100, queue_position=1)
+    db_session.add(queue)
+    db_session.commit()
+    return seller, buyer, bot, scheme, queue
+
+
+def _quote(bot_id, db):
+    """The quote inputs place_bot_orders reads for the Solent nitrate bot, and the resulting bid/ask prices"""
+    ratio = market_making_bot.get_inventory_ratio(bot_id, db)
+    reference = market_making_bot.calculate_reference_price("SOLENT", "nitrate", db, {})
+    is_new = market_making_bot.is_market_new("SOLENT", "nitrate", db)
+    best_bid = market_making_bot.get_best_bid_price("SOLENT", "nitrate", db)
+    return ratio, reference, is_new, best_bid, market_making_bot.calculate_bid_ask_prices(reference, 4.0, ratio)
+
+
+def _count_selects(db):
+    selects = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda conn, cursor, statement, *args: (
+        selects.append(statement) if statement.lstrip().upper().startswith("SELECT") else None
+    ))
+    return selects
+
+
+def test_quotes_are_calculated_without_queries(db_session, market):
+    """Test that once a market is loaded, quote inputs are read from memory and track commits"""
+    seller, buyer, bot, scheme, queue = market
+    bot_id = bot.id
+    assert _quote(bot_id, db_session)[:4] == (0.75, 10.0, False, 9.0)
+
+    selects = _count_selects(db_session)
+    _quote(bot_id, db_session)
+    assert selects == []
+
+    # A trade, a fill from the bot's queue and a better bid, each committed normally
+    db_session.add(Trade(buyer_account_id=buyer.id, seller_account_id=seller.id, scheme_id=scheme.id,
+                         quantity_units=300, price_per_unit=12.0, total_price=3600.0))
+    queue.credits_available = 100
+    queue.credits_traded = 300
+    db_session.add(Order(account_id=buyer.id, order_type="LIMIT", side="BUY", catchment="SOLENT", unit_type="nitrate",
+                         price_per_unit=9.5, quantity_units=50, filled_quantity=0, remaining_quantity=50,
+                         status="PENDING", scheme_id=scheme.id))
+    db_session.commit()
+
+    selects.clear()
+    ratio, reference, is_new, best_bid, _ = _quote(bot_id, db_session)
+    assert selects == []
+    assert (ratio, is_new, best_bid) == (0.25, False, 9.5)
+    assert reference == pytest.approx((12.0 * 10 + 10.0 * 9) / 19)
+    state = get_market_state("SOLENT", "nitrate", db_session)
+    assert state.trade_count == 2
+    assert state.vwap() == pytest.approx((12.0 * 300 + 10.0 * 100) / 400)
+
+
+def test_state_reloads_with_the_order_book(db_session, market):
+    """Test that rebuilding the order books reloads the market state from the database"""
+    bot_id = market[2].id
+    before = _quote(bot_id, db_session)
+
+    # Written behind the session's back, so only a reload can see it
+    db_session.execute(text("UPDATE fifo_credit_queues SET credits_available = 0, credits_traded = 400"))
+    db_session.commit()
+    assert _quote(bot_id, db_session) == before
+
+    get_order_book_registry().reset()
+    db_session.expire_all()
+    ratio, reference, _, _, _ = _quote(bot_id, db_session)
+    assert ratio == 0.0
+    assert reference == before[1]
@@ -0,0 +1,54 @@
+import pytest
+from app.services import nonce_manager
+
+ADDRESS = "0x70997970C51812dc3A010C7d01b50e0d17dc79C8"
+RPC_URL = "http://127.0.0.1:8545"
+
+
+class FakeEth:
+    def __init__(self):
+        self.count_calls = 0
+        self.gas_price_calls = 0
+
+    def get_transaction_count(self, address, block_identifier):
+        self.count_calls += 1
+        return 7
+
+    @property
+    def gas_price(self):
+        self.gas_price_calls += 1
+        return 1000
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+@pytest.fixture
+def fake_web3(monkeypatch):
+    """Replace the shared provider with a counting stub"""
+    nonce_manager.reset_nonce_managers()
+    w3 = FakeWeb3()
+    monkeypatch.setattr(nonce_manager, "get_web3", lambda rpc_url=None: w3)
+    yield w3
+    nonce_manager.reset_nonce_managers()
+
+
+def test_nonces_are_allocated_locally(fake_web3):
+    """Test that only the first allocation reads the pending count from the node"""
+    manager = nonce_manager.get_nonce_manager(ADDRESS, RPC_URL)
+    assert [manager.allocate() for _ in range(3)] == [7, 8, 9]
+    assert fake_web3.eth.count_calls == 1
+    assert nonce_manager.get_nonce_manager(ADDRESS.lower(), RPC_URL) is manager
+
+    nonce_manager.resync_nonce(ADDRESS, RPC_URL)
+    assert manager.allocate() == 7
+    assert fake_web3.eth.count_calls == 2
+
+
+def test_gas_price_is_cached(fake_web3):
+    """Test that gas price is read once within the TTL"""
+    assert nonce_manager.get_gas_price(RPC_URL) == 1000
+    assert nonce_manager.get_gas_price(RPC_URL) == 1000
+    assert fake_web3.eth.gas_price_calls == 1
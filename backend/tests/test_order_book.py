@@ -0,0 +1,133 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import Account, Scheme, Order, Trade, AccountRole
+from app.services.order_book import get_order_book, get_order_book_registry
+from app.services.order_matching import match_order
+
+
+@pytest.fixture
+def db_session(monkeypatch):
+    """Create an in-memory SQLite database with a fresh order book registry"""
+    monkeypatch.delenv("SCHEME_CREDITS_CONTRACT_ADDRESS", raising=False)
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = TestingSessionLocal()
+    get_order_book_registry().reset()
+    try:
+        yield session
+    finally:
+        session.close()
+        get_order_book_registry().reset()
+
+
+@pytest.fixture
+def market(db_session):
+    """Create a seller, a buyer and a scheme in SOLENT nitrate"""
+    seller = Account(name="Seller", role=AccountRole.DEVELOPER, evm_address="0x" + "1" * 40)
+    buyer = Account(name="Buyer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    db_session.add_all([seller, buyer])
+    db_session.commit()
+    scheme = Scheme(
+        nft_token_id=1,
+        name="Solent Scheme",
+        catchment="SOLENT",
+        location="Solent",
+        unit_type="nitrate",
+        original_tonnage=10.0,
+        remaining_tonnage=10.0,
+        created_by_account_id=seller.id
+    )
+    db_session.add(scheme)
+    db_session.commit()
+    return seller, buyer, scheme
+
+
+def _limit_order(db_session, account, side, price, quantity, scheme=None):
+    order = Order(
+        account_id=account.id,
+        order_type="LIMIT",
+        side=side,
+        catchment="SOLENT",
+        unit_type="nitrate",
+        price_per_unit=price,
+        quantity_units=quantity,
+        filled_quantity=0,
+        remaining_quantity=quantity,
+        status="PENDING",
+        scheme_id=scheme.id if scheme else None,
+        nft_token_id=scheme.nft_token_id if scheme else None
+    )
+    db_session.add(order)
+    db_session.commit()
+    return order
+
+
+def test_book_loads_existing_orders_in_price_time_priority(db_session, market):
+    """Test that the book is built from the orders table with sorted levels"""
+    seller, buyer, scheme = market
+    first = _limit_order(db_session, seller, "SELL", 2.0, 100, scheme)
+    _limit_order(db_session, seller, "SELL", 1.5, 50, scheme)
+    second = _limit_order(db_session, seller, "SELL", 2.0, 25, scheme)
+    _limit_order(db_session, buyer, "BUY", 1.0, 10)
+
+    book = get_order_book("solent", "NITRATE", db_session)
+
+    assert book.best_ask() == 1.5
+    assert book.best_bid() == 1.0
+    assert book.depth("SELL") == [(1.5, 50), (2.0, 125)]
+    levels = list(book.iter_levels("SELL"))
+    assert [entry.order_id for entry in levels[1][1]] == [first.id, second.id]
+
+
+def test_book_tracks_commits_and_ignores_rollbacks(db_session, market):
+    """Test that committed creates/cancels update the book and rollbacks do not"""
+    seller, buyer, scheme = market
+    book = get_order_book("SOLENT", "nitrate", db_session)
+    order = _limit_order(db_session, seller, "SELL", 3.0, 40, scheme)
+    assert book.depth("SELL") == [(3.0, 40)]
+
+    order.status = "CANCELLED"
+    db_session.flush()
+    db_session.rollback()
+    assert book.depth("SELL") == [(3.0, 40)]
+
+    order.status = "CANCELLED"
+    db_session.commit()
+    assert book.depth("SELL") == []
+
+
+def test_match_order_walks_book_and_updates_levels(db_session, market):
+    """Test that a buy sweeps the best asks first and the book reflects the fills"""
+    seller, buyer, scheme = market
+    cheap = _limit_order(db_session, seller, "SELL", 1.0, 30, scheme)
+    dear = _limit_order(db_session, seller, "SELL", 2.0, 30, scheme)
+    book = get_order_book("SOLENT", "nitrate", db_session)
+
+    buy = _limit_order(db_session, buyer, "BUY", 2.0, 45)
+    trades = match_order(buy, db_session)
+
+    assert [(t.price_per_unit, t.quantity_units) for t in trades] == [(1.0, 30), (2.0, 15)]
+    assert db_session.get(Order, cheap.id).status == "FILLED"
+    assert db_session.get(Order, dear.id).remaining_quantity == 15
+    assert buy.status == "FILLED"
+    assert book.depth("SELL") == [(2.0, 15)]
+    assert book.depth("BUY") == []
+    assert db_session.query(Trade).count() == 2
+
+
+def test_match_order_stops_at_limit_price(db_session, market):
+    """Test that a limit buy rests in the book once the asks are too expensive"""
+    seller, buyer, scheme = market
+    _limit_order(db_session, seller, "SELL", 5.0, 10, scheme)
+    book = get_order_book("SOLENT", "nitrate", db_session)
+
+    buy = _limit_order(db_session, buyer, "BUY", 4.0, 10)
+    trades = match_order(buy, db_session)
+
+    assert trades == []
+    assert book.best_bid() == 4.0
+    assert book.best_ask() == 5.0
@@ -0,0 +1,144 @@
+from datetime import datetime
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import Account, AccountRole, Notification, Order, Scheme, Trade
+from app.routes import exchange as exchange_routes, landowner as landowner_routes
+from app.services.order_book import get_order_book_registry
+from app.services.pagination import DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.services.read_cache import get_read_cache
+
+
+@pytest.fixture
+def env():
+    """Exchange and landowner routers on an in-memory database with two accounts and a scheme"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    get_order_book_registry().reset()
+    get_read_cache().reset()
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(exchange_routes.router, prefix="/exchange")
+    app.include_router(landowner_routes.router, prefix="/landowner")
+    app.dependency_overrides[exchange_routes.get_db] = override_get_db
+    app.dependency_overrides[landowner_routes.get_db] = override_get_db
+
+    db = factory()
+    seller = Account(name="Seller", role=AccountRole.LANDOWNER, evm_address="0x" + "1" * 40)
+    buyer = Account(name="Buyer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    db.add_all([seller, buyer])
+    db.commit()
+    scheme = Scheme(
+        nft_token_id=7, name="Solent Scheme", catchment="SOLENT", location="Solent", unit_type="nitrate",
+        original_tonnage=10.0, remaining_tonnage=10.0, created_by_account_id=seller.id
+    )
+    db.add(scheme)
+    db.commit()
+    try:
+        yield TestClient(app), db, seller, buyer, scheme
+    finally:
+        db.close()
+        get_order_book_registry().reset()
+        get_read_cache().reset()
+
+
+def _walk(client, url, limit):
+    """Follow X-Next-Cursor from the first page to the last; returns the ids of each page."""
+    pages = []
+    cursor = None
+    while True:
+        response = client.get(url, params={"limit": limit, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.append([item["id"] for item in response.json()])
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages
+
+
+def test_trade_pages_cover_both_sides_in_order(env):
+    """Test that trade pages follow (created_at, id) newest first across buy and sell sides without repeats"""
+    client, db, seller, buyer, scheme = env
+    # Same-second trades (server default) on both sides, a self-trade, and two backdated trades
+    for buyer_id, seller_id in [(buyer.id, seller.id), (seller.id, buyer.id)] * 3 + [(buyer.id, buyer.id)]:
+        db.add(Trade(buyer_account_id=buyer_id, seller_account_id=seller_id, scheme_id=scheme.id,
+                     quantity_units=1, price_per_unit=10.0, total_price=10.0))
+        db.commit()
+    for day in (1, 2):
+        db.add(Trade(buyer_account_id=buyer.id, seller_account_id=seller.id, scheme_id=scheme.id,
+                     quantity_units=1, price_per_unit=10.0, total_price=10.0, created_at=datetime(2020, 1, day)))
+        db.commit()
+
+    expected = [trade.id for trade in sorted(
+        db.query(Trade).filter((Trade.buyer_account_id == buyer.id) | (Trade.seller_account_id == buyer.id)),
+        key=lambda trade: (trade.created_at, trade.id), reverse=True
+    )]
+    assert len(expected) == 9 and expected[-2:] == [9, 8]
+
+    pages = _walk(client, f"/exchange/trades?account_id={buyer.id}", limit=4)
+    assert [len(page) for page in pages] == [4, 4, 1]
+    assert [trade_id for page in pages for trade_id in page] == expected
+    # The market filter pages the same way
+    pages = _walk(client, f"/exchange/trades?account_id={buyer.id}&catchment=solent&unit_type=nitrate", limit=9)
+    assert pages == [expected]
+
+
+def test_completed_orders_and_notifications_paginate(env):
+    """Test that completed orders (both statuses) and notifications page newest first to the end"""
+    client, db, seller, buyer, scheme = env
+    for index in range(5):
+        db.add(Order(
+            account_id=buyer.id, order_type="LIMIT", side="BUY", catchment="SOLENT", unit_type="nitrate",
+            price_per_unit=10.0, quantity_units=10, filled_quantity=10 if index % 2 else 0, remaining_quantity=0,
+            status="FILLED" if index % 2 else "CANCELLED", scheme_id=scheme.id, nft_token_id=scheme.nft_token_id
+        ))
+        db.add(Notification(account_id=seller.id, scheme_id=scheme.id, notification_type="SCHEME_APPROVED", message=str(index)))
+        db.commit()
+    # Open orders are not part of the history
+    db.add(Order(
+        account_id=buyer.id, order_type="LIMIT", side="BUY", catchment="SOLENT", unit_type="nitrate",
+        price_per_unit=10.0, quantity_units=10, filled_quantity=0, remaining_quantity=10,
+        status="PENDING", scheme_id=scheme.id, nft_token_id=scheme.nft_token_id
+    ))
+    db.commit()
+
+    assert _walk(client, f"/exchange/orders/completed?account_id={buyer.id}", limit=2) == [[5, 4], [3, 2], [1]]
+    assert _walk(client, f"/landowner/notifications?account_id={seller.id}", limit=3) == [[5, 4, 3], [2, 1]]
+
+
+def test_notifications_without_limit_are_all_returned(env):
+    """Test that a notifications request without limit or cursor still returns every notification, unpaged"""
+    client, db, seller, buyer, scheme = env
+    for index in range(DEFAULT_PAGE_SIZE + 2):
+        db.add(Notification(account_id=seller.id, scheme_id=scheme.id, notification_type="SCHEME_APPROVED",
+                            message=str(index), claim_token=f"token-{index}"))
+    db.commit()
+
+    response = client.get(f"/landowner/notifications?account_id={seller.id}")
+    assert response.status_code == 200
+    assert len(response.json()) == DEFAULT_PAGE_SIZE + 2 and NEXT_CURSOR_HEADER not in response.headers
+    assert response.json()[-1]["claim_token"] == "token-0"
+
+
+def test_invalid_cursors_are_rejected(env):
+    """Test that a malformed cursor, or one from another listing, is a 400"""
+    client, _, _, buyer, _ = env
+    assert decode_cursor("trades", encode_cursor("trades", 42)) == 42
+    with pytest.raises(ValueError):
+        decode_cursor("trades", encode_cursor("notifications", 42))
+
+    assert client.get(f"/exchange/trades?account_id={buyer.id}&cursor=not-a-cursor").status_code == 400
+    notifications_cursor = encode_cursor("notifications", 1)
+    assert client.get(f"/exchange/orders/completed?account_id={buyer.id}&cursor={notifications_cursor}").status_code == 400
+    assert client.get(f"/exchange/trades?account_id={buyer.id}&limit=0").status_code == 422
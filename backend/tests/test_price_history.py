@@ -0,0 +1,151 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.db import Base
+from app.models import Account, AccountRole, PriceHistory, Scheme, Trade
+from app.services import price_history
+from app.services.price_history import Candle, get_candle_aggregator, get_price_history, rollup_candles
+
+START = datetime(2025, 1, 6, 9, 0)
+
+
+@pytest.fixture
+def db_session():
+    """Create an in-memory SQLite database for testing"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = TestingSessionLocal()
+    get_candle_aggregator().reset()
+    try:
+        yield session
+    finally:
+        session.close()
+        get_candle_aggregator().reset()
+
+
+@pytest.fixture
+def scheme(db_session):
+    """A seller, a buyer and one Solent nitrate scheme"""
+    seller = Account(name="Seller", role=AccountRole.LANDOWNER, evm_address="0x" + "1" * 40)
+    buyer = Account(name="Buyer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    db_session.add_all([seller, buyer])
+    db_session.commit()
+    scheme = Scheme(
+        nft_token_id=7,
+        name="Solent Scheme",
+        catchment="Solent",
+        location="Solent",
+        unit_type="nitrate",
+        original_tonnage=10.0,
+        remaining_tonnage=10.0,
+        created_by_account_id=seller.id
+    )
+    db_session.add(scheme)
+    db_session.commit()
+    return scheme
+
+
+def _trade(db, scheme, minutes, price, quantity):
+    trade = Trade(
+        buyer_account_id=2,
+        seller_account_id=1,
+        scheme_id=scheme.id,
+        quantity_units=quantity,
+        price_per_unit=price,
+        total_price=price * quantity,
+        created_at=START + timedelta(minutes=minutes)
+    )
+    db.add(trade)
+    db.commit()
+    return trade
+
+
+# Trades spanning several 5min/15min buckets and two hours
+TRADES = [(0, 10.0, 5), (0.5, 12.0, 3), (3, 9.0, 2), (7, 11.0, 4), (16, 13.0, 1), (61, 8.0, 6), (62, 10.5, 2)]
+
+
+def test_trades_are_recorded_in_memory_and_flushed_in_one_batch(db_session, scheme):
+    """Test that recording trades issues no queries once loaded and flush writes all dirty candles at once"""
+    trades = [_trade(db_session, scheme, *spec) for spec in TRADES]
+    price_history.update_price_history(trades[0], db_session)
+
+    statements = []
+    engine = db_session.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        for trade in trades[1:]:
+            price_history.update_price_history(trade, db_session)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert not any("price_history" in statement for statement in statements)
+    assert db_session.query(PriceHistory).count() == 0
+
+    written = get_candle_aggregator().flush(db_session)
+    assert written == db_session.query(PriceHistory).count()
+    assert get_candle_aggregator().dirty_count() == 0
+
+    hourly = {row.timestamp.replace(tzinfo=None): row for row in db_session.query(PriceHistory).filter_by(timeframe="1hr")}
+    first_hour = hourly[START]
+    assert (first_hour.open_price, first_hour.high_price, first_hour.low_price, first_hour.close_price) == (10.0, 13.0, 9.0, 13.0)
+    assert first_hour.volume == 15
+
+    # A later trade updates the existing row rather than inserting a duplicate
+    price_history.update_price_history(_trade(db_session, scheme, 63, 20.0, 1), db_session)
+    get_candle_aggregator().flush(db_session)
+    second_hour = db_session.query(PriceHistory).filter_by(timeframe="1hr", timestamp=START + timedelta(hours=1)).one()
+    assert (second_hour.high_price, second_hour.close_price, second_hour.volume) == (20.0, 20.0, 9)
+
+
+def test_rollups_match_direct_aggregation_and_range_queries(db_session, scheme):
+    """Test that higher timeframes equal candles aggregated directly from trades, and from/to filter them"""
+    for spec in TRADES:
+        price_history.update_price_history(_trade(db_session, scheme, *spec), db_session)
+
+    minute = [Candle(**{k: v for k, v in c.items() if k != "timestamp"}, timestamp=datetime.fromisoformat(c["timestamp"]))
+              for c in get_price_history("SOLENT", "nitrate", "1min", limit=1000, db=db_session)]
+    for timeframe in ("5min", "15min", "1hr", "4hr", "1day"):
+        direct = {}
+        for minutes, price, quantity in TRADES:
+            bucket = price_history.round_timestamp_to_timeframe(START + timedelta(minutes=minutes), timeframe)
+            if bucket in direct:
+                direct[bucket].add_trade(price, quantity)
+            else:
+                direct[bucket] = Candle.from_trade(bucket, price, quantity)
+        served = get_price_history("solent", "NITRATE", timeframe, limit=1000, db=db_session)
+        assert served == [candle.to_dict() for candle in direct.values()]
+        assert [c.to_dict() for c in rollup_candles(minute, timeframe)] == served
+
+    ranged = get_price_history(
+        "SOLENT", "nitrate", "5min", db=db_session,
+        start=START + timedelta(minutes=5), end=START + timedelta(minutes=60)
+    )
+    assert [c["timestamp"] for c in ranged] == [
+        (START + timedelta(minutes=5)).isoformat(),
+        (START + timedelta(minutes=15)).isoformat(),
+        (START + timedelta(minutes=60)).isoformat()
+    ]
+    assert len(get_price_history("SOLENT", "nitrate", "1min", limit=2, db=db_session)) == 2
+
+
+def test_rebuild_from_trades_replaces_candles(db_session, scheme):
+    """Test that the backfill rebuilds price_history from trades and the aggregator reloads it"""
+    for spec in TRADES:
+        _trade(db_session, scheme, *spec)
+    db_session.add(PriceHistory(
+        catchment="SOLENT", unit_type="nitrate", timeframe="1hr", timestamp=START,
+        open_price=1.0, high_price=1.0, low_price=1.0, close_price=1.0, volume=1
+    ))
+    db_session.commit()
+
+    written = price_history.rebuild_price_history(db_session)
+
+    assert written == db_session.query(PriceHistory).count()
+    assert db_session.query(PriceHistory).filter_by(timeframe="1min").count() == 6
+    daily = get_price_history("SOLENT", "nitrate", "1day", db=db_session)
+    assert daily == [{
+        "timestamp": datetime(2025, 1, 6).isoformat(),
+        "open": 10.0, "high": 13.0, "low": 8.0, "close": 10.5, "volume": 23
+    }]
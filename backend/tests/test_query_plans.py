@@ -0,0 +1,165 @@
+import re
+import pytest
+from fastapi import Response
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import (
+    Account, AccountRole, BotOrder, ExchangeListing, FIFOCreditQueue, MarketMakingBot, BotAssignment, Notification,
+    Order, Scheme, SellLadderBot, SellLadderBotAssignment, SellLadderFIFOCreditQueue, Trade
+)
+from app.routes import broker as broker_routes
+from app.routes import exchange as exchange_routes
+from app.routes import landowner as landowner_routes
+from app.services import market_making_bot, sell_ladder_bot
+from app.services.order_book import get_order_book_registry
+from app.services.order_matching import match_order
+
+# Tables whose hot queries must never fall back to a full table scan
+HOT_TABLES = {
+    "orders", "trades", "exchange_listings", "schemes", "bot_orders", "fifo_credit_queues",
+    "sell_ladder_bot_orders", "sell_ladder_fifo_credit_queues", "notifications"
+}
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+@pytest.fixture
+def db_session():
+    """In-memory database seeded with a few markets, orders, trades and bot queues"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    get_order_book_registry().reset()
+
+    seller = Account(name="Seller", role=AccountRole.DEVELOPER, evm_address="0x" + "1" * 40)
+    buyer = Account(name="Buyer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    broker = Account(name="Broker", role=AccountRole.BROKER, evm_address="0x" + "3" * 40)
+    session.add_all([seller, buyer, broker])
+    session.commit()
+
+    schemes = []
+    for index, catchment in enumerate(["SOLENT", "SEVERN", "HUMBER"]):
+        for unit_type in ("nitrate", "phosphate"):
+            schemes.append(Scheme(
+                nft_token_id=len(schemes) + 1, name=f"{catchment} {unit_type}", catchment=catchment,
+                location=catchment, unit_type=unit_type, original_tonnage=10.0, remaining_tonnage=10.0,
+                created_by_account_id=seller.id
+            ))
+    session.add_all(schemes)
+    session.commit()
+
+    for scheme in schemes:
+        for side, price in (("SELL", 12.0), ("SELL", 11.0), ("BUY", 9.0)):
+            session.add(Order(
+                account_id=seller.id if side == "SELL" else buyer.id, order_type="LIMIT", side=side,
+                catchment=scheme.catchment, unit_type=scheme.unit_type, price_per_unit=price,
+                quantity_units=100, filled_quantity=0, remaining_quantity=100, status="PENDING",
+                scheme_id=scheme.id, nft_token_id=scheme.nft_token_id
+            ))
+        session.add(Trade(
+            buyer_account_id=buyer.id, seller_account_id=seller.id, scheme_id=scheme.id,
+            quantity_units=10, price_per_unit=10.0, total_price=100.0
+        ))
+        session.add(Notification(account_id=buyer.id, scheme_id=scheme.id, notification_type="SCHEME_APPROVED", message=scheme.name))
+        session.add(ExchangeListing(
+            owner_account_id=seller.id, scheme_id=scheme.id, nft_token_id=scheme.nft_token_id,
+            catchment=scheme.catchment, unit_type=scheme.unit_type, price_per_unit=10.0, quantity_units=10
+        ))
+    session.commit()
+
+    bot = MarketMakingBot(broker_account_id=broker.id, catchment="SOLENT", unit_type="nitrate", name="MM", strategy_config="{}")
+    ladder = SellLadderBot(broker_account_id=broker.id, catchment="SOLENT", unit_type="nitrate", name="Ladder", strategy_config="{}")
+    session.add_all([bot, ladder])
+    session.commit()
+    assignment = BotAssignment(bot_id=bot.id, is_house_account=1, priority_order=1)
+    ladder_assignment = SellLadderBotAssignment(bot_id=ladder.id, is_house_account=1, priority_order=1)
+    session.add_all([assignment, ladder_assignment])
+    session.commit()
+    session.add_all([
+        FIFOCreditQueue(bot_id=bot.id, assignment_id=assignment.id, scheme_id=schemes[0].id, credits_available=100, queue_position=1),
+        SellLadderFIFOCreditQueue(bot_id=ladder.id, assignment_id=ladder_assignment.id, scheme_id=schemes[0].id, credits_available=100, queue_position=1),
+        BotOrder(bot_id=bot.id, order_id=1, strategy_price=12.0, order_type="ASK")
+    ])
+    session.commit()
+
+    try:
+        yield session, buyer, bot, ladder
+    finally:
+        session.close()
+        get_order_book_registry().reset()
+
+
+def _captured_selects(db, run):
+    """Run `run()` and return every SELECT (with its parameters) it sent to the database."""
+    statements = []
+    engine = db.get_bind()
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        run()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return statements
+
+
+def _full_scans(db, statements):
+    scans = []
+    connection = db.connection()
+    for statement, parameters in statements:
+        for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters):
+            match = FULL_SCAN.match(row[-1])
+            if match and match.group(1) in HOT_TABLES:
+                scans.append((row[-1], statement))
+    return scans
+
+
+def test_matching_and_bot_paths_use_indexes(db_session):
+    """Test that book load, matching, best bid/ask and FIFO queue lookups never scan a hot table"""
+    db, buyer, bot, ladder = db_session
+
+    def run():
+        order = Order(
+            account_id=buyer.id, order_type="LIMIT", side="BUY", catchment="SOLENT", unit_type="nitrate",
+            price_per_unit=12.0, quantity_units=150, filled_quantity=0, remaining_quantity=150, status="PENDING"
+        )
+        db.add(order)
+        db.commit()
+        match_order(order, db)
+        market_making_bot.get_best_bid_price("SOLENT", "nitrate", db)
+        market_making_bot.get_best_ask_price("SOLENT", "nitrate", db)
+        market_making_bot.calculate_reference_price("SEVERN", "nitrate", db, {})
+        market_making_bot.get_inventory_ratio(bot.id, db)
+        market_making_bot.get_next_credits_from_queue(bot.id, 10, db)
+        sell_ladder_bot.get_next_credits_from_queue(ladder.id, 10, db)
+        sell_ladder_bot.get_sell_ladder_bot_order_by_order_id(1, db)
+
+    statements = _captured_selects(db, run)
+    assert statements
+    assert _full_scans(db, statements) == []
+
+
+def test_account_and_listing_endpoints_use_indexes(db_session):
+    """Test that /orders/open, /orders/completed, /trades, notifications, broker /trades and /listings never scan a hot table"""
+    db, buyer, bot, _ = db_session
+    last_trade = db.query(Trade).order_by(Trade.id.desc()).first()
+
+    def run():
+        exchange_routes.get_open_orders(account_id=buyer.id, catchment="SOLENT", unit_type="nitrate", db=db)
+        exchange_routes.get_open_orders(account_id=buyer.id, catchment=None, unit_type=None, db=db)
+        exchange_routes.get_completed_orders(Response(), account_id=buyer.id, catchment=None, unit_type=None, limit=50, cursor=None, db=db)
+        exchange_routes._build_trades(account_id=buyer.id, catchment=None, unit_type=None, limit=50, db=db)
+        exchange_routes._build_trades(account_id=buyer.id, catchment="SOLENT", unit_type="nitrate", limit=50, db=db)
+        # A later page starts from the cursor row inside the same indexes
+        exchange_routes._build_trades(account_id=buyer.id, catchment=None, unit_type=None, limit=2, db=db, after_id=last_trade.id)
+        landowner_routes.get_notifications(Response(), account_id=buyer.id, limit=2, cursor=None, db=db)
+        broker_routes.get_broker_trades(broker_account_id=bot.broker_account_id, bot_id=None, db=db)
+        exchange_routes.browse_listings(catchment="SOLENT", unit_type="nitrate", db=db)
+
+    statements = _captured_selects(db, run)
+    assert len(statements) >= 8
+    assert _full_scans(db, statements) == []
@@ -0,0 +1,153 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import Account, AccountRole, Order, Scheme, Trade
+from app.routes import exchange as exchange_routes, regulator as regulator_routes
+from app.services.order_book import get_order_book_registry
+from app.services.price_history import get_candle_aggregator, update_price_history
+from app.services.read_cache import get_read_cache
+
+
+@pytest.fixture
+def env():
+    """Exchange and regulator routers on an in-memory database, with a log of SQL statements"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    get_order_book_registry().reset()
+    get_candle_aggregator().reset()
+    get_read_cache().reset()
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(exchange_routes.router, prefix="/exchange")
+    app.include_router(regulator_routes.router, prefix="/regulator")
+    app.dependency_overrides[exchange_routes.get_db] = override_get_db
+    app.dependency_overrides[regulator_routes.get_db] = override_get_db
+
+    db = factory()
+    seller = Account(name="Seller", role=AccountRole.DEVELOPER, evm_address="0x" + "1" * 40)
+    buyer = Account(name="Buyer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    db.add_all([seller, buyer])
+    db.commit()
+    scheme = Scheme(
+        nft_token_id=7, name="Solent Scheme", catchment="SOLENT", location="Solent", unit_type="nitrate",
+        original_tonnage=10.0, remaining_tonnage=10.0, created_by_account_id=seller.id
+    )
+    db.add(scheme)
+    db.commit()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    try:
+        yield TestClient(app), db, seller, buyer, scheme, statements
+    finally:
+        db.close()
+        get_order_book_registry().reset()
+        get_candle_aggregator().reset()
+        get_read_cache().reset()
+
+
+def _place(db, account, side, price, quantity, scheme):
+    db.add(Order(
+        account_id=account.id, order_type="LIMIT", side=side, catchment="SOLENT", unit_type="nitrate",
+        price_per_unit=price, quantity_units=quantity, filled_quantity=0, remaining_quantity=quantity,
+        status="PENDING", scheme_id=scheme.id, nft_token_id=scheme.nft_token_id
+    ))
+    db.commit()
+
+
+def test_orderbook_etag_and_invalidation(env):
+    """Test that an unchanged book returns 304 without SQL and an order in the market changes the ETag"""
+    client, db, seller, _, scheme, statements = env
+    _place(db, seller, "SELL", 12.0, 50, scheme)
+    url = "/exchange/orderbook?catchment=solent&unit_type=nitrate"
+
+    first = client.get(url)
+    assert first.status_code == 200 and first.json()["asks"][0]["quantity"] == 50
+    etag = first.headers["etag"]
+
+    statements.clear()
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(url).json() == first.json()
+    assert statements == []
+
+    # Another market does not invalidate this one
+    db.add(Order(
+        account_id=seller.id, order_type="LIMIT", side="SELL", catchment="HUMBER", unit_type="nitrate",
+        price_per_unit=5.0, quantity_units=5, filled_quantity=0, remaining_quantity=5, status="PENDING"
+    ))
+    db.commit()
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    _place(db, seller, "SELL", 11.0, 30, scheme)
+    second = client.get(url, headers={"If-None-Match": etag})
+    assert second.status_code == 200 and second.headers["etag"] != etag
+    assert [ask["price"] for ask in second.json()["asks"]] == [11.0, 12.0]
+
+
+def test_trades_and_price_history_follow_new_trades(env):
+    """Test that cached trades and candles are served until a trade in the market commits"""
+    client, db, seller, buyer, scheme, statements = env
+    trades_url = f"/exchange/trades?account_id={buyer.id}"
+    history_url = "/exchange/price-history?catchment=SOLENT&unit_type=nitrate&timeframe=1hr"
+    assert client.get(trades_url).json() == []
+    assert client.get(history_url).json() == []
+
+    statements.clear()
+    assert client.get(trades_url).json() == [] and client.get(history_url).json() == []
+    assert statements == []
+
+    trade = Trade(
+        buyer_account_id=buyer.id, seller_account_id=seller.id, scheme_id=scheme.id,
+        quantity_units=5, price_per_unit=10.0, total_price=50.0
+    )
+    db.add(trade)
+    db.commit()
+    update_price_history(trade, db)
+
+    assert [row["id"] for row in client.get(trades_url).json()] == [trade.id]
+    assert [candle["volume"] for candle in client.get(history_url).json()] == [5]
+
+
+def test_regulator_scheme_list_invalidated_by_scheme_changes(env):
+    """Test that /regulator/schemes is cached until a scheme row changes"""
+    client, db, _, _, scheme, statements = env
+    first = client.get("/regulator/schemes")
+    etag = first.headers["etag"]
+
+    statements.clear()
+    assert client.get("/regulator/schemes", headers={"If-None-Match": etag}).status_code == 304
+    assert statements == []
+
+    scheme.remaining_tonnage = 7.5
+    db.commit()
+    second = client.get("/regulator/schemes", headers={"If-None-Match": etag})
+    assert second.status_code == 200
+    assert second.json()[0]["remaining_tonnage"] == 7.5
+
+
+def test_disabled_cache_reads_changes_made_elsewhere(env, monkeypatch):
+    """Test that with the cache disabled (PostgreSQL) every request is computed and no ETag is sent"""
+    client, db, _, _, scheme, statements = env
+    monkeypatch.setattr(get_read_cache(), "enabled", False)
+    first = client.get("/regulator/schemes")
+    assert first.status_code == 200 and "etag" not in first.headers
+
+    # A write that bypasses this process's session events, as another API process's would
+    with db.get_bind().begin() as conn:
+        conn.execute(update(Scheme).where(Scheme.id == scheme.id).values(remaining_tonnage=4.0))
+    statements.clear()
+    second = client.get("/regulator/schemes", headers={"If-None-Match": '"anything"'})
+    assert second.status_code == 200 and second.json()[0]["remaining_tonnage"] == 4.0
+    assert statements and get_read_cache().hits == 0 and get_read_cache().misses == 0
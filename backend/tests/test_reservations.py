@@ -0,0 +1,122 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import Account, CreditReservation, ExchangeListing, Scheme, Order, AccountRole
+from app.services import exchange, reservations
+from app.services.order_book import get_order_book_registry
+from app.services.order_matching import match_order
+
+
+@pytest.fixture
+def db_session():
+    """Create an in-memory SQLite database for testing"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = TestingSessionLocal()
+    get_order_book_registry().reset()
+    try:
+        yield session
+    finally:
+        session.close()
+        get_order_book_registry().reset()
+
+
+@pytest.fixture
+def market(db_session):
+    """A seller (developer, selling from their own wallet), a buyer and one scheme"""
+    seller = Account(name="Seller", role=AccountRole.DEVELOPER, evm_address="0x" + "1" * 40)
+    buyer = Account(name="Buyer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    db_session.add_all([seller, buyer])
+    db_session.commit()
+    scheme = Scheme(
+        nft_token_id=7,
+        name="Solent Scheme",
+        catchment="Solent",
+        location="Solent",
+        unit_type="nitrate",
+        original_tonnage=10.0,
+        remaining_tonnage=10.0,
+        created_by_account_id=seller.id
+    )
+    db_session.add(scheme)
+    db_session.commit()
+    return seller, buyer, scheme
+
+
+def _place(db, account, side, quantity, scheme):
+    order = Order(
+        account_id=account.id,
+        order_type="LIMIT",
+        side=side,
+        catchment="SOLENT",
+        unit_type="nitrate",
+        price_per_unit=1.0,
+        quantity_units=quantity,
+        filled_quantity=0,
+        remaining_quantity=quantity,
+        status="PENDING",
+        scheme_id=scheme.id,
+        nft_token_id=scheme.nft_token_id
+    )
+    reservations.reserve_order(order, db)
+    db.add(order)
+    db.commit()
+    return order
+
+
+def _counter(db, account, scheme):
+    return db.query(CreditReservation).filter_by(account_id=account.id, scheme_id=scheme.id).one().reserved_units
+
+
+def test_orders_and_listings_maintain_counters(db_session, market):
+    """Test that placement, fills, cancels and listing sales keep the counter equal to a rebuild"""
+    seller, buyer, scheme = market
+
+    ask = _place(db_session, seller, "SELL", 300, scheme)
+    listing = ExchangeListing(
+        owner_account_id=seller.id,
+        scheme_id=scheme.id,
+        nft_token_id=scheme.nft_token_id,
+        catchment=scheme.catchment,
+        unit_type=scheme.unit_type,
+        price_per_unit=1.0,
+        quantity_units=200,
+        reserved_units=0,
+        status="ACTIVE"
+    )
+    reservations.reserve_listing(listing, db_session)
+    db_session.add(listing)
+    db_session.commit()
+    assert _counter(db_session, seller, scheme) == 500
+    # Catchment-wide lookup uses the normalised catchment copied from the scheme
+    assert reservations.get_reserved_credits_by_scheme(seller.id, "solent", "NITRATE", db_session) == {scheme.id: 500}
+
+    match_order(_place(db_session, buyer, "BUY", 120, scheme), db_session)
+    assert _counter(db_session, seller, scheme) == 380
+
+    reservations.release_listing(listing, 50, db_session)
+    listing.quantity_units -= 50
+    reservations.release_order(ask, ask.remaining_quantity, db_session)
+    ask.status = "CANCELLED"
+    db_session.commit()
+    assert _counter(db_session, seller, scheme) == 150
+
+    assert reservations.rebuild_credit_reservations(db_session) == 1
+    assert _counter(db_session, seller, scheme) == 150
+
+
+def test_seller_check_reads_counter_instead_of_scanning(db_session, market, monkeypatch):
+    """Test that free credits are on-chain available minus the reservation counter"""
+    seller, _, scheme = market
+    monkeypatch.setattr(exchange, "is_connected", lambda rpc_url=None: True)
+    monkeypatch.setattr(exchange, "get_cached_balances", lambda holder, token_ids, address, rpc_url: {7: (1000, 100)})
+    _place(db_session, seller, "SELL", 500, scheme)
+
+    has_sufficient, available = exchange.check_seller_has_sufficient_credits(
+        seller, scheme.id, scheme.nft_token_id, 401, db_session, scheme_credits_address="0x" + "c" * 40
+    )
+
+    assert (has_sufficient, available) == (False, 400)
@@ -0,0 +1,266 @@
+import pytest
+from types import SimpleNamespace
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db import Base
+from app.models import (
+    Account, Scheme, Order, Trade, SettlementInstruction, AccountRole, BrokerMandate,
+    SellLadderBot, SellLadderBotAssignment, SellLadderFIFOCreditQueue
+)
+from app.services import settlement
+from app.services.sell_ladder_bot import replace_sell_ladder_orders
+from app.services.order_book import get_order_book_registry
+from app.services.order_matching import match_order
+from web3.exceptions import TimeExhausted
+
+
+@pytest.fixture
+def db_session(monkeypatch):
+    """Create an in-memory SQLite database for testing"""
+    monkeypatch.setenv("SCHEME_CREDITS_CONTRACT_ADDRESS", "0x" + "c" * 40)
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = TestingSessionLocal()
+    get_order_book_registry().reset()
+    try:
+        yield session
+    finally:
+        session.close()
+        get_order_book_registry().reset()
+
+
+@pytest.fixture
+def matched_trade(db_session):
+    """Match a landowner sell against a developer buy"""
+    landowner = Account(name="Landowner", role=AccountRole.LANDOWNER, evm_address="0x" + "1" * 40)
+    developer = Account(name="Developer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    db_session.add_all([landowner, developer])
+    db_session.commit()
+    scheme = Scheme(
+        nft_token_id=7,
+        name="Solent Scheme",
+        catchment="SOLENT",
+        location="Solent",
+        unit_type="nitrate",
+        original_tonnage=10.0,
+        remaining_tonnage=10.0,
+        created_by_account_id=landowner.id
+    )
+    db_session.add(scheme)
+    db_session.commit()
+
+    for account, side in ((landowner, "SELL"), (developer, "BUY")):
+        order = Order(
+            account_id=account.id,
+            order_type="LIMIT",
+            side=side,
+            catchment="SOLENT",
+            unit_type="nitrate",
+            price_per_unit=1.0,
+            quantity_units=100,
+            filled_quantity=0,
+            remaining_quantity=100,
+            status="PENDING",
+            scheme_id=scheme.id,
+            nft_token_id=scheme.nft_token_id
+        )
+        db_session.add(order)
+        db_session.commit()
+
+    trades = match_order(order, db_session)
+    assert len(trades) == 1
+    return trades[0]
+
+
+def test_matching_records_pending_trade_and_outbox_row(db_session, matched_trade, monkeypatch):
+    """Test that matching does not touch the chain and writes an outbox row"""
+    assert matched_trade.status == settlement.TRADE_PENDING_SETTLEMENT
+    assert matched_trade.transaction_hash is None
+
+    instruction = db_session.query(SettlementInstruction).one()
+    assert instruction.trade_id == matched_trade.id
+    assert instruction.status == settlement.INSTRUCTION_PENDING
+    assert instruction.signer == "TRADING_ACCOUNT"
+    assert instruction.from_address == settlement.get_trading_account_address()
+    assert instruction.to_address == "0x" + "2" * 40
+    assert instruction.nft_token_id == 7
+    assert instruction.quantity_units == 100
+
+
+def test_worker_settles_and_writes_back_hash(db_session, matched_trade, monkeypatch):
+    """Test that draining the outbox writes the hash and final status back"""
+    submitted = []
+    monkeypatch.setattr(settlement, "submit_credit_transfer", lambda **kwargs: submitted.append(kwargs) or "abc123")
+    monkeypatch.setattr(settlement, "wait_for_receipts", lambda hashes, rpc_url, timeout: {h: SimpleNamespace(status=1) for h in hashes})
+
+    assert settlement.settle_pending_trades(db_session) == 1
+
+    trade = db_session.get(Trade, matched_trade.id)
+    assert trade.status == settlement.TRADE_SETTLED
+    assert trade.transaction_hash == "abc123"
+    assert submitted[0]["quantity_credits"] == 100
+    assert db_session.query(SettlementInstruction).one().status == settlement.INSTRUCTION_SETTLED
+    assert settlement.settle_pending_trades(db_session) == 0
+
+
+def test_failed_settlement_retries_then_fails_trade(db_session, matched_trade, monkeypatch):
+    """Test that failures are retried and eventually mark the trade failed"""
+    def fail(**kwargs):
+        raise ValueError("node unavailable")
+
+    monkeypatch.setattr(settlement, "submit_credit_transfer", fail)
+
+    for _ in range(settlement.MAX_SETTLEMENT_ATTEMPTS):
+        assert settlement.settle_pending_trades(db_session) == 0
+
+    instruction = db_session.query(SettlementInstruction).one()
+    assert instruction.status == settlement.INSTRUCTION_FAILED
+    assert instruction.attempts == settlement.MAX_SETTLEMENT_ATTEMPTS
+    assert "node unavailable" in instruction.last_error
+    assert db_session.get(Trade, matched_trade.id).status == settlement.TRADE_SETTLEMENT_FAILED
+
+
+def test_submitted_transfers_are_confirmed_together(db_session, matched_trade, monkeypatch):
+    """Test that a batch is fully submitted before any receipt is awaited"""
+    events = []
+    monkeypatch.setattr(settlement, "submit_credit_transfer", lambda **kwargs: events.append("submit") or "0x01")
+
+    def receipts(hashes, rpc_url, timeout):
+        events.append(("wait", list(hashes)))
+        return {h: TimeExhausted() for h in hashes}
+
+    monkeypatch.setattr(settlement, "wait_for_receipts", receipts)
+
+    assert settlement.settle_pending_trades(db_session) == 0
+    assert events == ["submit", ("wait", ["0x01"])]
+
+    # Still in the mempool: not resubmitted on the next pass
+    assert settlement.settle_pending_trades(db_session) == 0
+    assert events[2:] == [("wait", ["0x01"])]
+    assert db_session.query(SettlementInstruction).one().status == settlement.INSTRUCTION_SUBMITTED
+
+
+def _instruction(from_address, to_address, token_id, quantity, signer="TRADING_ACCOUNT", trade_id=None):
+    return SettlementInstruction(
+        trade_id=trade_id,
+        from_address=from_address,
+        to_address=to_address,
+        nft_token_id=token_id,
+        quantity_units=quantity,
+        signer=signer,
+        status=settlement.INSTRUCTION_PENDING,
+        attempts=0
+    )
+
+
+def test_batches_group_by_pair_and_net_opposing_fills():
+    """Test that fills between the same wallets are grouped per direction and netted per token"""
+    a, b, c = "0x" + "a" * 40, "0x" + "B" * 40, "0x" + "c" * 40
+    instructions = [
+        _instruction(a, b, 1, 100),
+        _instruction(a, b, 2, 50),
+        _instruction(b.lower(), a, 1, 30, signer="BROKER"),
+        _instruction(a, b, 3, 20),
+        _instruction(b, a, 3, 20, signer="BROKER"),
+        _instruction(b, a, 4, 10, signer="BROKER"),
+        _instruction(a, c, 1, 5),
+    ]
+
+    batches = settlement.build_settlement_batches(instructions)
+    by_route = {(batch.from_address.lower(), batch.to_address.lower(), bool(batch.quantities)): batch for batch in batches}
+
+    forward = by_route[(a, b.lower(), True)]
+    assert forward.quantities == {1: 70, 2: 50}
+    assert forward.signer == "TRADING_ACCOUNT"
+    assert len(forward.instructions) == 3
+
+    backward = by_route[(b.lower(), a, True)]
+    assert backward.quantities == {4: 10}
+    assert backward.signer == "BROKER"
+
+    netted = [batch for batch in batches if not batch.quantities]
+    assert len(netted) == 1 and len(netted[0].instructions) == 2
+    assert by_route[(a, c, True)].quantities == {1: 5}
+    assert sum(len(batch.instructions) for batch in batches) == len(instructions)
+
+
+def test_batched_trades_share_transaction_hash(db_session, matched_trade, monkeypatch):
+    """Test that several fills between the same wallets settle in one batch transfer"""
+    second = Trade(
+        buyer_account_id=matched_trade.buyer_account_id,
+        seller_account_id=matched_trade.seller_account_id,
+        scheme_id=matched_trade.scheme_id,
+        quantity_units=40,
+        price_per_unit=1.0,
+        total_price=40.0
+    )
+    instruction = db_session.query(SettlementInstruction).one()
+    settlement.enqueue_settlement(second, instruction.from_address, instruction.to_address, 8, 40, instruction.signer, db_session)
+    db_session.commit()
+
+    batch_calls = []
+    monkeypatch.setattr(settlement, "submit_batch_credit_transfer", lambda **kwargs: batch_calls.append(kwargs) or "0xbatch")
+    monkeypatch.setattr(settlement, "wait_for_receipts", lambda hashes, rpc_url, timeout: {h: SimpleNamespace(status=1) for h in hashes})
+
+    assert settlement.settle_pending_trades(db_session) == 2
+    assert batch_calls[0]["scheme_ids"] == [7, 8]
+    assert batch_calls[0]["quantities"] == [100, 40]
+    assert {t.transaction_hash for t in db_session.query(Trade).all()} == {"0xbatch"}
+
+
+def test_sell_order_funding_is_stored_at_placement(db_session, monkeypatch):
+    """Test that a ladder order stores its house wallet and mandate, and fills read them without probing"""
+    monkeypatch.setenv("BROKER_HOUSE_ADDRESS", "0x" + "9" * 40)
+    broker = Account(name="Broker", role=AccountRole.BROKER, evm_address="0x" + "3" * 40)
+    landowner = Account(name="Landowner", role=AccountRole.LANDOWNER, evm_address="0x" + "1" * 40)
+    developer = Account(name="Developer", role=AccountRole.DEVELOPER, evm_address="0x" + "2" * 40)
+    db_session.add_all([broker, landowner, developer])
+    db_session.commit()
+    scheme = Scheme(
+        nft_token_id=7, name="Solent Scheme", catchment="SOLENT", location="Solent", unit_type="nitrate",
+        original_tonnage=10.0, remaining_tonnage=10.0, created_by_account_id=landowner.id
+    )
+    db_session.add(scheme)
+    db_session.commit()
+    mandate = BrokerMandate(
+        landowner_account_id=landowner.id, broker_account_id=broker.id, scheme_id=scheme.id,
+        credits_amount=1000, fee_percentage=5.0
+    )
+    bot = SellLadderBot(broker_account_id=broker.id, catchment="SOLENT", unit_type="nitrate", name="Ladder", strategy_config="{}")
+    db_session.add_all([mandate, bot])
+    db_session.commit()
+    assignment = SellLadderBotAssignment(bot_id=bot.id, is_house_account=1, priority_order=1)
+    db_session.add(assignment)
+    db_session.commit()
+    queue = SellLadderFIFOCreditQueue(bot_id=bot.id, assignment_id=assignment.id, scheme_id=scheme.id, credits_available=100, queue_position=1)
+    db_session.add(queue)
+    db_session.commit()
+
+    replace_sell_ladder_orders(bot, [(1, 1.0, 100, queue.id)], db_session)
+    sell = db_session.query(Order).filter(Order.side == "SELL").one()
+    assert (sell.funding_source, sell.source_address, sell.mandate_id) == ("BROKER_HOUSE", "0x" + "9" * 40, mandate.id)
+
+    buy = Order(
+        account_id=developer.id, order_type="LIMIT", side="BUY", catchment="SOLENT", unit_type="nitrate",
+        price_per_unit=1.0, quantity_units=40, filled_quantity=0, remaining_quantity=40, status="PENDING",
+        scheme_id=scheme.id, nft_token_id=scheme.nft_token_id
+    )
+    db_session.add(buy)
+    db_session.commit()
+
+    statements = []
+    engine = db_session.get_bind()
+    capture = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        trades = match_order(buy, db_session)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert len(trades) == 1 and trades[0].mandate_id == mandate.id
+    instruction = db_session.query(SettlementInstruction).one()
+    assert (instruction.from_address, instruction.signer) == ("0x" + "9" * 40, "BROKER_HOUSE")
+    probes = [s for s in statements if "broker_mandates.broker_account_id = " in s or "FROM sell_ladder_bot_assignments" in s]
+    assert probes == []